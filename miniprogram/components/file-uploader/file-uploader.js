@@ -183,8 +183,10 @@ Component({
           fileType: this.data.fileType,
           filePath: storedPath,
           cloudPath: storedPath,
-          tempPath: filePath
+          tempPath: filePath,
+          quality: result.quality || null
         })
+        this.showQualityTip(result.quality)
       } catch (err) {
         console.error('上传失败:', err)
         this.setData({
@@ -211,6 +213,26 @@ Component({
       })
     },
 
+    // 服务端上传质量检查（模糊/反光/分辨率/证件不完整）提示，仅提醒不拦截
+    showQualityTip(quality) {
+      if (!quality || quality.verdict === 'pass' || !Array.isArray(quality.issues) || !quality.issues.length) {
+        return
+      }
+      const content = quality.issues.map(item => item.message).join('\n')
+      wx.showModal({
+        title: quality.verdict === 'fail' ? '图片质量不合格' : '图片质量提醒',
+        content,
+        confirmText: '重新上传',
+        cancelText: '继续使用',
+        success: (res) => {
+          if (res.confirm) {
+            this.deleteFile()
+            this.chooseFile()
+          }
+        }
+      })
+    },
+
     deleteFile() {
       this.setData({
         fileUrl: '',
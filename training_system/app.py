@@ -18,6 +18,7 @@
   - 管理后台页面：基于 session 的密码登录认证
   - API 接口：支持 session、API Key、小程序 JWT 令牌三种认证方式
 """
+import multiprocessing
 import os
 from datetime import timedelta
 from flask import Flask, g, jsonify, redirect, render_template, request, session
@@ -243,6 +244,9 @@ def create_app():
 
     # ======================== 日志初始化 ========================
     setup_logger(app)
+    # 图像处理流程日志（material_service.log_line）在 capture_logs 之外时写入应用日志
+    from services.material_service import attach_pipeline_logger
+    attach_pipeline_logger(app.logger)
     # 记录 .env 文件加载结果
     if env_load.get('error'):
         app.logger.warning(
@@ -272,7 +276,7 @@ def create_app():
     app.register_blueprint(auth_bp)          # /auth/*       管理后台登录/登出
     app.register_blueprint(miniprogram_bp)   # /api/miniprogram/*  小程序认证
     app.register_blueprint(student_bp)       # /api/students/*     学员 CRUD 及审核
-    app.register_blueprint(file_bp)          # /students/*         静态文件服务
+    app.register_blueprint(file_bp)          # /students/*, /thumbs/*  静态文件与缩略图服务
     app.register_blueprint(export_bp)        # /api/export/*       数据导出
     app.register_blueprint(config_bp)        # /api/config/*       配置接口
     app.register_blueprint(exam_bank_bp)     # /api/*/exam_banks, /api/miniprogram/practice 题库练习
@@ -318,6 +322,9 @@ def create_app():
         # 学员附件文件公开访问（路径由 file_routes 提供）
         if path.startswith('/students/'):
             return None
+        # 学员附件缩略图与原图同等对待（路径由 file_routes 提供）
+        if path.startswith('/thumbs/'):
+            return None
         # 小程序登录接口无需认证（登录本身就是获取认证）
         if path == '/api/miniprogram/login':
             return None
@@ -410,6 +417,10 @@ def create_app():
     backup_enabled = os.getenv('DB_BACKUP_ENABLED', 'true').lower() in ('true', '1', 'yes')
     is_reloader_child = os.getenv('WERKZEUG_RUN_MAIN') == 'true'
     is_debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    # 图像处理进程池的子进程以 spawn 方式启动，直接运行 app.py 时会重新导入本模块，
+    # 子进程内不启动任何后台服务
+    if multiprocessing.parent_process() is not None:
+        is_debug, is_reloader_child = True, False
 
     if backup_enabled and (not is_debug or is_reloader_child):
         try:
@@ -418,6 +429,59 @@ def create_app():
         except Exception as e:
             app.logger.warning(f'备份调度器启动失败（不影响系统运行）: {e}')
 
+    # ======================== 证件照背景替换推理进程 ========================
+    # 启动阶段拉起共享推理进程并预热模型，所有 worker 共用一份模型（同样避开 reloader 父进程）
+    if not is_debug or is_reloader_child:
+        try:
+            from services.bg_removal_service import start_service
+            start_service(app)
+        except Exception as e:
+            app.logger.warning(f'背景替换推理进程启动失败（将回退为进程内处理）: {e}')
+
+    # ======================== 图像处理进程池 ========================
+    # 材料生成、手动裁剪等 OpenCV 任务在独立子进程中执行，Web 进程内存保持平稳
+    if not is_debug or is_reloader_child:
+        try:
+            from services.image_worker_pool import start_service as start_image_worker_pool
+            start_image_worker_pool(app)
+        except Exception as e:
+            app.logger.warning(f'图像处理进程池启用失败（将在 Web 进程内处理）: {e}')
+
+    # ======================== 裁剪点位预计算线程 ========================
+    if not is_debug or is_reloader_child:
+        try:
+            from services.crop_precompute_service import start_service as start_crop_precompute
+            start_crop_precompute(app)
+        except Exception as e:
+            app.logger.warning(f'裁剪点位预计算线程启动失败（分析接口将现场识别）: {e}')
+
+    # ======================== COS 同步发件箱 ========================
+    # dual 模式下 COS 上传/移动/删除由后台线程异步执行，请求只等待本地写入
+    if not is_debug or is_reloader_child:
+        try:
+            from services.cos_outbox_service import start_service as start_cos_outbox
+            start_cos_outbox(app)
+        except Exception as e:
+            app.logger.warning(f'COS 发件箱启动失败（COS 操作将在请求内同步执行）: {e}')
+
+    # ======================== 学员文件夹迁移后台线程 ========================
+    # dual 模式下关键字段修改的 COS 复制/删除在后台执行，并续做上次中断的迁移
+    if not is_debug or is_reloader_child:
+        try:
+            from services.student_folder_service import start_service as start_folder_migration
+            start_folder_migration(app)
+        except Exception as e:
+            app.logger.warning(f'文件夹迁移后台线程启动失败（COS 迁移将在请求内执行）: {e}')
+
+    # ======================== 文件浏览索引线程 ========================
+    # 增量刷新有变化的学员文件夹统计，并定期全量对账
+    if not is_debug or is_reloader_child:
+        try:
+            from services.folder_index_service import start_service as start_folder_index
+            start_folder_index(app)
+        except Exception as e:
+            app.logger.warning(f'文件浏览索引线程启动失败（浏览时按需刷新）: {e}')
+
     return app
 
 # ======================== 应用启动 ========================
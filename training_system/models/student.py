@@ -270,6 +270,119 @@ def init_db(database_path):
             )
         ''')
 
+        # 自动裁剪点位预计算缓存：附件提交/审核通过后后台识别，按源文件内容哈希失效
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS material_crop_points (
+                id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id    INTEGER NOT NULL,
+                path_key      TEXT NOT NULL,
+                profile_name  TEXT NOT NULL,
+                canny_scale   REAL NOT NULL DEFAULT 1.0,
+                source_hash   TEXT NOT NULL,
+                points_json   TEXT DEFAULT 'null',
+                confidence    REAL,
+                detector      TEXT,
+                computed_at   TIMESTAMP DEFAULT (DATETIME(CURRENT_TIMESTAMP, 'localtime')),
+                UNIQUE(student_id, path_key, canny_scale)
+            )
+        ''')
+
+        # 材料生成步骤耗时样本：每次生成按 (材料, 步骤) 记录墙钟/CPU 耗时，用于统计分位数
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS material_step_timings (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id      TEXT,
+                scope       TEXT NOT NULL,
+                step        TEXT NOT NULL,
+                wall_ms     REAL NOT NULL DEFAULT 0,
+                cpu_ms      REAL NOT NULL DEFAULT 0,
+                created_at  TIMESTAMP DEFAULT (DATETIME(CURRENT_TIMESTAMP, 'localtime'))
+            )
+        ''')
+
+        # COS 同步发件箱：dual 模式下本地写入成功后登记待执行的 COS 上传/复制/删除，由后台线程异步执行
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cos_outbox (
+                id              INTEGER PRIMARY KEY AUTOINCREMENT,
+                op              TEXT NOT NULL,
+                cos_key         TEXT NOT NULL,
+                src_key         TEXT NOT NULL DEFAULT '',
+                status          TEXT NOT NULL DEFAULT 'pending',
+                attempts        INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                lease_until     REAL NOT NULL DEFAULT 0,
+                last_error      TEXT NOT NULL DEFAULT '',
+                created_at      TIMESTAMP DEFAULT (DATETIME(CURRENT_TIMESTAMP, 'localtime')),
+                updated_at      TIMESTAMP DEFAULT (DATETIME(CURRENT_TIMESTAMP, 'localtime'))
+            )
+        ''')
+
+        # 学员文件夹迁移日志：关键字段变更时记录迁移清单与逐文件进度，中断后据此续做或回滚
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS folder_migrations (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id  INTEGER,
+                backend     TEXT NOT NULL,
+                phase       TEXT NOT NULL DEFAULT 'local',
+                items       TEXT NOT NULL DEFAULT '[]',
+                attempts    INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL NOT NULL DEFAULT 0,
+                last_error  TEXT NOT NULL DEFAULT '',
+                created_at  TIMESTAMP DEFAULT (DATETIME(CURRENT_TIMESTAMP, 'localtime')),
+                updated_at  TIMESTAMP DEFAULT (DATETIME(CURRENT_TIMESTAMP, 'localtime'))
+            )
+        ''')
+
+        # 文件浏览索引：students/ 下每个顶层文件夹（或文件）的大小、文件数、修改时间与匹配学员
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS folder_index (
+                name        TEXT PRIMARY KEY,
+                type        TEXT NOT NULL DEFAULT 'directory',
+                size        INTEGER NOT NULL DEFAULT 0,
+                file_count  INTEGER NOT NULL DEFAULT 0,
+                mtime       REAL NOT NULL DEFAULT 0,
+                student_id  INTEGER,
+                indexed_at  REAL NOT NULL DEFAULT 0
+            )
+        ''')
+
+        # 文件浏览索引的待刷新文件夹：任何进程（Web worker、图像处理子进程）都可登记，浏览与后台线程处理
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS folder_index_dirty (
+                name       TEXT PRIMARY KEY,
+                marked_at  REAL NOT NULL
+            )
+        ''')
+
+        # 附件对账：每个顶层文件夹上次检查时的引用摘要与修改时间、当前对账计划（孤立/缺失/不一致条目）、水位
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS reconcile_folders (
+                folder      TEXT PRIMARY KEY,
+                ref_digest  TEXT NOT NULL DEFAULT '',
+                local_mtime REAL NOT NULL DEFAULT 0,
+                checked_at  REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS reconcile_findings (
+                key         TEXT PRIMARY KEY,
+                folder      TEXT NOT NULL,
+                kind        TEXT NOT NULL,
+                location    TEXT NOT NULL,
+                local_size  INTEGER,
+                local_mtime REAL,
+                cos_size    INTEGER,
+                cos_mtime   REAL,
+                found_at    REAL NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS reconcile_state (
+                name  TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+
         # 学员业务操作日志：用于按学员展示报名、审核、材料、下载、省网等操作时间线
         conn.execute('''
             CREATE TABLE IF NOT EXISTS operation_logs (
@@ -502,6 +615,38 @@ def init_db(database_path):
             "CREATE INDEX IF NOT EXISTS idx_material_adjustments_student "
             "ON material_adjustments(student_id)"
         )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_material_crop_points_student "
+            "ON material_crop_points(student_id)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_material_step_timings_created "
+            "ON material_step_timings(created_at)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cos_outbox_status_due "
+            "ON cos_outbox(status, next_attempt_at)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cos_outbox_key "
+            "ON cos_outbox(cos_key)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_folder_migrations_phase "
+            "ON folder_migrations(phase)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_reconcile_findings_kind "
+            "ON reconcile_findings(kind, folder)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_folder_index_mtime "
+            "ON folder_index(mtime DESC)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_students_name_company "
+            "ON students(name, company)"
+        )
         conn.execute(
             "CREATE INDEX IF NOT EXISTS idx_operation_logs_student_created "
             "ON operation_logs(student_id, created_at DESC, id DESC)"
@@ -650,6 +795,684 @@ def get_material_adjustments(student_id):
     return result
 
 
+def save_crop_points(student_id, path_key, profile_name, source_hash, points,
+                     confidence=None, detector='', canny_scale=1.0):
+    """
+    保存某个附件的自动裁剪点位识别结果（覆盖同一附件同一 canny_scale 的旧结果）。
+
+    参数:
+        student_id: 学员 ID
+        path_key: 附件字段名，如 id_card_front_path
+        profile_name: 识别使用的裁剪配置（id_card / diploma / hukou）
+        source_hash: 识别时源文件内容的 SHA-256，用于判断缓存是否失效
+        points: 原图坐标系下的 4 个角点；未识别到证件时为 None
+        confidence: 候选框置信度
+        detector: 候选框来源检测器
+        canny_scale: 识别时使用的 Canny 阈值缩放
+    """
+    with get_db_connection() as conn:
+        conn.execute(
+            '''
+            INSERT INTO material_crop_points
+                (student_id, path_key, profile_name, canny_scale, source_hash,
+                 points_json, confidence, detector)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(student_id, path_key, canny_scale) DO UPDATE SET
+                profile_name = excluded.profile_name,
+                source_hash = excluded.source_hash,
+                points_json = excluded.points_json,
+                confidence = excluded.confidence,
+                detector = excluded.detector,
+                computed_at = DATETIME(CURRENT_TIMESTAMP, 'localtime')
+            ''',
+            (
+                student_id, path_key, profile_name, float(canny_scale), source_hash,
+                json.dumps(points), confidence, detector or '',
+            )
+        )
+
+
+def get_crop_points(student_id, path_key, canny_scale=1.0):
+    """
+    获取某个附件已缓存的自动裁剪点位，不存在返回 None。
+
+    返回:
+        dict: {'profile_name', 'source_hash', 'points', 'confidence', 'detector', 'computed_at'}
+    """
+    with get_db_connection() as conn:
+        row = conn.execute(
+            '''
+            SELECT *
+            FROM material_crop_points
+            WHERE student_id = ? AND path_key = ? AND canny_scale = ?
+            ''',
+            (student_id, path_key, float(canny_scale))
+        ).fetchone()
+    if not row:
+        return None
+    item = dict(row)
+    try:
+        points = json.loads(item.get('points_json') or 'null')
+    except (TypeError, ValueError):
+        points = None
+    return {
+        'profile_name': item.get('profile_name') or '',
+        'source_hash': item.get('source_hash') or '',
+        'points': points,
+        'confidence': item.get('confidence'),
+        'detector': item.get('detector') or '',
+        'computed_at': item.get('computed_at') or '',
+    }
+
+
+def save_step_timings(job_id, timings):
+    """
+    批量写入一次材料生成的步骤耗时样本。
+
+    参数:
+        job_id: 生成任务关联 ID
+        timings: [{'scope', 'step', 'wall_ms', 'cpu_ms'}, ...]
+    """
+    rows = [
+        (job_id or '', item['scope'], item['step'], float(item.get('wall_ms') or 0), float(item.get('cpu_ms') or 0))
+        for item in timings or []
+        if item.get('scope') and item.get('step')
+    ]
+    if not rows:
+        return 0
+    with get_db_connection() as conn:
+        conn.executemany(
+            '''
+            INSERT INTO material_step_timings (job_id, scope, step, wall_ms, cpu_ms)
+            VALUES (?, ?, ?, ?, ?)
+            ''',
+            rows
+        )
+    return len(rows)
+
+
+def get_step_timings_since(since):
+    """获取 since（'YYYY-MM-DD HH:MM:SS'）之后的全部步骤耗时样本。"""
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            '''
+            SELECT scope, step, wall_ms, cpu_ms
+            FROM material_step_timings
+            WHERE created_at >= ?
+            ''',
+            (since,)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def delete_step_timings_before(before):
+    """删除 before 之前的步骤耗时样本，返回删除条数。"""
+    with get_db_connection() as conn:
+        cursor = conn.execute('DELETE FROM material_step_timings WHERE created_at < ?', (before,))
+        return cursor.rowcount
+
+
+def enqueue_cos_op(op, cos_key, src_key=''):
+    """
+    登记一条 COS 发件箱操作（op: put / copy / delete / delete_prefix）。
+
+    同一 key（delete_prefix 为前缀下所有 key）上尚未开始执行的操作会被新操作取代：新写入或删除发生后，
+    旧的待执行操作已没有意义。正在执行中（inflight）的操作不受影响，新操作会排在其后执行。
+
+    返回:
+        int: 新操作 ID
+    """
+    with get_db_connection() as conn:
+        if op == 'delete_prefix':
+            conn.execute(
+                "DELETE FROM cos_outbox WHERE substr(cos_key, 1, ?) = ? AND status IN ('pending', 'failed')",
+                (len(cos_key), cos_key)
+            )
+        else:
+            conn.execute(
+                "DELETE FROM cos_outbox WHERE cos_key = ? AND status IN ('pending', 'failed')",
+                (cos_key,)
+            )
+        cursor = conn.execute(
+            'INSERT INTO cos_outbox (op, cos_key, src_key) VALUES (?, ?, ?)',
+            (op, cos_key, src_key or '')
+        )
+        return cursor.lastrowid
+
+
+def get_pending_cos_put(cos_key):
+    """返回 cos_key 上尚未开始执行的 put 操作（不存在时返回 None）。"""
+    with get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT * FROM cos_outbox WHERE cos_key = ? AND op = 'put' AND status = 'pending'",
+            (cos_key,)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def claim_cos_ops(now, limit, lease_sec):
+    """
+    领取到期的发件箱操作并标记为 inflight（租约 lease_sec 秒）。
+
+    同一 key（含 copy 的源 key、delete_prefix 覆盖的前缀）上存在更早的未完成操作时跳过，保证同一 key 的操作按登记顺序执行。
+    租约过期的 inflight 操作（进程崩溃遗留）先退回 pending 再参与领取。
+    """
+    with get_db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(
+            "UPDATE cos_outbox SET status = 'pending' WHERE status = 'inflight' AND lease_until < ?",
+            (now,)
+        )
+        rows = conn.execute(
+            """
+            SELECT o.* FROM cos_outbox o
+            WHERE o.status = 'pending' AND o.next_attempt_at <= ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM cos_outbox p
+                  WHERE p.id < o.id AND p.status IN ('pending', 'inflight')
+                    AND (
+                        p.cos_key IN (o.cos_key, o.src_key)
+                        OR (p.src_key != '' AND p.src_key = o.cos_key)
+                        OR (p.op = 'delete_prefix' AND substr(o.cos_key, 1, length(p.cos_key)) = p.cos_key)
+                        OR (o.op = 'delete_prefix' AND substr(p.cos_key, 1, length(o.cos_key)) = o.cos_key)
+                    )
+              )
+            ORDER BY o.id
+            LIMIT ?
+            """,
+            (now, limit)
+        ).fetchall()
+        if rows:
+            conn.executemany(
+                "UPDATE cos_outbox SET status = 'inflight', lease_until = ? WHERE id = ?",
+                [(now + lease_sec, row['id']) for row in rows]
+            )
+    return [dict(row) for row in rows]
+
+
+def complete_cos_op(op_id):
+    """操作成功后从发件箱移除。"""
+    with get_db_connection() as conn:
+        conn.execute('DELETE FROM cos_outbox WHERE id = ?', (op_id,))
+
+
+def fail_cos_op(op_id, error, next_attempt_at, dead=False):
+    """记录一次失败：退回 pending 等待重试，或在超过重试上限后标记为 failed。"""
+    with get_db_connection() as conn:
+        conn.execute(
+            """
+            UPDATE cos_outbox
+            SET status = ?, attempts = attempts + 1, next_attempt_at = ?, lease_until = 0,
+                last_error = ?, updated_at = DATETIME(CURRENT_TIMESTAMP, 'localtime')
+            WHERE id = ?
+            """,
+            ('failed' if dead else 'pending', next_attempt_at, str(error)[:500], op_id)
+        )
+
+
+def retry_failed_cos_ops():
+    """把所有 failed 操作重新放回队列，返回条数。"""
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            "UPDATE cos_outbox SET status = 'pending', attempts = 0, next_attempt_at = 0 WHERE status = 'failed'"
+        )
+        return cursor.rowcount
+
+
+def get_cos_outbox_stats(now):
+    """
+    发件箱队列统计。
+
+    返回:
+        dict: {'pending', 'inflight', 'failed', 'due', 'oldest_pending_at', 'by_op'}
+    """
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            'SELECT status, op, COUNT(*) AS cnt FROM cos_outbox GROUP BY status, op'
+        ).fetchall()
+        due = conn.execute(
+            "SELECT COUNT(*) FROM cos_outbox WHERE status = 'pending' AND next_attempt_at <= ?",
+            (now,)
+        ).fetchone()[0]
+        oldest = conn.execute(
+            "SELECT MIN(created_at) FROM cos_outbox WHERE status IN ('pending', 'inflight')"
+        ).fetchone()[0]
+    stats = {'pending': 0, 'inflight': 0, 'failed': 0, 'due': due, 'oldest_pending_at': oldest, 'by_op': {}}
+    for row in rows:
+        stats[row['status']] = stats.get(row['status'], 0) + row['cnt']
+        stats['by_op'][row['op']] = stats['by_op'].get(row['op'], 0) + row['cnt']
+    return stats
+
+
+def get_unfinished_cos_ops():
+    """列出发件箱中尚未完成（pending / inflight / failed）的操作：(op, cos_key, src_key, status)。"""
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            "SELECT op, cos_key, src_key, status FROM cos_outbox WHERE status IN ('pending', 'inflight', 'failed')"
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_failed_cos_ops(limit=100):
+    """列出最近失败的发件箱操作。"""
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            "SELECT * FROM cos_outbox WHERE status = 'failed' ORDER BY id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def create_folder_migration(student_id, backend, items, lease_until=0):
+    """
+    登记一次学员文件夹迁移（local 阶段，lease_until 前由登记者独占执行）。
+
+    参数:
+        items: [{'old': 旧 key, 'new': 新 key, ...进度标记}]
+
+    返回:
+        int: 迁移日志 ID
+    """
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            'INSERT INTO folder_migrations (student_id, backend, items, lease_until) VALUES (?, ?, ?, ?)',
+            (student_id, backend, json.dumps(items, ensure_ascii=False), lease_until)
+        )
+        return cursor.lastrowid
+
+
+def claim_folder_migration(migration_id, now, lease_sec):
+    """
+    领取一条未完成的迁移（租约 lease_sec 秒），避免多个 worker 进程同时续做。
+
+    返回:
+        bool: 领取成功返回 True；已完成或正被其他执行者持有时返回 False
+    """
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            "UPDATE folder_migrations SET lease_until = ? "
+            "WHERE id = ? AND phase IN ('local', 'cos') AND lease_until < ?",
+            (now + lease_sec, migration_id, now)
+        )
+        return cursor.rowcount == 1
+
+
+def update_folder_migration(migration_id, phase=None, items=None, last_error=None,
+                            failed_attempt=False, release=False):
+    """更新迁移日志的阶段、逐文件进度或错误信息（只更新传入的字段）；release=True 时释放租约。"""
+    sets = ["updated_at = DATETIME(CURRENT_TIMESTAMP, 'localtime')"]
+    params = []
+    if release:
+        sets.append('lease_until = 0')
+    if phase is not None:
+        sets.append('phase = ?')
+        params.append(phase)
+    if items is not None:
+        sets.append('items = ?')
+        params.append(json.dumps(items, ensure_ascii=False))
+    if last_error is not None:
+        sets.append('last_error = ?')
+        params.append(last_error[:2000])
+    if failed_attempt:
+        sets.append('attempts = attempts + 1')
+    params.append(migration_id)
+    with get_db_connection() as conn:
+        conn.execute(f"UPDATE folder_migrations SET {', '.join(sets)} WHERE id = ?", params)
+
+
+def _folder_migration_row(row):
+    record = dict(row)
+    record['items'] = json.loads(record.get('items') or '[]')
+    return record
+
+
+def get_folder_migration(migration_id):
+    with get_db_connection() as conn:
+        row = conn.execute('SELECT * FROM folder_migrations WHERE id = ?', (migration_id,)).fetchone()
+    return _folder_migration_row(row) if row else None
+
+
+def get_unfinished_folder_migrations():
+    """列出尚未完成（local / cos 阶段）的迁移，按登记顺序。"""
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            "SELECT * FROM folder_migrations WHERE phase IN ('local', 'cos') ORDER BY id"
+        ).fetchall()
+    return [_folder_migration_row(row) for row in rows]
+
+
+FOLDER_INDEX_SORTS = {
+    'modified': 'mtime',
+    'name': 'name',
+    'size': 'size',
+    'file_count': 'file_count',
+}
+
+
+def get_student_attachment_keys(fields):
+    """返回 students 表中 fields 列引用的全部附件 key（去重、去空）。"""
+    with get_db_connection() as conn:
+        rows = conn.execute(f"SELECT {', '.join(fields)} FROM students").fetchall()
+    return {value for row in rows for value in row if value}
+
+
+def get_reconcile_state(name, default=None):
+    with get_db_connection() as conn:
+        row = conn.execute('SELECT value FROM reconcile_state WHERE name = ?', (name,)).fetchone()
+    return row['value'] if row else default
+
+
+def set_reconcile_state(name, value):
+    with get_db_connection() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO reconcile_state (name, value) VALUES (?, ?)', (name, str(value))
+        )
+
+
+def get_reconcile_folders():
+    """返回 {文件夹: 上次检查记录}。"""
+    with get_db_connection() as conn:
+        rows = conn.execute('SELECT * FROM reconcile_folders').fetchall()
+    return {row['folder']: dict(row) for row in rows}
+
+
+def save_reconcile_results(checked_folders, folder_rows, removed_folders, findings):
+    """
+    在一个事务内写入一次对账的结果：替换 checked_folders 的对账条目，更新文件夹记录。
+
+    参数:
+        checked_folders: 本次检查过的文件夹（其旧条目全部替换）
+        folder_rows: [{'folder', 'ref_digest', 'local_mtime', 'checked_at'}]
+        removed_folders: 本地、COS、数据库都已不存在的文件夹
+        findings: [{'key', 'folder', 'kind', 'location', 'local_size', 'local_mtime',
+                    'cos_size', 'cos_mtime', 'found_at'}]
+    """
+    with get_db_connection() as conn:
+        conn.executemany(
+            'DELETE FROM reconcile_findings WHERE folder = ?', [(folder,) for folder in checked_folders]
+        )
+        conn.executemany(
+            'INSERT OR REPLACE INTO reconcile_findings '
+            '(key, folder, kind, location, local_size, local_mtime, cos_size, cos_mtime, found_at) '
+            'VALUES (:key, :folder, :kind, :location, :local_size, :local_mtime, :cos_size, :cos_mtime, :found_at)',
+            findings
+        )
+        conn.executemany(
+            'INSERT OR REPLACE INTO reconcile_folders (folder, ref_digest, local_mtime, checked_at) '
+            'VALUES (:folder, :ref_digest, :local_mtime, :checked_at)',
+            folder_rows
+        )
+        conn.executemany(
+            'DELETE FROM reconcile_folders WHERE folder = ?', [(folder,) for folder in removed_folders]
+        )
+
+
+def get_reconcile_findings(kinds=None, limit=None):
+    """按文件夹、key 顺序列出对账条目，kinds 为 None 时不筛选。"""
+    sql = 'SELECT * FROM reconcile_findings'
+    params = []
+    if kinds:
+        sql += f" WHERE kind IN ({', '.join('?' for _ in kinds)})"
+        params.extend(kinds)
+    sql += ' ORDER BY folder, key'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(int(limit))
+    with get_db_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_reconcile_finding_folders():
+    with get_db_connection() as conn:
+        rows = conn.execute('SELECT DISTINCT folder FROM reconcile_findings').fetchall()
+    return [row['folder'] for row in rows]
+
+
+def delete_reconcile_findings(keys):
+    if not keys:
+        return
+    with get_db_connection() as conn:
+        conn.executemany('DELETE FROM reconcile_findings WHERE key = ?', [(key,) for key in keys])
+
+
+def get_folder_index_map():
+    """返回 {名称: 索引行}，供对账比较。"""
+    with get_db_connection() as conn:
+        rows = conn.execute('SELECT * FROM folder_index').fetchall()
+    return {row['name']: dict(row) for row in rows}
+
+
+def save_folder_index(rows, removed_names=()):
+    """
+    在一个事务内写入/更新索引行并删除已消失的条目。
+
+    参数:
+        rows: [{'name', 'type', 'size', 'file_count', 'mtime', 'student_id', 'indexed_at'}]
+        removed_names: 需要删除的名称
+    """
+    with get_db_connection() as conn:
+        if rows:
+            conn.executemany(
+                'INSERT OR REPLACE INTO folder_index '
+                '(name, type, size, file_count, mtime, student_id, indexed_at) '
+                'VALUES (:name, :type, :size, :file_count, :mtime, :student_id, :indexed_at)',
+                rows
+            )
+        if removed_names:
+            conn.executemany('DELETE FROM folder_index WHERE name = ?', [(name,) for name in removed_names])
+
+
+def mark_folder_index_dirty(names, marked_at):
+    """登记待刷新的顶层文件夹；已登记的更新登记时间。"""
+    with get_db_connection() as conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO folder_index_dirty (name, marked_at) VALUES (?, ?)',
+            [(name, marked_at) for name in names]
+        )
+
+
+def get_folder_index_dirty():
+    """返回 {名称: 登记时间}。"""
+    with get_db_connection() as conn:
+        rows = conn.execute('SELECT name, marked_at FROM folder_index_dirty').fetchall()
+    return {row['name']: row['marked_at'] for row in rows}
+
+
+def clear_folder_index_dirty(marks=None, before=None):
+    """
+    清除已处理的待刷新登记。处理期间重新登记的（登记时间更晚）保留到下一轮。
+
+    参数:
+        marks: {名称: 处理时读到的登记时间}
+        before: 清除登记时间不晚于该时间的全部条目（全量对账后使用）
+    """
+    with get_db_connection() as conn:
+        if marks:
+            conn.executemany(
+                'DELETE FROM folder_index_dirty WHERE name = ? AND marked_at <= ?',
+                list(marks.items())
+            )
+        if before is not None:
+            conn.execute('DELETE FROM folder_index_dirty WHERE marked_at <= ?', (before,))
+
+
+def update_folder_index_students(matches):
+    """matches: [(student_id 或 None, 名称)]"""
+    if not matches:
+        return
+    with get_db_connection() as conn:
+        conn.executemany('UPDATE folder_index SET student_id = ? WHERE name = ?', matches)
+
+
+def query_folder_index(search='', sort='modified', descending=True, offset=0, limit=None, matched=None):
+    """
+    分页查询文件浏览索引。
+
+    参数:
+        search: 名称包含的关键字（不区分大小写）
+        sort: FOLDER_INDEX_SORTS 中的字段名
+        matched: True 只看已匹配学员的文件夹，False 只看未匹配的，None 不筛选
+
+    返回:
+        tuple: (当前页的行列表, 符合条件的总数)
+    """
+    clauses, params = [], []
+    if search:
+        escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append("name LIKE ? ESCAPE '\\'")
+        params.append(f'%{escaped}%')
+    if matched is True:
+        clauses.append("type = 'directory' AND student_id IS NOT NULL")
+    elif matched is False:
+        clauses.append("type = 'directory' AND student_id IS NULL")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    column = FOLDER_INDEX_SORTS.get(sort, 'mtime')
+    direction = 'DESC' if descending else 'ASC'
+
+    with get_db_connection() as conn:
+        total = conn.execute(f'SELECT COUNT(*) FROM folder_index {where}', params).fetchone()[0]
+        sql = f'SELECT * FROM folder_index {where} ORDER BY {column} {direction}, name ASC'
+        page_params = list(params)
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            page_params += [int(limit), int(offset)]
+        rows = conn.execute(sql, page_params).fetchall()
+    return [dict(row) for row in rows], total
+
+
+def get_folder_index_summary():
+    """全部索引条目的汇总：文件夹数、文件数、总大小、已匹配/未匹配文件夹数。"""
+    with get_db_connection() as conn:
+        row = conn.execute('''
+            SELECT
+                COALESCE(SUM(type = 'directory'), 0) AS directories,
+                COALESCE(SUM(type = 'file'), 0) AS files,
+                COALESCE(SUM(size), 0) AS size,
+                COALESCE(SUM(type = 'directory' AND student_id IS NOT NULL), 0) AS matched,
+                COALESCE(SUM(type = 'directory' AND student_id IS NULL), 0) AS unmatched
+            FROM folder_index
+        ''').fetchone()
+    return dict(row)
+
+
+def get_folder_index_changed_since(since):
+    """返回 indexed_at 晚于 since 的索引条目名称（增量对账的变更来源）。"""
+    with get_db_connection() as conn:
+        rows = conn.execute('SELECT name FROM folder_index WHERE indexed_at > ?', (since,)).fetchall()
+    return [row['name'] for row in rows]
+
+
+def get_student_name_lookup():
+    """
+    构建 (姓名, 公司) -> student_id 与 姓名 -> [student_id, ...] 两个查找字典（全表扫描一次）。
+    """
+    name_company_map = {}
+    name_map = {}
+    with get_db_connection() as conn:
+        rows = conn.execute('SELECT id, name, company FROM students ORDER BY id').fetchall()
+    for row in rows:
+        name_company_map[(row['name'], row['company'] or '')] = row['id']
+        name_map.setdefault(row['name'], []).append(row['id'])
+    return name_company_map, name_map
+
+
+def find_student_id_by_name(name, company):
+    """
+    按姓名 + 公司精确查找学员（同名同公司取最新一条），找不到时退回仅按姓名匹配（取最早一条）。
+    与 get_student_name_lookup 的匹配结果一致，走 idx_students_name_company 索引。
+    """
+    with get_db_connection() as conn:
+        row = conn.execute(
+            'SELECT MAX(id) FROM students WHERE name = ? AND company = ?', (name, company)
+        ).fetchone()
+        if row[0]:
+            return row[0]
+        row = conn.execute('SELECT MIN(id) FROM students WHERE name = ?', (name,)).fetchone()
+    return row[0]
+
+
+# 归档时随学员一起迁出的关联表（按 student_id 关联）
+ARCHIVE_RELATED_TABLES = ('material_adjustments', 'material_crop_points')
+
+
+def get_archive_candidates(statuses, created_before, limit=None):
+    """
+    列出可归档的学员 ID：状态在 statuses 中、创建时间早于 created_before，且没有未完成的文件夹迁移。
+
+    参数:
+        statuses: 终态列表，如 ('exam_passed', 'rejected')
+        created_before: 'YYYY-MM-DD HH:MM:SS' 格式的时间（与 created_at 同格式比较）
+    """
+    if not statuses:
+        return []
+    sql = (
+        f"SELECT id FROM students s WHERE status IN ({', '.join('?' for _ in statuses)}) "
+        "AND created_at < ? AND NOT EXISTS ("
+        "SELECT 1 FROM folder_migrations m WHERE m.student_id = s.id AND m.phase IN ('local', 'cos')"
+        ") ORDER BY id"
+    )
+    params = [*statuses, created_before]
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(int(limit))
+    with get_db_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [row['id'] for row in rows]
+
+
+def get_student_archive_rows(student_id):
+    """
+    读取学员的原始记录与关联表行（不做 training_projects 字典合并），学员不存在返回 None。
+
+    返回:
+        dict: {'student': 学员行, 'related': {表名: [行, ...]}}
+    """
+    with get_db_connection() as conn:
+        student = conn.execute('SELECT * FROM students WHERE id = ?', (student_id,)).fetchone()
+        if not student:
+            return None
+        related = {
+            table: [dict(row) for row in conn.execute(
+                f'SELECT * FROM {table} WHERE student_id = ? ORDER BY id', (student_id,)
+            ).fetchall()]
+            for table in ARCHIVE_RELATED_TABLES
+        }
+    return {'student': dict(student), 'related': related}
+
+
+def get_students_with_name(name, company, exclude_id=None):
+    """列出同姓名、同单位的其他学员（id, training_type, company, name），用于判断学员文件夹是否共用。"""
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            'SELECT id, training_type, company, name FROM students WHERE name = ? AND company = ? AND id != ?',
+            (name, company, exclude_id or 0)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def restore_student_rows(student, related):
+    """
+    按原 ID 写回归档学员及其关联表行（一个事务内完成）。
+
+    只写入当前表结构中存在的列，归档后新增/删除的列不影响恢复；关联表行重新分配自增 ID。
+
+    异常:
+        DatabaseError: 同 ID 的学员已存在时抛出
+    """
+    with get_db_connection() as conn:
+        if conn.execute('SELECT 1 FROM students WHERE id = ?', (student['id'],)).fetchone():
+            raise DatabaseError(f"学员 ID {student['id']} 已存在，无法恢复")
+        for table, rows in [('students', [student])] + [(t, related.get(t, [])) for t in ARCHIVE_RELATED_TABLES]:
+            columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+            for row in rows:
+                values = {k: v for k, v in row.items() if k in columns and (table == 'students' or k != 'id')}
+                conn.execute(
+                    f"INSERT INTO {table} ({', '.join(values)}) VALUES ({', '.join('?' for _ in values)})",
+                    list(values.values())
+                )
+
+
 def create_student(data, file_paths):
     """
     创建新的学员记录。
@@ -890,6 +1713,7 @@ def delete_student(student_id):
             raise NotFoundError('学员不存在')
 
         conn.execute('DELETE FROM material_adjustments WHERE student_id = ?', (student_id,))
+        conn.execute('DELETE FROM material_crop_points WHERE student_id = ?', (student_id,))
         conn.execute('DELETE FROM students WHERE id = ?', (student_id,))
         return dict(student)
 
@@ -5,8 +5,10 @@
 
 API 端点:
     GET /students/<path:filename>          - 访问学员附件文件
-    GET /api/files/browse                  - 列出 students/ 下所有文件夹
-    GET /api/files/browse/<path:folder>    - 列出指定文件夹内的文件
+    GET /thumbs/<size>/<path:filename>     - 访问学员附件缩略图（按需生成，磁盘缓存）
+    POST /api/thumbs/batch                 - 批量获取缩略图
+    GET /api/files/browse                  - 列出 students/ 下所有文件夹（来自 folder_index 索引，支持分页/排序/搜索）
+    GET /api/files/browse/<path:folder>    - 列出指定文件夹内的文件（支持分页/排序/搜索）
 
 文件存储结构:
     students/
@@ -24,11 +26,10 @@ API 端点:
     不易被猜测，且文件内容为学员自行上传的资料。
     /api/files/browse 系列端点受 session 认证保护。
 """
-from flask import Blueprint, current_app, jsonify, redirect, request, send_from_directory
-from models.student import get_db_connection
-from services import storage_service
+from flask import Blueprint, current_app, jsonify, redirect, request, send_file, send_from_directory
+from services import folder_index_service, image_variant_service, storage_service, thumbnail_service
+import base64
 import os
-import sqlite3
 
 
 # 创建文件服务蓝图
@@ -84,36 +85,108 @@ def serve_students(filename):
 
 
 
-# ======================== 图片扩展名集合 ========================
-IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+# 缩略图缓存时间：URL 带内容版本号（?v=<etag>）时视为不可变，否则短期缓存后按 ETag 重新验证
+THUMB_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+THUMB_REVALIDATE_MAX_AGE = 300
 
 
-def _get_dir_size(path):
-    """递归计算目录总大小（字节）。"""
-    total = 0
-    try:
-        for entry in os.scandir(path):
-            if entry.is_file(follow_symlinks=False):
-                total += entry.stat(follow_symlinks=False).st_size
-            elif entry.is_dir(follow_symlinks=False):
-                total += _get_dir_size(entry.path)
-    except PermissionError:
-        pass
-    return total
-
-
-def _count_files(path):
-    """递归统计目录内文件数量。"""
-    count = 0
+def _thumb_url(size, key, etag=None):
+    url = f"/thumbs/{size}/{key[len('students/'):]}"
+    return f'{url}?v={etag}' if etag else url
+
+
+@file_bp.route('/thumbs/<size>/<path:filename>')
+def serve_thumbnail(size, filename):
+    """
+    提供学员附件的缩略图（JPEG / WebP，见 thumbnail_service）。
+
+    参数:
+        size (str): 尺寸档位（s/m/l/xl 或对应像素值）
+        filename (str): 相对于 students 目录的原图路径
+
+    查询参数:
+        fmt: jpeg / webp（缺省时按 Accept 头协商）
+        v:   内容版本号（即 ETag），与当前内容一致时返回长期缓存头
+
+    返回:
+        200: 缩略图内容（带强 ETag）
+        304: If-None-Match 命中
+        404: 档位不支持、原图不存在或无法解码
+    """
+    max_side = thumbnail_service.resolve_size(size)
+    if not max_side or '..' in filename.split('/'):
+        return "缩略图不存在", 404
+
+    fmt = thumbnail_service.resolve_format(request.args.get('fmt'), request.headers.get('Accept', ''))
     try:
-        for entry in os.scandir(path):
-            if entry.is_file(follow_symlinks=False):
-                count += 1
-            elif entry.is_dir(follow_symlinks=False):
-                count += _count_files(entry.path)
-    except PermissionError:
-        pass
-    return count
+        thumb = thumbnail_service.get_thumbnail(f'students/{filename}', max_side, fmt)
+    except Exception as e:
+        current_app.logger.error(f'Error serving thumbnail {filename}: {str(e)}')
+        thumb = None
+    if not thumb:
+        return "缩略图不存在", 404
+
+    resp = send_file(thumb['path'], mimetype=thumb['mimetype'], etag=thumb['etag'], conditional=True)
+    if request.args.get('v') == thumb['etag']:
+        resp.headers['Cache-Control'] = f'public, max-age={THUMB_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        resp.headers['Cache-Control'] = f'public, max-age={THUMB_REVALIDATE_MAX_AGE}'
+    if not request.args.get('fmt'):
+        resp.headers['Vary'] = 'Accept'
+    resp.headers['Content-Disposition'] = 'inline'
+    return resp
+
+
+@file_bp.route('/api/thumbs/batch', methods=['POST'])
+def batch_thumbnails():
+    """
+    批量获取缩略图，一次请求返回多张附件的缩略图。
+
+    请求体 (JSON):
+        paths:  存储 key 列表，如 ["students/xxx/yyy.jpg", ...]（最多 100 个）
+        size:   尺寸档位（默认 m）
+        format: jpeg / webp（默认按 Accept 头协商）
+        inline: 是否内联返回图片数据（data URI，默认 true）
+
+    返回:
+        {"size": 320, "format": "jpeg", "items": {key: {"url", "etag", "data"} 或 null}}
+        url 带内容版本号，可被浏览器长期缓存
+    """
+    data = request.get_json(silent=True) or {}
+    paths = data.get('paths') or []
+    if not isinstance(paths, list):
+        return jsonify({'error': 'paths 必须为数组'}), 400
+    if len(paths) > thumbnail_service.THUMB_BATCH_MAX:
+        return jsonify({'error': f'一次最多请求 {thumbnail_service.THUMB_BATCH_MAX} 张缩略图'}), 400
+
+    size_token = str(data.get('size') or 'm')
+    max_side = thumbnail_service.resolve_size(size_token)
+    if not max_side:
+        return jsonify({'error': '不支持的缩略图尺寸'}), 400
+    fmt = thumbnail_service.resolve_format(data.get('format'), request.headers.get('Accept', ''))
+    inline = data.get('inline', True) is not False
+
+    keys = []
+    for raw in paths:
+        key = str(raw or '').strip().replace('\\', '/').lstrip('/')
+        if key.startswith('students/') and '..' not in key.split('/'):
+            keys.append(key)
+
+    items = {str(raw): None for raw in paths}
+    for key, thumb in thumbnail_service.get_thumbnails(keys, max_side, fmt).items():
+        if not thumb:
+            continue
+        item = {'url': _thumb_url(size_token, key, thumb['etag']), 'etag': thumb['etag']}
+        if inline:
+            with open(thumb['path'], 'rb') as f:
+                encoded = base64.b64encode(f.read()).decode('ascii')
+            item['data'] = f"data:{thumb['mimetype']};base64,{encoded}"
+        items[key] = item
+
+    return jsonify({'size': max_side, 'format': fmt, 'items': items})
+
+# ======================== 图片扩展名集合 ========================
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
 
 
 def _format_size(size_bytes):
@@ -128,47 +201,42 @@ def _format_size(size_bytes):
         return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
 
 
-def _build_student_lookup():
-    """
-    从数据库加载所有学员，构建 (姓名, 公司) -> student_id 的查找字典。
-    同时构建 姓名 -> [student_id, ...] 的备用查找。
+def _parse_listing_args():
     """
-    name_company_map = {}
-    name_map = {}
-    try:
-        with get_db_connection() as conn:
-            rows = conn.execute(
-                'SELECT id, name, company, training_type FROM students'
-            ).fetchall()
-            for row in rows:
-                r = dict(row)
-                key = (r['name'], r.get('company', ''))
-                name_company_map[key] = r['id']
-                name_map.setdefault(r['name'], []).append(r['id'])
-    except Exception:
-        pass
-    return name_company_map, name_map
-
-
-def _match_folder_to_student(folder_name, name_company_map, name_map):
-    """
-    尝试将文件夹名匹配到数据库学员记录。
-    文件夹名格式: 培训类型-公司名-姓名
-    返回 (matched: bool, student_id: int|None)
+    解析列表接口的分页/排序/搜索参数。
+
+    返回:
+        dict: {'search', 'sort', 'descending', 'page', 'page_size'}；
+              未传 page/page_size 时 page_size 为 None（返回全部条目，兼容旧调用方）
     """
-    parts = folder_name.split('-', 2)
-    if len(parts) == 3:
-        company = parts[1]
-        name = parts[2]
-        # 精确匹配：姓名 + 公司
-        sid = name_company_map.get((name, company))
-        if sid:
-            return True, sid
-        # 备用：仅姓名匹配
-        ids = name_map.get(name, [])
-        if ids:
-            return True, ids[0]
-    return False, None
+    args = request.args
+    page_size = None
+    if 'page' in args or 'page_size' in args:
+        page_size = args.get('page_size', type=int) or folder_index_service.DEFAULT_PAGE_SIZE
+    return {
+        'search': (args.get('q') or '').strip(),
+        'sort': args.get('sort') or 'modified',
+        'descending': (args.get('order') or 'desc').lower() != 'asc',
+        'page': args.get('page', 1, type=int) or 1,
+        'page_size': page_size,
+    }
+
+
+def _index_row_to_item(row):
+    item = {
+        'name': row['name'],
+        'type': row['type'],
+        'size': row['size'],
+        'size_display': _format_size(row['size']),
+        'modified': row['mtime'],
+    }
+    if row['type'] == 'directory':
+        item.update(
+            file_count=row['file_count'],
+            matched=row['student_id'] is not None,
+            student_id=row['student_id'],
+        )
+    return item
 
 
 @file_bp.route('/api/files/browse')
@@ -176,49 +244,45 @@ def browse_folders():
     """
     列出 students/ 下所有子项（文件夹和文件）。
     返回每个文件夹的名称、大小、文件数、是否匹配数据库学员。
+
+    数据来自 folder_index 索引（见 folder_index_service），不再逐个文件夹递归统计。
+
+    查询参数:
+        page / page_size: 分页（传入任一参数时返回分页结构，否则返回全部条目的数组）
+        sort: modified（默认）/ name / size / file_count
+        order: desc（默认）/ asc
+        q: 名称搜索关键字
+        matched: 1 只看已匹配学员的文件夹，0 只看未匹配的
+
+    返回（分页时）:
+        {'items', 'total', 'page', 'page_size', 'summary': {'directories', 'files', 'size', 'matched', 'unmatched'}}
     """
     students_dir = current_app.config['STUDENTS_FOLDER']
     if not os.path.isdir(students_dir):
         return jsonify([])
 
-    name_company_map, name_map = _build_student_lookup()
-    items = []
-
+    options = _parse_listing_args()
+    matched = request.args.get('matched')
     try:
-        # 按修改时间倒序排列（最新的在前面）
-        for entry in sorted(os.scandir(students_dir), key=lambda e: e.stat(follow_symlinks=False).st_mtime, reverse=True):
-            if entry.is_dir(follow_symlinks=False):
-                full_path = entry.path
-                size = _get_dir_size(full_path)
-                file_count = _count_files(full_path)
-                matched, student_id = _match_folder_to_student(
-                    entry.name, name_company_map, name_map
-                )
-                stat = entry.stat(follow_symlinks=False)
-                items.append({
-                    'name': entry.name,
-                    'type': 'directory',
-                    'size': size,
-                    'size_display': _format_size(size),
-                    'file_count': file_count,
-                    'matched': matched,
-                    'student_id': student_id,
-                    'modified': stat.st_mtime,
-                })
-            elif entry.is_file(follow_symlinks=False):
-                stat = entry.stat(follow_symlinks=False)
-                items.append({
-                    'name': entry.name,
-                    'type': 'file',
-                    'size': stat.st_size,
-                    'size_display': _format_size(stat.st_size),
-                    'modified': stat.st_mtime,
-                })
+        result = folder_index_service.browse(
+            students_dir,
+            matched={'1': True, '0': False}.get(matched),
+            **options
+        )
     except Exception as e:
         current_app.logger.error(f'Error browsing students folder: {e}')
         return jsonify({'error': str(e)}), 500
 
-    return jsonify(items)
+    items = [_index_row_to_item(row) for row in result['rows']]
+    if options['page_size'] is None:
+        return jsonify(items)
+    return jsonify({
+        'items': items,
+        'total': result['total'],
+        'page': result['page'],
+        'page_size': result['page_size'],
+        'summary': result['summary'],
+    })
 
 
 @file_bp.route('/api/files/browse/<path:folder_name>')
@@ -226,6 +290,9 @@ def browse_folder_contents(folder_name):
     """
     列出指定文件夹内的文件和子文件夹。
     支持多级路径，如 "学员文件夹/子文件夹"。
+
+    查询参数与 /api/files/browse 相同（page / page_size / sort / order / q）；
+    默认文件夹在前、按名称升序。只为当前页的子文件夹统计大小与文件数。
     """
     students_dir = current_app.config['STUDENTS_FOLDER']
     target_dir = os.path.normpath(os.path.join(students_dir, folder_name))
@@ -237,40 +304,86 @@ def browse_folder_contents(folder_name):
     if not os.path.isdir(target_dir):
         return jsonify({'error': '文件夹不存在'}), 404
 
-    items = []
+    options = _parse_listing_args()
+    search = options['search'].lower()
     try:
-        for entry in sorted(os.scandir(target_dir), key=lambda e: (not e.is_dir(), e.name)):
+        entries = []
+        for entry in os.scandir(target_dir):
+            # 隐藏目录（.variants 缩略图/分析图变体）不在文件浏览中展示
+            if entry.name.startswith('.'):
+                continue
+            if search and search not in entry.name.lower():
+                continue
             if entry.is_dir(follow_symlinks=False):
-                stat = entry.stat(follow_symlinks=False)
-                size = _get_dir_size(entry.path)
+                entries.append({'entry': entry, 'type': 'directory'})
+            elif entry.is_file(follow_symlinks=False):
+                entries.append({'entry': entry, 'type': 'file'})
+
+        sort = options['sort'] if 'sort' in request.args else 'name'
+        for record in entries:
+            stat = record['entry'].stat(follow_symlinks=False)
+            record['modified'] = stat.st_mtime
+            if record['type'] == 'file':
+                record['size'], record['file_count'] = stat.st_size, 0
+            elif sort in ('size', 'file_count'):
+                record['size'], record['file_count'] = folder_index_service.dir_stats(record['entry'].path)
+        # 文件夹始终排在文件前面
+        sort_key = {
+            'name': lambda r: r['entry'].name,
+            'modified': lambda r: r['modified'],
+            'size': lambda r: r['size'],
+            'file_count': lambda r: r['file_count'],
+        }.get(sort, lambda r: r['entry'].name)
+        default_order = 'asc' if sort == 'name' else 'desc'
+        descending = (request.args.get('order') or default_order).lower() != 'asc'
+        entries.sort(key=sort_key, reverse=descending)
+        entries.sort(key=lambda r: r['type'] != 'directory')
+
+        total = len(entries)
+        page_size = options['page_size']
+        page = max(1, options['page'])
+        if page_size is not None:
+            page_size = min(folder_index_service.MAX_PAGE_SIZE, max(1, page_size))
+            entries = entries[(page - 1) * page_size:page * page_size]
+
+        items = []
+        for record in entries:
+            entry = record['entry']
+            if record['type'] == 'directory':
+                if 'size' not in record:
+                    record['size'], record['file_count'] = folder_index_service.dir_stats(entry.path)
                 items.append({
                     'name': entry.name,
                     'type': 'directory',
-                    'size': size,
-                    'size_display': _format_size(size),
-                    'file_count': _count_files(entry.path),
-                    'modified': stat.st_mtime,
+                    'size': record['size'],
+                    'size_display': _format_size(record['size']),
+                    'file_count': record['file_count'],
+                    'modified': record['modified'],
                 })
-            elif entry.is_file(follow_symlinks=False):
-                stat = entry.stat(follow_symlinks=False)
+            else:
                 ext = os.path.splitext(entry.name)[1].lower()
                 is_image = ext in IMAGE_EXTENSIONS
                 # 返回相对路径，前端请求 /students/... 时 serve_students 会透明重定向到 COS
                 preview_url = f'/students/{folder_name}/{entry.name}' if is_image else None
+                # 列表使用缩略图服务，预览大图仍使用原图
+                thumb_url = _thumb_url('m', f'students/{folder_name}/{entry.name}') if is_image else None
                 items.append({
                     'name': entry.name,
                     'type': 'file',
-                    'size': stat.st_size,
-                    'size_display': _format_size(stat.st_size),
-                    'modified': stat.st_mtime,
+                    'size': record['size'],
+                    'size_display': _format_size(record['size']),
+                    'modified': record['modified'],
                     'is_image': is_image,
                     'preview_url': preview_url,
+                    'thumb_url': thumb_url,
                 })
     except Exception as e:
         current_app.logger.error(f'Error browsing folder {folder_name}: {e}')
         return jsonify({'error': str(e)}), 500
 
-    return jsonify(items)
+    if page_size is None:
+        return jsonify(items)
+    return jsonify({'items': items, 'total': total, 'page': page, 'page_size': page_size})
 
 
 @file_bp.route('/api/files/delete', methods=['POST'])
@@ -307,15 +420,26 @@ def delete_local_file():
     try:
         if os.path.isfile(target):
             os.remove(target)
+            # 同步删除该文件的缩略图/分析图变体
+            variant_dir = None
+            for variant_rel in image_variant_service.all_variant_keys(rel_path):
+                variant_path = os.path.join(students_dir, variant_rel)
+                variant_dir = os.path.dirname(variant_path)
+                if os.path.isfile(variant_path):
+                    os.remove(variant_path)
+            if variant_dir and os.path.isdir(variant_dir) and not os.listdir(variant_dir):
+                os.rmdir(variant_dir)
             # 如果父目录变成空了，顺手删掉空目录
             parent = os.path.dirname(target)
             if os.path.isdir(parent) and not os.listdir(parent):
                 os.rmdir(parent)
+            folder_index_service.mark_changed(f'students/{rel_path}')
             current_app.logger.warning(f'管理员通过文件管理面板删除本地文件: {rel_path}')
             return jsonify({'success': True, 'message': '文件已删除'})
         elif os.path.isdir(target):
             import shutil
             shutil.rmtree(target)
+            folder_index_service.mark_changed(f'students/{rel_path}')
             current_app.logger.warning(f'管理员通过文件管理面板删除本地文件夹: {rel_path}')
             return jsonify({'success': True, 'message': '文件夹已删除'})
         else:
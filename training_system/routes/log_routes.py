@@ -4,10 +4,15 @@
 本模块提供管理后台的系统日志查看功能：
 - GET /admin/logs      : 渲染日志查看器页面
 - GET /api/logs/content: 获取最新的日志内容（支持普通 app.log 和错误 error.log）
+- GET /admin/pipeline_timings      : 渲染材料生成步骤耗时页面
+- GET /api/logs/pipeline_timings   : 获取各材料各步骤的耗时分位数与直方图
+- GET /api/logs/cos_outbox         : 获取 COS 同步发件箱的队列统计与最近失败记录
 """
 import os
 from flask import Blueprint, current_app, jsonify, render_template, request
 
+from services import cos_outbox_service, pipeline_metrics_service
+
 log_bp = Blueprint('logs', __name__)
 
 @log_bp.route('/admin/logs')
@@ -61,3 +66,43 @@ def get_log_content():
         'success': True,
         'lines': lines
     })
+
+
+@log_bp.route('/admin/pipeline_timings')
+def admin_pipeline_timings():
+    """渲染材料生成步骤耗时页面（受统一登录保护）。"""
+    return render_template('pipeline_timings_admin.html')
+
+
+@log_bp.route('/api/logs/pipeline_timings')
+def get_pipeline_timings():
+    """
+    获取材料生成各 (材料, 步骤) 的墙钟/CPU 耗时 p50、p95 与直方图。
+    查询参数:
+        days: 统计窗口天数（默认 7，最大 90）
+    """
+    try:
+        days = int(request.args.get('days', 7))
+        days = max(1, min(days, 90))
+    except ValueError:
+        days = 7
+
+    try:
+        summary = pipeline_metrics_service.summarize(days)
+    except Exception as e:
+        current_app.logger.error(f"统计步骤耗时失败: {str(e)}")
+        return jsonify({'success': False, 'error': '统计步骤耗时失败'}), 500
+
+    return jsonify(dict(summary, success=True))
+
+
+@log_bp.route('/api/logs/cos_outbox')
+def get_cos_outbox_metrics():
+    """获取 COS 同步发件箱的待执行/执行中/失败数量、最早积压时间与最近失败记录。"""
+    try:
+        metrics = cos_outbox_service.get_metrics()
+    except Exception as e:
+        current_app.logger.error(f"获取 COS 发件箱统计失败: {str(e)}")
+        return jsonify({'success': False, 'error': '获取 COS 发件箱统计失败'}), 500
+
+    return jsonify(dict(metrics, success=True))
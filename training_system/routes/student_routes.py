@@ -15,6 +15,10 @@ API 端点列表:
     POST   /api/students/<id>/mark_exam_passed  - 标记理论考试通过
     GET    /api/students/<id>/attachments.zip   - 打包下载学员所有附件
     GET    /api/companies                       - 获取公司名称列表
+    POST   /api/students/<id>/archive           - 归档学员（附件打包，记录迁入归档库）
+    GET    /api/students/archived               - 检索归档学员
+    GET    /api/students/archived/<id>          - 获取归档学员详情
+    POST   /api/students/archived/<id>/restore  - 从归档恢复学员
 
 权限控制:
     - 创建学员：任何已认证用户（含小程序普通用户）
@@ -24,22 +28,28 @@ API 端点列表:
     - 审核/驳回：仅管理员
     - 打包下载：仅管理员
     - 公司列表：仅管理员
+    - 归档/检索/恢复：仅管理员
 
 附件管理规则:
     - 特种作业 (special_operation)  : 必传学历证书、身份证正反面
     - 特种设备 (special_equipment)  : 必传个人照片、学历证书、身份证正反面、户口本户籍页和个人页
 """
 from functools import wraps
-from flask import Blueprint, request, jsonify, current_app, g, session
+from flask import Blueprint, Response, request, jsonify, current_app, g, session, stream_with_context
 from models.student import (
     create_student, get_students, get_student_by_id, update_student,
     delete_student, get_companies, get_material_adjustments, save_material_adjustment
 )
 from services.wechat_service import send_review_result_message, broadcast_new_student_to_admins
 from services.image_service import process_and_save_file, delete_student_files
-from services.student_folder_service import migrate_student_files, MigrationError, MigrationRollbackError
+from services.student_folder_service import (
+    migrate_student_files, MigrationError, MigrationRollbackError, get_student_folder_prefix,
+)
 from services.document_service import generate_health_check_form
-from services import exam_bank_service, storage_service
+from services import (
+    crop_precompute_service, exam_bank_service, folder_index_service, image_worker_pool,
+    pipeline_metrics_service, storage_service, student_archive_service, zip_stream_service,
+)
 from services.operation_log_service import get_student_operation_logs, log_student_operation
 from services.student_serializer import enrich_student, enrich_students
 from utils.validators import validate_student_data, validate_file_upload
@@ -52,8 +62,6 @@ from utils.auth import (
     resolve_web_admin_name,
 )
 import os
-import io
-import zipfile
 import time
 
 
@@ -607,6 +615,9 @@ def create_student_route():
                 }
             )
         
+        # 后台预计算证件裁剪点位，管理员打开裁剪编辑器时可直接读取缓存
+        crop_precompute_service.schedule_student(student_id)
+
         # 异步/非阻塞方式发送给所有管理员（基于小程序订阅消息）
         broadcast_new_student_to_admins(student_name=student_payload.get('name', ''))
 
@@ -1034,6 +1045,7 @@ def update_student_route(id):
             new_rel = updated_student.get(db_key, '')
             if old_rel and old_rel != new_rel:
                 delete_student_files({db_key: old_rel}, current_app.config['BASE_DIR'])
+        crop_precompute_service.schedule_student(id)
 
         # 检查是否是从被驳回修改为重新提交（待审核）状态
         is_resubmitted = (
@@ -1144,6 +1156,7 @@ def upload_student_attachment_route(id):
         # 成功更新数据库后，清理因改名导致路径变更产生的孤儿旧文件
         if old_rel and old_rel != rel:
             delete_student_files({db_key: old_rel}, current_app.config['BASE_DIR'])
+        crop_precompute_service.schedule_student(id)
 
         log_student_operation(
             id,
@@ -1191,7 +1204,9 @@ def miniprogram_upload_attachment_route():
         company       : 公司名称（用于文件命名，可选）
 
     返回:
-        200: {"success": true, "path": "students/...", "file_type": "photo"}
+        200: {"success": true, "path": "students/...", "file_type": "photo", "quality": {...}}
+             quality 为上传质量检查结果（verdict: pass/warn/fail，issues 为提示列表），
+             非图片文件为 null
     """
     try:
         upload_file = request.files.get('file')
@@ -1209,8 +1224,8 @@ def miniprogram_upload_attachment_route():
 
         validate_file_upload(upload_file)
 
-        # 保存到临时目录（提交时再 move 到正式目录）
-        from services.image_service import save_temp_file
+        # 保存到临时目录（提交时再 move 到正式目录），同时完成上传质量检查
+        from services.image_service import get_upload_quality, save_temp_file
         tmp_rel = save_temp_file(upload_file, file_type)
         if not tmp_rel:
             raise AppError('临时文件保存失败', status_code=500)
@@ -1218,7 +1233,8 @@ def miniprogram_upload_attachment_route():
         return jsonify({
             'success': True,
             'path': tmp_rel,
-            'file_type': file_type
+            'file_type': file_type,
+            'quality': get_upload_quality(tmp_rel),
         })
 
     except (ValidationError, AppError) as e:
@@ -1237,7 +1253,7 @@ def miniprogram_sync_cos_route():
         file_type : 附件类型
     
     返回:
-        200: {"success": true, "path": "students/...", "file_type": "photo"}
+        200: {"success": true, "path": "students/...", "file_type": "photo", "quality": {...}}
     """
     try:
         data = request.json or {}
@@ -1261,11 +1277,16 @@ def miniprogram_sync_cos_route():
         # 因为 cos_key 本身已经包含了类似 tmp/... 的 uuid 格式，
         # 且已被 pull_from_cos 放置在了本地严格对应的文件位置上，
         # 在最终提交表单时，commit_temp_files 会顺畅地处理这些文件。
-        
+        from services.storage_service import read_local
+        from services.upload_quality_service import assess_image_bytes
+        local_data = read_local(cos_key)
+        quality = assess_image_bytes(local_data, file_type) if local_data else None
+
         return jsonify({
             'success': True,
             'path': cos_key,
-            'file_type': file_type
+            'file_type': file_type,
+            'quality': quality,
         })
     except (ValidationError, AppError) as e:
         return jsonify(e.to_dict()), e.status_code
@@ -1413,9 +1434,7 @@ def approve_student_route(id):
         # ---- 1. 先自动生成报名材料（人脸会被裁剪/白底处理，并在本地生成结果） ----
         materials_ok = False
         try:
-            from services.material_service import generate_student_materials
-            import io as _io
-            import contextlib
+            from services.material_service import capture_logs, generate_student_materials
 
             base_dir = current_app.config['BASE_DIR']
             output_root = current_app.config['STUDENTS_FOLDER']
@@ -1429,13 +1448,12 @@ def approve_student_route(id):
             student_folder_name = f"{training_type_name}-{company}-{student_name}"
             actual_output_root = os.path.join(output_root, student_folder_name)
 
-            log_buffer = _io.StringIO()
-            with contextlib.redirect_stdout(log_buffer):
-                report = generate_student_materials(current_student, base_dir, actual_output_root)
-
-            for line in log_buffer.getvalue().splitlines():
-                if line.strip():
-                    current_app.logger.info(line)
+            with capture_logs() as job_log:
+                report = image_worker_pool.run(generate_student_materials, current_student, base_dir, actual_output_root)
+            # 生成文件由子进程直接写盘，在此登记学员文件夹待刷新浏览索引
+            folder_index_service.mark_changed(get_student_folder_prefix(current_student))
+            job_log.flush_to(current_app.logger)
+            pipeline_metrics_service.record_report(report)
 
             materials_ok = bool(report.get('success'))
             if materials_ok:
@@ -1457,6 +1475,8 @@ def approve_student_route(id):
         if health_check_path:
             updates['training_form_path'] = health_check_path
         student = update_student(id, updates)
+        # 审核通过后管理员可能随即调整裁剪，提前补齐尚未预计算的点位
+        crop_precompute_service.schedule_student(id)
 
         # 发送微信推送消息
         submitter_openid = student.get('submitter_openid')
@@ -1801,7 +1821,7 @@ def download_attachments_zip_route(id):
     将学员所有附件打包为 ZIP 下载。
 
     仅对已审核学员可用。将学员的所有附件文件（照片、证书、体检表等）
-    打包为 ZIP 文件，通过内存缓冲区直接返回给客户端。
+    打包为 ZIP 文件，边读取边以流式响应返回给客户端（见 zip_stream_service）。
 
     ZIP 文件命名格式: <身份证号>-<姓名>.zip
 
@@ -1829,37 +1849,23 @@ def download_attachments_zip_route(id):
             'training_form_path'
         ]
 
-        # 收集实际存在的附件文件
+        # 收集附件文件（cos-only 模式无本地文件，按数据库记录打包，缺失文件在打包时跳过）
+        cos_only = storage_service._get_backend() == 'cos'
         files_to_zip = []
         for key in attachment_keys:
-            rel = student.get(key, '')
+            rel = (student.get(key, '') or '').replace('\\', '/')
             if not rel:
                 continue
-            abs_path = os.path.join(current_app.config['BASE_DIR'], rel)
-            if os.path.exists(abs_path) and os.path.isfile(abs_path):
+            if cos_only or storage_service.file_exists_local(rel):
                 # 使用文件名作为 ZIP 内的存档名
-                arcname = os.path.basename(abs_path)
-                files_to_zip.append((abs_path, arcname))
+                files_to_zip.append((rel, os.path.basename(rel)))
 
         if not files_to_zip:
             return jsonify({'error': '该学员暂无可打包的附件'}), 400
 
-        # 在内存中创建 ZIP 文件（避免写入临时文件）
-        buffer = io.BytesIO()
-        with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
-            for abs_path, arcname in files_to_zip:
-                try:
-                    zf.write(abs_path, arcname)
-                except Exception as e:
-                    current_app.logger.error(f'Failed to add file to ZIP: {str(e)}')
-
-        # 将读取位置重置到开头
-        buffer.seek(0)
-
-        from flask import send_file
         # 生成安全的文件名（移除路径分隔符）
         safe_name = f"{student.get('id_card','')}-{student.get('name','')}".replace('/', '-').replace('\\', '-')
-        current_app.logger.info(f'Attachments ZIP generated for student ID={id}')
+        current_app.logger.info(f'Attachments ZIP streaming for student ID={id}')
         log_student_operation(
             id,
             'attachments_zip_downloaded',
@@ -1872,11 +1878,11 @@ def download_attachments_zip_route(id):
             }
         )
 
-        return send_file(
-            buffer,
+        # 边读边发送，不在内存中生成完整 ZIP
+        return Response(
+            stream_with_context(zip_stream_service.stream_zip(files_to_zip)),
             mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"{safe_name}.zip"
+            headers=zip_stream_service.attachment_headers(f"{safe_name}.zip"),
         )
 
     except NotFoundError as e:
@@ -2021,9 +2027,7 @@ def generate_materials_route(id):
         if student.get('status') not in PROCESSED_STUDENT_STATUSES:
             return jsonify({'error': '仅支持已审核、已报名或考试通过学员生成报名材料'}), 400
             
-        from services.material_service import generate_student_materials, generate_health_check_form
-        import io as _io
-        import contextlib
+        from services.material_service import capture_logs, generate_student_materials, generate_health_check_form
         base_dir = current_app.config['BASE_DIR']
         output_root = current_app.config['STUDENTS_FOLDER']
         
@@ -2058,16 +2062,15 @@ def generate_materials_route(id):
         student_folder_name = f"{training_type_name}-{company}-{name}"
         actual_output_root = os.path.join(output_root, student_folder_name)
         
-        # 捕获 print 输出
-        log_buffer = _io.StringIO()
-        with contextlib.redirect_stdout(log_buffer):
-            report = generate_student_materials(student, base_dir, actual_output_root)
-        logs = log_buffer.getvalue()
+        # 收集本次生成的处理日志（仅限当前请求上下文，不影响并发请求）
+        with capture_logs() as job_log:
+            report = image_worker_pool.run(generate_student_materials, student, base_dir, actual_output_root)
+        folder_index_service.mark_changed(get_student_folder_prefix(student))
+        logs = job_log.text()
         
         # 同时输出到服务器日志
-        for line in logs.splitlines():
-            if line.strip():
-                current_app.logger.info(line)
+        job_log.flush_to(current_app.logger)
+        pipeline_metrics_service.record_report(report)
         
         payload = {
             'message': '生成成功' if report.get('success') else '生成未完全成功',
@@ -2123,49 +2126,28 @@ def analyze_material_points_route(id):
         
         base_dir = current_app.config['BASE_DIR']
         
-        def _get_points(path_key, profile_func):
-            rel = student.get(path_key)
-            if not rel:
-                return None
-            abs_p = os.path.join(base_dir, rel)
-            if not os.path.exists(abs_p):
-                return None
-            from services.material_service import read_cv_image
-            img = read_cv_image(abs_p)
-            if img is None:
+        def _get_points(path_key, profile_name):
+            if adjustments.get('crop_mode', 'auto') == 'none':
                 return None
-                
-            crop_kwargs = {
-                'return_meta': True,
-                'expand_level': adjustments.get('expand_level'),
-                'skip_ratio_trim': adjustments.get('skip_ratio_trim', False)
-            }
-            crop_mode = adjustments.get('crop_mode', 'auto')
-            if crop_mode == 'none':
-                return None
-            if crop_mode == 'rect_only':
-                crop_kwargs['allow_perspective'] = False
-            # auto_crop_diploma 不接受 canny_scale
-            if 'canny_scale' in adjustments and profile_func != auto_crop_diploma:
-                crop_kwargs['canny_scale'] = float(adjustments['canny_scale'])
-                
-            _, meta = profile_func(img, **crop_kwargs)
-            sel = meta.get('selected_candidate')
-            if sel and sel.get('points_orig'):
-                return sel['points_orig']
-            return None
+            canny_scale = crop_precompute_service.DEFAULT_CANNY_SCALE
+            # 学历证书裁剪不使用 canny_scale
+            if 'canny_scale' in adjustments and profile_name != 'diploma':
+                canny_scale = float(adjustments['canny_scale'])
+            # 源文件未变化时直接读取预计算结果，否则现场识别并回写缓存
+            return crop_precompute_service.get_points(
+                student, path_key, profile_name, base_dir, canny_scale=canny_scale,
+            )
 
         result = {}
-        from services.material_service import auto_crop_id_card, auto_crop_diploma, auto_crop_hukou_page
 
         if material_type == 'id_card':
-            result['front_points'] = _get_points('id_card_front_path', auto_crop_id_card)
-            result['back_points'] = _get_points('id_card_back_path', auto_crop_id_card)
+            result['front_points'] = _get_points('id_card_front_path', 'id_card')
+            result['back_points'] = _get_points('id_card_back_path', 'id_card')
         elif material_type == 'diploma':
-            result['points'] = _get_points('diploma_path', auto_crop_diploma)
+            result['points'] = _get_points('diploma_path', 'diploma')
         elif material_type == 'hukou':
-            result['home_points'] = _get_points('hukou_residence_path', auto_crop_hukou_page)
-            result['personal_points'] = _get_points('hukou_personal_path', auto_crop_hukou_page)
+            result['home_points'] = _get_points('hukou_residence_path', 'hukou')
+            result['personal_points'] = _get_points('hukou_personal_path', 'hukou')
             
         return jsonify(result)
 
@@ -2181,7 +2163,6 @@ def manual_crop_material_route(id):
     手动画框裁剪：接收用户在原图上标记的 4 个角点，对原始附件图像做透视变换，
     然后以 crop_mode=none 调用 regenerate_single_material 完成 A4 排版和方向校正。
     """
-    import tempfile
     try:
 
         student = get_student_by_id(id)
@@ -2198,31 +2179,15 @@ def manual_crop_material_route(id):
 
         def crop_points_to_temp(abs_path, points, crop_mode):
             """对原图按给定模式裁剪，写入临时文件并返回路径。"""
-            if not abs_path or not os.path.exists(abs_path):
-                return None
-            import numpy as np
-            from services.material_service import read_cv_image, write_cv_image, crop_image_with_points
-            img = read_cv_image(abs_path)
-            if img is None:
-                return None
-            current_app.logger.info(f"[manual_crop] Loaded image {abs_path} with shape {img.shape}")
+            from services.material_service import crop_file_to_temp
             current_app.logger.info(f"[manual_crop] Received manual points: {points}")
-            pts = np.array(points, dtype='float32')
-            if crop_mode == 'none':
-                return None
-            actual_mode = 'rect_only' if crop_mode == 'rect_only' else 'perspective'
-            cropped = crop_image_with_points(img, pts, mode=actual_mode)
-            suffix = os.path.splitext(abs_path)[1] or '.jpg'
-            tmp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False,
-                                              dir=os.path.dirname(abs_path))
-            tmp.close()
-            write_cv_image(tmp.name, cropped)
-            return tmp.name
+            # 读取原图和透视变换在图像处理进程中完成，裁剪结果经临时文件传回
+            return image_worker_pool.run(crop_file_to_temp, abs_path, points, crop_mode)
 
         def resolve(key, pts_key, crop_mode):
             """返回 (abs_path, is_temp)：有 4 点则透视裁剪成临时文件，否则用原始路径。"""
-            rel = student.get(key)
-            abs_p = os.path.join(base_dir, rel) if rel else None
+            from services.material_service import resolve_source_path
+            abs_p = resolve_source_path(base_dir, student.get(key))
             pts = data.get(pts_key)
             if pts and len(pts) == 4:
                 tmp_path = crop_points_to_temp(abs_p, pts, crop_mode)
@@ -2276,24 +2241,24 @@ def manual_crop_material_route(id):
                 student_copy['hukou_personal_path'] = os.path.relpath(pp, base_dir)
                 adjustments['personal_manual_crop_applied'] = True
 
-        import io as _io, contextlib
-        from services.material_service import regenerate_single_material
+        from services.material_service import capture_logs, regenerate_single_material
 
-        log_buffer = _io.StringIO()
         try:
-            with contextlib.redirect_stdout(log_buffer):
-                report = regenerate_single_material(student_copy, base_dir, output_root, material_type, adjustments)
+            with capture_logs() as job_log:
+                report = image_worker_pool.run(
+                    regenerate_single_material, student_copy, base_dir, output_root, material_type, adjustments,
+                )
         finally:
+            folder_index_service.mark_changed(get_student_folder_prefix(student_copy))
             for f in tmp_files:
                 try:
                     os.remove(f)
                 except Exception:
                     pass
 
-        logs = log_buffer.getvalue()
-        for line in logs.splitlines():
-            if line.strip():
-                current_app.logger.info(line)
+        logs = job_log.text()
+        job_log.flush_to(current_app.logger)
+        pipeline_metrics_service.record_report(report)
 
         payload = {
             'message': '手动裁剪并重新生成成功' if report.get('success') else '手动裁剪后的重新生成失败',
@@ -2391,20 +2356,18 @@ def regenerate_material_route(id):
 
         adjustments = data.get('adjustments', {})
 
-        from services.material_service import regenerate_single_material
-        import io as _io
-        import contextlib
+        from services.material_service import capture_logs, regenerate_single_material
         base_dir = current_app.config['BASE_DIR']
         output_root = current_app.config['STUDENTS_FOLDER']
 
-        log_buffer = _io.StringIO()
-        with contextlib.redirect_stdout(log_buffer):
-            report = regenerate_single_material(student, base_dir, output_root, material_type, adjustments)
-        logs = log_buffer.getvalue()
-
-        for line in logs.splitlines():
-            if line.strip():
-                current_app.logger.info(line)
+        with capture_logs() as job_log:
+            report = image_worker_pool.run(
+                regenerate_single_material, student, base_dir, output_root, material_type, adjustments,
+            )
+        folder_index_service.mark_changed(get_student_folder_prefix(student))
+        logs = job_log.text()
+        job_log.flush_to(current_app.logger)
+        pipeline_metrics_service.record_report(report)
 
         payload = {
             'message': '重新生成成功' if report.get('success') else '重新生成失败',
@@ -2530,7 +2493,7 @@ def get_generated_materials_route(id):
 @mini_admin_required
 def download_materials_zip_route(id):
     """
-    下载生成的报名材料（ZIP）。
+    下载生成的报名材料（ZIP），以流式响应返回。
     """
     try:
 
@@ -2551,33 +2514,20 @@ def download_materials_zip_route(id):
         training_type_name = training_type_map.get(training_type, '特种作业')
         student_folder_name = f"{training_type_name}-{company}-{name}"
         
-        output_dir = os.path.join(current_app.config['STUDENTS_FOLDER'], student_folder_name, f"{name_prefix}-报名材料")
-        
-        if not os.path.exists(output_dir) or not os.path.isdir(output_dir):
+        output_prefix = f"students/{student_folder_name}/{name_prefix}-报名材料"
+        listing = storage_service.list_dir(output_prefix)
+        if not listing['files'] and not listing['dirs']:
             return jsonify({'error': '该学员暂未生成报名材料子文件夹'}), 400
-            
-        files_to_zip = []
-        for filename in os.listdir(output_dir):
-            abs_path = os.path.join(output_dir, filename)
-            if os.path.isfile(abs_path):
-                # 为了保留子文件夹结构
-                arcname = os.path.join(f"{name_prefix}-报名材料", filename)
-                files_to_zip.append((abs_path, arcname))
+
+        # 为了保留子文件夹结构
+        files_to_zip = [
+            (item['key'], f"{name_prefix}-报名材料/{item['name']}")
+            for item in listing['files']
+        ]
 
         if not files_to_zip:
             return jsonify({'error': '报名材料文件夹为空'}), 400
 
-        buffer = io.BytesIO()
-        with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
-            for abs_path, arcname in files_to_zip:
-                try:
-                    zf.write(abs_path, arcname)
-                except Exception as e:
-                    current_app.logger.error(f'Failed to add file to ZIP: {str(e)}')
-
-        buffer.seek(0)
-
-        from flask import send_file
         safe_name = f"{name_prefix}-报名材料".replace('/', '-').replace('\\', '-')
         log_student_operation(
             id,
@@ -2591,11 +2541,10 @@ def download_materials_zip_route(id):
             }
         )
 
-        return send_file(
-            buffer,
+        return Response(
+            stream_with_context(zip_stream_service.stream_zip(files_to_zip)),
             mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"{safe_name}.zip"
+            headers=zip_stream_service.attachment_headers(f"{safe_name}.zip"),
         )
 
     except Exception as e:
@@ -2634,6 +2583,88 @@ def get_companies_route():
         return build_internal_error_response('加载公司列表失败，请稍后重试')
 
 
+@student_bp.route('/api/students/<int:id>/archive', methods=['POST'])
+@mini_admin_required
+def archive_student_route(id):
+    """归档已办结或已驳回的学员：附件打包为压缩包，记录迁入归档库。"""
+    try:
+        result = student_archive_service.archive_student(id)
+        current_app.logger.info(
+            f'[归档] 操作人={log_operator_name()} IP={get_client_ip(request)} '
+            f'学员ID={id} 附件数={result["file_count"]}'
+        )
+        return jsonify({'success': True, 'message': '学员已归档', **result})
+    except AppError as e:
+        return jsonify(e.to_dict()), e.status_code
+    except Exception:
+        current_app.logger.exception('Error archiving student %s', id)
+        return build_internal_error_response('归档失败，请稍后重试')
+
+
+@student_bp.route('/api/students/archived', methods=['GET'])
+@mini_admin_required
+def search_archived_students_route():
+    """
+    检索归档学员。
+
+    查询参数:
+        search (str)   : 按姓名、身份证号、手机号模糊搜索
+        company (str)  : 按单位名称模糊筛选
+        page (int)     : 页码（默认 1）
+        page_size (int): 每页条数（默认 50，最大 500）
+    """
+    try:
+        result = student_archive_service.search_archived(
+            search=request.args.get('search', '').strip(),
+            company=request.args.get('company', '').strip(),
+            page=request.args.get('page', 1, type=int),
+            page_size=request.args.get('page_size', student_archive_service.DEFAULT_PAGE_SIZE, type=int),
+        )
+        return jsonify({'success': True, **result})
+    except Exception:
+        current_app.logger.exception('Error searching archived students')
+        return build_internal_error_response('检索归档学员失败，请稍后重试')
+
+
+@student_bp.route('/api/students/archived/<int:id>', methods=['GET'])
+@mini_admin_required
+def get_archived_student_route(id):
+    """获取归档学员详情（归档时的完整记录）。"""
+    try:
+        archived = student_archive_service.get_archived(id)
+        if archived is None:
+            raise NotFoundError('归档记录不存在')
+        return jsonify({'success': True, 'archived': archived})
+    except AppError as e:
+        return jsonify(e.to_dict()), e.status_code
+    except Exception:
+        current_app.logger.exception('Error getting archived student %s', id)
+        return build_internal_error_response('加载归档学员失败，请稍后重试')
+
+
+@student_bp.route('/api/students/archived/<int:id>/restore', methods=['POST'])
+@mini_admin_required
+def restore_archived_student_route(id):
+    """从归档恢复学员：按原 ID 写回记录并还原附件。"""
+    try:
+        result = student_archive_service.restore_student(id)
+        current_app.logger.info(
+            f'[恢复归档] 操作人={log_operator_name()} IP={get_client_ip(request)} '
+            f'学员ID={id} 附件数={result["restored_files"]}'
+        )
+        return jsonify({
+            'success': True,
+            'message': '学员已恢复',
+            'student': enrich_student(get_student_by_id(id)),
+            **result,
+        })
+    except AppError as e:
+        return jsonify(e.to_dict()), e.status_code
+    except Exception:
+        current_app.logger.exception('Error restoring archived student %s', id)
+        return build_internal_error_response('恢复归档失败，请稍后重试')
+
+
 @student_bp.route('/api/stats/dashboard', methods=['GET'])
 @mini_admin_required
 def dashboard_stats_route():
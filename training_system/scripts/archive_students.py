@@ -0,0 +1,64 @@
+"""
+学员冷存储归档脚本。
+
+把创建时间超过 STUDENT_ARCHIVE_AGE_DAYS 天、状态为终态（默认考试通过 / 已驳回）的学员迁入归档库，
+附件打包为 archive/students/ 下的压缩包。归档逻辑见 services/student_archive_service.py。
+建议用 cron 每周执行一次。
+
+使用方法：
+    # 在 training_system 目录下执行，先预览可归档的学员：
+    python scripts/archive_students.py --dry-run
+
+    # 归档（每次最多 500 人）：
+    python scripts/archive_students.py --limit 500
+
+    # 检索 / 恢复归档学员：
+    python scripts/archive_students.py --search 张三
+    python scripts/archive_students.py --restore 123
+
+选项：
+    --dry-run         只列出可归档的学员 ID，不做修改
+    --age-days N      覆盖 STUDENT_ARCHIVE_AGE_DAYS
+    --limit N         本次最多归档的学员数
+    --search TEXT     按姓名 / 身份证号 / 手机号检索归档学员
+    --restore ID      从归档恢复指定学员
+"""
+import argparse
+import json
+import os
+import sys
+
+# 将项目根目录加入 Python 路径（脚本在 scripts/ 子目录）
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_project_root = os.path.dirname(_script_dir)
+sys.path.insert(0, _project_root)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='学员冷存储归档')
+    parser.add_argument('--dry-run', action='store_true', help='只列出可归档的学员，不做修改')
+    parser.add_argument('--age-days', type=int, default=None, help='创建超过多少天的学员可归档')
+    parser.add_argument('--limit', type=int, default=None, help='本次最多归档的学员数')
+    parser.add_argument('--search', default=None, help='检索归档学员')
+    parser.add_argument('--restore', type=int, default=None, help='从归档恢复指定学员 ID')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    from services import student_archive_service
+
+    app = create_app()
+    with app.app_context():
+        if args.search is not None:
+            output = student_archive_service.search_archived(search=args.search)
+        elif args.restore is not None:
+            output = student_archive_service.restore_student(args.restore)
+        else:
+            output = student_archive_service.archive_eligible(
+                age_days=args.age_days, limit=args.limit, dry_run=args.dry_run,
+            )
+        print(json.dumps(output, ensure_ascii=False, indent=2))
+    return 1 if output.get('failed') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+附件内容去重存储（blob）维护脚本。
+
+使用场景：
+    - 启用去重前已上传的历史附件仍各存一份，用 --ingest 补做去重
+    - 学员目录删除后，blob 目录中会留下无人引用的内容，用 --gc 回收
+
+使用方法：
+    # 在 training_system 目录下执行，打印占用统计：
+    python scripts/dedup_blobs.py
+
+    # 对 students/ 下的历史文件补做去重（先预览）：
+    python scripts/dedup_blobs.py --ingest --dry-run
+    python scripts/dedup_blobs.py --ingest
+
+    # 回收引用计数为 0 的 blob：
+    python scripts/dedup_blobs.py --gc
+
+选项：
+    --ingest     对 students/ 下的已有文件补做去重
+    --gc         回收无引用的 blob 与失效的材料输出记录
+    --dry-run    仅统计，不修改文件
+"""
+import argparse
+import json
+import os
+import sys
+
+# 将项目根目录加入 Python 路径（脚本在 scripts/ 子目录）
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_project_root = os.path.dirname(_script_dir)
+sys.path.insert(0, _project_root)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='附件内容去重存储维护')
+    parser.add_argument('--ingest', action='store_true', help='对 students/ 下的已有文件补做去重')
+    parser.add_argument('--gc', action='store_true', help='回收无引用的 blob')
+    parser.add_argument('--dry-run', action='store_true', help='仅统计，不修改文件')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    from services import blob_store_service, storage_service
+
+    app = create_app()
+    with app.app_context():
+        if storage_service._get_backend() == 'cos':
+            print('cos-only 模式本地不保存附件，无需去重')
+            return 0
+        output = {}
+        if args.ingest:
+            students_dir = os.path.join(storage_service.get_base_dir(), 'students')
+            output['ingest'] = blob_store_service.ingest_tree(students_dir, dry_run=args.dry_run)
+        if args.gc:
+            output['gc'] = blob_store_service.gc(dry_run=args.dry_run)
+        output['stats'] = blob_store_service.stats()
+        print(json.dumps(output, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
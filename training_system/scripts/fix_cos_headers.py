@@ -1,17 +1,28 @@
 """
 批量修复 COS 上已有文件的 Content-Disposition 和 Content-Type 元数据。
 
-不重新上传文件内容，仅通过 COS 服务端 copy-to-self 更新元数据（速度快）。
+不重新上传文件内容：先 HEAD 检查，元数据已正确的对象直接跳过；需要修复的对象通过 COS 服务端
+copy-to-self（x-cos-metadata-directive: Replaced）改写元数据，并保留原有的 x-cos-meta-* 自定义元数据。
+对象边列举边交给 services/bulk_op_service 并发处理，完成的 key 记入检查点，中断后重新执行即继续。
 
 使用方法：
     # 在 training_system 目录下执行：
     python scripts/fix_cos_headers.py
 
-    # 仅预览将要处理的文件，不实际操作：
+    # 仅统计将要处理的对象数与字节数，不实际操作：
     python scripts/fix_cos_headers.py --dry-run
 
     # 指定前缀（只修复某个子目录）：
     python scripts/fix_cos_headers.py --prefix students/特种设备-XX公司-张三/
+
+    # 长时间运行时建议脱离终端，SSH 断开也不影响：
+    nohup python scripts/fix_cos_headers.py --threads 16 --rate 200 > fix_headers.log 2>&1 &
+
+选项：
+    --threads N      并发线程数（默认 8）
+    --rate N         每秒最多处理的对象数（默认不限速）
+    --checkpoint P   检查点数据库路径（默认 database/bulk_ops.db）
+    --reset          清除本作业的检查点后从头执行
 """
 import os
 import sys
@@ -53,9 +64,8 @@ def get_cos_client():
     return CosS3Client(config), bucket, region, os.getenv('COS_KEY_PREFIX', '').strip().rstrip('/')
 
 
-def list_all_objects(client, bucket, prefix):
-    """列举指定前缀下所有 COS 对象。"""
-    objects = []
+def iter_objects(client, bucket, prefix):
+    """分页列举前缀下的 COS 对象，逐个产出 (key, 大小, None)。"""
     marker = ''
     while True:
         resp = client.list_objects(
@@ -65,50 +75,63 @@ def list_all_objects(client, bucket, prefix):
             MaxKeys=1000,
         )
         for obj in resp.get('Contents', []) or []:
-            objects.append(obj['Key'])
+            if obj['Key'].endswith('/'):
+                continue
+            yield obj['Key'], int(obj.get('Size', 0)), None
         if resp.get('IsTruncated') == 'true':
             marker = resp.get('NextMarker', '')
         else:
             break
-    return objects
 
 
-def fix_object_headers(client, bucket, region, full_key, dry_run=False):
+def _header(headers, name):
+    name = name.lower()
+    for key, value in (headers or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def fix_object_headers(client, bucket, region, full_key):
     """
-    重新 put_object 以更新元数据（ContentType + ContentDisposition）。
-    腾讯 COS SDK v5 不支持 copy-to-self 修改元数据，故先 get 再 put。
+    修复单个对象的 ContentType + ContentDisposition。
+
+    返回:
+        str: 'skipped'（元数据已正确）或 'done'（已通过 copy-to-self 改写）
     """
     content_type, _ = mimetypes.guess_type(full_key)
     if not content_type:
         content_type = 'application/octet-stream'
 
-    if dry_run:
-        print(f'[DRY] {full_key}  →  Content-Type={content_type}  Content-Disposition=inline')
-        return True
+    head = client.head_object(Bucket=bucket, Key=full_key)
+    if _header(head, 'Content-Type') == content_type and _header(head, 'Content-Disposition') == 'inline':
+        return 'skipped'
 
-    try:
-        # 1. 下载原始内容
-        resp = client.get_object(Bucket=bucket, Key=full_key)
-        data = resp['Body'].get_raw_stream().read()
-
-        # 2. 用正确元数据重新上传（覆盖同一 Key）
-        client.put_object(
-            Bucket=bucket,
-            Key=full_key,
-            Body=data,
-            ContentType=content_type,
-            ContentDisposition='inline',
-        )
-        return True
-    except Exception as e:
-        print(f'[FAIL] {full_key}: {e}')
-        return False
+    # Replaced 会丢弃未在请求中给出的自定义元数据，需原样带上（如 x-cos-meta-md5）
+    metadata = {key.lower(): value for key, value in head.items() if key.lower().startswith('x-cos-meta-')}
+    client.copy_object(
+        Bucket=bucket,
+        Key=full_key,
+        CopySource={'Bucket': bucket, 'Key': full_key, 'Region': region},
+        CopyStatus='Replaced',
+        ContentType=content_type,
+        ContentDisposition='inline',
+        Metadata=metadata,
+    )
+    return 'done'
 
 
 def main():
+    from services import bulk_op_service
+
     parser = argparse.ArgumentParser(description='批量修复 COS 文件的 Content-Disposition 元数据')
-    parser.add_argument('--dry-run', action='store_true', help='仅预览，不实际操作')
+    parser.add_argument('--dry-run', action='store_true', help='仅统计，不实际操作')
     parser.add_argument('--prefix', default='students/', help='限定处理的前缀（默认 students/）')
+    parser.add_argument('--threads', type=int, default=8, help='并发线程数（默认 8）')
+    parser.add_argument('--rate', type=float, default=0, help='每秒最多处理的对象数（默认不限速）')
+    parser.add_argument('--checkpoint', default=bulk_op_service.DEFAULT_CHECKPOINT_PATH,
+                        help='检查点数据库路径（默认 database/bulk_ops.db）')
+    parser.add_argument('--reset', action='store_true', help='清除本作业的检查点后从头执行')
     args = parser.parse_args()
 
     load_env(_project_root)
@@ -122,29 +145,20 @@ def main():
         print('--- DRY-RUN 模式，不实际修改 ---')
     print()
 
-    print('正在列举对象...')
-    keys = list_all_objects(client, bucket, cos_prefix)
-    print(f'共找到 {len(keys)} 个对象')
-    print()
+    job = f'fix_cos_headers:{cos_prefix}'
+    checkpoint = bulk_op_service.Checkpoint(args.checkpoint, job)
+    if args.reset:
+        checkpoint.reset()
 
-    ok, fail = 0, 0
-    for i, key in enumerate(keys, 1):
-        success = fix_object_headers(client, bucket, region, key, dry_run=args.dry_run)
-        if not args.dry_run:
-            status = 'OK  ' if success else 'FAIL'
-            print(f'[{status}] ({i}/{len(keys)}) {key}')
-        if success:
-            ok += 1
-        else:
-            fail += 1
+    report = bulk_op_service.run_bulk(
+        job, iter_objects(client, bucket, cos_prefix),
+        lambda key, _payload: fix_object_headers(client, bucket, region, key),
+        threads=args.threads, rate=args.rate, checkpoint=checkpoint, dry_run=args.dry_run,
+    )
+    checkpoint.close()
 
     print()
-    print('=' * 60)
-    if args.dry_run:
-        print(f'DRY-RUN 完成：将处理 {ok} 个对象')
-    else:
-        print(f'修复完成：成功 {ok} 个  失败 {fail} 个')
-    print('=' * 60)
+    print(bulk_op_service.format_report(report))
 
 
 if __name__ == '__main__':
@@ -9,20 +9,30 @@
     # 在 training_system 目录下执行：
     python scripts/migrate_to_cos.py
 
-    # 仅预览，不实际上传（dry-run 模式）：
+    # 仅统计待上传的文件数与字节数，不实际上传（dry-run 模式）：
     python scripts/migrate_to_cos.py --dry-run
 
     # 指定特定子目录（如只同步某学员文件夹）：
     python scripts/migrate_to_cos.py --prefix 特种设备-XX公司-张三
 
+    # 长时间运行时建议脱离终端，SSH 断开也不影响；中断后重新执行同一命令即从检查点继续：
+    nohup python scripts/migrate_to_cos.py --threads 16 > migrate.log 2>&1 &
+
 选项：
-    --dry-run       仅打印将要上传的文件列表，不执行上传
-    --prefix TEXT   只同步 students/<prefix>/ 下的文件
-    --skip-existing 跳过 COS 上已存在的文件（节省流量，默认跳过）
-    --overwrite     强制覆盖 COS 上已存在的文件
+    --dry-run        仅统计待上传文件（已扣除检查点中完成的部分），不执行上传
+    --prefix TEXT    只同步 students/<prefix>/ 下的文件
+    --overwrite      强制覆盖 COS 上已存在的文件（默认跳过同名且大小一致的对象）
+    --threads N      并发上传线程数（默认 8）
+    --rate N         每秒最多上传的文件数（默认不限速）
+    --checkpoint P   检查点数据库路径（默认 database/bulk_ops.db）
+    --reset          清除本作业的检查点后从头执行
+
+实现：
+    启动时分页列举一次 COS 前缀下的对象（代替逐个文件 HEAD），由 services/bulk_op_service 并发执行上传，
+    上传走 cos_sync_service.upload_file（大文件分块上传、写入 x-cos-meta-md5 元数据）。
 
 统计：
-    脚本结束时打印上传成功/跳过/失败数量，并将失败文件路径写入 migrate_failed.txt。
+    脚本结束时打印上传/跳过/失败数量与吞吐量，并将失败文件路径写入 migrate_failed.txt。
 """
 import os
 import sys
@@ -54,35 +64,62 @@ def load_env(base_dir):
 
 
 def get_cos_client():
-    """初始化 COS 客户端。"""
-    from qcloud_cos import CosConfig, CosS3Client
-    secret_id  = os.getenv('COS_SECRET_ID', '')
-    secret_key = os.getenv('COS_SECRET_KEY', '')
-    region     = os.getenv('COS_REGION', '')
-    bucket     = os.getenv('COS_BUCKET', '')
-
-    if not all([secret_id, secret_key, region, bucket]):
-        print('错误：COS 配置不完整，请填写 .env 中的 COS_SECRET_ID / COS_SECRET_KEY / COS_REGION / COS_BUCKET')
+    """初始化 COS 客户端（复用 storage_service 的单例，上传时共用同一连接池）。"""
+    from services import storage_service
+    try:
+        client, config = storage_service._get_cos_client()
+    except RuntimeError as e:
+        print(f'错误：{e}')
         sys.exit(1)
+    return client, config['bucket'], config['prefix']
 
-    config = CosConfig(Region=region, SecretId=secret_id, SecretKey=secret_key)
-    return CosS3Client(config), bucket, os.getenv('COS_KEY_PREFIX', '').strip().rstrip('/')
 
+def list_remote_sizes(client, bucket, prefix):
+    """
+    分页列举前缀下的全部 COS 对象，返回 {完整 key: 大小}。
 
-def cos_key_exists(client, bucket, full_key):
-    """检查 COS 对象是否存在。"""
-    try:
-        client.head_object(Bucket=bucket, Key=full_key)
-        return True
-    except Exception:
-        return False
+    一次列举（每页 1000 个）代替逐个文件 HEAD，数万个文件只需几十次请求。
+    """
+    sizes = {}
+    marker = ''
+    while True:
+        resp = client.list_objects(Bucket=bucket, Prefix=prefix, Marker=marker, MaxKeys=1000)
+        for obj in resp.get('Contents', []) or []:
+            sizes[obj['Key']] = int(obj.get('Size', 0))
+        if resp.get('IsTruncated') != 'true':
+            break
+        marker = resp.get('NextMarker', '')
+    return sizes
+
+
+def iter_local_files(scan_dir, base_dir):
+    """按目录顺序产出 (rel_key, 大小, 绝对路径)。"""
+    for root, dirs, filenames in os.walk(scan_dir):
+        dirs.sort()
+        for fn in sorted(filenames):
+            if fn.startswith('.'):
+                continue
+            abs_path = os.path.join(root, fn)
+            try:
+                size = os.path.getsize(abs_path)
+            except OSError:
+                continue
+            rel_key = os.path.relpath(abs_path, base_dir).replace('\\', '/')
+            yield rel_key, size, abs_path
 
 
 def main():
+    from services import bulk_op_service, cos_sync_service
+
     parser = argparse.ArgumentParser(description='将本地 students/ 目录迁移至腾讯 COS')
-    parser.add_argument('--dry-run', action='store_true', help='仅打印文件列表，不实际上传')
+    parser.add_argument('--dry-run', action='store_true', help='仅统计待上传文件，不实际上传')
     parser.add_argument('--prefix', default='', help='限定同步的子目录前缀（相对于 students/）')
     parser.add_argument('--overwrite', action='store_true', help='强制覆盖 COS 上已存在的文件')
+    parser.add_argument('--threads', type=int, default=8, help='并发上传线程数（默认 8）')
+    parser.add_argument('--rate', type=float, default=0, help='每秒最多上传的文件数（默认不限速）')
+    parser.add_argument('--checkpoint', default=bulk_op_service.DEFAULT_CHECKPOINT_PATH,
+                        help='检查点数据库路径（默认 database/bulk_ops.db）')
+    parser.add_argument('--reset', action='store_true', help='清除本作业的检查点后从头执行')
     args = parser.parse_args()
 
     skip_existing = not args.overwrite
@@ -94,9 +131,9 @@ def main():
 
     if args.dry_run:
         print('=' * 60)
-        print('DRY-RUN 模式：仅预览，不实际上传')
+        print('DRY-RUN 模式：仅统计，不实际上传')
         print('=' * 60)
-    
+
     client, bucket, global_prefix = get_cos_client()
 
     # 确定要扫描的本地目录
@@ -116,73 +153,43 @@ def main():
     print(f'COS 前缀：{global_prefix or "(无)"}')
     print()
 
-    # 收集所有文件
-    all_files = []
-    for root, dirs, filenames in os.walk(scan_dir):
-        dirs.sort()
-        for fn in sorted(filenames):
-            if fn.startswith('.'):
-                continue
-            abs_path = os.path.join(root, fn)
-            rel_key = os.path.relpath(abs_path, base_dir).replace('\\', '/')
-            all_files.append((abs_path, rel_key))
-
-    print(f'共找到 {len(all_files)} 个文件')
-    print()
-
-    stats = {'upload': 0, 'skip': 0, 'fail': 0}
-    failed_files = []
+    remote_sizes = {}
+    if skip_existing:
+        print('正在列举 COS 上已有对象...')
+        remote_sizes = list_remote_sizes(
+            client, bucket, f'{global_prefix}/{rel_prefix}' if global_prefix else rel_prefix
+        )
+        print(f'COS 上已有 {len(remote_sizes)} 个对象')
 
-    for i, (abs_path, rel_key) in enumerate(all_files, 1):
+    def upload(rel_key, abs_path):
         full_key = f'{global_prefix}/{rel_key}' if global_prefix else rel_key
-
-        # dry-run 仅打印
-        if args.dry_run:
-            print(f'[{i}/{len(all_files)}] {rel_key}  ->  {full_key}')
-            stats['upload'] += 1
-            continue
-
-        # 跳过已存在的
-        if skip_existing and cos_key_exists(client, bucket, full_key):
-            print(f'[SKIP] {rel_key}')
-            stats['skip'] += 1
-            continue
-
-        # 上传
-        try:
-            import mimetypes as _mt
-            content_type, _ = _mt.guess_type(abs_path)
-            if not content_type:
-                content_type = 'application/octet-stream'
-            with open(abs_path, 'rb') as f:
-                client.put_object(
-                    Bucket=bucket,
-                    Body=f,
-                    Key=full_key,
-                    ContentType=content_type,
-                    ContentDisposition='inline',
-                )
-            print(f'[OK  ] ({i}/{len(all_files)}) {rel_key}')
-            stats['upload'] += 1
-        except Exception as e:
-            print(f'[FAIL] {rel_key}  ->  {e}')
-            stats['fail'] += 1
-            failed_files.append(rel_key)
+        # 同名且大小一致视为已迁移
+        if skip_existing and remote_sizes.get(full_key) == os.path.getsize(abs_path):
+            return 'skipped'
+        cos_sync_service.upload_file(abs_path, rel_key)
+        return 'done'
+
+    job = f'migrate_to_cos:{rel_prefix}:{"overwrite" if args.overwrite else "skip"}'
+    checkpoint = bulk_op_service.Checkpoint(args.checkpoint, job)
+    if args.reset:
+        checkpoint.reset()
+
+    report = bulk_op_service.run_bulk(
+        job, iter_local_files(scan_dir, base_dir), upload,
+        threads=args.threads, rate=args.rate, checkpoint=checkpoint, dry_run=args.dry_run,
+    )
+    failed_files = checkpoint.failed_keys()
+    checkpoint.close()
 
     # 汇总
     print()
-    print('=' * 60)
-    if args.dry_run:
-        print(f'DRY-RUN 完成：将上传 {stats["upload"]} 个文件')
-    else:
-        print(f'迁移完成：上传 {stats["upload"]} 个  跳过 {stats["skip"]} 个  失败 {stats["fail"]} 个')
+    print(bulk_op_service.format_report(report))
 
-    if failed_files:
+    if failed_files and not args.dry_run:
         fail_log = os.path.join(_project_root, 'migrate_failed.txt')
         with open(fail_log, 'w', encoding='utf-8') as f:
             f.write('\n'.join(failed_files))
-        print(f'失败文件列表已写入：{fail_log}')
-    print('=' * 60)
+        print(f'失败文件列表已写入：{fail_log}（重新执行本命令会自动重试）')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,83 @@
+"""
+COS 发件箱对账脚本（dual 模式）。
+
+使用场景：发件箱中有操作多次重试后被标记为 failed，或怀疑有文件未同步到 COS（如发件箱启用前
+的历史上传失败）。脚本对比本地与 COS 的文件列表，为缺失或大小不一致的文件补登上传操作。
+
+使用方法：
+    # 在 training_system 目录下执行：
+    python scripts/reconcile_cos_outbox.py
+
+    # 仅预览差异，不登记任何操作：
+    python scripts/reconcile_cos_outbox.py --dry-run
+
+    # 对账后在当前进程内立即执行队列（无需等待 Web 进程的后台线程）：
+    python scripts/reconcile_cos_outbox.py --drain
+
+选项：
+    --prefix TEXT       只对账 students/<prefix>/ 下的文件
+    --dry-run           仅打印差异
+    --no-retry-failed   不重新入队 failed 状态的操作
+    --drain             对账后在本进程内执行队列直至清空
+    --stats             仅打印发件箱队列统计
+"""
+import argparse
+import json
+import os
+import sys
+
+# 将项目根目录加入 Python 路径（脚本在 scripts/ 子目录）
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_project_root = os.path.dirname(_script_dir)
+sys.path.insert(0, _project_root)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='对账本地文件与 COS，补登 COS 发件箱操作')
+    parser.add_argument('--prefix', default='', help='限定对账的子目录前缀（相对于 students/）')
+    parser.add_argument('--dry-run', action='store_true', help='仅打印差异，不登记操作')
+    parser.add_argument('--no-retry-failed', action='store_true', help='不重新入队 failed 状态的操作')
+    parser.add_argument('--drain', action='store_true', help='对账后在本进程内执行队列直至清空')
+    parser.add_argument('--stats', action='store_true', help='仅打印发件箱队列统计')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    from services import cos_outbox_service, storage_service
+
+    app = create_app()
+    if storage_service._get_backend() != 'dual':
+        print('错误：发件箱仅用于 STORAGE_BACKEND=dual')
+        return 1
+
+    with app.app_context():
+        if args.stats:
+            print(json.dumps(cos_outbox_service.get_metrics(), ensure_ascii=False, indent=2))
+            return 0
+
+        prefix = f'students/{args.prefix.strip("/")}/' if args.prefix else 'students/'
+        result = cos_outbox_service.reconcile(
+            prefix, retry_failed=not args.no_retry_failed, dry_run=args.dry_run,
+        )
+        for key in result['keys']:
+            print(f'[{"DIFF" if args.dry_run else "PUT "}] {key}')
+        print('=' * 60)
+        print(
+            f"检查 {result['checked']} 个本地文件：COS 缺失 {result['missing']} 个，"
+            f"大小不一致 {result['size_mismatch']} 个，补登 {result['enqueued']} 个，"
+            f"重新入队失败操作 {result['requeued_failed']} 个"
+        )
+
+    if args.drain and not args.dry_run:
+        worker = cos_outbox_service.create_worker(app)
+        try:
+            worker.drain(timeout=3600)
+        finally:
+            worker.stop()
+        print(f"执行完成：成功 {worker.stats['completed']} 个，待重试 {worker.stats['retried']} 个，"
+              f"放弃 {worker.stats['dead']} 个")
+    print('=' * 60)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,705 @@
+"""
+证件照背景替换（rembg）推理服务。
+
+原实现由 image_service._get_rembg_session 在第一次处理照片时懒加载 u2net_human_seg 模型：
+第一个请求要承担模型加载耗时，并且每个 gunicorn worker 各自持有一份模型，内存随 worker 数线性增长。
+本模块改为：
+
+    1. 独立推理进程：应用启动时（create_app）拉起一个常驻进程，加载并预热模型，
+       通过本机 Unix Socket 对所有 worker 提供服务。多个 worker 同时启动时用文件锁保证只拉起一个。
+       推理进程与主进程（gunicorn master / flask 进程，即进程组组长）同进程组，主进程退出后随之退出；
+       Socket 文件名带代码版本号（本模块源码哈希），部署新代码后 worker 连接新版本的推理进程，
+       新进程就绪后通知其他版本的推理进程退出，不会继续用旧代码处理请求
+    2. onnxruntime 线程调优：推理会话的 intra-op 线程数由 BG_REMOVAL_THREADS 控制，
+       inter-op 固定为 1（单模型串行推理，多余的 inter-op 线程只会争抢 CPU）
+    3. 请求队列与批处理：推理线程每轮从队列中最多取 BG_REMOVAL_BATCH_MAX 个请求，
+       相同内容的请求合并为一次推理
+    4. 结果缓存：按输入内容哈希（SHA-256）+ 背景色缓存最终 JPEG 字节，按总字节数做 LRU 淘汰，
+       同一张照片在材料生成、体检表插图等环节重复处理时直接命中
+
+推理进程仍在加载模型时，请求最多等待 BG_REMOVAL_STARTUP_TIMEOUT_SEC 秒直到其就绪，
+不在 worker 内另行加载模型。推理进程不可用（模型加载失败、启动超时、请求出错）或未返回结果时
+返回 None（调用方保留原图），并在 BG_REMOVAL_RETRY_COOLDOWN_SEC 秒内不再等待推理进程；
+设置 BG_REMOVAL_LOCAL_FALLBACK=true 时改为回退到当前进程内的 BgRemovalEngine（每个 worker 各加载一份模型）。
+关闭 BG_REMOVAL_SERVICE_ENABLED 或平台不支持 Unix Socket 时直接使用进程内引擎，行为与原实现一致。
+
+环境变量:
+    BG_REMOVAL_SERVICE_ENABLED   是否使用独立推理进程（默认 true）
+    BG_REMOVAL_LOCAL_FALLBACK    推理进程不可用时是否回退到进程内推理（默认 false）
+    BG_REMOVAL_SOCKET            Unix Socket 路径（默认 database/run/bg_removal.sock，实际文件名追加代码版本号）
+    BG_REMOVAL_OWNER_PID         推理进程跟随的主进程 PID（默认为拉起它的进程所在进程组的组长）
+    BG_REMOVAL_THREADS           onnxruntime intra-op 线程数（默认 min(4, CPU 核数)）
+    BG_REMOVAL_BATCH_MAX         每轮最多处理的请求数（默认 4）
+    BG_REMOVAL_BATCH_WAIT_MS     凑批等待时间（默认 20ms）
+    BG_REMOVAL_CACHE_MB          结果缓存上限（默认 64MB）
+
+命令行:
+    python -m services.bg_removal_service [socket_path]   # 前台运行推理进程（调试用）
+
+可选依赖:
+    - rembg / onnxruntime : 背景去除模型
+    - cv2                 : alpha 掩码膨胀修复
+"""
+import glob
+import hashlib
+import io
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+from PIL import Image
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BG_REMOVAL_MODEL = 'u2net_human_seg'
+BG_REMOVAL_JPEG_QUALITY = 95
+BG_REMOVAL_REQUEST_TIMEOUT_SEC = 120
+BG_REMOVAL_STARTUP_TIMEOUT_SEC = 60
+BG_REMOVAL_RETRY_COOLDOWN_SEC = 300
+# 推理进程检查主进程是否存活的间隔
+BG_REMOVAL_OWNER_POLL_SEC = 2
+
+# ======================== 可选依赖加载 ========================
+CV2_IMPORT_ERROR = ''
+REMBG_IMPORT_ERROR = ''
+FCNTL_IMPORT_ERROR = ''
+
+try:
+    import cv2
+except Exception as err:
+    cv2 = None
+    CV2_IMPORT_ERROR = str(err)
+
+try:
+    from rembg import remove, new_session
+except Exception as err:
+    remove = None
+    new_session = None
+    REMBG_IMPORT_ERROR = str(err)
+
+try:
+    import fcntl
+except Exception as err:
+    fcntl = None
+    FCNTL_IMPORT_ERROR = str(err)
+
+
+def _env_int(name, default, minimum=1):
+    try:
+        return max(minimum, int(os.getenv(name, str(default))))
+    except (TypeError, ValueError):
+        return default
+
+
+def is_available():
+    """rembg 与 cv2 是否均已安装。"""
+    return remove is not None and cv2 is not None
+
+
+def service_enabled():
+    return os.getenv('BG_REMOVAL_SERVICE_ENABLED', 'true').lower() in ('true', '1', 'yes')
+
+
+def local_fallback_enabled():
+    return os.getenv('BG_REMOVAL_LOCAL_FALLBACK', 'false').lower() in ('true', '1', 'yes')
+
+
+def _source_version():
+    """本模块源码的 SHA-256 前 12 位，作为推理进程的代码版本号。"""
+    try:
+        with open(os.path.abspath(__file__), 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()[:12]
+    except OSError:
+        return 'unknown'
+
+
+SERVICE_VERSION = _source_version()
+
+
+def _base_socket_path():
+    return os.getenv(
+        'BG_REMOVAL_SOCKET',
+        os.path.join(PROJECT_DIR, 'database', 'run', 'bg_removal.sock')
+    )
+
+
+def get_socket_path():
+    """当前代码版本的推理进程 Socket 路径：<BG_REMOVAL_SOCKET 去扩展名>-<版本号><扩展名>。"""
+    root, ext = os.path.splitext(_base_socket_path())
+    return f'{root}-{SERVICE_VERSION}{ext}'
+
+
+def get_owner_pid():
+    """推理进程跟随的主进程：BG_REMOVAL_OWNER_PID，默认当前进程组组长（gunicorn master / flask 进程）。"""
+    owner = _env_int('BG_REMOVAL_OWNER_PID', 0, 0)
+    if owner:
+        return owner
+    try:
+        return os.getpgrp()
+    except AttributeError:
+        return os.getpid()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_intra_op_threads():
+    return _env_int('BG_REMOVAL_THREADS', min(4, os.cpu_count() or 1))
+
+
+def cache_key(data, bg_color):
+    """按输入字节内容和背景色计算缓存键。"""
+    hasher = hashlib.sha256(data)
+    hasher.update(('|%d,%d,%d' % tuple(bg_color)).encode('ascii'))
+    return hasher.hexdigest()
+
+
+# ======================== 推理流水线 ========================
+
+def create_session(threads=None):
+    """创建调优后的 rembg 会话（intra-op 线程数可配置，inter-op 固定为 1）。"""
+    import onnxruntime as ort
+
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = threads or get_intra_op_threads()
+    sess_opts.inter_op_num_threads = 1
+    sess_opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    return new_session(BG_REMOVAL_MODEL, sess_opts=sess_opts)
+
+
+def render_with_background(session, data, bg_color):
+    """
+    去除照片背景并合成到纯色背景上，返回 JPEG 字节。
+
+    处理步骤与原 image_service.change_id_photo_bg 相同：
+    rembg 抠图 -> alpha 通道 3x3 膨胀一次（填补服装等区域的透明缝隙）-> 与背景色 alpha 合成。
+    """
+    output_img = remove(data, session=session)
+    img_no_bg = Image.open(io.BytesIO(output_img)).convert('RGBA')
+
+    img_np = np.array(img_no_bg)
+    kernel = np.ones((3, 3), np.uint8)
+    img_np[:, :, 3] = cv2.dilate(img_np[:, :, 3], kernel, iterations=1)
+    img_no_bg_fixed = Image.fromarray(img_np, mode='RGBA')
+
+    bg_img = Image.new('RGBA', img_no_bg_fixed.size, tuple(bg_color) + (255,))
+    result = Image.alpha_composite(bg_img, img_no_bg_fixed).convert('RGB')
+
+    buf = io.BytesIO()
+    result.save(buf, format='JPEG', quality=BG_REMOVAL_JPEG_QUALITY)
+    for img in (img_no_bg, img_no_bg_fixed, bg_img, result):
+        try:
+            img.close()
+        except Exception:
+            pass
+    return buf.getvalue()
+
+
+def _open_default_processor():
+    """在推理线程内加载模型并预热，返回 process(data, bg_color) -> bytes。"""
+    session = create_session()
+    # 预热：首轮推理会触发 onnxruntime 的内存分配和图优化，放在启动阶段完成
+    warmup = io.BytesIO()
+    Image.new('RGB', (64, 64), (128, 128, 128)).save(warmup, format='JPEG')
+    try:
+        render_with_background(session, warmup.getvalue(), (255, 255, 255))
+    except Exception as err:
+        print(f'[bg_removal] 模型预热失败: {err}')
+
+    def process(data, bg_color):
+        return render_with_background(session, data, bg_color)
+
+    return process
+
+
+# ======================== 结果缓存 ========================
+
+class ResultCache:
+    """按总字节数限制容量的线程安全 LRU 缓存。"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if value is None or len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+
+# ======================== 推理引擎 ========================
+
+class BgRemovalEngine:
+    """
+    单线程背景替换推理引擎。
+
+    processor_factory 在推理线程内调用，返回 process(data, bg_color) -> bytes。
+    rembg 会话内部已使用 intra-op 多线程，因此推理本身串行执行；
+    每轮最多取 batch_max 个请求，同一轮内缓存键相同的请求只推理一次。
+    """
+
+    def __init__(self, processor_factory=_open_default_processor, cache_bytes=None,
+                 batch_max=None, batch_wait_ms=None):
+        self._processor_factory = processor_factory
+        self._cache = ResultCache(
+            cache_bytes if cache_bytes is not None
+            else _env_int('BG_REMOVAL_CACHE_MB', 64) * 1024 * 1024
+        )
+        self._batch_max = batch_max or _env_int('BG_REMOVAL_BATCH_MAX', 4)
+        wait_ms = batch_wait_ms if batch_wait_ms is not None else _env_int('BG_REMOVAL_BATCH_WAIT_MS', 20, 0)
+        self._batch_wait = wait_ms / 1000.0
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._ready = threading.Event()
+        self.load_error = None
+        self.stats = {'hits': 0, 'misses': 0, 'inferences': 0, 'batches': 0, 'errors': 0}
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='bg-removal', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        with self._start_lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout=5)
+
+    def wait_ready(self, timeout=None):
+        """等待模型加载（含预热）结束，返回模型是否可用（加载失败返回 False）。"""
+        return self._ready.wait(timeout) and self.load_error is None
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self._batch_wait
+        while len(batch) < self._batch_max:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        try:
+            process = self._processor_factory()
+        except Exception as err:
+            print(f'[bg_removal] 模型加载失败: {err}')
+            self.load_error = str(err) or type(err).__name__
+            process = None
+        self._ready.set()
+
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            self.stats['batches'] += 1
+            for key, data, bg_color, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    with self._pending_lock:
+                        self._pending.pop(key, None)
+                    continue
+                result = self._cache.get(key)
+                if result is None and process is not None:
+                    try:
+                        result = process(data, bg_color)
+                        self.stats['inferences'] += 1
+                    except Exception as err:
+                        print(f'[bg_removal] 背景替换失败: {err}')
+                        self.stats['errors'] += 1
+                        result = None
+                self._cache.put(key, result)
+                with self._pending_lock:
+                    self._pending.pop(key, None)
+                future.set_result(result)
+
+    def submit(self, data, bg_color=(255, 255, 255)):
+        """提交一张照片，返回 Future（结果为 JPEG 字节，失败为 None）。"""
+        bg_color = tuple(int(c) for c in bg_color)
+        key = cache_key(data, bg_color)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.stats['hits'] += 1
+            future = Future()
+            future.set_result(cached)
+            return future
+        with self._pending_lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.stats['hits'] += 1
+                return pending
+            self.stats['misses'] += 1
+            future = Future()
+            self._pending[key] = future
+        self.start()
+        self._queue.put((key, data, bg_color, future))
+        return future
+
+    def process(self, data, bg_color=(255, 255, 255), timeout=BG_REMOVAL_REQUEST_TIMEOUT_SEC):
+        try:
+            return self.submit(data, bg_color).result(timeout=timeout)
+        except Exception:
+            return None
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats.update({
+            'cache_entries': len(self._cache),
+            'cache_bytes': self._cache.size_bytes,
+            'queue_depth': self._queue.qsize(),
+            'ready': self._ready.is_set() and self.load_error is None,
+            'load_error': self.load_error,
+        })
+        return stats
+
+    def clear_cache(self):
+        self._cache.clear()
+
+
+# ======================== 推理进程（服务端） ========================
+
+def _handle_connection(conn, engine, stop_event, server_info):
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            op = message[0] if message else None
+            if op == 'remove':
+                _, data, bg_color = message
+                conn.send(('ok', engine.process(data, bg_color)))
+            elif op == 'stats':
+                conn.send(('ok', engine.snapshot()))
+            elif op == 'ping':
+                conn.send(('ok', dict(server_info, ready=engine.wait_ready(0))))
+            elif op == 'shutdown':
+                # 新版本的推理进程就绪后通知旧版本退出
+                conn.send(('ok', True))
+                stop_event.set()
+            else:
+                conn.send(('error', f'unknown op: {op}'))
+    finally:
+        conn.close()
+
+
+def _retire_other_versions(socket_path):
+    """通知同目录下其他代码版本的推理进程退出，并清理无人监听的旧 Socket 文件。"""
+    root, ext = os.path.splitext(socket_path)
+    suffix = f'-{SERVICE_VERSION}'
+    if not root.endswith(suffix):
+        return
+    for path in glob.glob(f'{glob.escape(root[:-len(suffix)])}-*{ext}'):
+        if path == socket_path:
+            continue
+        try:
+            _request(('shutdown',), path, timeout=2)
+            print(f'[bg_removal] 已通知旧版本推理服务退出: {path}')
+        except (ConnectionRefusedError, FileNotFoundError):
+            for stale in (path, path + '.lock', path + '.error'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+        except Exception as err:
+            print(f'[bg_removal] 通知旧版本推理服务退出失败 {path}: {err}')
+
+
+def _watch_owner(owner_pid, stop_event):
+    while not stop_event.wait(BG_REMOVAL_OWNER_POLL_SEC):
+        if not _pid_alive(owner_pid):
+            print(f'[bg_removal] 主进程 {owner_pid} 已退出，推理服务随之退出')
+            stop_event.set()
+
+
+def serve(socket_path=None, engine=None, ready_event=None, stop_event=None, owner_pid=None):
+    """
+    运行推理服务：启动引擎（加载并预热模型），然后在 Unix Socket 上接受请求。
+
+    每个连接由一个线程处理，连接线程只负责收发，推理统一交给引擎的推理线程。
+    owner_pid（默认取 BG_REMOVAL_OWNER_PID）退出或收到 shutdown 请求时服务停止。
+    """
+    from multiprocessing.connection import Client, Listener
+
+    socket_path = socket_path or get_socket_path()
+    stop_event = stop_event or threading.Event()
+    owner_pid = owner_pid if owner_pid is not None else _env_int('BG_REMOVAL_OWNER_PID', 0, 0)
+    os.makedirs(os.path.dirname(socket_path), mode=0o700, exist_ok=True)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    engine = engine or BgRemovalEngine()
+    engine.start()
+    if not engine.wait_ready():
+        # 模型不可用时不监听 Socket，写下失败原因后退出，等待中的客户端据此提前放弃
+        print(f'[bg_removal] 模型不可用，推理服务退出: {engine.load_error}')
+        try:
+            with open(socket_path + '.error', 'w', encoding='utf-8') as f:
+                f.write(str(engine.load_error))
+        except OSError:
+            pass
+        engine.stop()
+        return
+
+    old_umask = os.umask(0o177)
+    try:
+        listener = Listener(socket_path, family='AF_UNIX')
+    finally:
+        os.umask(old_umask)
+    print(f'[bg_removal] 推理服务已就绪: {socket_path} (version={SERVICE_VERSION}, '
+          f'intra-op threads={get_intra_op_threads()}, owner={owner_pid or "-"})')
+    if ready_event is not None:
+        ready_event.set()
+    _retire_other_versions(socket_path)
+
+    def _wake_on_stop():
+        # 关闭监听 Socket 不会唤醒阻塞中的 accept，连一次自身让主循环检查停止标志
+        stop_event.wait()
+        try:
+            Client(socket_path, family='AF_UNIX').close()
+        except Exception:
+            pass
+    threading.Thread(target=_wake_on_stop, daemon=True).start()
+    if owner_pid:
+        threading.Thread(target=_watch_owner, args=(owner_pid, stop_event), daemon=True).start()
+
+    server_info = {'version': SERVICE_VERSION, 'pid': os.getpid(), 'owner': owner_pid}
+    try:
+        while not stop_event.is_set():
+            try:
+                conn = listener.accept()
+            except OSError:
+                break
+            if stop_event.is_set():
+                conn.close()
+                break
+            threading.Thread(
+                target=_handle_connection, args=(conn, engine, stop_event, server_info), daemon=True
+            ).start()
+    finally:
+        try:
+            listener.close()
+        except Exception:
+            pass
+        engine.stop()
+
+
+# ======================== 客户端 ========================
+
+def _request(message, socket_path=None, timeout=BG_REMOVAL_REQUEST_TIMEOUT_SEC):
+    from multiprocessing.connection import Client
+
+    conn = Client(socket_path or get_socket_path(), family='AF_UNIX')
+    try:
+        conn.send(message)
+        if not conn.poll(timeout):
+            raise TimeoutError('bg removal service timed out')
+        status, payload = conn.recv()
+    finally:
+        conn.close()
+    if status != 'ok':
+        raise RuntimeError(payload)
+    return payload
+
+
+def ping(socket_path=None):
+    """推理服务是否在线、模型已加载完成且与当前代码版本一致。"""
+    try:
+        info = _request(('ping',), socket_path, timeout=2)
+    except Exception:
+        return False
+    return isinstance(info, dict) and bool(info.get('ready')) and info.get('version') == SERVICE_VERSION
+
+
+def _spawn_server(socket_path):
+    """拉起推理进程：留在当前进程组（随主进程一起收到终止信号），并监视主进程存活。"""
+    log_dir = os.path.join(PROJECT_DIR, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    env = dict(os.environ, BG_REMOVAL_OWNER_PID=str(get_owner_pid()))
+    with open(os.path.join(log_dir, 'bg_removal.log'), 'ab') as log_file:
+        subprocess.Popen(
+            [sys.executable, '-m', 'services.bg_removal_service', socket_path],
+            cwd=PROJECT_DIR,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+        )
+
+
+def ensure_server(socket_path=None, wait_timeout=0):
+    """
+    确保推理进程已启动。多个 worker 并发调用时通过文件锁只拉起一个进程。
+
+    wait_timeout > 0 时阻塞等待服务就绪，返回服务是否可用。
+    """
+    if not (service_enabled() and is_available() and fcntl is not None and hasattr(socket, 'AF_UNIX')):
+        return False
+    socket_path = socket_path or get_socket_path()
+    if ping(socket_path):
+        return True
+
+    os.makedirs(os.path.dirname(socket_path), mode=0o700, exist_ok=True)
+    with open(socket_path + '.lock', 'a+') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # 持锁后再检查：进程存活（socket 文件存在）但仍在加载模型时不重复拉起
+            starting = False
+            lock_file.seek(0)
+            try:
+                spawned_at = float(lock_file.read().strip() or 0)
+                starting = time.time() - spawned_at < BG_REMOVAL_STARTUP_TIMEOUT_SEC
+            except ValueError:
+                pass
+            if not starting and not ping(socket_path):
+                if os.path.exists(socket_path + '.error'):
+                    os.remove(socket_path + '.error')
+                _spawn_server(socket_path)
+                lock_file.seek(0)
+                lock_file.truncate()
+                lock_file.write(str(time.time()))
+                lock_file.flush()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        if ping(socket_path):
+            return True
+        if os.path.exists(socket_path + '.error'):
+            return False
+        time.sleep(0.5)
+    return wait_timeout > 0 and ping(socket_path)
+
+
+_local_engine = None
+_local_engine_lock = threading.Lock()
+# 推理进程启动失败后的冷却截止时间：冷却期内不再等待推理进程，避免每个请求都等待启动超时
+_service_retry_after = 0.0
+
+
+def get_local_engine():
+    """返回进程内推理引擎（首次调用时加载模型）。"""
+    global _local_engine
+    with _local_engine_lock:
+        if _local_engine is None:
+            _local_engine = BgRemovalEngine().start()
+        return _local_engine
+
+
+def _service_supported():
+    return service_enabled() and fcntl is not None and hasattr(socket, 'AF_UNIX')
+
+
+def _fallback(data, bg_color, timeout):
+    if not local_fallback_enabled():
+        return None
+    return get_local_engine().process(data, bg_color, timeout=timeout)
+
+
+def remove_background(data, bg_color=(255, 255, 255), timeout=BG_REMOVAL_REQUEST_TIMEOUT_SEC):
+    """
+    去除照片背景并替换为 bg_color，返回 JPEG 字节；依赖不可用或处理失败时返回 None。
+
+    交给共享推理进程处理，推理进程仍在加载模型时等待其就绪；
+    推理进程不可用时返回 None，只有开启 BG_REMOVAL_LOCAL_FALLBACK 才在当前进程内加载模型处理。
+    """
+    if not data or not is_available():
+        return None
+    global _service_retry_after
+    bg_color = tuple(int(c) for c in bg_color)
+
+    if not _service_supported():
+        return get_local_engine().process(data, bg_color, timeout=timeout)
+
+    if time.monotonic() >= _service_retry_after:
+        if ensure_server(wait_timeout=BG_REMOVAL_STARTUP_TIMEOUT_SEC):
+            try:
+                result = _request(('remove', data, bg_color), timeout=timeout)
+            except Exception as err:
+                print(f'[bg_removal] 推理服务请求失败: {err}')
+                _service_retry_after = time.monotonic() + BG_REMOVAL_RETRY_COOLDOWN_SEC
+            else:
+                if result is not None:
+                    return result
+                # 单张照片推理失败：推理服务本身仍可继续使用，不进入冷却
+                print('[bg_removal] 推理服务未返回结果')
+        else:
+            print('[bg_removal] 推理服务不可用')
+            _service_retry_after = time.monotonic() + BG_REMOVAL_RETRY_COOLDOWN_SEC
+
+    return _fallback(data, bg_color, timeout)
+
+
+def start_service(app):
+    """应用启动时调用：后台拉起推理进程（不阻塞启动流程）。"""
+    if not service_enabled():
+        return
+    if not is_available():
+        app.logger.warning(
+            'rembg/cv2 unavailable, background removal service not started; cv2_error=%s rembg_error=%s',
+            CV2_IMPORT_ERROR or '-',
+            REMBG_IMPORT_ERROR or '-'
+        )
+        return
+    threading.Thread(target=ensure_server, name='bg-removal-boot', daemon=True).start()
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,416 @@
+"""
+内容寻址的附件去重存储（SHA-256 + 引用计数）。
+
+同一个人每报名一个项目，身份证、学历证书、户口本等附件就在新的
+students/<培训类型>-<单位>-<姓名>/ 目录下再存一份，本地和 COS 上重复占用空间，
+材料生成也会对完全相同的输入再跑一遍裁剪排版。本模块在 storage_service 之下提供内容寻址层：
+
+    1. Blob：内容按 SHA-256 存放在 BLOB_STORE_DIR/<前两位>/<sha256>，相同内容只存一份
+    2. 引用：数据库与业务代码仍使用原有相对路径 key，本地 key 文件是指向 blob 的硬链接；
+       引用计数即 blob 的硬链接数减一，删除/覆盖 key 文件时自然减少，无需额外记账
+    3. COS 去重：<sha256>.cos 记录已上传过该内容的 COS key，再次上传相同内容时
+       改为服务端复制，不再上传文件内容；源对象已删除或内容不一致时照常上传
+    4. 材料输出复用：以 (材料类型, 输入文件 SHA-256, 调整参数, 版本) 为键记录生成结果，
+       输入完全相同时直接链接已有输出，跳过裁剪排版
+    5. 回收：gc() 删除引用计数为 0 的 blob 以及指向已回收 blob 的材料输出记录
+
+硬链接要求 blob 目录与 students/ 位于同一文件系统；不支持硬链接（跨设备、文件系统限制）时
+入库返回 None，文件保持原有的独立存储。
+
+注意：key 文件与 blob 共享 inode，改写已入库的文件必须先写临时文件再 os.replace，
+不能原地截断重写（storage_service.save_file、material_service.write_cv_image 均为原子替换，
+其他写入方使用 atomic_output）。
+
+环境变量:
+    BLOB_STORE_DIR   blob 目录（默认 <BASE_DIR>/blobs）
+    BLOB_DEDUP       是否启用去重（默认 1）
+    BLOB_MIN_BYTES   小于该字节数的文件不入库（默认 4096）
+"""
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+HASH_CHUNK_SIZE = 1024 * 1024
+MATERIAL_DIR_NAME = 'materials'
+MATERIAL_OUTPUT_DIR_SUFFIX = '-报名材料'
+COS_INDEX_SUFFIX = '.cos'
+_BLOB_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+
+def enabled():
+    """BLOB_DEDUP 未关闭时启用去重。"""
+    return os.getenv('BLOB_DEDUP', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def min_bytes():
+    try:
+        return max(0, int(os.getenv('BLOB_MIN_BYTES', '4096')))
+    except ValueError:
+        return 4096
+
+
+def get_root():
+    """返回 blob 目录（默认位于存储根目录下，保证与 students/ 同一文件系统）。"""
+    root = os.getenv('BLOB_STORE_DIR', '').strip()
+    if root:
+        return root
+    from services import storage_service
+    return os.path.join(storage_service.get_base_dir(), 'blobs')
+
+
+def root_for(abs_path):
+    """
+    返回与本地文件同属一个存储根目录的 blob 目录：<students 的上级目录>/blobs。
+
+    设置了 BLOB_STORE_DIR 时返回该目录；路径不在 students/ 下时返回 None（不做去重）。
+    """
+    if os.getenv('BLOB_STORE_DIR', '').strip():
+        return get_root()
+    current = os.path.dirname(os.path.abspath(abs_path))
+    while True:
+        parent = os.path.dirname(current)
+        if os.path.basename(current) == 'students':
+            return os.path.join(parent, 'blobs')
+        if parent == current:
+            return None
+        current = parent
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(abs_path):
+    """分块计算文件 SHA-256（十六进制）。"""
+    hasher = hashlib.sha256()
+    with open(abs_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def blob_path(digest, root=None):
+    root = root or get_root()
+    return os.path.join(root, digest[:2], digest)
+
+
+def _tmp_name(path):
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.lnk'
+
+
+def _link_over(src, dest):
+    """以指向 src 的硬链接原子替换 dest（先链接到临时名再 os.replace）。"""
+    tmp_path = _tmp_name(dest)
+    os.link(src, tmp_path)
+    try:
+        os.replace(tmp_path, dest)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def atomic_output(path):
+    """
+    为改写 path 提供临时文件路径：with 块内写入临时文件，正常结束后 os.replace 到 path。
+
+    path 可能是 blob 的硬链接，原地截断重写会改掉所有共享该内容的文件；
+    替换只改变 path 这一个目录项，其他引用保持原内容。异常时删除临时文件。
+    """
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# ======================== 入库 / 引用 ========================
+
+def ingest(abs_path, digest=None, root=None):
+    """
+    将本地文件纳入 blob 存储：内容首次出现时登记为新 blob，
+    已存在相同内容时把该文件替换为指向已有 blob 的硬链接（释放重复的磁盘空间）。
+
+    参数:
+        abs_path: 本地文件绝对路径
+        digest: 已计算好的 SHA-256（None 时现场计算）
+        root: blob 目录（默认 root_for(abs_path)）
+
+    返回:
+        dict: {'digest', 'deduped'}；未启用、文件过小、不在 students/ 下或文件系统不支持硬链接时返回 None
+    """
+    if not enabled():
+        return None
+    try:
+        size = os.path.getsize(abs_path)
+        if size < min_bytes():
+            return None
+        root = root or root_for(abs_path)
+        if not root:
+            return None
+        digest = digest or hash_file(abs_path)
+        target = blob_path(digest, root)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(abs_path, target)
+            return {'digest': digest, 'deduped': False}
+        except FileExistsError:
+            pass
+
+        if os.path.samefile(target, abs_path):
+            return {'digest': digest, 'deduped': False}
+        if os.path.getsize(target) != size:
+            # blob 与哈希不符（被外部改写），以当前文件重新登记
+            _link_over(abs_path, target)
+            return {'digest': digest, 'deduped': False}
+        _link_over(target, abs_path)
+        return {'digest': digest, 'deduped': True}
+    except OSError as e:
+        print(f'[blob_store] 入库失败 {abs_path}: {e}')
+        return None
+
+
+def ref_count(digest, root=None):
+    """返回 blob 的引用数（硬链接数减去 blob 自身）；blob 不存在返回 0。"""
+    try:
+        return max(0, os.stat(blob_path(digest, root)).st_nlink - 1)
+    except OSError:
+        return 0
+
+
+def link_blob(digest, dest, root=None):
+    """
+    把 blob 放到 dest（原子替换；不支持硬链接时复制）。
+
+    返回:
+        bool: blob 不存在返回 False
+    """
+    src = blob_path(digest, root)
+    if not os.path.isfile(src):
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    try:
+        _link_over(src, dest)
+    except OSError:
+        tmp_path = _tmp_name(dest)
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dest)
+    return True
+
+
+# ======================== COS 内容索引 ========================
+
+def cos_source(digest, root=None):
+    """返回曾上传过该内容的 COS key；未记录返回 None。"""
+    try:
+        with open(blob_path(digest, root) + COS_INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def remember_cos_key(digest, key, root=None):
+    """记录该内容已存在于 COS 的 key（供后续相同内容改为服务端复制）。"""
+    path = blob_path(digest, root) + COS_INDEX_SUFFIX
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = _tmp_name(path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(key)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f'[blob_store] 记录 COS 索引失败 {key}: {e}')
+
+
+# ======================== 材料输出复用 ========================
+
+def material_key(scope, input_paths, params=None, version=1):
+    """按材料类型、输入文件内容、调整参数与版本计算材料输出的缓存键。"""
+    payload = {
+        'scope': scope,
+        'version': version,
+        'inputs': [hash_file(p) if p and os.path.isfile(p) else None for p in input_paths],
+        'params': params or {},
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _material_record_path(cache_key, root=None):
+    root = root or get_root()
+    return os.path.join(root, MATERIAL_DIR_NAME, cache_key[:2], f'{cache_key}.json')
+
+
+def lookup_material(cache_key, root=None):
+    """
+    返回材料输出记录 {'digest', 'suffix'}；未记录或对应 blob 已回收时返回 None。
+    """
+    try:
+        with open(_material_record_path(cache_key, root), 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(record, dict) or not os.path.isfile(blob_path(record.get('digest', '00'), root)):
+        return None
+    return record
+
+
+def store_material(cache_key, output_path, suffix, root=None):
+    """
+    将生成好的材料输出入库并记录缓存键；输出文件本身成为 blob 的一个引用。
+
+    返回:
+        dict 或 None: 写入的记录；入库失败（未启用、文件系统不支持等）时返回 None
+    """
+    info = ingest(output_path, root=root)
+    if not info:
+        return None
+    record = {'digest': info['digest'], 'suffix': suffix, 'created_at': int(time.time())}
+    path = _material_record_path(cache_key, root)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = _tmp_name(path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f'[blob_store] 记录材料输出失败 {output_path}: {e}')
+        return None
+    return record
+
+
+def ingest_tree(directory, root=None, dry_run=False):
+    """
+    把目录下已有的文件逐个入库（去重前上传的历史文件补做去重）。
+
+    *-报名材料 目录是材料生成的输出，重新生成时会整体覆盖，不参与补做去重
+    （可复用的输出已由材料输出缓存登记）。
+
+    返回:
+        dict: {'files', 'ingested', 'deduped', 'bytes_saved'}；dry_run 时只统计可去重的文件
+    """
+    result = {'files': 0, 'ingested': 0, 'deduped': 0, 'bytes_saved': 0}
+    root = root or root_for(os.path.join(directory, '_'))
+    if not root:
+        return result
+    seen = set()
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [name for name in dirnames if not name.endswith(MATERIAL_OUTPUT_DIR_SUFFIX)]
+        for filename in sorted(filenames):
+            if filename.endswith(('.tmp', '.tmp_upload', '.lnk')):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if size < min_bytes():
+                continue
+            result['files'] += 1
+            if dry_run:
+                digest = hash_file(path)
+                existing = blob_path(digest, root)
+                if digest in seen or (os.path.isfile(existing) and not os.path.samefile(existing, path)):
+                    result['deduped'] += 1
+                    result['bytes_saved'] += size
+                seen.add(digest)
+                continue
+            info = ingest(path, root=root)
+            if not info:
+                continue
+            result['ingested'] += 1
+            if info['deduped']:
+                result['deduped'] += 1
+                result['bytes_saved'] += size
+    return result
+
+
+# ======================== 统计 / 回收 ========================
+
+def _iter_blobs(root):
+    if not os.path.isdir(root):
+        return
+    for shard in sorted(os.listdir(root)):
+        shard_dir = os.path.join(root, shard)
+        if shard == MATERIAL_DIR_NAME or not os.path.isdir(shard_dir):
+            continue
+        for name in os.listdir(shard_dir):
+            if _BLOB_NAME.match(name):
+                path = os.path.join(shard_dir, name)
+                try:
+                    yield name, path, os.stat(path)
+                except OSError:
+                    continue
+
+
+def stats(root=None):
+    """
+    汇总 blob 存储占用。
+
+    返回:
+        dict: {'blobs', 'references', 'unreferenced', 'stored_bytes', 'logical_bytes', 'saved_bytes'}
+        logical_bytes 为不去重时各引用各存一份的总字节数
+    """
+    root = root or get_root()
+    result = {'blobs': 0, 'references': 0, 'unreferenced': 0,
+              'stored_bytes': 0, 'logical_bytes': 0, 'saved_bytes': 0}
+    referenced_bytes = 0
+    for _, _, st in _iter_blobs(root):
+        refs = max(0, st.st_nlink - 1)
+        result['blobs'] += 1
+        result['references'] += refs
+        result['stored_bytes'] += st.st_size
+        result['logical_bytes'] += st.st_size * refs
+        if refs:
+            referenced_bytes += st.st_size
+        else:
+            result['unreferenced'] += 1
+    result['saved_bytes'] = result['logical_bytes'] - referenced_bytes
+    return result
+
+
+def gc(root=None, dry_run=False):
+    """
+    回收引用计数为 0 的 blob，并清理指向已回收 blob 的材料输出记录。
+
+    返回:
+        dict: {'blobs_removed', 'bytes_freed', 'material_records_removed'}
+    """
+    root = root or get_root()
+    result = {'blobs_removed': 0, 'bytes_freed': 0, 'material_records_removed': 0}
+    removed = set()
+    for digest, path, st in list(_iter_blobs(root)):
+        if st.st_nlink > 1:
+            continue
+        removed.add(digest)
+        result['blobs_removed'] += 1
+        result['bytes_freed'] += st.st_size
+        if not dry_run:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    material_root = os.path.join(root, MATERIAL_DIR_NAME)
+    for dirpath, _, filenames in os.walk(material_root):
+        for filename in filenames:
+            if not filename.endswith('.json'):
+                continue
+            record = lookup_material(filename[:-len('.json')], root)
+            if record is not None and record['digest'] not in removed:
+                continue
+            result['material_records_removed'] += 1
+            if not dry_run:
+                try:
+                    os.remove(os.path.join(dirpath, filename))
+                except OSError:
+                    pass
+    return result
@@ -0,0 +1,284 @@
+"""
+COS 批量操作引擎（供 scripts/migrate_to_cos.py、scripts/fix_cos_headers.py 使用）。
+
+两个运维脚本原先逐个对象串行执行，每个对象都要等一次网络往返，数万个对象要跑数小时；
+中途 Ctrl-C 或 SSH 断开后只能从头再来。本模块提供通用的批量执行器：
+
+    1. 并发：有界线程池（--threads）执行单个对象操作；对象边枚举边提交，在途任务数有上限，
+       不必先把全部对象列表读入内存
+    2. 限速：按每秒操作数匀速放行（--rate），避免触发 COS 频控
+    3. 断点续做：完成（done/skipped）的 key 记入本地 SQLite 检查点（默认 database/bulk_ops.db），
+       再次执行同一作业时直接跳过；失败的 key 记为 failed，下次重新尝试。
+       收到 SIGINT / SIGTERM / SIGHUP（SSH 断开）时停止提交新任务，等在途任务结束并写入检查点后退出
+    4. dry-run：只枚举并统计待处理对象数与字节数（已扣除检查点中完成的部分），不执行操作
+    5. 吞吐报告：定期打印进度（对象/秒、MB/秒、预计剩余时间），结束时返回并打印汇总
+
+作业名（job）区分不同脚本与参数组合，同一检查点文件可保存多个作业的进度。
+"""
+import os
+import queue
+import signal
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CHECKPOINT_PATH = os.path.join(PROJECT_DIR, 'database', 'bulk_ops.db')
+
+# 单次写入检查点的最大行数 / 最长间隔
+_FLUSH_ROWS = 500
+_FLUSH_SEC = 2.0
+_COMPLETED = ('done', 'skipped')
+
+
+class RateLimiter:
+    """按固定间隔放行的限速器；rate <= 0 时不限速。线程安全。"""
+
+    def __init__(self, rate_per_sec):
+        self.rate = float(rate_per_sec or 0)
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + 1.0 / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Checkpoint:
+    """
+    SQLite 检查点：记录作业中每个 key 的处理结果。
+
+    只由协调线程读写（工作线程的结果经队列回传），不需要跨线程共享连接。
+    """
+
+    def __init__(self, path, job):
+        self.path = path
+        self.job = job
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS bulk_checkpoint (
+                job TEXT NOT NULL,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                detail TEXT NOT NULL DEFAULT '',
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job, key)
+            )
+        ''')
+        self.conn.commit()
+
+    def completed_keys(self):
+        rows = self.conn.execute(
+            'SELECT key FROM bulk_checkpoint WHERE job = ? AND status IN (?, ?)',
+            (self.job, *_COMPLETED),
+        )
+        return {row[0] for row in rows}
+
+    def record_many(self, rows):
+        """rows: [(key, status, bytes, detail), ...]"""
+        if not rows:
+            return
+        now = time.time()
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO bulk_checkpoint (job, key, status, bytes, detail, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(self.job, key, status, size, detail[:500], now) for key, status, size, detail in rows],
+        )
+        self.conn.commit()
+
+    def failed_keys(self):
+        rows = self.conn.execute(
+            'SELECT key FROM bulk_checkpoint WHERE job = ? AND status = ? ORDER BY key',
+            (self.job, 'failed'),
+        )
+        return [row[0] for row in rows]
+
+    def reset(self):
+        """清除本作业的全部进度。"""
+        self.conn.execute('DELETE FROM bulk_checkpoint WHERE job = ?', (self.job,))
+        self.conn.commit()
+
+    def summary(self):
+        rows = self.conn.execute(
+            'SELECT status, COUNT(*), COALESCE(SUM(bytes), 0) FROM bulk_checkpoint WHERE job = ? GROUP BY status',
+            (self.job,),
+        )
+        return {status: {'count': count, 'bytes': size} for status, count, size in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+def _install_stop_handlers(stop):
+    """SIGINT/SIGTERM/SIGHUP 只设置停止标志；返回恢复原处理函数的回调。"""
+    if threading.current_thread() is not threading.main_thread():
+        return lambda: None
+
+    previous = {}
+
+    def handler(signum, frame):
+        if not stop.is_set():
+            print(f'\n[bulk] 收到信号 {signum}，等待在途任务完成后退出（已完成的进度会保存）')
+        stop.set()
+
+    for name in ('SIGINT', 'SIGTERM', 'SIGHUP'):
+        signum = getattr(signal, name, None)
+        if signum is None:
+            continue
+        previous[signum] = signal.signal(signum, handler)
+
+    def restore():
+        for signum, old in previous.items():
+            signal.signal(signum, old)
+    return restore
+
+
+def _fmt_bytes(size):
+    return f'{size / 1024 / 1024:.1f}MB'
+
+
+def run_bulk(job, items, operation, threads=8, rate=0, checkpoint=None,
+             dry_run=False, progress_sec=5.0, total_hint=None):
+    """
+    并发执行批量操作。
+
+    参数:
+        job: 作业名（检查点按作业区分）
+        items: 可迭代的 (key, size, payload)，可以是边列举边产出的生成器
+        operation: operation(key, payload) -> 'done' | 'skipped'；抛异常视为 failed
+        threads: 并发线程数
+        rate: 每秒最多发起的操作数（0 不限速）
+        checkpoint: Checkpoint 实例（None 时不记录进度）
+        dry_run: True 时只统计，不调用 operation
+        progress_sec: 进度打印间隔（秒）
+        total_hint: 预估对象总数（用于计算剩余时间，可为 None）
+
+    返回:
+        dict: {'job', 'dry_run', 'interrupted', 'seen', 'already_done', 'pending', 'pending_bytes',
+               'done', 'skipped', 'failed', 'bytes', 'elapsed_sec', 'objects_per_sec', 'mb_per_sec',
+               'failed_keys'（最多 100 个）}
+    """
+    threads = max(1, int(threads))
+    completed = checkpoint.completed_keys() if checkpoint else set()
+    limiter = RateLimiter(rate)
+    stop = threading.Event()
+    results = queue.Queue()
+    slots = threading.BoundedSemaphore(threads * 4)
+    report = {
+        'job': job, 'dry_run': dry_run, 'interrupted': False,
+        'seen': 0, 'already_done': 0, 'pending': 0, 'pending_bytes': 0,
+        'done': 0, 'skipped': 0, 'failed': 0, 'bytes': 0, 'failed_keys': [],
+    }
+    started = time.monotonic()
+    state = {'rows': [], 'flushed_at': started, 'printed_at': started}
+
+    def work(key, size, payload):
+        try:
+            if stop.is_set():
+                results.put((key, 'cancelled', 0, ''))
+                return
+            limiter.acquire()
+            status = operation(key, payload) or 'done'
+            results.put((key, status, size if status == 'done' else 0, ''))
+        except Exception as e:
+            results.put((key, 'failed', 0, str(e)))
+        finally:
+            slots.release()
+
+    def drain(force=False):
+        while True:
+            try:
+                key, status, size, detail = results.get_nowait()
+            except queue.Empty:
+                break
+            if status == 'cancelled':
+                continue
+            report[status] = report.get(status, 0) + 1
+            report['bytes'] += size
+            if status == 'failed':
+                if len(report['failed_keys']) < 100:
+                    report['failed_keys'].append(key)
+                print(f'[FAIL] {key}: {detail}')
+            state['rows'].append((key, status, size, detail))
+        now = time.monotonic()
+        if checkpoint and state['rows'] and (
+                force or len(state['rows']) >= _FLUSH_ROWS or now - state['flushed_at'] >= _FLUSH_SEC):
+            checkpoint.record_many(state['rows'])
+            state['rows'] = []
+            state['flushed_at'] = now
+        elif not checkpoint:
+            state['rows'] = []
+        if progress_sec and now - state['printed_at'] >= progress_sec:
+            state['printed_at'] = now
+            print(_progress_line(report, now - started, total_hint))
+
+    restore = _install_stop_handlers(stop)
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for key, size, payload in items:
+                if stop.is_set():
+                    report['interrupted'] = True
+                    break
+                report['seen'] += 1
+                if key in completed:
+                    report['already_done'] += 1
+                    continue
+                report['pending'] += 1
+                report['pending_bytes'] += size or 0
+                if dry_run:
+                    continue
+                while not slots.acquire(timeout=0.5):
+                    drain()
+                executor.submit(work, key, size or 0, payload)
+                drain()
+            # 退出 with 时等待在途任务结束（最多 threads * 4 个），结果留在队列中统一写入检查点
+        drain(force=True)
+    finally:
+        restore()
+
+    if stop.is_set():
+        report['interrupted'] = True
+    elapsed = time.monotonic() - started
+    processed = report['done'] + report['skipped'] + report['failed']
+    report['elapsed_sec'] = round(elapsed, 2)
+    report['objects_per_sec'] = round(processed / elapsed, 1) if elapsed > 0 else 0.0
+    report['mb_per_sec'] = round(report['bytes'] / 1024 / 1024 / elapsed, 2) if elapsed > 0 else 0.0
+    return report
+
+
+def _progress_line(report, elapsed, total_hint):
+    processed = report['done'] + report['skipped'] + report['failed']
+    speed = processed / elapsed if elapsed > 0 else 0
+    line = (f'[bulk] 已处理 {processed}（完成 {report["done"]} 跳过 {report["skipped"]} 失败 {report["failed"]}）'
+            f'  {speed:.1f} 个/秒  {report["bytes"] / 1024 / 1024 / max(elapsed, 1e-6):.2f} MB/秒')
+    if total_hint and speed > 0:
+        remaining = max(0, total_hint - report['already_done'] - processed)
+        line += f'  预计剩余 {int(remaining / speed)} 秒'
+    return line
+
+
+def format_report(report):
+    """将 run_bulk 的结果格式化为多行文本。"""
+    lines = ['=' * 60]
+    if report['dry_run']:
+        lines.append(f'DRY-RUN 完成：共 {report["seen"]} 个对象，检查点中已完成 {report["already_done"]} 个，'
+                     f'待处理 {report["pending"]} 个（{_fmt_bytes(report["pending_bytes"])}）')
+    else:
+        lines.append(f'完成 {report["done"]} 个  跳过 {report["skipped"]} 个  失败 {report["failed"]} 个  '
+                     f'（检查点中已完成 {report["already_done"]} 个）')
+        lines.append(f'传输 {_fmt_bytes(report["bytes"])}  用时 {report["elapsed_sec"]} 秒  '
+                     f'{report["objects_per_sec"]} 个/秒  {report["mb_per_sec"]} MB/秒')
+    if report['interrupted']:
+        lines.append('作业被中断：重新执行同一命令即可从检查点继续')
+    lines.append('=' * 60)
+    return '\n'.join(lines)
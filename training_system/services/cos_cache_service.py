@@ -0,0 +1,313 @@
+"""
+cos-only 模式的本地磁盘读缓存。
+
+cos-only 部署下 storage_service.read_bytes 每次都从 COS 下载整个对象，pull_from_cos 也先把对象
+整体读入内存再写盘；材料生成、打包下载反复读取同一批附件，重复支付流量费用和网络延迟。本模块提供读穿透缓存：
+
+    1. 读穿透：fetch(key) 命中时直接返回本地缓存文件路径，未命中时从 COS 流式下载到缓存目录
+       （分块写临时文件后原子替换），不在内存中保留整个对象
+    2. ETag 重新验证：缓存文件旁的 .meta 记录对象 ETag 和上次验证时间；超过 COS_CACHE_REVALIDATE_SEC
+       后命中时先 HEAD 远端，ETag 不变则继续使用，变化则重新下载，远端已删除则清除缓存
+    3. 容量上限：按总字节数做 LRU 淘汰。各缓存文件的大小和最近使用时间记在缓存目录下的
+       SQLite 账本（ledger.db）中，所有 worker 进程共享同一份记账，总量不会随进程数翻倍；
+       账本为空时扫描目录按 mtime 恢复。命中时文件已被其他进程淘汰则按未命中重新下载
+    4. 单飞下载：同一 key 的并发未命中只下载一次（按 key 哈希分段加锁）
+    5. 打开文件：open_file(key) 在 fetch 返回路径后打开文件；路径返回与打开之间被其他线程或进程
+       淘汰时重新获取一次。文件一经打开，之后的淘汰不影响已打开的句柄
+
+缓存文件名 = SHA-256(存储 key) + 原扩展名，保留扩展名便于 cv2/PIL 按路径读取。
+
+环境变量:
+    COS_CACHE_DIR              缓存目录（默认 database/cos_cache）
+    COS_CACHE_MB               缓存上限（默认 2048MB）
+    COS_CACHE_REVALIDATE_SEC   ETag 重新验证间隔（默认 60 秒）
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+_LOCK_STRIPES = 64
+LEDGER_NAME = 'ledger.db'
+
+
+def _is_missing(error):
+    return 'NoSuchKey' in str(error) or '404' in str(error)
+
+
+def _etag(headers):
+    for name, value in (headers or {}).items():
+        if name.lower() == 'etag':
+            return str(value).strip('"')
+    return ''
+
+
+def stream_object_to_file(client, bucket, full_key, dest_path):
+    """
+    将 COS 对象分块写入 dest_path（临时文件 + 原子替换）。
+
+    返回:
+        str: 对象 ETag；对象不存在返回 None
+    """
+    try:
+        resp = client.get_object(Bucket=bucket, Key=full_key)
+    except Exception as e:
+        if _is_missing(e):
+            return None
+        raise
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    tmp_path = f'{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    stream = resp['Body'].get_raw_stream()
+    try:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                chunk = stream.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if hasattr(stream, 'close'):
+            stream.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return _etag(resp)
+
+
+class CosReadCache:
+    """按存储 key 寻址的 COS 对象磁盘缓存，按总字节数 LRU 淘汰。"""
+
+    def __init__(self, root, max_bytes, revalidate_sec=60):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.revalidate_sec = revalidate_sec
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self._ledger_ready = False
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'evictions': 0, 'bytes_downloaded': 0,
+                      'reopened': 0}
+
+    def path_for(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        ext = os.path.splitext(key)[1].lower()[:10]
+        return os.path.join(self.root, digest[:2], f'{digest}{ext}')
+
+    @staticmethod
+    def _meta_path(path):
+        return f'{path}.meta'
+
+    def _scan(self):
+        found = []
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if filename.endswith(('.tmp', '.meta')) or filename.startswith(LEDGER_NAME):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((path, st.st_size, st.st_mtime))
+        return found
+
+    @contextlib.contextmanager
+    def _ledger(self):
+        """打开共享账本并持有写锁（BEGIN IMMEDIATE），退出时提交；首次使用时建表，账本为空则扫描目录恢复。"""
+        os.makedirs(self.root, exist_ok=True)
+        # isolation_level=None：事务由显式的 BEGIN IMMEDIATE 控制，多个进程的记账串行执行
+        conn = sqlite3.connect(os.path.join(self.root, LEDGER_NAME), timeout=15, isolation_level=None)
+        try:
+            if not self._ledger_ready:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS cos_cache (
+                        path    TEXT PRIMARY KEY,
+                        size    INTEGER NOT NULL,
+                        used_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_cos_cache_used_at ON cos_cache(used_at)')
+            conn.execute('BEGIN IMMEDIATE')
+            if not self._ledger_ready:
+                if conn.execute('SELECT 1 FROM cos_cache LIMIT 1').fetchone() is None:
+                    conn.executemany('INSERT OR IGNORE INTO cos_cache VALUES (?, ?, ?)', self._scan())
+                self._ledger_ready = True
+            try:
+                yield conn
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def _remove(self, path):
+        for target in (path, self._meta_path(path)):
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+
+    def _touch(self, path):
+        """命中时刷新 LRU 位置；文件已被其他进程淘汰时返回 False（按未命中处理）。"""
+        now = time.time()
+        try:
+            size = os.path.getsize(path)
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            return False
+        except OSError:
+            pass
+        else:
+            try:
+                with self._ledger() as conn:
+                    conn.execute('INSERT OR REPLACE INTO cos_cache VALUES (?, ?, ?)', (path, size, now))
+            except sqlite3.Error as e:
+                print(f'[cos_cache] 更新缓存账本失败: {e}')
+        with self._lock:
+            self.stats['hits'] += 1
+        return True
+
+    def _account(self, path):
+        size = os.path.getsize(path)
+        evicted = 0
+        try:
+            with self._ledger() as conn:
+                conn.execute('INSERT OR REPLACE INTO cos_cache VALUES (?, ?, ?)', (path, size, time.time()))
+                evicted = self._evict(conn, keep=path)
+        except sqlite3.Error as e:
+            print(f'[cos_cache] 更新缓存账本失败: {e}')
+        with self._lock:
+            self.stats['misses'] += 1
+            self.stats['bytes_downloaded'] += size
+            self.stats['evictions'] += evicted
+
+    def _evict(self, conn, keep=None):
+        """在账本写锁内按最近使用时间淘汰，直到总字节数不超过上限；返回淘汰数量。"""
+        evicted = 0
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cos_cache').fetchone()[0]
+        while total > self.max_bytes:
+            rows = conn.execute(
+                'SELECT path, size FROM cos_cache WHERE path != ? ORDER BY used_at LIMIT 32', (keep or '',)
+            ).fetchall()
+            if not rows:
+                break
+            for path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute('DELETE FROM cos_cache WHERE path = ?', (path,))
+                self._remove(path)
+                total -= size
+                evicted += 1
+        return evicted
+
+    @property
+    def size_bytes(self):
+        """所有进程共享的缓存总字节数（来自账本）。"""
+        with self._ledger() as conn:
+            return conn.execute('SELECT COALESCE(SUM(size), 0) FROM cos_cache').fetchone()[0]
+
+    def _read_meta(self, path):
+        try:
+            with open(self._meta_path(path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, path, etag, checked_at):
+        tmp_path = f'{self._meta_path(path)}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'etag': etag, 'checked_at': checked_at}, f)
+        os.replace(tmp_path, self._meta_path(path))
+
+    def invalidate(self, key):
+        """写入/删除对象后清除对应缓存。"""
+        path = self.path_for(key)
+        try:
+            with self._ledger() as conn:
+                conn.execute('DELETE FROM cos_cache WHERE path = ?', (path,))
+        except sqlite3.Error as e:
+            print(f'[cos_cache] 更新缓存账本失败: {e}')
+        self._remove(path)
+
+    def fetch(self, key, client, bucket, full_key):
+        """
+        返回 key 对应的本地缓存文件路径（必要时下载或重新验证）；对象不存在返回 None。
+        """
+        path = self.path_for(key)
+        stripe = self._key_locks[hash(path) % _LOCK_STRIPES]
+        with stripe:
+            meta = self._read_meta(path) if os.path.exists(path) else None
+            now = time.time()
+            if meta is not None:
+                if now - meta.get('checked_at', 0) < self.revalidate_sec:
+                    if self._touch(path):
+                        return path
+                    meta = None
+            if meta is not None:
+                try:
+                    remote_etag = _etag(client.head_object(Bucket=bucket, Key=full_key))
+                except Exception as e:
+                    if not _is_missing(e):
+                        raise
+                    self.invalidate(key)
+                    return None
+                if remote_etag and remote_etag == meta.get('etag') and self._touch(path):
+                    self._write_meta(path, remote_etag, now)
+                    with self._lock:
+                        self.stats['revalidated'] += 1
+                    return path
+
+            etag = stream_object_to_file(client, bucket, full_key, path)
+            if etag is None:
+                self.invalidate(key)
+                return None
+            self._write_meta(path, etag, now)
+            self._account(path)
+            return path
+
+    def open_file(self, key, client, bucket, full_key):
+        """
+        以二进制只读方式打开 key 对应的缓存文件；对象不存在返回 None。
+        """
+        for attempt in range(2):
+            path = self.fetch(key, client, bucket, full_key)
+            if path is None:
+                return None
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                # 刚返回的缓存文件已被淘汰：再次 fetch 时按未命中重新下载
+                if attempt:
+                    raise
+                with self._lock:
+                    self.stats['reopened'] += 1
+
+    def snapshot(self):
+        with self._ledger() as conn:
+            entries, size_bytes = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cos_cache').fetchone()
+        with self._lock:
+            return dict(self.stats, entries=entries, size_bytes=size_bytes, max_bytes=self.max_bytes)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """返回进程内共享的 COS 读缓存（懒加载）。"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                root = os.environ.get('COS_CACHE_DIR', '').strip() or \
+                    os.path.join(PROJECT_DIR, 'database', 'cos_cache')
+                max_mb = int(os.environ.get('COS_CACHE_MB', '2048'))
+                revalidate = int(os.environ.get('COS_CACHE_REVALIDATE_SEC', '60'))
+                _cache = CosReadCache(root, max_mb * 1024 * 1024, revalidate)
+    return _cache
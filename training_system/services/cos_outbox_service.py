@@ -0,0 +1,306 @@
+"""
+COS 同步发件箱（dual 模式）。
+
+dual 模式下 save_file / save_from_local / move_temp_file / delete_file 原先在请求内同步调用 COS，
+每次上传和每份生成材料都要等待一次 COS 往返，失败只记警告、不再重试。本模块把 COS 操作改为异步：
+
+    1. 登记：本地写入成功后只在 cos_outbox 表登记一条 put / copy / delete / delete_prefix 操作，
+       请求耗时只剩本地磁盘写入
+    2. 合并：同一 key 上尚未执行的旧操作被新操作取代（如连续两次上传同一文件只推送最后一次）；
+       临时文件尚未上传就被移动到正式目录时，直接改为上传正式文件，临时 key 不再推送
+    3. 执行：后台调度线程领取到期操作交给上传线程池执行；同一 key 的操作按登记顺序串行，
+       put 执行时流式上传本地文件的最新内容
+    4. 重试：失败按指数退避重试，超过 COS_OUTBOX_MAX_ATTEMPTS 次标记为 failed 并保留在表中，
+       不会静默丢失；reconcile() / scripts/reconcile_cos_outbox.py 可重新入队失败操作，
+       并补登本地存在而 COS 缺失或大小不一致的文件
+    5. 崩溃恢复：领取时设置租约，进程退出后租约过期的 inflight 操作自动退回队列
+
+发件箱只在 create_app 调用 start_service() 后启用；未启用时（开发模式、脚本）storage_service
+仍按原逻辑同步推送。图像处理子进程（services/image_worker_pool.py）没有后台线程，启动时调用
+enable_relay() 后只负责登记，登记的操作由 Web 进程的发件箱线程轮询执行，同样享有重试。
+
+环境变量:
+    COS_OUTBOX_ENABLED        是否启用（默认 true，仅 dual 模式生效）
+    COS_OUTBOX_THREADS        上传线程数（默认 4）
+    COS_OUTBOX_MAX_ATTEMPTS   最大尝试次数（默认 8）
+    COS_OUTBOX_POLL_SEC       空闲轮询间隔（默认 2 秒）
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from models.student import (
+    claim_cos_ops,
+    complete_cos_op,
+    enqueue_cos_op,
+    fail_cos_op,
+    get_cos_outbox_stats,
+    get_failed_cos_ops,
+    get_pending_cos_put,
+    retry_failed_cos_ops,
+)
+from services import cos_sync_service, storage_service
+
+BACKOFF_BASE_SEC = 5
+BACKOFF_MAX_SEC = 1800
+LEASE_SEC = 300
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def backoff_seconds(attempts):
+    """第 attempts 次失败后的重试间隔（指数退避，封顶 BACKOFF_MAX_SEC）。"""
+    return min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * (2 ** max(0, attempts - 1)))
+
+
+def _is_missing(error):
+    return 'NoSuchKey' in str(error) or '404' in str(error)
+
+
+def outbox_enabled():
+    """发件箱是否生效（COS_OUTBOX_ENABLED 且 dual 模式）。"""
+    if os.getenv('COS_OUTBOX_ENABLED', 'true').lower() not in ('true', '1', 'yes'):
+        return False
+    return storage_service._get_backend() == 'dual'
+
+
+def record_op(op, key, src_key=''):
+    """在 cos_outbox 表登记一条操作（需要应用上下文），返回操作 ID。"""
+    if op == 'copy' and get_pending_cos_put(src_key):
+        # 临时文件还没推送就被移走：删除源 key（取代其待执行的 put），改为上传目标文件
+        enqueue_cos_op('delete', src_key)
+        return enqueue_cos_op('put', key)
+    op_id = enqueue_cos_op(op, key, src_key)
+    if op == 'copy':
+        enqueue_cos_op('delete', src_key)
+    return op_id
+
+
+def execute_op(op):
+    """对 COS 执行一条发件箱操作；失败时抛出异常。"""
+    client, config = storage_service._get_cos_client()
+    bucket = config['bucket']
+    key = op['cos_key']
+
+    if op['op'] == 'put':
+        abs_path = storage_service.local_abs_path(key)
+        if not os.path.isfile(abs_path):
+            # 本地文件已被后续操作移走或删除，对应的 copy/delete 会另行登记
+            storage_service._log_info(f'COS发件箱: 本地文件已不存在，跳过上传 {key}')
+            return
+        cos_sync_service.upload_file(abs_path, key)
+
+    elif op['op'] == 'copy':
+        try:
+            client.copy_object(
+                Bucket=bucket,
+                Key=storage_service._full_cos_key(key, config),
+                CopySource={
+                    'Bucket': bucket,
+                    'Key': storage_service._full_cos_key(op['src_key'], config),
+                    'Region': config['region'],
+                },
+            )
+        except Exception as e:
+            # 源对象从未上传成功时，直接上传本地的目标文件
+            if not _is_missing(e) or not os.path.isfile(storage_service.local_abs_path(key)):
+                raise
+            execute_op(dict(op, op='put'))
+
+    elif op['op'] == 'delete':
+        client.delete_object(Bucket=bucket, Key=storage_service._full_cos_key(key, config))
+
+    elif op['op'] == 'delete_prefix':
+        result = storage_service._delete_cos_prefix(key)
+        if result['failed_keys']:
+            raise RuntimeError(f"部分对象删除失败: {', '.join(result['failed_keys'][:5])}")
+
+    else:
+        raise ValueError(f'未知的发件箱操作: {op["op"]}')
+
+
+class CosOutboxWorker:
+    """后台调度线程 + 上传线程池。"""
+
+    def __init__(self, app, threads=4, max_attempts=8, poll_interval=2.0):
+        self.app = app
+        self.threads = threads
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='cos-outbox')
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'completed': 0, 'retried': 0, 'dead': 0, 'last_error': ''}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='cos-outbox', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._executor.shutdown(wait=True)
+
+    def enqueue(self, op, key, src_key=''):
+        with self.app.app_context():
+            op_id = record_op(op, key, src_key)
+        with self._lock:
+            self.stats['enqueued'] += 1
+        self._wakeup.set()
+        return op_id
+
+    def _execute(self, op):
+        try:
+            with self.app.app_context():
+                execute_op(op)
+        except Exception as e:
+            attempts = op['attempts'] + 1
+            dead = attempts >= self.max_attempts
+            with self.app.app_context():
+                fail_cos_op(op['id'], e, time.time() + backoff_seconds(attempts), dead=dead)
+            with self._lock:
+                self.stats['dead' if dead else 'retried'] += 1
+                self.stats['last_error'] = f"{op['op']} {op['cos_key']}: {e}"
+            storage_service._log_warning(
+                f"COS发件箱操作失败 op={op['op']} key={op['cos_key']} 第{attempts}次: {e}"
+            )
+            return False
+        with self.app.app_context():
+            complete_cos_op(op['id'])
+        with self._lock:
+            self.stats['completed'] += 1
+        return True
+
+    def run_once(self):
+        """领取一批到期操作并执行完毕，返回本批操作数。"""
+        with self.app.app_context():
+            ops = claim_cos_ops(time.time(), self.threads * 4, LEASE_SEC)
+        if ops:
+            list(self._executor.map(self._execute, ops))
+        return len(ops)
+
+    def drain(self, timeout=60):
+        """反复执行直到没有到期操作（脚本与测试使用）。"""
+        deadline = time.time() + timeout
+        while time.time() < deadline and self.run_once():
+            pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                processed = 0
+                print(f'[cos_outbox] 调度失败: {e}')
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+# 图像处理子进程内为 True：没有后台线程，只登记操作
+_relay = False
+
+
+def create_worker(app):
+    return CosOutboxWorker(
+        app,
+        threads=_env_int('COS_OUTBOX_THREADS', 4),
+        max_attempts=_env_int('COS_OUTBOX_MAX_ATTEMPTS', 8),
+        poll_interval=float(_env_int('COS_OUTBOX_POLL_SEC', 2)),
+    )
+
+
+def start_service(app):
+    """启动发件箱后台线程（由 create_app 调用，仅 dual 模式）。"""
+    global _worker
+    if not outbox_enabled():
+        return None
+    with _worker_lock:
+        if _worker is None:
+            _worker = create_worker(app).start()
+        return _worker
+
+
+def enable_relay():
+    """图像处理子进程启动时调用（需已推入应用上下文）：发件箱生效时改为直接登记操作。"""
+    global _relay
+    _relay = outbox_enabled()
+    return _relay
+
+
+def enqueue(op, key, src_key=''):
+    """
+    登记一条 COS 操作。发件箱未启用或登记失败时返回 False，由调用方同步执行。
+    """
+    worker = _worker
+    if worker is None and not _relay:
+        return False
+    try:
+        if worker is not None:
+            worker.enqueue(op, key, src_key)
+        else:
+            record_op(op, key, src_key)
+        return True
+    except Exception as e:
+        storage_service._log_warning(f'COS发件箱登记失败 op={op} key={key}，改为同步执行: {e}')
+        return False
+
+
+def get_metrics():
+    """发件箱队列统计（需要应用上下文）。"""
+    metrics = get_cos_outbox_stats(time.time())
+    worker = _worker
+    metrics['enabled'] = worker is not None
+    metrics['worker'] = dict(worker.stats) if worker is not None else None
+    metrics['recent_failures'] = [
+        {key: row[key] for key in ('id', 'op', 'cos_key', 'src_key', 'attempts', 'last_error', 'updated_at')}
+        for row in get_failed_cos_ops(20)
+    ]
+    return metrics
+
+
+def reconcile(prefix='students/', retry_failed=True, dry_run=False, enqueue_func=None):
+    """
+    对账：本地存在但 COS 缺失或大小不一致的文件补登 put 操作（需要应用上下文）。
+
+    返回:
+        dict: {'checked', 'missing', 'size_mismatch', 'requeued_failed', 'enqueued', 'keys'}
+    """
+    enqueue_func = enqueue_func or (lambda key: enqueue_cos_op('put', key))
+    requeued = retry_failed_cos_ops() if retry_failed and not dry_run else 0
+    local_files = storage_service._list_dir_local(prefix, recursive=True)['files']
+    remote = {item['key']: item['size'] for item in storage_service._list_dir_cos(prefix, recursive=True)['files']}
+
+    result = {'checked': 0, 'missing': 0, 'size_mismatch': 0, 'requeued_failed': requeued, 'enqueued': 0, 'keys': []}
+    for item in local_files:
+        key = item['key']
+        if key.endswith('.tmp_upload'):
+            continue
+        result['checked'] += 1
+        if key not in remote:
+            result['missing'] += 1
+        elif remote[key] != item['size']:
+            result['size_mismatch'] += 1
+        else:
+            continue
+        result['keys'].append(key)
+        if not dry_run:
+            enqueue_func(key)
+            result['enqueued'] += 1
+    return result
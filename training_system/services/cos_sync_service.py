@@ -0,0 +1,208 @@
+"""
+本地文件到 COS 的并发同步。
+
+材料生成结束后 _sync_output_dir_to_cos 原先逐个文件调用 save_from_local：
+每个文件先整体读入内存，再通过同一个客户端串行上传，COS 同步常常是整个生成流程中最慢的一步。
+本模块提供并发同步引擎：
+
+    1. 并发：有界线程池（COS_SYNC_THREADS，默认 4）同时上传多个文件
+    2. 流式上传：小文件以文件对象作为请求体流式上传，不整体读入内存；
+       超过 COS_MULTIPART_THRESHOLD_MB 的大文件改用 SDK 的分块上传（upload_file）
+    3. 跳过未变化文件：上传前 HEAD 远端对象，ETag（简单上传时即内容 MD5）或
+       上传时写入的 x-cos-meta-md5 元数据与本地 MD5 一致则跳过
+    4. 内容去重：相同内容（SHA-256）已上传到其他 key 时改为 COS 服务端复制（状态 copied），
+       不再上传文件内容（见 blob_store_service）
+    5. 结果汇总：每个文件返回 uploaded / skipped / copied / queued / failed 状态、字节数与耗时，
+       由调用方写入生成日志，不再逐行打印
+
+dual 模式下 COS 发件箱（cos_outbox_service）已启用时，文件只登记到发件箱（状态 queued），
+由后台线程调用 upload_file() 上传。
+
+环境变量:
+    COS_SYNC_THREADS               并发上传线程数（默认 4）
+    COS_MULTIPART_THRESHOLD_MB     分块上传阈值（默认 20MB）
+    COS_MULTIPART_PART_MB          分块大小（默认 8MB）
+"""
+import hashlib
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services import blob_store_service, storage_service
+
+MD5_META_HEADER = 'x-cos-meta-md5'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def file_md5(abs_path):
+    """分块计算文件 MD5（十六进制）。"""
+    hasher = hashlib.md5()
+    with open(abs_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in (headers or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def remote_md5(client, bucket, full_key):
+    """
+    读取远端对象的内容 MD5；对象不存在返回 None。
+
+    优先使用上传时写入的 x-cos-meta-md5；分块上传的 ETag 不是内容 MD5（带 -N 后缀），不作比较。
+    """
+    try:
+        headers = client.head_object(Bucket=bucket, Key=full_key)
+    except Exception as e:
+        if 'NoSuchKey' in str(e) or '404' in str(e):
+            return None
+        raise
+    meta = _header(headers, MD5_META_HEADER)
+    if meta:
+        return meta.lower()
+    etag = (_header(headers, 'ETag') or '').strip('"').lower()
+    return etag if etag and '-' not in etag else ''
+
+
+def copy_duplicate(key, digest, md5, root=None):
+    """
+    相同内容已上传到其他 COS key 时，以服务端复制代替上传。
+
+    复制前 HEAD 源对象核对 MD5，源对象已删除或内容已变化时不复制。
+
+    返回:
+        bool: 已复制返回 True；无可复用对象或复制失败返回 False，由调用方照常上传
+    """
+    src_key = blob_store_service.cos_source(digest, root or blob_store_service.get_root())
+    if not src_key or src_key == key:
+        return False
+    try:
+        client, config = storage_service._get_cos_client()
+        bucket = config['bucket']
+        src_full = storage_service._full_cos_key(src_key, config)
+        if remote_md5(client, bucket, src_full) != md5:
+            return False
+        client.copy_object(
+            Bucket=bucket,
+            Key=storage_service._full_cos_key(key, config),
+            CopySource={'Bucket': bucket, 'Key': src_full, 'Region': config['region']},
+        )
+        return True
+    except Exception as e:
+        storage_service._log_warning(f'COS去重复制失败 {src_key}->{key}，改为上传: {e}')
+        return False
+
+
+def upload_file(abs_path, key, md5=None, skip_unchanged=False):
+    """
+    将单个本地文件上传到 COS。
+
+    参数:
+        abs_path: 本地文件绝对路径
+        key: 存储 key
+        md5: 已计算好的本地 MD5（None 时现场计算）
+        skip_unchanged: True 时远端 MD5 一致则跳过
+
+    返回:
+        str: 'uploaded'、'copied'（服务端复制了相同内容的对象）或 'skipped'
+    """
+    client, config = storage_service._get_cos_client()
+    bucket = config['bucket']
+    full_key = storage_service._full_cos_key(key, config)
+    md5 = md5 or file_md5(abs_path)
+
+    if skip_unchanged and remote_md5(client, bucket, full_key) == md5:
+        return 'skipped'
+
+    digest = None
+    blob_root = blob_store_service.root_for(abs_path) if blob_store_service.enabled() else None
+    if blob_root and os.path.getsize(abs_path) >= blob_store_service.min_bytes():
+        digest = blob_store_service.hash_file(abs_path)
+        if copy_duplicate(key, digest, md5, blob_root):
+            return 'copied'
+
+    content_type, _ = mimetypes.guess_type(key)
+    headers = {
+        'ContentType': content_type or 'application/octet-stream',
+        # inline 使浏览器直接预览（图片/文档），而非弹出下载框
+        'ContentDisposition': 'inline',
+        'Metadata': {MD5_META_HEADER: md5},
+    }
+    threshold = _env_int('COS_MULTIPART_THRESHOLD_MB', 20) * 1024 * 1024
+    if os.path.getsize(abs_path) >= threshold:
+        client.upload_file(
+            Bucket=bucket,
+            Key=full_key,
+            LocalFilePath=abs_path,
+            PartSize=_env_int('COS_MULTIPART_PART_MB', 8),
+            MAXThread=2,
+            **headers
+        )
+    else:
+        with open(abs_path, 'rb') as f:
+            client.put_object(Bucket=bucket, Body=f, Key=full_key, **headers)
+    if digest:
+        blob_store_service.remember_cos_key(digest, key, blob_root)
+    return 'uploaded'
+
+
+def _sync_one(abs_path, key, use_outbox):
+    started = time.perf_counter()
+    result = {'key': key, 'status': 'failed', 'bytes': 0, 'ms': 0.0, 'error': ''}
+    try:
+        result['bytes'] = os.path.getsize(abs_path)
+        if use_outbox and storage_service._enqueue_cos('put', key):
+            result['status'] = 'queued'
+        else:
+            result['status'] = upload_file(abs_path, key, skip_unchanged=True)
+    except Exception as e:
+        result['error'] = str(e)
+    result['ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def sync_files(pairs, max_workers=None):
+    """
+    并发同步一组本地文件到 COS。
+
+    参数:
+        pairs: [(本地绝对路径, 存储 key)]
+        max_workers: 线程数，默认 COS_SYNC_THREADS
+
+    返回:
+        dict: {'files': [{'key', 'status', 'bytes', 'ms', 'error'}],
+               'uploaded', 'skipped', 'copied', 'queued', 'failed', 'bytes', 'elapsed_ms'}
+        bytes 只统计实际上传（或排队上传）的字节数
+    """
+    pairs = list(pairs)
+    started = time.perf_counter()
+    use_outbox = storage_service._get_backend() == 'dual'
+    workers = min(max_workers or _env_int('COS_SYNC_THREADS', 4), max(1, len(pairs)))
+
+    if workers <= 1:
+        files = [_sync_one(abs_path, key, use_outbox) for abs_path, key in pairs]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cos-sync') as executor:
+            files = list(executor.map(lambda pair: _sync_one(pair[0], pair[1], use_outbox), pairs))
+
+    summary = {'files': files, 'uploaded': 0, 'skipped': 0, 'copied': 0, 'queued': 0, 'failed': 0, 'bytes': 0}
+    for item in files:
+        summary[item['status']] += 1
+        if item['status'] in ('uploaded', 'queued'):
+            summary['bytes'] += item['bytes']
+    summary['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return summary
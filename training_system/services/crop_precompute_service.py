@@ -0,0 +1,194 @@
+"""
+自动裁剪点位预计算服务。
+
+analyze_material_points_route 原先在管理员打开裁剪编辑器时才现场跑完整的候选框检测，
+管理员需要等待识别完成。本模块把识别提前到后台：
+
+    1. 触发时机：附件提交（新建/修改学员、单独上传附件）和审核通过后，
+       schedule_student() 把学员放入后台队列（同一学员排队期间只保留一份）
+    2. 后台识别：常驻工作线程逐个附件调用 material_service.locate_document_from_path
+       （优先读取上传时生成的分析图变体，点位换算回母版坐标）
+    3. 持久化：点位、置信度、检测器与源文件内容哈希写入 material_crop_points 表
+       （与 material_adjustments 同库，删除学员时一并清理）
+    4. 查询：get_points() 先比对源文件哈希，一致则直接返回缓存；
+       不一致（附件被替换）或尚未预计算时现场识别并回写缓存
+
+工作线程只在 create_app 中调用 start_service() 后运行；未启动时 schedule_student()
+为空操作，分析接口仍可按需现场识别。
+"""
+import hashlib
+import os
+import queue
+import threading
+
+from models.student import get_crop_points, get_student_by_id, save_crop_points
+
+# (附件字段, 裁剪配置)：需要裁剪编辑器的附件
+CROP_SOURCES = (
+    ('id_card_front_path', 'id_card'),
+    ('id_card_back_path', 'id_card'),
+    ('diploma_path', 'diploma'),
+    ('hukou_residence_path', 'hukou'),
+    ('hukou_personal_path', 'hukou'),
+)
+DEFAULT_CANNY_SCALE = 1.0
+
+
+def source_hash(abs_path):
+    """计算源文件内容的 SHA-256。"""
+    hasher = hashlib.sha256()
+    with open(abs_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def detect_points(rel_path, profile_name, base_dir, canny_scale=DEFAULT_CANNY_SCALE):
+    """
+    对单个附件做候选框检测。
+
+    返回:
+        dict: {'points', 'confidence', 'detector'}；未识别到证件时 points 为 None
+    """
+    from services import image_worker_pool
+    from services.image_variant_service import analysis_source
+    from services.material_service import locate_document_from_path
+
+    source_path, (scale_x, scale_y) = analysis_source(rel_path, base_dir)
+    sel = image_worker_pool.run(locate_document_from_path, source_path, profile_name, canny_scale=canny_scale)
+    if not sel or not sel.get('points_orig'):
+        return {'points': None, 'confidence': None, 'detector': ''}
+    return {
+        'points': [[x * scale_x, y * scale_y] for x, y in sel['points_orig']],
+        'confidence': sel.get('confidence'),
+        'detector': sel.get('detector', ''),
+    }
+
+
+def _lookup_or_detect(student, path_key, profile_name, base_dir, canny_scale):
+    """返回 (points, 是否现场识别)；附件不存在时返回 (None, False)。"""
+    rel = student.get(path_key)
+    if not rel:
+        return None, False
+    abs_path = os.path.join(base_dir, rel)
+    if not os.path.exists(abs_path):
+        return None, False
+
+    digest = source_hash(abs_path)
+    cached = get_crop_points(student['id'], path_key, canny_scale)
+    if cached and cached['source_hash'] == digest and cached['profile_name'] == profile_name:
+        return cached['points'], False
+
+    result = detect_points(rel, profile_name, base_dir, canny_scale=canny_scale)
+    save_crop_points(
+        student['id'], path_key, profile_name, digest, result['points'],
+        confidence=result['confidence'], detector=result['detector'], canny_scale=canny_scale,
+    )
+    return result['points'], True
+
+
+def get_points(student, path_key, profile_name, base_dir, canny_scale=DEFAULT_CANNY_SCALE):
+    """
+    获取附件的自动裁剪点位：源文件哈希与缓存一致时直接返回缓存，否则现场识别并回写。
+
+    返回:
+        list 或 None: 原图坐标系下的 4 个角点
+    """
+    points, _ = _lookup_or_detect(student, path_key, profile_name, base_dir, canny_scale)
+    return points
+
+
+def precompute_student(student, base_dir):
+    """为学员的全部裁剪类附件预计算默认参数下的点位，返回实际识别的附件数。"""
+    computed = 0
+    for path_key, profile_name in CROP_SOURCES:
+        _, detected = _lookup_or_detect(student, path_key, profile_name, base_dir, DEFAULT_CANNY_SCALE)
+        computed += int(detected)
+    return computed
+
+
+class CropPrecomputeWorker:
+    """
+    后台预计算工作线程。
+
+    队列中只放学员 ID，同一学员排队期间重复调度会被合并；
+    执行时重新读取学员记录，保证使用的是最新附件路径。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {'scheduled': 0, 'computed': 0, 'errors': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='crop-precompute', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def schedule(self, student_id):
+        with self._lock:
+            if student_id in self._queued:
+                return False
+            self._queued.add(student_id)
+            self.stats['scheduled'] += 1
+        self._queue.put(student_id)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            student_id = self._queue.get()
+            if student_id is None:
+                self._queue.task_done()
+                break
+            with self._lock:
+                self._queued.discard(student_id)
+            try:
+                with self.app.app_context():
+                    student = get_student_by_id(student_id)
+                    if student:
+                        self.stats['computed'] += precompute_student(student, self.app.config['BASE_DIR'])
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f'[crop_precompute] 学员 {student_id} 预计算失败: {e}')
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """阻塞直到已调度的学员全部处理完毕。"""
+        self._queue.join()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_service(app):
+    """启动后台预计算线程（由 create_app 调用）。"""
+    global _worker
+    if os.getenv('CROP_PRECOMPUTE_ENABLED', 'true').lower() not in ('true', '1', 'yes'):
+        return None
+    with _worker_lock:
+        if _worker is None:
+            _worker = CropPrecomputeWorker(app).start()
+        return _worker
+
+
+def schedule_student(student_id):
+    """调度学员的点位预计算；后台线程未启动时不做任何事。"""
+    worker = _worker
+    if worker is None or not student_id:
+        return False
+    return worker.schedule(student_id)
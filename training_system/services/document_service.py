@@ -29,8 +29,8 @@ from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from PIL import Image
 from lxml import etree
 from flask import current_app
-from services.image_service import change_id_photo_bg
-from services import storage_service
+from services.image_service import replace_background_bytes
+from services import blob_store_service, storage_service
 
 
 # ======================== 体检表模板配置 ========================
@@ -231,7 +231,9 @@ def generate_word_doc(template_path, output_path, data, photo_path=None, skip_bg
             except Exception as _e:
                 current_app.logger.warning(f'Failed to insert photo into doc: {_e}')
 
-        doc.save(output_path)
+        # 旧的体检表可能已入库为 blob 硬链接，先写临时文件再替换
+        with blob_store_service.atomic_output(output_path) as tmp_path:
+            doc.save(tmp_path)
         current_app.logger.info(f'Document generated: {output_path}')
 
     except Exception as e:
@@ -249,27 +251,19 @@ def _insert_photo_into_doc(doc, photo_path, skip_bg_remove=False):
         skip_bg_remove: 是否跳过白底处理
     """
     try:
+        # 加载照片
+        with open(photo_path, 'rb') as f:
+            img_bytes = f.read()
+
         # 尝试将照片背景替换为白色（体检表要求白底证件照）
-        # 如果已经有白底或跳过，直接使用
-        temp_photo_path = None
-        if skip_bg_remove:
-            photo_to_use = photo_path
-        else:
+        # 直接在内存中处理，推理结果按照片内容缓存，与材料生成共用同一份结果
+        if not skip_bg_remove:
             try:
-                from services.image_service import change_id_photo_bg
-                import tempfile
-                temp_fd, temp_photo_path = tempfile.mkstemp(suffix='.jpg')
-                os.close(temp_fd)
-                processed_photo_path = change_id_photo_bg(photo_path, temp_photo_path)
-                photo_to_use = processed_photo_path if processed_photo_path == temp_photo_path else photo_path
+                processed_bytes = replace_background_bytes(img_bytes)
+                if processed_bytes:
+                    img_bytes = processed_bytes
             except Exception as e:
                 current_app.logger.warning(f'Background processing failed, using original: {str(e)}')
-                photo_to_use = photo_path
-                temp_photo_path = None
-
-        # 加载照片
-        with open(photo_to_use, 'rb') as f:
-            img_bytes = f.read()
 
         # 一寸证件照的标准尺寸（2.5cm × 3.5cm），转换为英寸
         default_w_in = 2.5 / 2.54  # 约 0.984 英寸
@@ -434,10 +428,3 @@ def _insert_photo_into_doc(doc, photo_path, skip_bg_remove=False):
 
     except Exception as e:
         current_app.logger.error(f'Error processing/replacing image: {str(e)}')
-    finally:
-        # 清理临时文件
-        if temp_photo_path and os.path.exists(temp_photo_path):
-            try:
-                os.remove(temp_photo_path)
-            except Exception:
-                pass
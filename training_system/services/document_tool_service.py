@@ -2,7 +2,6 @@ import io
 import json
 import os
 import shutil
-import tempfile
 import uuid
 import zipfile
 from datetime import datetime, timedelta
@@ -10,16 +9,16 @@ from datetime import datetime, timedelta
 from flask import current_app, session
 from werkzeug.utils import secure_filename
 
+from services import image_worker_pool
 from services.material_service import (
     MaterialGenerationLogger,
     auto_crop_hukou_page,
     auto_crop_id_card,
     build_generation_report,
-    crop_image_with_points,
+    crop_file_to_temp,
     process_hukou,
     process_id_cards,
     read_cv_image,
-    write_cv_image,
 )
 
 
@@ -230,6 +229,19 @@ def _input_path(inputs, field):
     return path if path and os.path.exists(path) else None
 
 
+def _render_outputs(document_type, front_path, back_path, output_dir, name_prefix, adjustments):
+    """生成证件排版输出（在图像处理进程中执行），返回 (result, report)。"""
+    logger = MaterialGenerationLogger()
+    if document_type == "id_card":
+        process = process_id_cards
+    elif document_type == "hukou":
+        process = process_hukou
+    else:
+        raise ValueError("无效的证件类型")
+    result = process(front_path, back_path, output_dir, name_prefix, adjustments=adjustments, logger=logger)
+    return result, build_generation_report(output_dir, logger, [result])
+
+
 def _generate_outputs(manifest, adjustments=None):
     output_dir = _safe_join(_task_root(manifest["id"]), "output")
     if os.path.isdir(output_dir):
@@ -239,31 +251,18 @@ def _generate_outputs(manifest, adjustments=None):
                 os.remove(path)
     os.makedirs(output_dir, exist_ok=True)
 
-    logger = MaterialGenerationLogger()
     adjustments = adjustments or {}
     inputs = manifest.get("inputs", {})
-    if manifest["document_type"] == "id_card":
-        result = process_id_cards(
-            _input_path(inputs, "id_card_front"),
-            _input_path(inputs, "id_card_back"),
-            output_dir,
-            _name_prefix(manifest),
-            adjustments=adjustments,
-            logger=logger,
-        )
-    elif manifest["document_type"] == "hukou":
-        result = process_hukou(
-            _input_path(inputs, "hukou_residence"),
-            _input_path(inputs, "hukou_personal"),
-            output_dir,
-            _name_prefix(manifest),
-            adjustments=adjustments,
-            logger=logger,
-        )
-    else:
-        raise ValueError("无效的证件类型")
-
-    report = build_generation_report(output_dir, logger, [result])
+    fields = DOCUMENT_TYPES.get(manifest["document_type"], {}).get("fields", ("", ""))
+    result, report = image_worker_pool.run(
+        _render_outputs,
+        manifest["document_type"],
+        _input_path(inputs, fields[0]),
+        _input_path(inputs, fields[1]),
+        output_dir,
+        _name_prefix(manifest),
+        adjustments,
+    )
     manifest["updated_at"] = _now_iso()
     manifest["adjustments"] = adjustments
     manifest["report"] = {
@@ -369,51 +368,26 @@ def analyze_points(task_id, adjustments=None):
     adjustments = adjustments or {}
     inputs = manifest.get("inputs", {})
     if manifest["document_type"] == "id_card":
-        return {
-            "front_points": _auto_points_for_path(
-                _input_path(inputs, "id_card_front"),
-                "id_card",
-                adjustments,
-                "front",
-            ) if _input_path(inputs, "id_card_front") else None,
-            "back_points": _auto_points_for_path(
-                _input_path(inputs, "id_card_back"),
-                "id_card",
-                adjustments,
-                "back",
-            ) if _input_path(inputs, "id_card_back") else None,
-        }
-    return {
-        "home_points": _auto_points_for_path(
-            _input_path(inputs, "hukou_residence"),
-            "hukou",
-            adjustments,
-            "home",
-        ) if _input_path(inputs, "hukou_residence") else None,
-        "personal_points": _auto_points_for_path(
-            _input_path(inputs, "hukou_personal"),
-            "hukou",
-            adjustments,
-            "personal",
-        ) if _input_path(inputs, "hukou_personal") else None,
-    }
+        targets = (
+            ("front_points", "id_card_front", "id_card", "front"),
+            ("back_points", "id_card_back", "id_card", "back"),
+        )
+    else:
+        targets = (
+            ("home_points", "hukou_residence", "hukou", "home"),
+            ("personal_points", "hukou_personal", "hukou", "personal"),
+        )
+    result = {}
+    for point_key, field, document_type, side in targets:
+        path = _input_path(inputs, field)
+        result[point_key] = image_worker_pool.run(
+            _auto_points_for_path, path, document_type, adjustments, side,
+        ) if path else None
+    return result
 
 
 def _crop_to_temp(path, points, crop_mode):
-    if not path or not os.path.exists(path) or not points or len(points) != 4:
-        return None
-    if crop_mode == "none":
-        return None
-    image = read_cv_image(path)
-    if image is None:
-        return None
-    mode = "rect_only" if crop_mode == "rect_only" else "perspective"
-    cropped = crop_image_with_points(image, points, mode=mode)
-    suffix = os.path.splitext(path)[1] or ".jpg"
-    temp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False, dir=os.path.dirname(path))
-    temp.close()
-    write_cv_image(temp.name, cropped)
-    return temp.name
+    return image_worker_pool.run(crop_file_to_temp, path, points, crop_mode)
 
 
 def regenerate_task(task_id, adjustments=None, points_payload=None):
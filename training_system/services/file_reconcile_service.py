@@ -0,0 +1,410 @@
+"""
+学员附件对账：数据库引用 / 本地磁盘 / COS 三方比对，生成对账计划并安全地批量清理孤立文件。
+
+scripts/cleanup_orphaned_files.py 原先每次都从数据库重建全部有效路径、完整遍历 students/ 目录，
+且不检查 COS 上的孤立对象；目录越大越慢，只能偶尔运行。本模块改为增量对账：
+
+    1. 三方比对：以顶层文件夹（students/<文件夹>/）为单位合并数据库引用的 key、本地文件与 COS 对象，
+       生成对账条目（reconcile_findings 表）：
+         orphan    未被数据库引用的本地文件或 COS 对象（超过最小存在时间才列入）
+         missing   数据库引用、但本地或 COS 缺失
+         mismatch  本地与 COS 大小不一致
+       报名材料子文件夹（*-报名材料）、隐藏的派生文件（.variants 等）和证件工具临时目录不参与对账
+    2. 增量：以上次对账的开始时间为水位，之后只检查有变化的文件夹——顶层目录 mtime 晚于水位、
+       文件浏览索引（folder_index.indexed_at）晚于水位、数据库引用摘要变化、发件箱中有未完成操作、
+       上次计划中仍有条目，以及本地已消失的文件夹
+    3. 发件箱：pending / inflight 操作涉及的 key 正在同步，不列入对账条目
+    4. 全量：首次运行、full=True 或距上次全量超过 RECONCILE_FULL_DAYS 天时检查全部文件夹，
+       COS 一次分页列举整个 students/ 前缀
+    5. 安全清理：apply() 只处理计划中的 orphan 条目；删除前重新确认未被引用、无未完成的发件箱操作、
+       本地文件大小与修改时间和计划一致；COS 对象按 1000 个一批删除；
+       数据库未引用任何附件时拒绝删除（防止数据库路径配置错误导致误删）
+
+环境变量:
+    RECONCILE_MIN_AGE_HOURS   孤立文件的最小存在时间（默认 24 小时）
+    RECONCILE_FULL_DAYS       自动全量对账间隔（默认 7 天）
+"""
+import hashlib
+import os
+import time
+from datetime import datetime
+
+from models.student import (
+    delete_reconcile_findings,
+    get_folder_index_changed_since,
+    get_reconcile_finding_folders,
+    get_reconcile_findings,
+    get_reconcile_folders,
+    get_reconcile_state,
+    get_student_attachment_keys,
+    get_unfinished_cos_ops,
+    save_reconcile_results,
+    set_reconcile_state,
+)
+from services import folder_index_service, storage_service
+
+# 学员记录中引用附件的字段
+ATTACHMENT_FIELDS = (
+    'photo_path',
+    'diploma_path',
+    'id_card_front_path',
+    'id_card_back_path',
+    'hukou_residence_path',
+    'hukou_personal_path',
+    'certificate_info_page_path',
+    'certificate_records_page_path',
+    'training_form_path',
+)
+# 目录 mtime 精度与时钟误差的余量
+MTIME_SLACK_SEC = 2
+COS_DELETE_BATCH = 1000
+
+
+def _env_float(name, default):
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def is_protected(key):
+    """不参与对账的 key：生成的报名材料、隐藏的派生文件、证件工具临时目录。"""
+    parts = key.split('/')
+    if any(part.startswith('.') for part in parts):
+        return True
+    if any(part.endswith('-报名材料') for part in parts[:-1]):
+        return True
+    return key.startswith('students/tmp/document_tools/')
+
+
+def _ref_digest(keys):
+    if not keys:
+        return ''
+    return hashlib.sha1('\n'.join(sorted(keys)).encode('utf-8')).hexdigest()
+
+
+def _group_by_folder(entries):
+    """按顶层文件夹分组：{文件夹: {key: 值}}；entries 为 key 集合时值为 None。"""
+    groups = {}
+    for key in entries:
+        folder = folder_index_service.folder_of(key)
+        if folder:
+            groups.setdefault(folder, {})[key] = entries[key] if isinstance(entries, dict) else None
+    return groups
+
+
+def _parse_cos_time(value):
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def _list_local(folder, base_dir):
+    """列出本地 students/<folder> 下的文件：{key: (大小, mtime)}。"""
+    root = os.path.join(base_dir, 'students', folder)
+    result = {}
+    if os.path.isfile(root):
+        st = os.stat(root)
+        return {f'students/{folder}': (st.st_size, st.st_mtime)}
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if name.startswith('.') or name.endswith('.tmp_upload'):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result[os.path.relpath(path, base_dir).replace('\\', '/')] = (st.st_size, st.st_mtime)
+    return result
+
+
+def _list_cos(prefix):
+    """列出 COS 前缀下的对象：{key: (大小, 最后修改时间)}。"""
+    return {
+        item['key']: (item['size'], _parse_cos_time(item['last_modified']))
+        for item in storage_service._list_dir_cos(prefix, recursive=True)['files']
+        if not item['key'].endswith('/')
+    }
+
+
+class _Outbox:
+    """发件箱中未完成的操作：正在同步的 key 不列入对账，涉及的文件夹需要重新检查。"""
+
+    def __init__(self):
+        self.keys = set()
+        self.prefixes = []
+        self.folders = set()
+        for op in get_unfinished_cos_ops():
+            for key in (op['cos_key'], op['src_key']):
+                if not key:
+                    continue
+                self.folders.add(folder_index_service.folder_of(key))
+                if op['status'] == 'failed':
+                    continue
+                if op['op'] == 'delete_prefix' and key == op['cos_key']:
+                    self.prefixes.append(key)
+                else:
+                    self.keys.add(key)
+        self.folders.discard(None)
+
+    def in_flight(self, key):
+        return key in self.keys or any(key.startswith(prefix) for prefix in self.prefixes)
+
+
+def _classify(folder, refs, local, cos, check_local, check_cos, outbox, now, min_age):
+    """比对一个文件夹，返回 (对账条目列表, 因太新而跳过的孤立文件数)。"""
+    findings = []
+    young = 0
+    for key in sorted(set(refs) | set(local) | set(cos)):
+        if is_protected(key) or outbox.in_flight(key):
+            continue
+        local_stat, cos_stat = local.get(key), cos.get(key)
+        if key in refs:
+            missing = [
+                location for location, present, checked in (
+                    ('local', local_stat, check_local), ('cos', cos_stat, check_cos)
+                ) if checked and not present
+            ]
+            if missing:
+                kind, location = 'missing', 'both' if len(missing) == 2 else missing[0]
+            elif check_local and check_cos and local_stat[0] != cos_stat[0]:
+                kind, location = 'mismatch', 'both'
+            else:
+                continue
+        else:
+            times = [stat[1] for stat in (local_stat, cos_stat) if stat]
+            # 修改时间未知时按刚写入处理
+            newest = max((t if t is not None else now) for t in times)
+            if now - newest < min_age:
+                young += 1
+                continue
+            kind = 'orphan'
+            location = 'both' if local_stat and cos_stat else ('local' if local_stat else 'cos')
+        findings.append({
+            'key': key,
+            'folder': folder,
+            'kind': kind,
+            'location': location,
+            'local_size': local_stat[0] if local_stat else None,
+            'local_mtime': local_stat[1] if local_stat else None,
+            'cos_size': cos_stat[0] if cos_stat else None,
+            'cos_mtime': cos_stat[1] if cos_stat else None,
+            'found_at': now,
+        })
+    return findings, young
+
+
+def build_plan(full=None, now=None):
+    """
+    对账并刷新对账计划（需要应用上下文）。
+
+    参数:
+        full: True 全量；False 增量；None 时按水位与 RECONCILE_FULL_DAYS 自动决定
+
+    返回:
+        dict: {'mode', 'folders_checked', 'orphan', 'missing', 'mismatch', 'young_skipped', 'elapsed_ms'}
+              （计数为本次检查的文件夹内的条目数）
+    """
+    started = time.perf_counter()
+    now = now or time.time()
+    backend = storage_service._get_backend()
+    check_local = backend in ('local', 'dual')
+    check_cos = backend in ('cos', 'dual')
+    base_dir = storage_service.get_base_dir()
+    students_dir = os.path.join(base_dir, 'students')
+    min_age = _env_float('RECONCILE_MIN_AGE_HOURS', 24) * 3600
+
+    refs_by_folder = _group_by_folder(get_student_attachment_keys(ATTACHMENT_FIELDS))
+    previous = get_reconcile_folders()
+    outbox = _Outbox()
+    watermark = float(get_reconcile_state('watermark', 0))
+    last_full = float(get_reconcile_state('last_full_at', 0))
+    if full is None:
+        full = not watermark or now - last_full >= _env_float('RECONCILE_FULL_DAYS', 7) * 86400
+
+    local_mtimes = {}
+    if check_local and os.path.isdir(students_dir):
+        for entry in os.scandir(students_dir):
+            try:
+                local_mtimes[entry.name] = entry.stat(follow_symlinks=False).st_mtime
+            except OSError:
+                continue
+
+    cos_by_folder = None
+    if full:
+        candidates = set(local_mtimes) | set(previous) | set(refs_by_folder)
+        if check_cos:
+            cos_by_folder = _group_by_folder(_list_cos('students/'))
+            candidates |= set(cos_by_folder)
+    else:
+        since = watermark - MTIME_SLACK_SEC
+        candidates = {name for name, mtime in local_mtimes.items() if mtime > since or name not in previous}
+        candidates |= {name for name, row in previous.items() if row['local_mtime'] and name not in local_mtimes}
+        candidates |= {
+            folder for folder in set(refs_by_folder) | set(previous)
+            if _ref_digest(refs_by_folder.get(folder)) != previous.get(folder, {}).get('ref_digest')
+        }
+        candidates |= set(get_folder_index_changed_since(since))
+    candidates |= outbox.folders | set(get_reconcile_finding_folders())
+
+    findings, folder_rows, removed = [], [], []
+    young = 0
+    for folder in sorted(candidates):
+        local = _list_local(folder, base_dir) if folder in local_mtimes else {}
+        cos = {}
+        if check_cos:
+            cos = cos_by_folder.get(folder, {}) if cos_by_folder is not None else _list_cos(f'students/{folder}/')
+        refs = refs_by_folder.get(folder, {})
+        rows, skipped = _classify(folder, refs, local, cos, check_local, check_cos, outbox, now, min_age)
+        findings.extend(rows)
+        young += skipped
+        if not local and not cos and not refs and folder not in local_mtimes:
+            removed.append(folder)
+        else:
+            folder_rows.append({
+                'folder': folder,
+                'ref_digest': _ref_digest(refs),
+                'local_mtime': local_mtimes.get(folder, 0),
+                'checked_at': now,
+            })
+
+    save_reconcile_results(sorted(candidates), folder_rows, removed, findings)
+    # 水位取本次开始时间：对账期间发生的改动留给下一次
+    set_reconcile_state('watermark', now)
+    if full:
+        set_reconcile_state('last_full_at', now)
+
+    summary = {
+        'mode': 'full' if full else 'incremental',
+        'folders_checked': len(candidates),
+        'orphan': 0,
+        'missing': 0,
+        'mismatch': 0,
+        'young_skipped': young,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+    for row in findings:
+        summary[row['kind']] += 1
+    return summary
+
+
+def get_plan(kinds=None, limit=None):
+    """列出当前对账计划中的条目（需要应用上下文）。"""
+    return get_reconcile_findings(kinds, limit)
+
+
+def _prune_empty_dirs(path, students_dir):
+    """删除文件后向上清理空目录（不删除 students/ 与 students/tmp/ 本身）。"""
+    stop = {os.path.abspath(students_dir), os.path.abspath(os.path.join(students_dir, 'tmp'))}
+    current = os.path.abspath(os.path.dirname(path))
+    while current not in stop and current.startswith(os.path.abspath(students_dir)):
+        try:
+            os.rmdir(current)
+        except OSError:
+            break
+        current = os.path.dirname(current)
+
+
+def _delete_cos_batch(keys):
+    """批量删除 COS 对象，返回删除失败的 key 集合。"""
+    client, config = storage_service._get_cos_client()
+    full_to_key = {storage_service._full_cos_key(key, config): key for key in keys}
+    failed = set()
+    full_keys = list(full_to_key)
+    for start in range(0, len(full_keys), COS_DELETE_BATCH):
+        batch = full_keys[start:start + COS_DELETE_BATCH]
+        try:
+            resp = client.delete_objects(
+                Bucket=config['bucket'],
+                Delete={'Object': [{'Key': key} for key in batch], 'Quiet': 'true'},
+            )
+        except Exception as e:
+            storage_service._log_warning(f'COS批量删除失败（{len(batch)} 个）: {e}')
+            failed.update(full_to_key[key] for key in batch)
+            continue
+        for err in (resp or {}).get('Error', []) or []:
+            failed.add(full_to_key.get(err.get('Key'), err.get('Key')))
+    storage_service._invalidate_cache(*[key for key in keys if key not in failed])
+    return failed
+
+
+def apply(max_delete=1000, dry_run=False):
+    """
+    删除计划中的孤立文件（需要应用上下文）。
+
+    参数:
+        max_delete: 本次最多处理的孤立条目数
+        dry_run: True 时只做删除前检查，返回将删除的 key
+
+    返回:
+        dict: {'planned', 'deleted_local', 'deleted_cos', 'skipped', 'failed', 'freed_bytes', 'keys'}
+
+    异常:
+        RuntimeError: 数据库未引用任何附件时拒绝删除
+    """
+    refs = get_student_attachment_keys(ATTACHMENT_FIELDS)
+    if not refs:
+        raise RuntimeError('数据库未引用任何附件，拒绝删除（请确认数据库路径配置）')
+    backend = storage_service._get_backend()
+    check_local = backend in ('local', 'dual')
+    check_cos = backend in ('cos', 'dual')
+    base_dir = storage_service.get_base_dir()
+    students_dir = os.path.join(base_dir, 'students')
+    outbox = _Outbox()
+
+    plan = get_reconcile_findings(('orphan',), max_delete)
+    result = {
+        'planned': len(plan), 'deleted_local': 0, 'deleted_cos': 0, 'skipped': 0,
+        'failed': [], 'freed_bytes': 0, 'keys': [],
+    }
+    done, cos_keys = [], []
+    for item in plan:
+        key = item['key']
+        if key in refs or is_protected(key) or outbox.in_flight(key):
+            result['skipped'] += 1
+            continue
+        path = os.path.join(base_dir, key)
+        local_stat = None
+        if check_local and item['location'] in ('local', 'both'):
+            try:
+                local_stat = os.stat(path)
+            except FileNotFoundError:
+                local_stat = None
+            if local_stat and (local_stat.st_size != item['local_size']
+                               or abs(local_stat.st_mtime - (item['local_mtime'] or 0)) > 1e-3):
+                # 计划生成后文件又被写入过，留待下次对账
+                result['skipped'] += 1
+                continue
+        result['keys'].append(key)
+        if dry_run:
+            continue
+        if local_stat:
+            try:
+                os.remove(path)
+            except OSError as e:
+                result['failed'].append({'key': key, 'error': str(e)})
+                continue
+            result['deleted_local'] += 1
+            result['freed_bytes'] += local_stat.st_size
+            folder_index_service.mark_changed(key)
+            _prune_empty_dirs(path, students_dir)
+        if check_cos and item['location'] in ('cos', 'both'):
+            cos_keys.append(key)
+        else:
+            done.append(key)
+
+    if cos_keys:
+        failed = _delete_cos_batch(cos_keys)
+        for key in cos_keys:
+            if key in failed:
+                result['failed'].append({'key': key, 'error': 'COS 删除失败'})
+            else:
+                result['deleted_cos'] += 1
+                done.append(key)
+    delete_reconcile_findings(done)
+    if done:
+        print(f'[file_reconcile] 已清理 {len(done)} 个孤立文件，释放本地 {result["freed_bytes"]} 字节')
+    return result
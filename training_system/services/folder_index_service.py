@@ -0,0 +1,327 @@
+"""
+文件浏览索引（students/ 顶层文件夹的大小、文件数、修改时间与匹配学员）。
+
+/api/files/browse 原先每次打开页面都对每个学员文件夹做两遍完整的递归 scandir（大小、文件数），
+并全表查询 students 构建姓名匹配字典；文件夹上千个时页面要等待数秒。本模块维护一张 folder_index 表：
+
+    1. 增量更新：storage_service 的写入/移动/删除（以及文件管理面板删除、学员文件夹迁移、
+       材料生成路由）调用 mark_changed(key) 把所在顶层文件夹登记到 folder_index_dirty 表，
+       任何 gunicorn worker 或图像处理子进程的登记对所有进程可见；后台线程每隔 FOLDER_INDEX_FLUSH_SEC
+       只重新统计这些文件夹（单个文件夹一次 scandir），浏览接口在查询前也会先处理待刷新项
+    2. 定期对账：后台线程每隔 FOLDER_INDEX_RECONCILE_SEC 全量扫描一次 students/，
+       补上绕过 storage_service 的改动（手工拷贝、外部脚本）并重新匹配学员
+    3. 查询：分页、排序（修改时间 / 名称 / 大小 / 文件数）、名称搜索与匹配状态筛选都在 SQLite 中完成；
+       当前页的文件夹按姓名+公司走索引重新匹配学员，新建或删除学员后无需等待对账
+    4. 首次使用：索引为空时同步构建一次
+
+后台线程只在 create_app 调用 start_service() 后运行；未启动时 mark_changed() 仍记录待刷新项，
+由下一次浏览请求处理。没有应用上下文（或写库失败）时待刷新项暂存在本进程内。
+
+环境变量:
+    FOLDER_INDEX_FLUSH_SEC       待刷新文件夹的处理间隔（默认 2 秒）
+    FOLDER_INDEX_RECONCILE_SEC   全量对账间隔（默认 1800 秒）
+"""
+import os
+import threading
+import time
+
+from flask import has_app_context
+
+from models.student import (
+    clear_folder_index_dirty,
+    find_student_id_by_name,
+    get_folder_index_dirty,
+    get_folder_index_map,
+    get_folder_index_summary,
+    get_student_name_lookup,
+    mark_folder_index_dirty,
+    query_folder_index,
+    save_folder_index,
+    update_folder_index_students,
+)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def folder_of(key):
+    """存储 key 所属的顶层条目名（'students/<名称>/...' -> 名称）；不在 students/ 下返回 None。"""
+    parts = str(key or '').replace('\\', '/').strip('/').split('/')
+    if len(parts) < 2 or parts[0] != 'students' or not parts[1]:
+        return None
+    return parts[1]
+
+
+def mark_changed(*keys):
+    """记录 key 所在的顶层文件夹需要重新统计（有应用上下文时登记到库中，所有进程可见）。"""
+    names = {name for name in (folder_of(key) for key in keys) if name}
+    if not names:
+        return
+    if has_app_context():
+        try:
+            mark_folder_index_dirty(sorted(names), time.time())
+            return
+        except Exception as e:
+            print(f'[folder_index] 登记待刷新文件夹失败，暂存在本进程: {e}')
+    with _pending_lock:
+        _pending.update(names)
+
+
+def dir_stats(path):
+    """
+    一次遍历统计目录的总大小与文件数。
+
+    大小包含隐藏的派生文件（.variants 缩略图等），文件数不含隐藏文件和隐藏目录中的文件。
+
+    返回:
+        tuple: (总字节数, 文件数)
+    """
+    size, count = 0, 0
+    stack = [(path, False)]
+    while stack:
+        current, hidden = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except (PermissionError, FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in entries:
+            entry_hidden = hidden or entry.name.startswith('.')
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    size += entry.stat(follow_symlinks=False).st_size
+                    if not entry_hidden:
+                        count += 1
+                elif entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, entry_hidden))
+            except FileNotFoundError:
+                continue
+    return size, count
+
+
+def match_student(folder_name, lookup=None):
+    """
+    将 '培训类型-公司名-姓名' 格式的文件夹名匹配到学员 ID，未匹配返回 None。
+
+    lookup 为 get_student_name_lookup() 的结果时在内存中匹配（对账用），否则逐个走索引查询。
+    """
+    parts = folder_name.split('-', 2)
+    if len(parts) != 3:
+        return None
+    company, name = parts[1], parts[2]
+    if lookup is None:
+        return find_student_id_by_name(name, company)
+    name_company_map, name_map = lookup
+    sid = name_company_map.get((name, company))
+    if sid:
+        return sid
+    ids = name_map.get(name, [])
+    return ids[0] if ids else None
+
+
+def scan_entry(students_dir, name, lookup=None, now=None):
+    """统计 students/ 下一个顶层条目；条目不存在返回 None。"""
+    path = os.path.join(students_dir, name)
+    try:
+        stat = os.stat(path, follow_symlinks=False)
+    except OSError:
+        return None
+    row = {'name': name, 'mtime': stat.st_mtime, 'indexed_at': now or time.time()}
+    if os.path.isdir(path):
+        row['size'], row['file_count'] = dir_stats(path)
+        row.update(type='directory', student_id=match_student(name, lookup))
+    else:
+        row.update(type='file', size=stat.st_size, file_count=0, student_id=None)
+    return row
+
+
+def refresh(names, students_dir):
+    """重新统计指定的顶层条目（需要应用上下文）；返回处理的条目数。"""
+    rows, removed = [], []
+    now = time.time()
+    for name in names:
+        row = scan_entry(students_dir, name, now=now)
+        if row is None:
+            removed.append(name)
+        else:
+            rows.append(row)
+    save_folder_index(rows, removed)
+    return len(rows) + len(removed)
+
+
+def flush_pending(students_dir):
+    """处理库中登记与本进程暂存的待刷新文件夹（需要应用上下文）。"""
+    with _pending_lock:
+        local = set(_pending)
+        _pending.clear()
+    try:
+        marks = get_folder_index_dirty()
+        names = sorted(local | set(marks))
+        if not names:
+            return 0
+        count = refresh(names, students_dir)
+        clear_folder_index_dirty(marks)
+        return count
+    except Exception:
+        # 写索引失败时放回队列（库中的登记保留），下次重试
+        with _pending_lock:
+            _pending.update(local)
+        raise
+
+
+def reconcile(students_dir):
+    """
+    全量扫描 students/ 并与索引对账（需要应用上下文）。
+
+    返回:
+        dict: {'entries', 'added', 'changed', 'removed', 'elapsed_ms'}
+    """
+    started = time.perf_counter()
+    scan_started_at = time.time()
+    with _pending_lock:
+        # 全量扫描覆盖了此前登记的待刷新项
+        _pending.clear()
+    existing = get_folder_index_map()
+    lookup = get_student_name_lookup()
+    now = time.time()
+    rows = []
+    names = set()
+    if os.path.isdir(students_dir):
+        for entry in os.scandir(students_dir):
+            row = scan_entry(students_dir, entry.name, lookup, now)
+            if row is not None:
+                rows.append(row)
+                names.add(entry.name)
+
+    fields = ('type', 'size', 'file_count', 'mtime', 'student_id')
+    added = [row for row in rows if row['name'] not in existing]
+    changed = [
+        row for row in rows
+        if row['name'] in existing and any(existing[row['name']][f] != row[f] for f in fields)
+    ]
+    removed = [name for name in existing if name not in names]
+    # 只写入有变化的行：indexed_at 即该条目最近一次变化的时间（file_reconcile_service 据此增量对账）
+    save_folder_index(added + changed, removed)
+    clear_folder_index_dirty(before=scan_started_at)
+    return {
+        'entries': len(rows),
+        'added': len(added),
+        'changed': len(changed),
+        'removed': len(removed),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def _rematch(rows):
+    """当前页的文件夹重新匹配学员，结果有变化时回写索引。"""
+    updates = []
+    for row in rows:
+        if row['type'] != 'directory':
+            continue
+        student_id = match_student(row['name'])
+        if student_id != row['student_id']:
+            row['student_id'] = student_id
+            updates.append((student_id, row['name']))
+    update_folder_index_students(updates)
+
+
+def browse(students_dir, search='', sort='modified', descending=True, page=1, page_size=None, matched=None):
+    """
+    从索引分页查询 students/ 顶层条目（需要应用上下文）。
+
+    参数:
+        page_size: 每页条数；None 时返回全部条目
+
+    返回:
+        dict: {'rows'（folder_index 行）, 'total', 'page', 'page_size', 'summary'}
+    """
+    flush_pending(students_dir)
+    summary = get_folder_index_summary()
+    if not summary['directories'] and not summary['files'] and os.listdir(students_dir):
+        reconcile(students_dir)
+        summary = get_folder_index_summary()
+
+    page = max(1, int(page or 1))
+    limit = None
+    if page_size is not None:
+        limit = min(MAX_PAGE_SIZE, max(1, int(page_size)))
+    rows, total = query_folder_index(
+        search=search.strip(), sort=sort, descending=descending,
+        offset=(page - 1) * (limit or 0), limit=limit, matched=matched,
+    )
+    if limit is not None:
+        _rematch(rows)
+    return {
+        'rows': rows,
+        'total': total,
+        'page': page,
+        'page_size': limit,
+        'summary': summary,
+    }
+
+
+class FolderIndexWorker:
+    """后台线程：定期处理待刷新文件夹，并按间隔全量对账。"""
+
+    def __init__(self, app):
+        self.app = app
+        self.flush_sec = _env_int('FOLDER_INDEX_FLUSH_SEC', 2)
+        self.reconcile_sec = _env_int('FOLDER_INDEX_RECONCILE_SEC', 1800)
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'refreshed': 0, 'reconciles': 0, 'errors': 0, 'last_reconcile': None}
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='folder-index', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        students_dir = self.app.config['STUDENTS_FOLDER']
+        # 启动后先对账一次，补上服务停止期间的改动
+        next_reconcile = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    if time.monotonic() >= next_reconcile:
+                        result = reconcile(students_dir)
+                        self.stats['reconciles'] += 1
+                        self.stats['last_reconcile'] = result
+                        next_reconcile = time.monotonic() + self.reconcile_sec
+                        if result['added'] or result['changed'] or result['removed']:
+                            print(f'[folder_index] 对账完成: {result}')
+                    else:
+                        self.stats['refreshed'] += flush_pending(students_dir)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f'[folder_index] 索引更新失败: {e}')
+            self._stop.wait(self.flush_sec)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_service(app):
+    """启动后台索引线程（由 create_app 调用）。"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = FolderIndexWorker(app).start()
+        return _worker
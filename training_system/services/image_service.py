@@ -5,7 +5,8 @@
 
 核心功能:
     1. 证件照背景替换：使用 rembg 去除原始背景，替换为白色背景
-    2. 文件保存：按统一的命名规范和目录结构保存上传的附件文件
+    2. 文件保存：按统一的命名规范和目录结构保存上传的附件文件，
+       图片经 services/image_variant_service.py 规范化为母版并生成缩略图/分析图变体
     3. 文件清理：删除学员记录时同步清理关联的所有附件文件
 
 文件命名规范:
@@ -17,17 +18,14 @@
     通过 services/storage_service.py 统一管理，支持本地、COS、双写三种模式。
     dual 模式下文件同时保存到本地和 COS，本地用于服务端处理，COS 提供对外访问 URL。
 
-可选依赖:
+可选依赖（由 services/bg_removal_service.py 加载）:
     - rembg : AI 背景去除库（未安装时背景替换功能自动跳过）
     - cv2   : OpenCV，用于图像掩码修复（未安装时同上）
 """
 import os
-import io
 import logging
-from PIL import Image, ImageOps
-import numpy as np
 from flask import current_app
-from services import storage_service
+from services import bg_removal_service, image_variant_service, storage_service
 
 logger = logging.getLogger(__name__)
 
@@ -46,49 +44,38 @@ ATTACHMENT_LABELS = {
 def get_attachment_label(label_key):
     return ATTACHMENT_LABELS.get(label_key, label_key)
 
-# ======================== 可选依赖加载 ========================
-# rembg 和 cv2 是可选依赖，未安装时背景替换功能自动降级（返回原图）
-CV2_IMPORT_ERROR = ''
-REMBG_IMPORT_ERROR = ''
-REMBG_SESSION_IMPORT_ERROR = ''
-
-try:
-    import cv2
-except Exception as err:
-    cv2 = None
-    CV2_IMPORT_ERROR = str(err)
-
-try:
-    from rembg import remove
-except Exception as err:
-    remove = None
-    REMBG_IMPORT_ERROR = str(err)
-
-try:
-    from rembg import new_session
-except Exception as err:
-    new_session = None
-    REMBG_SESSION_IMPORT_ERROR = str(err)
-
-
-# ======================== Rembg 单例会话缓存 ========================
-_rembg_session = None
-
-def _get_rembg_session():
-    """懒加载并返回全局单例的 rembg 会话，避免重复加载 AI 模型造成内存泄露。"""
-    global _rembg_session
-    if _rembg_session is None and new_session is not None:
-        try:
-            _rembg_session = new_session(
-                model_name="u2net_human_seg",
-                alpha_matting=True,
-                alpha_matting_foreground_threshold=240,
-                alpha_matting_background_threshold=10,
-                alpha_matting_erode_size=10
-            )
-        except Exception as err:
-            current_app.logger.error(f'初始化 rembg 会话失败: {err}')
-    return _rembg_session
+
+def _log(level, msg, *args):
+    """写 Flask 日志；无应用上下文时（脚本、未初始化的子进程）写模块日志，不影响图片处理流程。"""
+    try:
+        getattr(current_app.logger, level)(msg, *args)
+    except RuntimeError:
+        getattr(logger, level)(msg, *args)
+
+# ======================== 证件照背景替换 ========================
+# 模型推理由 bg_removal_service 统一负责：应用启动时拉起共享推理进程并预热模型，
+# 结果按照片内容哈希 + 背景色缓存。rembg/cv2 未安装时背景替换自动降级（返回原图）。
+
+def replace_background_bytes(image_bytes, bg_color=(255, 255, 255)):
+    """
+    将证件照字节的背景替换为指定颜色，返回 JPEG 字节。
+
+    参数:
+        image_bytes: 原始照片字节
+        bg_color: 背景颜色元组 (R, G, B)
+
+    返回:
+        bytes | None: 处理后的 JPEG 字节；依赖不可用或处理失败时返回 None
+    """
+    if not bg_removal_service.is_available():
+        _log(
+            'warning',
+            'rembg/cv2 unavailable, skipping background removal; cv2_error=%s rembg_error=%s',
+            bg_removal_service.CV2_IMPORT_ERROR or '-',
+            bg_removal_service.REMBG_IMPORT_ERROR or '-'
+        )
+        return None
+    return bg_removal_service.remove_background(image_bytes, bg_color)
 
 
 def change_id_photo_bg(input_path, output_path, bg_color=(255, 255, 255)):
@@ -103,66 +90,21 @@ def change_id_photo_bg(input_path, output_path, bg_color=(255, 255, 255)):
     返回:
         str: 处理后的照片路径（成功返回 output_path，失败返回 input_path）
     """
-    # 检查必要的依赖库是否可用
-    if remove is None or cv2 is None:
-        current_app.logger.warning(
-            'rembg/cv2 unavailable, skipping background removal; cv2_error=%s rembg_error=%s',
-            CV2_IMPORT_ERROR or '-',
-            REMBG_IMPORT_ERROR or '-'
-        )
-        # 依赖库不可用时直接返回原始图片路径
-        return input_path
-
     try:
-        # 读取并移除背景
         with open(input_path, "rb") as f:
             input_img = f.read()
 
-        # 使用复用的单例会话去除背景，避免重复加载神经网络参数
-        session = _get_rembg_session()
-        if session is not None:
-            output_img = remove(input_img, session=session)
-        else:
-            # new_session 不可用时回退到默认会话
-            if REMBG_SESSION_IMPORT_ERROR:
-                current_app.logger.warning(
-                    'rembg.new_session unavailable, using default session; detail=%s',
-                    REMBG_SESSION_IMPORT_ERROR
-                )
-            output_img = remove(input_img)
-        
-        img_no_bg = Image.open(io.BytesIO(output_img)).convert("RGBA")
-
-        # 修复透明度掩码：用形态学膨胀处理 alpha 通道
-        # 避免去背景后服装等区域出现透明缝隙
-        img_np = np.array(img_no_bg)
-        alpha_channel = img_np[:, :, 3]
-        kernel = np.ones((3, 3), np.uint8)  # 3x3 节级核
-        alpha_channel = cv2.dilate(alpha_channel, kernel, iterations=1)  # 膨胀一次填充缝隙
-        img_np[:, :, 3] = alpha_channel
-        img_no_bg_fixed = Image.fromarray(img_np, mode="RGBA")
-
-        # 创建指定颜色的背景图层，与去背景的图像进行 alpha 合成
-        bg_img = Image.new("RGBA", img_no_bg_fixed.size, bg_color + (255,))
-        result = Image.alpha_composite(bg_img, img_no_bg_fixed)
-        result = result.convert("RGB")  # 转换为 RGB 模式以保存为 JPEG
-
-        # 保存处理后的图片
-        result.save(output_path, quality=95)
-        current_app.logger.info(f'图片背景替换成功: {output_path}')
-        
-        # 显式关闭图片对象，加速内存释放
-        try:
-            img_no_bg.close()
-            img_no_bg_fixed.close()
-            bg_img.close()
-            result.close()
-        except Exception:
-            pass
+        output_img = replace_background_bytes(input_img, bg_color)
+        if output_img is None:
+            # 依赖库不可用或推理失败时直接返回原始图片路径
+            return input_path
 
+        with open(output_path, "wb") as f:
+            f.write(output_img)
+        _log('info', f'图片背景替换成功: {output_path}')
         return output_path
     except Exception as e:
-        current_app.logger.error(f'图片背景替换失败: {str(e)}')
+        _log('error', f'图片背景替换失败: {str(e)}')
         return input_path
 
 
@@ -176,6 +118,9 @@ def save_temp_file(file_storage, file_type):
     提交学员表单时，调用 commit_temp_files() 将所有临时文件
     整体移动到正式目录，并返回正式相对路径。
 
+    图片会同时做上传质量检查（模糊/反光/分辨率/证件是否完整），
+    结果记录在变体清单中，可通过 get_upload_quality() 读取。
+
     参数:
         file_storage: werkzeug FileStorage 对象
         file_type: 附件类型（如 'photo', 'diploma'）
@@ -194,13 +139,24 @@ def save_temp_file(file_storage, file_type):
     filename = f"{tmp_id}_{file_type}{orig_ext}"
     tmp_key = f"students/tmp/{filename}"
 
-    # 通过存储服务保存（dual 模式同时写本地和 COS）
-    storage_service.save_file(file_storage, tmp_key)
+    # 规范化母版 + 变体 + 上传质量检查，通过存储服务保存（dual 模式同时写本地和 COS）
+    image_variant_service.save_upload(file_storage, tmp_key, quality_type=file_type)
     current_app.logger.info(f'临时文件已保存: {tmp_key}')
 
     return tmp_key
 
 
+def get_upload_quality(file_key):
+    """
+    读取上传时的质量检查结果。
+
+    返回:
+        dict 或 None: {'verdict': 'pass'|'warn'|'fail', 'scores', 'issues', 'elapsed_ms'}
+    """
+    manifest = image_variant_service.read_manifest(file_key)
+    return manifest.get('quality') if manifest else None
+
+
 def commit_temp_files(tmp_paths_by_input_name, id_card, name, company, training_type):
     """
     提交阶段：将预上传的临时文件移动到学员正式目录，返回正式的相对路径字典。
@@ -246,6 +202,7 @@ def commit_temp_files(tmp_paths_by_input_name, id_card, name, company, training_
         if ok:
             current_app.logger.info(f'正式归档小程序的临时附件文件: {tmp_rel} -> {formal_key}')
             result[db_key] = formal_key
+            image_variant_service.move_variants(tmp_rel, formal_key)
             # 记录临时目录用于后续清理
             tmp_dirs_to_clean.add(os.path.dirname(tmp_rel))
         else:
@@ -296,8 +253,8 @@ def process_and_save_file(file_storage, id_card, name, label_key, company='', tr
     safe_name = f"{id_card}-{name}-{label_name}{orig_ext}"
     key = f"students/{student_folder_name}/{safe_name}"
 
-    # 通过存储服务保存（dual 模式同时写本地和 COS，原子写保证本地安全）
-    storage_service.save_file(file_storage, key)
+    # 规范化母版 + 变体，通过存储服务保存（dual 模式同时写本地和 COS，原子写保证本地安全）
+    image_variant_service.save_upload(file_storage, key)
     current_app.logger.info(f'文件已保存: {key}')
 
     return key
@@ -305,7 +262,7 @@ def process_and_save_file(file_storage, id_card, name, label_key, company='', tr
 
 def delete_file_if_exists(file_path, base_dir):
     """
-    如果文件存在则删除（本地 + COS）。
+    如果文件存在则删除（本地 + COS），同时删除其缩略图/分析图变体。
 
     参数:
         file_path: 相对文件路径（存储 key）
@@ -316,6 +273,7 @@ def delete_file_if_exists(file_path, base_dir):
     """
     if not file_path:
         return False
+    image_variant_service.delete_variants(file_path)
     return storage_service.delete_file(file_path)
 
 
@@ -346,6 +304,7 @@ def delete_student_files(student_record, base_dir=None):
     for key in file_keys:
         rel_path = student_record.get(key)
         if rel_path:
+            image_variant_service.delete_variants(rel_path)
             ok = storage_service.delete_file(rel_path)
             if not ok:
                 failed_files.append(rel_path)
@@ -0,0 +1,370 @@
+"""
+上传图片规范化与多分辨率变体服务。
+
+小程序/后台上传的手机照片原样落盘：常见 4000×3000 以上、带 EXIF 方向标记，
+后续的后台预览、文件浏览、自动识别裁剪都要反复解码全尺寸原图并各自处理一次方向。
+本模块在上传时一次性完成：
+
+    1. 母版规范化：应用 EXIF 方向（像素转正、去掉方向标记），长边超过
+       UPLOAD_MASTER_MAX_SIDE 时等比缩小。无需旋转且尺寸合规的图片保留原始字节，不做有损重编码
+    2. 缩略图变体：长边 THUMB_MAX_SIDE 的 JPEG，供后台预览和文件浏览列表使用
+    3. 分析图变体：长边 ANALYSIS_VARIANT_MAX_SIDE 的 JPEG，供 analyze_material_points 自动识别使用。
+       母版本身不超过该尺寸时不生成，直接使用母版
+    4. 变体清单：记录母版与各变体的尺寸、字节数，便于把分析图上的坐标换算回母版坐标；
+       指定附件类型时同时记录上传质量检查结果（见 upload_quality_service）
+
+存储约定（由母版 key 推导，不写数据库，文件改名/迁移时按同一规则同步移动）:
+    母版: students/<目录>/<文件名>
+    变体: students/<目录>/.variants/<文件名>.thumb.jpg
+          students/<目录>/.variants/<文件名>.analysis.jpg
+    清单: students/<目录>/.variants/<文件名>.json
+
+所有写入都经过 storage_service.save_file，dual 模式下变体同样同步至 COS。
+变体生成失败不影响母版保存，读取方在变体缺失时回退到母版。
+"""
+import io
+import json
+import os
+import posixpath
+
+from PIL import Image, ImageOps
+
+from services import storage_service, upload_quality_service
+
+UPLOAD_MASTER_MAX_SIDE = int(os.environ.get('UPLOAD_MASTER_MAX_SIDE', '3200'))
+THUMB_MAX_SIDE = 320
+# 与 material_service.ANALYSIS_MAX_SIDES 中的最大值保持一致
+ANALYSIS_VARIANT_MAX_SIDE = 2400
+
+MASTER_JPEG_QUALITY = 92
+THUMB_JPEG_QUALITY = 80
+ANALYSIS_JPEG_QUALITY = 90
+
+VARIANT_DIR_NAME = '.variants'
+VARIANT_NAMES = ('thumb', 'analysis')
+NORMALIZABLE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp'}
+MANIFEST_VERSION = 1
+
+_EXIF_ORIENTATION_TAG = 0x0112
+
+
+# ======================== key 约定 ========================
+
+def variant_key(key, variant):
+    """返回母版 key 对应的变体 key（如 thumb / analysis）。"""
+    directory, filename = posixpath.split(key)
+    return posixpath.join(directory, VARIANT_DIR_NAME, f'{filename}.{variant}.jpg')
+
+
+def manifest_key(key):
+    """返回母版 key 对应的变体清单 key。"""
+    directory, filename = posixpath.split(key)
+    return posixpath.join(directory, VARIANT_DIR_NAME, f'{filename}.json')
+
+
+def all_variant_keys(key):
+    """返回母版 key 关联的全部派生文件 key（各变体 + 清单）。"""
+    return [variant_key(key, name) for name in VARIANT_NAMES] + [manifest_key(key)]
+
+
+def is_variant_key(key):
+    """判断 key 是否位于变体目录下。"""
+    return f'/{VARIANT_DIR_NAME}/' in f'/{key}'
+
+
+# ======================== 图片处理 ========================
+
+def _read_data(data_or_fileobj):
+    if hasattr(data_or_fileobj, 'read'):
+        data = data_or_fileobj.read()
+        if hasattr(data_or_fileobj, 'seek'):
+            try:
+                data_or_fileobj.seek(0)
+            except Exception:
+                pass
+        return data
+    return bytes(data_or_fileobj)
+
+
+def _fit_size(size, max_side):
+    width, height = size
+    longest = max(width, height)
+    if longest <= max_side:
+        return width, height
+    scale = max_side / float(longest)
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+
+def _resize_to_max_side(img, max_side):
+    target = _fit_size(img.size, max_side)
+    if target == img.size:
+        return img
+    return img.resize(target, Image.LANCZOS, reducing_gap=3.0)
+
+
+def flatten_to_rgb(img):
+    """转换为 RGB/L 模式，透明区域铺白底（JPEG 不支持透明通道）。"""
+    if img.mode in ('RGB', 'L'):
+        return img
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        rgba = img.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def _encode(img, fmt, quality):
+    buf = io.BytesIO()
+    if fmt == 'PNG':
+        img.save(buf, format='PNG', optimize=True)
+    elif fmt == 'WEBP':
+        img.save(buf, format='WEBP', quality=quality)
+    else:
+        flatten_to_rgb(img).save(buf, format='JPEG', quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def normalize_upload(data):
+    """
+    规范化上传图片为母版。
+
+    参数:
+        data: 上传文件原始字节
+
+    返回:
+        (master_bytes, master_image, info)
+        - master_bytes: 母版字节（无需处理时即原始字节）
+        - master_image: 已转正、已限尺寸的 PIL.Image，用于生成变体
+        - info: {'original_size', 'original_bytes', 'exif_transposed', 'resized', 'reencoded'}
+
+    异常:
+        无法解码为图片时抛出异常，由调用方回退为原样保存
+    """
+    img = Image.open(io.BytesIO(data))
+    fmt = img.format or 'JPEG'
+    orientation = img.getexif().get(_EXIF_ORIENTATION_TAG, 1)
+    rotated = orientation not in (None, 1)
+    raw_size = img.size
+    oversized = max(raw_size) > UPLOAD_MASTER_MAX_SIDE
+
+    if fmt == 'JPEG' and oversized:
+        # JPEG 按 DCT 缩放解码，避免先解出全尺寸像素再缩小
+        img.draft('RGB', _fit_size(raw_size, UPLOAD_MASTER_MAX_SIDE))
+    img.load()
+
+    # 原始尺寸按转正后的方向记录（5-8 为含 90° 旋转的方向值）
+    if orientation in (5, 6, 7, 8):
+        original_size = [raw_size[1], raw_size[0]]
+    else:
+        original_size = list(raw_size)
+    master = ImageOps.exif_transpose(img) if rotated else img
+    master = _resize_to_max_side(master, UPLOAD_MASTER_MAX_SIDE)
+
+    info = {
+        'original_size': original_size,
+        'original_bytes': len(data),
+        'exif_transposed': rotated,
+        'resized': oversized,
+        'reencoded': rotated or oversized,
+    }
+    if not (rotated or oversized):
+        return data, master, info
+
+    if fmt not in ('PNG', 'WEBP'):
+        fmt = 'JPEG'
+    quality = MASTER_JPEG_QUALITY if fmt == 'JPEG' else 90
+    return _encode(master, fmt, quality), master, info
+
+
+def build_variants(master_img):
+    """
+    由母版生成变体。
+
+    返回:
+        dict: {variant_name: PIL.Image 或 None}，None 表示直接使用母版
+    """
+    thumb = flatten_to_rgb(master_img).copy()
+    thumb.thumbnail((THUMB_MAX_SIDE, THUMB_MAX_SIDE), Image.LANCZOS, reducing_gap=3.0)
+    analysis = None
+    if max(master_img.size) > ANALYSIS_VARIANT_MAX_SIDE:
+        analysis = _resize_to_max_side(flatten_to_rgb(master_img), ANALYSIS_VARIANT_MAX_SIDE)
+    return {'thumb': thumb, 'analysis': analysis}
+
+
+# ======================== 保存 / 读取 ========================
+
+def save_upload(data_or_fileobj, key, quality_type=None):
+    """
+    保存上传文件：图片写入规范化母版并生成变体与清单，其他文件原样保存。
+
+    参数:
+        data_or_fileobj: bytes 或 werkzeug FileStorage 对象
+        key: 母版存储 key
+        quality_type: 附件类型；指定时对母版做上传质量检查，结果写入清单的 quality 字段
+
+    返回:
+        dict 或 None: 变体清单；非图片或图片无法解码时返回 None
+
+    异常:
+        母版写入失败时向上抛出异常（与 storage_service.save_file 一致）
+    """
+    data = _read_data(data_or_fileobj)
+    ext = os.path.splitext(key)[1].lower()
+    if ext not in NORMALIZABLE_EXTENSIONS:
+        storage_service.save_file(data, key)
+        return None
+
+    try:
+        master_bytes, master_img, info = normalize_upload(data)
+    except Exception as e:
+        print(f'[image_variant] 图片无法解码，按原样保存 {key}: {e}')
+        storage_service.save_file(data, key)
+        delete_variants(key)
+        return None
+
+    storage_service.save_file(master_bytes, key)
+
+    quality = None
+    if quality_type:
+        try:
+            quality = upload_quality_service.assess_image(
+                master_img, quality_type, original_size=info['original_size'],
+            )
+        except Exception as e:
+            print(f'[image_variant] 质量检查失败 {key}: {e}')
+
+    try:
+        return _write_variants(key, master_bytes, master_img, info, quality)
+    except Exception as e:
+        print(f'[image_variant] 生成变体失败 {key}: {e}')
+        delete_variants(key)
+        return None
+
+
+def _write_variants(key, master_bytes, master_img, info, quality=None):
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'master': {
+            'width': master_img.size[0],
+            'height': master_img.size[1],
+            'bytes': len(master_bytes),
+        },
+        'source': info,
+        'variants': {},
+    }
+    if quality is not None:
+        manifest['quality'] = quality
+    quality = {'thumb': THUMB_JPEG_QUALITY, 'analysis': ANALYSIS_JPEG_QUALITY}
+    for name, img in build_variants(master_img).items():
+        target = variant_key(key, name)
+        if img is None:
+            manifest['variants'][name] = None
+            if storage_service.file_exists_local(target):
+                storage_service.delete_file(target)
+            continue
+        payload = _encode(img, 'JPEG', quality[name])
+        storage_service.save_file(payload, target)
+        manifest['variants'][name] = {
+            'width': img.size[0],
+            'height': img.size[1],
+            'bytes': len(payload),
+        }
+
+    storage_service.save_file(
+        json.dumps(manifest, ensure_ascii=False).encode('utf-8'),
+        manifest_key(key),
+    )
+    return manifest
+
+
+def read_manifest(key):
+    """读取母版 key 对应的变体清单，不存在或损坏时返回 None。"""
+    if not key:
+        return None
+    try:
+        raw = storage_service.read_bytes(manifest_key(key))
+    except Exception:
+        return None
+    if not raw:
+        return None
+    try:
+        manifest = json.loads(raw.decode('utf-8'))
+    except Exception:
+        return None
+    return manifest if isinstance(manifest, dict) else None
+
+
+def analysis_source(key, base_dir=None):
+    """
+    返回自动识别应读取的图片与坐标换算比例。
+
+    参数:
+        key: 母版存储 key
+        base_dir: 本地根目录（默认 storage_service.get_base_dir()）
+
+    返回:
+        (abs_path, (scale_x, scale_y))
+        分析图存在时读取分析图，识别出的坐标乘以比例即为母版坐标；
+        否则读取母版本身，比例为 (1.0, 1.0)
+    """
+    base_dir = base_dir or storage_service.get_base_dir()
+    master_path = os.path.join(base_dir, key)
+    variant_path = os.path.join(base_dir, variant_key(key, 'analysis'))
+    manifest_path = os.path.join(base_dir, manifest_key(key))
+    if not (os.path.isfile(variant_path) and os.path.isfile(manifest_path)):
+        return master_path, (1.0, 1.0)
+
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        master = manifest['master']
+        variant = manifest['variants']['analysis']
+        scale_x = float(master['width']) / float(variant['width'])
+        scale_y = float(master['height']) / float(variant['height'])
+    except Exception:
+        return master_path, (1.0, 1.0)
+    return variant_path, (scale_x, scale_y)
+
+
+def _existing_variant_keys(key):
+    if storage_service._get_backend() in ('local', 'dual'):
+        return [k for k in all_variant_keys(key) if storage_service.file_exists_local(k)]
+    # cos-only：以清单为准
+    manifest = read_manifest(key)
+    if not manifest:
+        return []
+    variants = manifest.get('variants') or {}
+    keys = [variant_key(key, name) for name in VARIANT_NAMES if variants.get(name)]
+    return keys + [manifest_key(key)]
+
+
+def move_variants(src_key, dst_key):
+    """母版移动后同步移动其变体（失败只记日志，读取方会回退到母版）。"""
+    targets = dict(zip(all_variant_keys(src_key), all_variant_keys(dst_key)))
+    moved = 0
+    for src in _existing_variant_keys(src_key):
+        dst = targets[src]
+        if storage_service.move_temp_file(src, dst):
+            moved += 1
+        else:
+            print(f'[image_variant] 移动变体失败: {src} -> {dst}')
+    return moved
+
+
+def delete_variants(key):
+    """删除母版 key 关联的所有变体与清单。"""
+    for target in _existing_variant_keys(key):
+        storage_service.delete_file(target)
+
+
+def variant_path_mapping(old_key, new_key, base_dir=None):
+    """
+    为文件迁移生成变体的 (old_key, new_key) 对（仅包含本地存在的变体）。
+    """
+    base_dir = base_dir or storage_service.get_base_dir()
+    return [
+        (src, dst)
+        for src, dst in zip(all_variant_keys(old_key), all_variant_keys(new_key))
+        if os.path.exists(os.path.join(base_dir, src))
+    ]
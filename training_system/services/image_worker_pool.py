@@ -0,0 +1,259 @@
+"""
+OpenCV 图像处理进程池。
+
+材料生成、手动裁剪、候选框检测原先都在 Flask worker 进程内执行：几张 5000 万像素的手机照片
+就能把 RSS 推到 1GB 以上，堆碎片化后内存也不会归还给系统，部分纯 Python 循环还会长时间持有 GIL。
+本模块把这些任务放到独立的子进程中执行：
+
+    1. 进程隔离：ProcessPoolExecutor（spawn 启动方式），Web 进程只负责调度，内存曲线保持平稳
+    2. 单任务内存上限：子进程启动时设置 RLIMIT_AS，每个子进程同一时间只执行一个任务，
+       超限时任务内抛出 MemoryError / cv2.error，转换为 ImageJobMemoryError 返回给调用方
+    3. 定期回收：每个子进程执行 IMAGE_WORKER_MAX_JOBS 个任务后退出并由进程池重新拉起，
+       堆碎片随进程一并释放
+    4. 线程数：子进程内 cv2.setNumThreads(IMAGE_WORKER_CV_THREADS)，避免多个子进程各自占满全部核心
+    5. 数据传递：任务参数与返回值只有路径和小字典，图像数据本身经由磁盘文件
+       （学员附件、输出目录、临时裁剪文件）在进程间传递，不经过管道序列化
+    6. 日志：子进程内的处理流程日志（material_service.log_line）按调用方的任务关联 ID 收集，
+       连同日志级别随结果返回后在调用方进程按原级别重放，进入调用方 capture_logs 的收集器
+    7. 应用上下文：start_service(app) 把应用配置中可序列化的部分传给子进程，子进程据此建立
+       一个最小 Flask 应用并常驻推入应用上下文，current_app.logger、get_base_dir()、
+       get_db_connection() 在子进程内与 Web 进程行为一致；dual 模式下生成文件的 COS 上传
+       登记到发件箱表（cos_outbox_service.enable_relay），由 Web 进程的发件箱线程执行
+
+进程池只在 create_app 中调用 start_service() 后启用；未启用（测试、调试父进程、平台不支持）时
+run() 直接在当前进程内执行，行为与原实现一致。子进程异常退出（如被系统 OOM 终止）时
+进程池自动重建，本次任务以 RuntimeError 失败。
+
+环境变量:
+    IMAGE_WORKER_POOL_ENABLED   是否启用进程池（默认 true）
+    IMAGE_WORKER_PROCESSES      子进程数（默认 min(2, CPU 核数)）
+    IMAGE_WORKER_MAX_JOBS       每个子进程执行多少个任务后回收（默认 20）
+    IMAGE_WORKER_MEMORY_MB      单任务地址空间上限（默认 3072MB，0 表示不限制）
+    IMAGE_WORKER_CV_THREADS     子进程内 OpenCV 线程数（默认 2）
+
+可选依赖:
+    - resource : 内存上限（仅 Unix）
+"""
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+
+from services import material_service
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ======================== 可选依赖加载 ========================
+RESOURCE_IMPORT_ERROR = ''
+
+try:
+    import resource
+except Exception as err:
+    resource = None
+    RESOURCE_IMPORT_ERROR = str(err)
+
+
+class ImageJobMemoryError(MemoryError):
+    """图像任务超出子进程内存上限。"""
+
+
+def _env_int(name, default, minimum=0):
+    try:
+        return max(minimum, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def pool_enabled():
+    return os.getenv('IMAGE_WORKER_POOL_ENABLED', 'true').lower() in ('true', '1', 'yes')
+
+
+def get_pool_settings():
+    """读取进程池配置。"""
+    return {
+        'processes': _env_int('IMAGE_WORKER_PROCESSES', min(2, os.cpu_count() or 1), minimum=1),
+        'max_jobs': _env_int('IMAGE_WORKER_MAX_JOBS', 20, minimum=1),
+        'memory_mb': _env_int('IMAGE_WORKER_MEMORY_MB', 3072),
+        'cv_threads': _env_int('IMAGE_WORKER_CV_THREADS', 2, minimum=1),
+    }
+
+
+def get_worker_config(app):
+    """应用配置中可跨进程传递的部分（字符串、数值、布尔、None），供子进程建立应用上下文。"""
+    return {
+        key: value for key, value in app.config.items()
+        if value is None or isinstance(value, (str, int, float, bool))
+    }
+
+
+# ======================== 子进程侧 ========================
+
+_worker_app = None
+
+
+def _push_app_context(app_config):
+    """按父进程的配置建立最小 Flask 应用（只含配置与日志），在子进程生命周期内保持其应用上下文。"""
+    global _worker_app
+    from flask import Flask
+    from utils.logger import setup_logger
+
+    _worker_app = Flask('app', root_path=PROJECT_DIR)
+    _worker_app.config.update(app_config)
+    setup_logger(_worker_app)
+    _worker_app.app_context().push()
+
+    # 子进程内生成的文件登记到发件箱，由 Web 进程的发件箱线程上传并负责重试
+    from services import cos_outbox_service
+    cos_outbox_service.enable_relay()
+
+
+def _init_worker(memory_mb, cv_threads, app_config=None):
+    """子进程初始化：设置地址空间上限和 OpenCV 线程数（图像处理模块已随本模块导入），推入应用上下文。"""
+    if memory_mb and resource is not None:
+        limit = memory_mb * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    cv2.setNumThreads(cv_threads)
+    if app_config is not None:
+        _push_app_context(app_config)
+
+
+def _is_memory_failure(exc):
+    if isinstance(exc, MemoryError):
+        return True
+    message = str(exc).lower()
+    return 'insufficient memory' in message or 'failed to allocate' in message
+
+
+def _execute(func, args, kwargs, job_id=None):
+    """
+    在子进程中执行任务，返回 (结果, 异常, [(日志级别, 日志行)], 统计)。
+
+    异常不直接抛出：先连同已收集的日志一起返回，由调用方进程重放日志后再抛出。
+    """
+    started = time.perf_counter()
+    result, error = None, None
+    with material_service.capture_logs(job_id) as job_log:
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            if _is_memory_failure(e):
+                error = ImageJobMemoryError(f'图像处理超出内存上限: {e}')
+            else:
+                error = e
+    try:
+        pickle.dumps(error)
+    except Exception:
+        error = RuntimeError(f'{type(error).__name__}: {error}')
+
+    stats = {'elapsed_ms': round((time.perf_counter() - started) * 1000, 1), 'pid': os.getpid()}
+    if resource is not None:
+        # Linux 下 ru_maxrss 单位为 KB
+        stats['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+    return result, error, job_log.records(), stats
+
+
+# ======================== 调用方侧 ========================
+
+class ImageWorkerPool:
+    """对 ProcessPoolExecutor 的封装：按配置建池，子进程异常退出后自动重建。"""
+
+    def __init__(self, processes=2, max_jobs=20, memory_mb=3072, cv_threads=2, app_config=None):
+        self.processes = processes
+        self.max_jobs = max_jobs
+        self.memory_mb = memory_mb
+        self.cv_threads = cv_threads
+        self.app_config = app_config
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {'jobs': 0, 'failed': 0, 'memory_errors': 0, 'pool_restarts': 0, 'max_rss_mb': 0.0}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.memory_mb, self.cv_threads, self.app_config),
+                    max_tasks_per_child=self.max_jobs,
+                )
+            return self._executor
+
+    def _discard_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.stats['pool_restarts'] += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, func, *args, **kwargs):
+        """在子进程中执行 func(*args, **kwargs) 并返回结果（func 须为模块级函数）。"""
+        executor = self._get_executor()
+        try:
+            future = executor.submit(_execute, func, args, kwargs, material_service.current_job_id())
+            result, error, records, stats = future.result()
+        except BrokenProcessPool as e:
+            self.stats['failed'] += 1
+            self._discard_executor(executor)
+            raise RuntimeError(f'图像处理进程异常退出（可能超出系统内存）: {e}') from e
+
+        for level, line in records:
+            material_service.pipeline_logger.log(level, line)
+        self.stats['jobs'] += 1
+        self.stats['max_rss_mb'] = max(self.stats['max_rss_mb'], stats.get('max_rss_mb', 0.0))
+        if error is not None:
+            self.stats['failed'] += 1
+            if isinstance(error, ImageJobMemoryError):
+                self.stats['memory_errors'] += 1
+            raise error
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_service(app=None):
+    """启用进程池（由 create_app 调用）；子进程按需拉起。"""
+    global _pool
+    if not pool_enabled() or multiprocessing.parent_process() is not None:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            settings = get_pool_settings()
+            _pool = ImageWorkerPool(**settings, app_config=get_worker_config(app) if app is not None else None)
+            if settings['memory_mb'] and resource is None:
+                print(f'[image_worker] 当前平台不支持内存上限，仅做进程隔离: {RESOURCE_IMPORT_ERROR}')
+            print(
+                f"[image_worker] 图像处理进程池已启用: {settings['processes']} 个进程, "
+                f"每进程 {settings['max_jobs']} 个任务后回收, 内存上限 {settings['memory_mb'] or '不限'}MB"
+            )
+        return _pool
+
+
+def get_pool():
+    return _pool
+
+
+def run(func, *args, **kwargs):
+    """
+    执行图像处理任务：进程池已启用时在子进程中执行，否则在当前进程内直接调用。
+    """
+    pool = _pool
+    if pool is None:
+        return func(*args, **kwargs)
+    return pool.run(func, *args, **kwargs)
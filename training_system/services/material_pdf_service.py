@@ -0,0 +1,315 @@
+"""
+报名材料 PDF 合成。
+
+材料生成输出的是一张张 A4 JPEG（create_a4_canvas 的 2480×3508 白底画布），管理员原先要手动合并后打印。
+本模块在生成流程末尾把这些 JPEG 合成为每个学员一个多页 PDF：
+
+    1. 直接嵌入：JPEG 字节原样作为 DCTDecode 图像写入 PDF，不解码、不重新编码，
+       只从 SOF 段读取宽高和通道数，合成耗时只有文件拷贝的量级
+    2. 页面布局：A4 画布按整页铺满；其他尺寸的图片（如个人照片）按 300DPI 的实际物理尺寸
+       放置在页面上方居中，超出版心时等比缩小
+    3. 紧凑模式（compact）：A4 画布中大部分是白色像素，紧凑模式只把画布上的证件区域
+       按原位置、原尺寸放到 PDF 页面上，白色由 PDF 页面背景提供。
+       证件区域 JPEG 在生成画布时（material_service.write_cv_image 调用 remember_compact_parts）
+       直接从未压缩的画布像素裁出、各编码一次，按画布 JPEG 的 SHA-256 缓存；合成 PDF 时不解码画布、
+       不二次压缩。没有缓存的页面（已被淘汰，或开启 compact 之前生成）按 full 方式整页原样嵌入
+    4. 流式写出：逐页读取 JPEG 写入临时文件，最后原子替换，不在内存中拼接整个 PDF
+
+环境变量:
+    MATERIAL_PDF_MODE       off / full / compact（默认 full）
+    MATERIAL_PDF_PARTS_DIR  紧凑模式证件区域缓存目录（默认 database/pdf_parts）
+    MATERIAL_PDF_PARTS_MB   紧凑模式证件区域缓存上限（默认 128MB）
+"""
+import hashlib
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF_DPI = 300
+A4_WIDTH_PT = 595.2756
+A4_HEIGHT_PT = 841.8898
+PAGE_MARGIN_PT = 72 / 2.54  # 1cm
+PDF_MODES = ('off', 'full', 'compact')
+
+# 紧凑模式：灰度低于该值视为内容；在缩小 COMPACT_DOWNSCALE 倍的掩码上找区域
+COMPACT_WHITE_LEVEL = 245
+COMPACT_DOWNSCALE = 8
+COMPACT_MIN_AREA_RATIO = 0.002
+COMPACT_PADDING_PX = 12
+COMPACT_JPEG_QUALITY = 92
+COMPACT_PARTS_EXT = '.parts'
+
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_COLOR_SPACES = {1: '/DeviceGray', 3: '/DeviceRGB', 4: '/DeviceCMYK'}
+
+
+def get_pdf_mode():
+    mode = os.getenv('MATERIAL_PDF_MODE', 'full').strip().lower()
+    return mode if mode in PDF_MODES else 'full'
+
+
+def jpeg_info(data):
+    """
+    从 JPEG 段结构中读取 (宽, 高, 通道数, 是否 Adobe 反相 CMYK)，不解码像素。
+
+    非 JPEG 或结构损坏时抛出 ValueError。
+    """
+    if data[:2] != b'\xff\xd8':
+        raise ValueError('不是 JPEG 数据')
+    adobe = False
+    pos = 2
+    size = len(data)
+    while pos + 4 <= size:
+        if data[pos] != 0xFF:
+            raise ValueError('JPEG 段结构损坏')
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if marker == 0xEE and data[pos + 4:pos + 9] == b'Adobe':
+            adobe = True
+        if marker in _SOF_MARKERS:
+            height = int.from_bytes(data[pos + 5:pos + 7], 'big')
+            width = int.from_bytes(data[pos + 7:pos + 9], 'big')
+            components = data[pos + 9]
+            return width, height, components, adobe and components == 4
+        pos += 2 + length
+    raise ValueError('未找到 JPEG 尺寸信息')
+
+
+def is_a4_canvas(width, height):
+    return abs(width / float(height) - A4_WIDTH_PT / A4_HEIGHT_PT) < 0.002
+
+
+def _natural_placement(width, height):
+    """按 PDF_DPI 的物理尺寸放在页面上方居中，超出版心时等比缩小。"""
+    w_pt = width * 72.0 / PDF_DPI
+    h_pt = height * 72.0 / PDF_DPI
+    max_w = A4_WIDTH_PT - 2 * PAGE_MARGIN_PT
+    max_h = A4_HEIGHT_PT - 2 * PAGE_MARGIN_PT
+    scale = min(1.0, max_w / w_pt, max_h / h_pt)
+    w_pt, h_pt = w_pt * scale, h_pt * scale
+    return (A4_WIDTH_PT - w_pt) / 2, A4_HEIGHT_PT - PAGE_MARGIN_PT - h_pt, w_pt, h_pt
+
+
+def find_content_regions(image):
+    """
+    找出 A4 画布上的非白色内容区域，返回画布像素坐标下的 [(x, y, w, h)]（按从上到下排序）。
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    h, w = gray.shape[:2]
+    small = cv2.resize(
+        gray, (max(1, w // COMPACT_DOWNSCALE), max(1, h // COMPACT_DOWNSCALE)), interpolation=cv2.INTER_AREA,
+    )
+    mask = (small < COMPACT_WHITE_LEVEL).astype(np.uint8) * 255
+    # 膨胀只用于把同一证件上的零散内容连成一块，区域边界仍按未膨胀的掩码收紧
+    merged = cv2.dilate(mask, np.ones((5, 5), dtype=np.uint8), iterations=2)
+    contours, _ = cv2.findContours(merged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = COMPACT_MIN_AREA_RATIO * small.shape[0] * small.shape[1]
+    regions = []
+    for contour in contours:
+        x, y, bw, bh = cv2.boundingRect(contour)
+        tight = cv2.boundingRect(mask[y:y + bh, x:x + bw])
+        x, y, bw, bh = x + tight[0], y + tight[1], tight[2], tight[3]
+        if bw * bh < min_area:
+            continue
+        x0 = max(0, x * COMPACT_DOWNSCALE - COMPACT_PADDING_PX)
+        y0 = max(0, y * COMPACT_DOWNSCALE - COMPACT_PADDING_PX)
+        x1 = min(w, (x + bw) * COMPACT_DOWNSCALE + COMPACT_PADDING_PX)
+        y1 = min(h, (y + bh) * COMPACT_DOWNSCALE + COMPACT_PADDING_PX)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+    regions.sort(key=lambda region: (region[1], region[0]))
+    return regions
+
+
+_parts_cache = None
+_parts_cache_lock = threading.Lock()
+
+
+def get_parts_cache():
+    """返回紧凑模式的证件区域缓存（按画布 JPEG 的 SHA-256 寻址，按总字节数 LRU 淘汰）。"""
+    global _parts_cache
+    if _parts_cache is None:
+        with _parts_cache_lock:
+            if _parts_cache is None:
+                from services.thumbnail_service import ThumbnailCache
+
+                root = os.getenv('MATERIAL_PDF_PARTS_DIR', '').strip() or \
+                    os.path.join(PROJECT_DIR, 'database', 'pdf_parts')
+                max_mb = int(os.getenv('MATERIAL_PDF_PARTS_MB', '128'))
+                _parts_cache = ThumbnailCache(root, max_mb * 1024 * 1024)
+    return _parts_cache
+
+
+def remember_compact_parts(canvas_jpeg, canvas):
+    """
+    生成 A4 画布时调用：从未压缩的画布像素裁出证件区域，各编码一次后按画布 JPEG 的 SHA-256 缓存。
+
+    缓存格式为一行 JSON 头（画布尺寸与各区域的字节数、像素位置）加上依次拼接的区域 JPEG。
+    返回缓存文件路径；不是 A4 画布或找不到证件区域时返回 None。
+    """
+    height, width = canvas.shape[:2]
+    if not is_a4_canvas(width, height):
+        return None
+    regions = find_content_regions(canvas)
+    if not regions:
+        return None
+    header = []
+    chunks = []
+    for x, y, w, h in regions:
+        ok, buf = cv2.imencode('.jpg', canvas[y:y + h, x:x + w], [int(cv2.IMWRITE_JPEG_QUALITY), COMPACT_JPEG_QUALITY])
+        if not ok:
+            return None
+        chunks.append(buf.tobytes())
+        header.append([len(chunks[-1]), x, y, w, h])
+    payload = json.dumps({'width': width, 'height': height, 'parts': header}).encode('ascii') + b'\n'
+    digest = hashlib.sha256(canvas_jpeg).hexdigest()
+    return get_parts_cache().put(digest, COMPACT_PARTS_EXT, payload + b''.join(chunks))
+
+
+def _compact_images(data, width, height):
+    """读取画布生成时缓存的证件区域，返回 [(jpeg_bytes, (x_pt, y_pt, w_pt, h_pt))]；没有缓存时返回 None。"""
+    path = get_parts_cache().get(hashlib.sha256(data).hexdigest(), COMPACT_PARTS_EXT)
+    if not path:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            header_line, _, body = f.read().partition(b'\n')
+        header = json.loads(header_line)
+    except (OSError, ValueError):
+        # 读取前已被其他进程淘汰或内容损坏，整页嵌入
+        return None
+    if (header.get('width'), header.get('height')) != (width, height):
+        return None
+    scale_x = A4_WIDTH_PT / width
+    scale_y = A4_HEIGHT_PT / height
+    placed = []
+    offset = 0
+    for length, x, y, w, h in header.get('parts') or []:
+        placed.append((body[offset:offset + length], (x * scale_x, A4_HEIGHT_PT - (y + h) * scale_y, w * scale_x, h * scale_y)))
+        offset += length
+    if not placed or offset != len(body):
+        return None
+    return placed
+
+
+def page_images(data, mode='full'):
+    """
+    计算单个 JPEG 对应的 PDF 页面内容，返回 [(jpeg_bytes, (x_pt, y_pt, w_pt, h_pt))]。
+    """
+    width, height, _, _ = jpeg_info(data)
+    if not is_a4_canvas(width, height):
+        return [(data, _natural_placement(width, height))]
+    if mode == 'compact':
+        placed = _compact_images(data, width, height)
+        if placed:
+            return placed
+    return [(data, (0.0, 0.0, A4_WIDTH_PT, A4_HEIGHT_PT))]
+
+
+class _PdfWriter:
+    """极简 PDF 写出器：只支持 A4 页面 + DCTDecode 图像。"""
+
+    def __init__(self, file_obj):
+        self.file = file_obj
+        self.offsets = {}
+        self.next_id = 3  # 1: Catalog, 2: Pages
+        self.page_ids = []
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _allocate(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(f'{obj_id} 0 obj\n'.encode('ascii'))
+        self.file.write(body.encode('ascii'))
+        if stream is not None:
+            self.file.write(b'\nstream\n')
+            self.file.write(stream)
+            self.file.write(b'\nendstream')
+        self.file.write(b'\nendobj\n')
+
+    def add_page(self, images):
+        page_id = self._allocate()
+        content_id = self._allocate()
+        xobjects = []
+        commands = []
+        for index, (data, (x, y, w, h)) in enumerate(images):
+            width, height, components, inverted = jpeg_info(data)
+            image_id = self._allocate()
+            decode = ' /Decode [1 0 1 0 1 0 1 0]' if inverted else ''
+            self._write_object(
+                image_id,
+                f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                f'/ColorSpace {_COLOR_SPACES.get(components, "/DeviceRGB")} /BitsPerComponent 8'
+                f'{decode} /Filter /DCTDecode /Length {len(data)} >>',
+                data,
+            )
+            name = f'Im{index}'
+            xobjects.append(f'/{name} {image_id} 0 R')
+            commands.append(f'q {w:.3f} 0 0 {h:.3f} {x:.3f} {y:.3f} cm /{name} Do Q')
+        content = '\n'.join(commands).encode('ascii')
+        self._write_object(content_id, f'<< /Length {len(content)} >>', content)
+        self._write_object(
+            page_id,
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {A4_WIDTH_PT:.4f} {A4_HEIGHT_PT:.4f}] '
+            f'/Resources << /XObject << {" ".join(xobjects)} >> >> /Contents {content_id} 0 R >>',
+        )
+        self.page_ids.append(page_id)
+
+    def close(self):
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        self._write_object(1, '<< /Type /Catalog /Pages 2 0 R >>')
+        self._write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>')
+        xref_offset = self.file.tell()
+        self.file.write(f'xref\n0 {self.next_id}\n'.encode('ascii'))
+        self.file.write(b'0000000000 65535 f \n')
+        for obj_id in range(1, self.next_id):
+            self.file.write(f'{self.offsets[obj_id]:010d} 00000 n \n'.encode('ascii'))
+        self.file.write(
+            f'trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode('ascii')
+        )
+
+
+def build_pdf(jpeg_paths, output_path, mode='full'):
+    """
+    将 JPEG 文件按顺序合成为多页 A4 PDF（每个文件一页）。
+
+    返回:
+        dict: {'output_path', 'pages', 'bytes', 'mode'}；没有可用页面时不写文件，返回 None
+    """
+    pages = [path for path in jpeg_paths if path and os.path.isfile(path)]
+    if not pages:
+        return None
+
+    tmp_path = f'{output_path}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            writer = _PdfWriter(f)
+            for path in pages:
+                with open(path, 'rb') as src:
+                    data = src.read()
+                writer.add_page(page_images(data, mode))
+            writer.close()
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {
+        'output_path': output_path,
+        'pages': len(pages),
+        'bytes': os.path.getsize(output_path),
+        'mode': mode,
+    }
@@ -1,14 +1,17 @@
-import io
+import contextlib
+import contextvars
+import logging
 import os
 import shutil
-import subprocess
-import tempfile
+import threading
+import time
+import uuid
 from datetime import datetime
 
 import cv2
 import numpy as np
 from PIL import Image
-from services import storage_service
+from services import blob_store_service, osd_service, storage_service
 
 A4_WIDTH = 2480
 A4_HEIGHT = 3508
@@ -17,7 +20,7 @@ ANALYSIS_MAX_SIDE = 1800
 MIN_CROP_DIM = 24
 ID_CARD_RATIO = 85.6 / 54.0
 HUKOU_PAGE_RATIO = 20.5 / 14.5  # ~1.414, 户口本页面标准长宽比
-TESSERACT_BINARY = shutil.which("tesseract")
+TESSERACT_BINARY = osd_service.TESSERACT_BINARY
 HUKOU_OSD_MIN_CONFIDENCE = 0.9
 HUKOU_OSD_STRONG_CONFIDENCE = 1.6
 HUKOU_OSD_TIMEOUT_SEC = 8
@@ -28,6 +31,18 @@ ANALYSIS_MAX_SIDES = {
     "diploma": 1800,
 }
 
+# 各类输出 JPEG 的字节预算：在 max_quality..min_quality 之间二分查找不超预算的最高质量，
+# 最低质量仍超预算时再等比缩小（不低于 min_scale）。A4 拼版以白底为主，预算内通常仍是原质量
+JPEG_OUTPUT_PROFILES = {
+    "photo": {"max_bytes": 1000 * 1024, "max_quality": 95, "min_quality": 30, "min_scale": 0.5},
+    "diploma": {"max_bytes": 1536 * 1024, "max_quality": 95, "min_quality": 70, "min_scale": 0.8},
+    "id_card": {"max_bytes": 1024 * 1024, "max_quality": 95, "min_quality": 70, "min_scale": 0.8},
+    "hukou": {"max_bytes": 1536 * 1024, "max_quality": 95, "min_quality": 70, "min_scale": 0.8},
+    "renewal_certificate": {"max_bytes": 1536 * 1024, "max_quality": 95, "min_quality": 70, "min_scale": 0.8},
+}
+# 是否输出渐进式 JPEG（网页预览先出轮廓；部分老旧系统不兼容，默认关闭）
+JPEG_PROGRESSIVE = os.environ.get("MATERIAL_JPEG_PROGRESSIVE", "").strip().lower() in ("1", "true", "yes")
+
 CROP_PROFILES = {
     "id_card": {
         "target_ratio": ID_CARD_RATIO,
@@ -102,14 +117,43 @@ MATERIAL_SCOPE_LABELS = {
 }
 
 
+# 处理流程日志：各处理函数通过 log_line 记录文本日志（原为 print），
+# 由 logging 分发给当前上下文中的 MaterialGenerationLogger（见 capture_logs），
+# 不再替换进程全局的 sys.stdout，多线程并发生成时各请求的日志互不串扰。
+# 没有激活的收集器时（后台预计算、文档工具等），日志转写到 attach_pipeline_logger 指定的应用日志
+pipeline_logger = logging.getLogger("training_system.material")
+_active_capture = contextvars.ContextVar("material_log_capture", default=None)
+_fallback_logger = None
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:12]
+
+
 class MaterialGenerationLogger:
-    def __init__(self):
+    """
+    材料生成日志收集器。
+
+    - 结构化事件（emit）：带任务关联 ID、相对任务开始的耗时，以及步骤耗时
+      （距上一事件的墙钟时间 duration_ms 与当前线程 CPU 时间 cpu_ms，
+      即把两次 emit 之间的处理时间记到后一个事件的 (scope, step) 上）
+    - 文本日志（add_line）：capture_logs 激活期间 log_line 输出的行，连同日志级别一起保存
+    """
+
+    def __init__(self, job_id=None):
+        self.job_id = job_id or current_job_id() or new_job_id()
         self.started_at = datetime.now().isoformat(timespec="seconds")
         self.finished_at = None
         self.events = []
         self.output_files = []
+        self.lines = []
+        self.levels = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._last_mark = (self._started, time.thread_time())
 
     def emit(self, level, scope, step, title, message, details=None, raw=None):
+        now, cpu_now = time.perf_counter(), time.thread_time()
         event = {
             "level": level,
             "scope": scope,
@@ -120,13 +164,48 @@ class MaterialGenerationLogger:
             "details": details or {},
             "raw": raw,
             "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "job_id": self.job_id,
         }
-        output_path = event["details"].get("output_path")
-        if output_path and output_path not in self.output_files:
-            self.output_files.append(output_path)
-        self.events.append(event)
+        with self._lock:
+            event["elapsed_ms"] = round((now - self._started) * 1000, 1)
+            last_wall, last_cpu = self._last_mark
+            event["duration_ms"] = round((now - last_wall) * 1000, 1)
+            event["cpu_ms"] = round(max(0.0, cpu_now - last_cpu) * 1000, 1)
+            self._last_mark = (now, cpu_now)
+            output_path = event["details"].get("output_path")
+            if output_path and output_path not in self.output_files:
+                self.output_files.append(output_path)
+            self.events.append(event)
         return event
 
+    def add_line(self, line, level=logging.INFO):
+        with self._lock:
+            self.lines.append(line)
+            self.levels.append(level)
+
+    def records(self):
+        """返回 [(日志级别, 行)]，供跨进程传递后按原级别重放。"""
+        with self._lock:
+            return list(zip(self.levels, self.lines))
+
+    def text(self):
+        with self._lock:
+            return "".join(f"{line}\n" for line in self.lines)
+
+    def step_timings(self):
+        """按 (材料, 步骤) 汇总墙钟与 CPU 耗时，按首次出现顺序返回。"""
+        totals = {}
+        with self._lock:
+            for event in self.events:
+                key = (event["scope"], event["step"])
+                item = totals.setdefault(key, {
+                    "scope": event["scope"], "step": event["step"], "count": 0, "wall_ms": 0.0, "cpu_ms": 0.0,
+                })
+                item["count"] += 1
+                item["wall_ms"] = round(item["wall_ms"] + event.get("duration_ms", 0.0), 1)
+                item["cpu_ms"] = round(item["cpu_ms"] + event.get("cpu_ms", 0.0), 1)
+        return list(totals.values())
+
     def build_summary(self):
         if self.finished_at is None:
             self.finished_at = datetime.now().isoformat(timespec="seconds")
@@ -140,8 +219,10 @@ class MaterialGenerationLogger:
             if event["scope"] != "global"
         }
         return {
+            "job_id": self.job_id,
             "started_at": self.started_at,
             "finished_at": self.finished_at,
+            "elapsed_ms": round((time.perf_counter() - self._started) * 1000, 1),
             "material_count": len(material_scopes),
             "success_count": success_count,
             "warning_count": warning_count,
@@ -149,6 +230,72 @@ class MaterialGenerationLogger:
             "output_files": list(self.output_files),
         }
 
+    def flush_to(self, target_logger):
+        """将收集到的文本日志逐行写入目标 logger（带任务关联 ID 前缀）。"""
+        for level, line in self.records():
+            if line.strip():
+                target_logger.log(level, f"[{self.job_id}] {line}")
+
+
+class _CaptureHandler(logging.Handler):
+    """把处理流程日志交给当前上下文中激活的收集器。"""
+
+    def emit(self, record):
+        capture = _active_capture.get()
+        try:
+            if capture is not None:
+                capture.add_line(record.getMessage(), record.levelno)
+            elif _fallback_logger is not None:
+                _fallback_logger.log(record.levelno, record.getMessage())
+        except Exception:
+            self.handleError(record)
+
+
+class _JobIdFilter(logging.Filter):
+    def filter(self, record):
+        record.job_id = current_job_id() or "-"
+        return True
+
+
+pipeline_logger.setLevel(logging.INFO)
+if not any(isinstance(handler, _CaptureHandler) for handler in pipeline_logger.handlers):
+    pipeline_logger.addHandler(_CaptureHandler())
+    pipeline_logger.addFilter(_JobIdFilter())
+
+
+def attach_pipeline_logger(target_logger):
+    """指定收集器之外的处理流程日志写入的 logger（create_app 传入 app.logger）。"""
+    global _fallback_logger
+    _fallback_logger = target_logger
+
+
+def current_job_id():
+    capture = _active_capture.get()
+    return capture.job_id if capture is not None else None
+
+
+@contextlib.contextmanager
+def capture_logs(job_id=None):
+    """
+    在当前上下文（线程 / 协程）内收集处理流程日志。
+
+    用法:
+        with capture_logs() as job_log:
+            report = generate_student_materials(...)
+        logs = job_log.text()
+    """
+    capture = MaterialGenerationLogger(job_id=job_id)
+    token = _active_capture.set(capture)
+    try:
+        yield capture
+    finally:
+        _active_capture.reset(token)
+
+
+def log_line(*parts):
+    """记录一行处理日志，参数拼接方式与 print 相同。"""
+    pipeline_logger.info(" ".join(str(part) for part in parts))
+
 
 def crop_image_with_points(image, points, mode="perspective"):
     points_array = np.array(points, dtype=np.float32)
@@ -166,6 +313,25 @@ def crop_image_with_points(image, points, mode="perspective"):
     return four_point_transform(image, points_array, inpaint=True)
 
 
+def resolve_source_path(base_dir, rel):
+    """
+    返回附件的本地可读路径。
+
+    本地存在时直接使用；cos-only 部署下本地没有附件，经 storage_service.ensure_local
+    取得本地读缓存中的副本。都取不到时返回原拼接路径，由调用方按文件不存在处理。
+    """
+    if not rel:
+        return None
+    abs_path = os.path.join(base_dir, rel)
+    if os.path.exists(abs_path):
+        return abs_path
+    try:
+        return storage_service.ensure_local(rel) or abs_path
+    except Exception as exc:
+        log_line(f'[material_service] 读取 COS 附件失败: {rel} -> {exc}')
+        return abs_path
+
+
 def cleanup_generated_outputs(output_dir, name_prefix, material_type=None):
     if not os.path.isdir(output_dir):
         return []
@@ -231,6 +397,7 @@ def build_generation_report(output_dir, logger, results):
         "errors": errors,
         "log_events": list(logger.events),
         "log_summary": summary,
+        "step_timings": logger.step_timings(),
     }
 
 
@@ -285,7 +452,7 @@ def four_point_transform(image, pts, inpaint=False):
         inpaint_mask = cv2.dilate(inpaint_mask, kernel, iterations=1)
         if inpaint_mask.any():
             missing_ratio = float(inpaint_mask.sum()) / (max_width * max_height * 255)
-            print(f"[four_point_transform] inpaint missing ratio={missing_ratio:.3f}")
+            log_line(f"[four_point_transform] inpaint missing ratio={missing_ratio:.3f}")
             warped = cv2.inpaint(warped, inpaint_mask, 5, cv2.INPAINT_TELEA)
 
     return warped
@@ -412,19 +579,21 @@ def apply_low_light_enhancement_if_needed(image, stage="analysis"):
 
 def prepare_analysis_image(image, enable_low_light=True, max_side=ANALYSIS_MAX_SIDE):
     analysis_image, scale = resize_for_analysis(image, max_side=max_side)
-    enhancement_meta = {
-        "enabled": False,
-        "stage": "analysis",
-        "mean_before": analyze_image_stats(analysis_image)["mean"],
-        "mean_after": analyze_image_stats(analysis_image)["mean"],
-        "dynamic_before": analyze_image_stats(analysis_image)["dynamic_range"],
-        "dynamic_after": analyze_image_stats(analysis_image)["dynamic_range"],
-    }
     if enable_low_light:
         analysis_image, enhancement_meta = apply_low_light_enhancement_if_needed(
             analysis_image,
             stage="analysis",
         )
+    else:
+        stats = analyze_image_stats(analysis_image)
+        enhancement_meta = {
+            "enabled": False,
+            "stage": "analysis",
+            "mean_before": stats["mean"],
+            "mean_after": stats["mean"],
+            "dynamic_before": stats["dynamic_range"],
+            "dynamic_after": stats["dynamic_range"],
+        }
     gray = cv2.cvtColor(analysis_image, cv2.COLOR_BGR2GRAY)
     return analysis_image, gray, enhancement_meta, scale
 
@@ -485,56 +654,81 @@ def detect_edges(gray, profile_name, canny_scale=1.0):
     return edges
 
 
+def order_points_batch(quads):
+    """order_points 的批量版本：quads 为 (N, 4, 2)，逐个按 左上、右上、右下、左下 排序。"""
+    quads = np.asarray(quads, dtype=np.float32).reshape(-1, 4, 2)
+    index = np.arange(len(quads))
+    sums = quads.sum(axis=2)
+    diffs = quads[:, :, 1] - quads[:, :, 0]
+    return np.stack(
+        [
+            quads[index, np.argmin(sums, axis=1)],
+            quads[index, np.argmin(diffs, axis=1)],
+            quads[index, np.argmax(sums, axis=1)],
+            quads[index, np.argmax(diffs, axis=1)],
+        ],
+        axis=1,
+    )
+
+
+def _side_lengths(ordered, start, end):
+    delta = ordered[:, end] - ordered[:, start]
+    return np.sqrt((delta * delta).sum(axis=1))
+
+
+def polygon_angle_qualities(quads):
+    """批量计算四边形四个内角接近 90° 的程度，返回 (N,) 数组。"""
+    ordered = order_points_batch(quads)
+    v1 = np.roll(ordered, 1, axis=1) - ordered
+    v2 = np.roll(ordered, -1, axis=1) - ordered
+    denom = np.sqrt((v1 * v1).sum(axis=2)) * np.sqrt((v2 * v2).sum(axis=2))
+    degenerate = denom <= 1e-6
+    cosine = np.clip((v1 * v2).sum(axis=2) / np.where(degenerate, 1.0, denom), -1.0, 1.0)
+    angle = np.degrees(np.arccos(cosine))
+    quality = np.maximum(0.0, 1.0 - np.abs(angle - 90.0) / 45.0)
+    return np.where(degenerate.any(axis=1), 0.0, quality.mean(axis=1)).astype(np.float64)
+
+
+def compute_aspect_ratios(quads):
+    """批量计算四边形长宽比（长边 / 短边），退化四边形为 0。"""
+    ordered = order_points_batch(quads)
+    width = np.maximum(_side_lengths(ordered, 0, 1), _side_lengths(ordered, 3, 2))
+    height = np.maximum(_side_lengths(ordered, 0, 3), _side_lengths(ordered, 1, 2))
+    short_side = np.minimum(width, height)
+    degenerate = short_side <= 1e-6
+    ratio = np.maximum(width, height) / np.where(degenerate, 1.0, short_side)
+    return np.where(degenerate, 0.0, ratio).astype(np.float64)
+
+
+def compute_border_margins(quads, image_shape):
+    """批量计算四边形到图像边缘的最小距离（相对短边归一化，负值截断为 0）。"""
+    quads = np.asarray(quads, dtype=np.float32).reshape(-1, 4, 2)
+    height, width = image_shape[:2]
+    margin = np.minimum.reduce([
+        quads[:, :, 0].min(axis=1),
+        quads[:, :, 1].min(axis=1),
+        width - 1 - quads[:, :, 0].max(axis=1),
+        height - 1 - quads[:, :, 1].max(axis=1),
+    ]) / float(max(1, min(height, width)))
+    return np.maximum(0.0, margin).astype(np.float64)
+
+
 def polygon_angle_quality(points):
-    ordered = order_points(points.astype("float32"))
-    quality = []
-    for index in range(4):
-        prev_pt = ordered[index - 1]
-        curr_pt = ordered[index]
-        next_pt = ordered[(index + 1) % 4]
-        v1 = prev_pt - curr_pt
-        v2 = next_pt - curr_pt
-        denom = np.linalg.norm(v1) * np.linalg.norm(v2)
-        if denom <= 1e-6:
-            return 0.0
-        cosine = np.clip(np.dot(v1, v2) / denom, -1.0, 1.0)
-        angle = np.degrees(np.arccos(cosine))
-        quality.append(max(0.0, 1.0 - abs(angle - 90.0) / 45.0))
-    return float(np.mean(quality))
+    return float(polygon_angle_qualities(points[None])[0])
 
 
 def compute_aspect_ratio(points):
-    ordered = order_points(points.astype("float32"))
-    width = max(np.linalg.norm(ordered[1] - ordered[0]), np.linalg.norm(ordered[2] - ordered[3]))
-    height = max(np.linalg.norm(ordered[3] - ordered[0]), np.linalg.norm(ordered[2] - ordered[1]))
-    if min(width, height) <= 1e-6:
-        return 0.0
-    return float(max(width, height) / min(width, height))
+    return float(compute_aspect_ratios(points[None])[0])
 
 
 def compute_border_edge_density(edges, points):
-    mask = np.zeros(edges.shape[:2], dtype=np.uint8)
-    thickness = max(2, int(round(min(edges.shape[:2]) * 0.005)))
-    cv2.polylines(mask, [points.astype(np.int32)], True, 255, thickness)
-    border_pixels = cv2.countNonZero(mask)
-    if border_pixels <= 0:
-        return 0.0
-    edge_pixels = cv2.countNonZero(cv2.bitwise_and(edges, mask))
-    return float(min(1.0, (edge_pixels / float(border_pixels)) * 4.0))
+    return CandidateScoringEngine(edges).border_edge_density(points)
 
 
 def compute_inner_line_density(line_mask, points):
     if line_mask is None:
         return 0.0
-    mask = np.zeros(line_mask.shape[:2], dtype=np.uint8)
-    cv2.fillPoly(mask, [points.astype(np.int32)], 255)
-    mask = cv2.erode(mask, np.ones((5, 5), dtype=np.uint8), iterations=1)
-    area = cv2.countNonZero(mask)
-    if area <= 0:
-        return 0.0
-    line_pixels = cv2.countNonZero(cv2.bitwise_and(line_mask, mask))
-    raw_density = line_pixels / float(area)
-    return float(min(1.0, raw_density * 10.0))
+    return CandidateScoringEngine(line_mask, line_mask).inner_line_density(points)
 
 
 def interval_score(value, min_value, max_value):
@@ -665,50 +859,23 @@ def rotate_image_by_degrees(image, degrees):
 
 
 def detect_text_osd_rotation(image):
-    if TESSERACT_BINARY is None or image is None or image.size == 0:
-        return None
+    return detect_text_osd_rotations([image])[0]
 
-    osd_image, _ = resize_for_analysis(image, max_side=2200)
-    osd_image, _ = apply_low_light_enhancement_if_needed(osd_image, stage="analysis")
 
-    temp_path = None
-    try:
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_file:
-            temp_path = temp_file.name
-        if not cv2.imwrite(temp_path, osd_image):
-            return None
-
-        process = subprocess.run(
-            [TESSERACT_BINARY, temp_path, "stdout", "--psm", "0"],
-            capture_output=True,
-            text=True,
-            timeout=HUKOU_OSD_TIMEOUT_SEC,
-            check=False,
-        )
-    except (OSError, subprocess.SubprocessError):
-        return None
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
-
-    output = "\n".join(part for part in (process.stdout, process.stderr) if part)
-    rotate_degrees = None
-    confidence = None
-    for line in output.splitlines():
-        if line.startswith("Rotate:"):
-            try:
-                rotate_degrees = int(line.split(":", 1)[1].strip())
-            except ValueError:
-                rotate_degrees = None
-        elif line.startswith("Orientation confidence:"):
-            try:
-                confidence = float(line.split(":", 1)[1].strip())
-            except ValueError:
-                confidence = None
+def detect_text_osd_rotations(images):
+    """批量 OSD：所有候选图一次入队，由 OSD 工作线程连续检测，结果与输入顺序对应。"""
+    if not osd_service.is_available():
+        return [None for _ in images]
 
-    if rotate_degrees is None or confidence is None:
-        return None
-    return {"rotate_degrees": rotate_degrees % 360, "confidence": confidence}
+    osd_images = []
+    for image in images:
+        if image is None or image.size == 0:
+            osd_images.append(None)
+            continue
+        osd_image, _ = resize_for_analysis(image, max_side=2200)
+        osd_image, _ = apply_low_light_enhancement_if_needed(osd_image, stage="analysis")
+        osd_images.append(osd_image)
+    return osd_service.detect_rotations(osd_images, timeout=HUKOU_OSD_TIMEOUT_SEC)
 
 
 def detect_hukou_home_stamp_centers(image):
@@ -812,52 +979,52 @@ def normalize_hukou_page_orientation(image, original_image=None, page_kind="pers
     # 优先用 Tesseract OSD（精度最高）
     raw_osd = detect_text_osd_rotation(source_image)
     if raw_osd:
-        print(f"{tag} Tesseract OSD: rotate={raw_osd['rotate_degrees']}°  confidence={raw_osd['confidence']:.2f}  (threshold={HUKOU_OSD_MIN_CONFIDENCE})")
+        log_line(f"{tag} Tesseract OSD: rotate={raw_osd['rotate_degrees']}°  confidence={raw_osd['confidence']:.2f}  (threshold={HUKOU_OSD_MIN_CONFIDENCE})")
     else:
-        print(f"{tag} Tesseract OSD: 不可用（未安装或反馈为空）")
+        log_line(f"{tag} Tesseract OSD: 不可用（未安装或反馈为空）")
 
     if raw_osd and raw_osd["confidence"] >= HUKOU_OSD_MIN_CONFIDENCE:
         rotate_degrees = raw_osd["rotate_degrees"]
         if rotate_degrees in (90, 270):
-            print(f"{tag} 决策: OSD 旋转 {rotate_degrees}°（横向竖放图片）")
+            log_line(f"{tag} 决策: OSD 旋转 {rotate_degrees}°（横向竖放图片）")
             return rotate_image_by_degrees(image, rotate_degrees)
         if page_kind != "home" or raw_osd["confidence"] >= HUKOU_OSD_STRONG_CONFIDENCE:
-            print(f"{tag} 决策: OSD 旋转 {rotate_degrees}°")
+            log_line(f"{tag} 决策: OSD 旋转 {rotate_degrees}°")
             return rotate_image_by_degrees(image, rotate_degrees)
-        print(f"{tag} OSD 置信度不足（{raw_osd['confidence']:.2f} < {HUKOU_OSD_STRONG_CONFIDENCE}），跳过 OSD 结果")
+        log_line(f"{tag} OSD 置信度不足（{raw_osd['confidence']:.2f} < {HUKOU_OSD_STRONG_CONFIDENCE}），跳过 OSD 结果")
     elif raw_osd:
-        print(f"{tag} OSD 置信度不足（{raw_osd['confidence']:.2f} < {HUKOU_OSD_MIN_CONFIDENCE}），进入备选逻辑")
+        log_line(f"{tag} OSD 置信度不足（{raw_osd['confidence']:.2f} < {HUKOU_OSD_MIN_CONFIDENCE}），进入备选逻辑")
 
     # home 页：先试印章颜色方案
     if page_kind == "home":
         before_shape = image.shape
         stamped = normalize_hukou_home_page(image)
         if stamped.shape != before_shape or not np.array_equal(stamped, image):
-            print(f"{tag} 决策: 印章颜色检测成功，已旋转调整方向")
+            log_line(f"{tag} 决策: 印章颜色检测成功，已旋转调整方向")
             return stamped
-        print(f"{tag} 印章颜色检测: 未触发（印章不够清晰或不存在），进入投影方法")
+        log_line(f"{tag} 印章颜色检测: 未触发（印章不够清晰或不存在），进入投影方法")
 
     # 纯视觉投影方向检测
     best_angle, proj_scores = estimate_orientation_by_projection(image)
     sorted_proj = sorted(proj_scores.items(), key=lambda kv: -kv[1])
     scores_str = "  ".join(f"{ang}°={s:.1f}" for ang, s in sorted_proj)
-    print(f"{tag} 投影得分: {scores_str}")
+    log_line(f"{tag} 投影得分: {scores_str}")
     if best_angle != 0:
-        print(f"{tag} 决策: 投影备选旋转 {best_angle}°")
+        log_line(f"{tag} 决策: 投影备选旋转 {best_angle}°")
         return rotate_image_by_degrees(image, best_angle)
-    print(f"{tag} 投影方法: 得分差异不显著，不旋转")
+    log_line(f"{tag} 投影方法: 得分差异不显著，不旋转")
 
 
-    # 如果裁剪图和原图都没能确定方向，再试一次裁剪后的 OSD
+    # 如果裁剪图和原图都没能确定方向，再试一次裁剪后的 OSD（原图结果可信时不会走到这里）
     if original_image is not None:
         crop_osd = detect_text_osd_rotation(image)
         if crop_osd:
-            print(f"{tag} 裁剪后二次 OSD: rotate={crop_osd['rotate_degrees']}°  confidence={crop_osd['confidence']:.2f}")
+            log_line(f"{tag} 裁剪后二次 OSD: rotate={crop_osd['rotate_degrees']}°  confidence={crop_osd['confidence']:.2f}")
         if crop_osd and crop_osd["confidence"] >= HUKOU_OSD_MIN_CONFIDENCE:
-            print(f"{tag} 决策: 二次 OSD 旋转 {crop_osd['rotate_degrees']}°")
+            log_line(f"{tag} 决策: 二次 OSD 旋转 {crop_osd['rotate_degrees']}°")
             return rotate_image_by_degrees(image, crop_osd["rotate_degrees"])
 
-    print(f"{tag} 所有方法均未成功识别方向，保持原图不动")
+    log_line(f"{tag} 所有方法均未成功识别方向，保持原图不动")
     return image
 
 
@@ -932,7 +1099,7 @@ def prepare_hukou_output_page(image, page_kind, crop_mode="auto", expand_level=N
     kind_label = "首页" if page_kind == "home" else "本人页"
     tag = f"[hukou][{kind_label}]"
     h0, w0 = image.shape[:2]
-    print(f"{tag} 原图尺寸: {w0}x{h0}")
+    log_line(f"{tag} 原图尺寸: {w0}x{h0}")
 
     if manual_crop_applied:
         page = image.copy()
@@ -945,7 +1112,7 @@ def prepare_hukou_output_page(image, page_kind, crop_mode="auto", expand_level=N
         page, meta = auto_crop_hukou_page(image, return_meta=True, allow_perspective=_allow_persp, expand_level=expand_level, skip_ratio_trim=skip_ratio_trim, canny_scale=canny_scale)
     selected = meta.get("selected_candidate") or {}
     h1, w1 = page.shape[:2]
-    print(
+    log_line(
         f"{tag} 裁剪后: {w1}x{h1}  "
         f"mode={meta.get('crop_mode')}  "
         f"detector={selected.get('detector', 'N/A')}  "
@@ -965,18 +1132,18 @@ def prepare_hukou_output_page(image, page_kind, crop_mode="auto", expand_level=N
         refined_page, refined_meta = auto_crop_hukou_page(page, return_meta=True, canny_scale=canny_scale)
         h2, w2 = refined_page.shape[:2]
         if refined_page.shape[0] * refined_page.shape[1] < page.shape[0] * page.shape[1] * 0.96:
-            print(f"{tag} 二次精细裁剪生效: {w2}x{h2}")
+            log_line(f"{tag} 二次精细裁剪生效: {w2}x{h2}")
             page = refined_page
             meta = refined_meta
             selected = meta.get("selected_candidate") or selected
         else:
-            print(f"{tag} 二次精细裁剪未生效（面积没有明显缩小），保持第一次结果")
+            log_line(f"{tag} 二次精细裁剪未生效（面积没有明显缩小），保持第一次结果")
 
     if not manual_crop_applied and not extra_rotate:
         page = normalize_hukou_page_orientation(page, original_image=image, page_kind=page_kind)
     h3, w3 = page.shape[:2]
     if (h3, w3) != (h1, w1):
-        print(f"{tag} 方向校正后: {w3}x{h3}")
+        log_line(f"{tag} 方向校正后: {w3}x{h3}")
 
     if (
         not manual_crop_applied
@@ -986,10 +1153,10 @@ def prepare_hukou_output_page(image, page_kind, crop_mode="auto", expand_level=N
         and selected.get("area_ratio", 0.0) >= 0.82
         and selected.get("edge_density_on_border", 1.0) < 0.40
     ):
-        print(f"{tag} 触发边缘修剪（area_ratio={selected.get('area_ratio', 0):.3f}, edge_density={selected.get('edge_density_on_border', 0):.3f}）")
+        log_line(f"{tag} 触发边缘修剪（area_ratio={selected.get('area_ratio', 0):.3f}, edge_density={selected.get('edge_density_on_border', 0):.3f}）")
         page = trim_hukou_home_page_margins(page)
         h4, w4 = page.shape[:2]
-        print(f"{tag} 边缘修剪后: {w4}x{h4}")
+        log_line(f"{tag} 边缘修剪后: {w4}x{h4}")
     return page
 
 
@@ -1026,7 +1193,13 @@ def summarize_candidate(candidate):
     }
 
 
-def build_candidate_from_contour(contour, edges, image_shape, scale, line_mask=None, detector="edge"):
+def quad_from_contour(contour):
+    """
+    将轮廓拟合为四边形。
+
+    返回 (ordered_points, contour_area, box_area, source)，无法构成有效四边形时返回 None。
+    source 为 "approx"（多边形逼近得到四点）或 "min_rect"（回退到最小外接矩形）。
+    """
     hull = cv2.convexHull(contour)
     contour_area = cv2.contourArea(hull)
     if contour_area <= 0:
@@ -1049,29 +1222,148 @@ def build_candidate_from_contour(contour, edges, image_shape, scale, line_mask=N
     box_area = cv2.contourArea(ordered)
     if box_area <= 0:
         return None
+    return ordered, float(contour_area), float(box_area), source
 
-    image_area = float(image_shape[0] * image_shape[1])
-    border_margin = min(
-        np.min(ordered[:, 0]),
-        np.min(ordered[:, 1]),
-        image_shape[1] - 1 - np.max(ordered[:, 0]),
-        image_shape[0] - 1 - np.max(ordered[:, 1]),
-    ) / float(max(1, min(image_shape[:2])))
 
-    return {
-        "points_analysis": ordered,
-        "points_orig": ordered * scale,
-        "contour_area": float(contour_area),
-        "area_ratio": float(contour_area / image_area),
-        "aspect_ratio": compute_aspect_ratio(ordered),
-        "rectangularity": float(min(1.0, contour_area / box_area)),
-        "corner_quality": polygon_angle_quality(ordered),
-        "border_margin": float(max(0.0, border_margin)),
-        "edge_density_on_border": compute_border_edge_density(edges, ordered),
-        "inner_line_density": compute_inner_line_density(line_mask, ordered),
-        "detector": detector,
-        "source": source,
-    }
+class CandidateScoringEngine:
+    """
+    候选框批量评分引擎。
+
+    每张分析图只构建一次：预先计算边缘掩码和表格线掩码的积分图，之后
+        - 长宽比、角点质量、边缘留白等几何特征对全部候选框一次性用 NumPy 数组计算
+        - 边框边缘密度 / 内部线条密度只在候选框外接矩形（ROI）内绘制掩码统计，
+          积分图用于 O(1) 判断 ROI 内是否有边缘/线条像素，没有时直接得 0
+        - 未通过 score_candidates 硬性门限（面积、长宽比）的候选框不计算密度
+
+    ROI 内的绘制与整图绘制逐像素一致（整数平移 + 足够的留白），
+    因此密度值与逐个整图绘制的旧实现相同。
+    """
+
+    _ERODE_KERNEL = np.ones((5, 5), dtype=np.uint8)
+    _ERODE_PAD = 4
+
+    def __init__(self, edges, line_mask=None):
+        self.edges = edges
+        self.line_mask = line_mask
+        self.shape = edges.shape[:2]
+        self.thickness = max(2, int(round(min(self.shape) * 0.005)))
+        self._edge_integral = None
+        self._line_integral = None
+
+    @staticmethod
+    def _integral(mask):
+        return cv2.integral((mask > 0).astype(np.uint8), sdepth=cv2.CV_32S)
+
+    @staticmethod
+    def _rect_sum(integral, x0, y0, x1, y1):
+        return int(integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0])
+
+    def _roi(self, points, pad):
+        height, width = self.shape
+        x0 = max(0, int(points[:, 0].min()) - pad)
+        y0 = max(0, int(points[:, 1].min()) - pad)
+        x1 = min(width, int(points[:, 0].max()) + pad + 1)
+        y1 = min(height, int(points[:, 1].max()) + pad + 1)
+        return x0, y0, x1, y1
+
+    def border_edge_density(self, points):
+        pts = points.astype(np.int32)
+        x0, y0, x1, y1 = self._roi(pts, self.thickness + 2)
+        if x1 <= x0 or y1 <= y0:
+            return 0.0
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.polylines(mask, [pts - np.array([x0, y0], dtype=np.int32)], True, 255, self.thickness)
+        border_pixels = cv2.countNonZero(mask)
+        if border_pixels <= 0:
+            return 0.0
+        if self._edge_integral is None:
+            self._edge_integral = self._integral(self.edges)
+        if self._rect_sum(self._edge_integral, x0, y0, x1, y1) == 0:
+            return 0.0
+        edge_pixels = cv2.countNonZero(cv2.bitwise_and(self.edges[y0:y1, x0:x1], mask))
+        return float(min(1.0, (edge_pixels / float(border_pixels)) * 4.0))
+
+    def inner_line_density(self, points):
+        if self.line_mask is None:
+            return 0.0
+        pts = points.astype(np.int32)
+        x0, y0, x1, y1 = self._roi(pts, self._ERODE_PAD)
+        if x1 <= x0 or y1 <= y0:
+            return 0.0
+        if self._line_integral is None:
+            self._line_integral = self._integral(self.line_mask)
+        if self._rect_sum(self._line_integral, x0, y0, x1, y1) == 0:
+            return 0.0
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.fillPoly(mask, [pts - np.array([x0, y0], dtype=np.int32)], 255)
+        mask = cv2.erode(mask, self._ERODE_KERNEL, iterations=1)
+        area = cv2.countNonZero(mask)
+        if area <= 0:
+            return 0.0
+        line_pixels = cv2.countNonZero(cv2.bitwise_and(self.line_mask[y0:y1, x0:x1], mask))
+        return float(min(1.0, (line_pixels / float(area)) * 10.0))
+
+    def build_candidates(self, contours_with_detector, scale, image_shape=None):
+        """由 (contour, detector) 列表构建候选框；几何特征批量计算，密度留待 measure_densities。"""
+        image_shape = image_shape or self.shape
+        quads = []
+        for contour, detector in contours_with_detector:
+            quad = quad_from_contour(contour)
+            if quad is not None:
+                quads.append(quad + (detector,))
+        if not quads:
+            return []
+
+        points = np.stack([item[0] for item in quads])
+        contour_areas = np.array([item[1] for item in quads], dtype=np.float64)
+        box_areas = np.array([item[2] for item in quads], dtype=np.float64)
+        image_area = float(image_shape[0] * image_shape[1])
+        area_ratios = contour_areas / image_area
+        rectangularity = np.minimum(1.0, contour_areas / box_areas)
+        aspect_ratios = compute_aspect_ratios(points)
+        corner_quality = polygon_angle_qualities(points)
+        border_margins = compute_border_margins(points, image_shape)
+
+        candidates = []
+        for index, (ordered, contour_area, _, source, detector) in enumerate(quads):
+            candidates.append({
+                "points_analysis": ordered,
+                "points_orig": ordered * scale,
+                "contour_area": contour_area,
+                "area_ratio": float(area_ratios[index]),
+                "aspect_ratio": float(aspect_ratios[index]),
+                "rectangularity": float(rectangularity[index]),
+                "corner_quality": float(corner_quality[index]),
+                "border_margin": float(border_margins[index]),
+                "edge_density_on_border": 0.0,
+                "inner_line_density": 0.0,
+                "detector": detector,
+                "source": source,
+            })
+        return candidates
+
+    def measure_densities(self, candidates, profile_name=None):
+        """为候选框计算边框边缘密度和内部线条密度；给定 profile_name 时跳过必然被淘汰的候选框。"""
+        if not candidates:
+            return candidates
+        if profile_name is not None:
+            eligible = candidate_gate_mask(candidates, profile_name)
+        else:
+            eligible = np.ones(len(candidates), dtype=bool)
+        for candidate, measure in zip(candidates, eligible):
+            if not measure:
+                continue
+            candidate["edge_density_on_border"] = self.border_edge_density(candidate["points_analysis"])
+            candidate["inner_line_density"] = self.inner_line_density(candidate["points_analysis"])
+        return candidates
+
+
+def build_candidate_from_contour(contour, edges, image_shape, scale, line_mask=None, detector="edge"):
+    engine = CandidateScoringEngine(edges, line_mask)
+    candidates = engine.build_candidates([(contour, detector)], scale, image_shape)
+    if not candidates:
+        return None
+    return engine.measure_densities(candidates)[0]
 
 
 def detect_foreground_mask_contours(gray):
@@ -1198,82 +1490,86 @@ def detect_document_candidates(analysis_image, gray, profile_name, scale=1.0, li
         background_color_contours = detect_background_color_contours(analysis_image)
         background_color_contours = sorted(background_color_contours, key=cv2.contourArea, reverse=True)[:8]
 
-    candidates = []
-    for contour in contours:
-        candidate = build_candidate_from_contour(
-            contour,
-            edges,
-            analysis_image.shape[:2],
-            scale,
-            line_mask=line_mask,
-            detector="edge",
-        )
-        if candidate is not None:
-            candidates.append(candidate)
-
+    sources = [(contour, "edge") for contour in contours]
     if profile_name in {"id_card", "hukou"}:
-        for contour in threshold_contours:
-            candidate = build_candidate_from_contour(
-                contour,
-                edges,
-                analysis_image.shape[:2],
-                scale,
-                line_mask=line_mask,
-                detector="foreground_mask",
-            )
-            if candidate is not None:
-                candidates.append(candidate)
-        for contour in background_color_contours:
-            candidate = build_candidate_from_contour(
-                contour,
-                edges,
-                analysis_image.shape[:2],
-                scale,
-                line_mask=line_mask,
-                detector="background_color",
-            )
-            if candidate is not None:
-                candidates.append(candidate)
-    return deduplicate_candidates(candidates)
+        sources.extend((contour, "foreground_mask") for contour in threshold_contours)
+        sources.extend((contour, "background_color") for contour in background_color_contours)
 
+    engine = CandidateScoringEngine(edges, line_mask)
+    candidates = engine.build_candidates(sources, scale, analysis_image.shape[:2])
+    candidates = deduplicate_candidates(candidates)
+    return engine.measure_densities(candidates, profile_name)
 
-def score_candidate(candidate, profile_name):
+
+def _interval_scores(values, min_value, max_value):
+    below = np.maximum(0.0, values / min_value) if min_value > 1e-6 else np.zeros_like(values)
+    above = np.maximum(0.0, 1.0 - (values - max_value) / max(1.0 - max_value, 1e-6))
+    return np.where(values < min_value, below, np.where(values > max_value, above, 1.0))
+
+
+def _preferred_scores(values, preferred, tolerance):
+    if tolerance <= 1e-6:
+        return np.ones_like(values)
+    return np.maximum(0.0, 1.0 - np.abs(values - preferred) / tolerance)
+
+
+def _preferred_scores_asymmetric(values, preferred, tolerance_low, tolerance_high):
+    low = np.maximum(0.0, 1.0 - (preferred - values) / tolerance_low) if tolerance_low > 1e-6 else np.ones_like(values)
+    high = np.maximum(0.0, 1.0 - (values - preferred) / tolerance_high) if tolerance_high > 1e-6 else np.ones_like(values)
+    return np.where(values <= preferred, low, high)
+
+
+def _candidate_column(candidates, key):
+    return np.array([candidate[key] for candidate in candidates], dtype=np.float64)
+
+
+def candidate_gate_mask(candidates, profile_name):
+    """面积和长宽比硬性门限：返回布尔数组，False 表示 score_candidates 必然淘汰该候选框。"""
     profile = CROP_PROFILES[profile_name]
+    area_ratio = _candidate_column(candidates, "area_ratio")
+    valid = ~(area_ratio < profile["min_area_ratio"] * 0.35)
+    valid &= ~(area_ratio > min(1.0, profile["max_area_ratio"] * 1.08))
     target_ratio = profile.get("target_ratio")
-    aspect_ratio_delta = 0.0
+    if target_ratio:
+        aspect_ratio_delta = np.abs(_candidate_column(candidates, "aspect_ratio") - target_ratio) / target_ratio
+        valid &= ~(aspect_ratio_delta > profile["ratio_tolerance"])
+    return valid
 
-    if candidate["area_ratio"] < profile["min_area_ratio"] * 0.35:
-        return None
-    if candidate["area_ratio"] > min(1.0, profile["max_area_ratio"] * 1.08):
-        return None
 
+def score_candidates(candidates, profile_name):
+    """
+    批量评分：所有候选框的各项得分以数组形式一次算出。
+
+    返回与输入一一对应的列表，未通过硬性门限的候选框为 None，其余为附加了
+    aspect_ratio_delta / confidence / perspective_threshold 的新字典。
+    """
+    if not candidates:
+        return []
+    profile = CROP_PROFILES[profile_name]
+    target_ratio = profile.get("target_ratio")
+    valid = candidate_gate_mask(candidates, profile_name)
+
+    area_ratio = _candidate_column(candidates, "area_ratio")
+    aspect_ratio = _candidate_column(candidates, "aspect_ratio")
+    border_margin = _candidate_column(candidates, "border_margin")
     if target_ratio:
-        aspect_ratio_delta = abs(candidate["aspect_ratio"] - target_ratio) / target_ratio
-        if aspect_ratio_delta > profile["ratio_tolerance"]:
-            return None
-        ratio_score = preferred_score(
-            candidate["aspect_ratio"],
-            target_ratio,
-            target_ratio * profile["ratio_tolerance"],
-        )
+        aspect_ratio_delta = np.abs(aspect_ratio - target_ratio) / target_ratio
+        ratio_score = _preferred_scores(aspect_ratio, target_ratio, target_ratio * profile["ratio_tolerance"])
     else:
-        ratio_score = 0.6
+        aspect_ratio_delta = np.zeros_like(aspect_ratio)
+        ratio_score = np.full_like(aspect_ratio, 0.6)
 
-    area_score = interval_score(
-        candidate["area_ratio"],
-        profile["min_area_ratio"],
-        profile["max_area_ratio"],
-    )
-    preferred_area_score = preferred_score_asymmetric(
-        candidate["area_ratio"],
+    area_score = _interval_scores(area_ratio, profile["min_area_ratio"], profile["max_area_ratio"])
+    preferred_area_score = _preferred_scores_asymmetric(
+        area_ratio,
         profile["preferred_area_ratio"],
         max(profile["preferred_area_ratio"] - profile["min_area_ratio"], 0.08),
         max(profile["max_area_ratio"] - profile["preferred_area_ratio"], 0.08) * 1.5,
     )
-    border_score = min(1.0, candidate["border_margin"] / profile["preferred_border_margin"])
-    edge_score = candidate["edge_density_on_border"]
-    rect_score = candidate["rectangularity"]
-    corner_score = candidate["corner_quality"]
+    border_score = np.minimum(1.0, border_margin / profile["preferred_border_margin"])
+    edge_score = _candidate_column(candidates, "edge_density_on_border")
+    rect_score = _candidate_column(candidates, "rectangularity")
+    corner_score = _candidate_column(candidates, "corner_quality")
 
     if profile_name == "id_card":
         confidence = (
@@ -1294,7 +1590,7 @@ def score_candidate(candidate, profile_name):
             + 0.16 * edge_score
             + 0.09 * corner_score
             + 0.06 * border_score
-            - 0.16 * candidate["inner_line_density"]
+            - 0.16 * _candidate_column(candidates, "inner_line_density")
         )
     else:
         confidence = (
@@ -1306,24 +1602,30 @@ def score_candidate(candidate, profile_name):
             + 0.04 * border_score
         )
 
-    if candidate["area_ratio"] > 0.88 and candidate["border_margin"] < 0.01:
-        confidence -= 0.25
-    if candidate["source"] == "min_rect":
-        confidence -= 0.03
+    confidence = np.where((area_ratio > 0.88) & (border_margin < 0.01), confidence - 0.25, confidence)
+    min_rect = np.array([candidate["source"] == "min_rect" for candidate in candidates])
+    confidence = np.where(min_rect, confidence - 0.03, confidence)
+    confidence = np.clip(confidence, 0.0, 1.0)
 
-    scored = dict(candidate)
-    scored["aspect_ratio_delta"] = float(aspect_ratio_delta)
-    scored["confidence"] = float(np.clip(confidence, 0.0, 1.0))
-    scored["perspective_threshold"] = profile["perspective_threshold"]
-    return scored
+    results = []
+    for index, candidate in enumerate(candidates):
+        if not valid[index]:
+            results.append(None)
+            continue
+        scored = dict(candidate)
+        scored["aspect_ratio_delta"] = float(aspect_ratio_delta[index])
+        scored["confidence"] = float(confidence[index])
+        scored["perspective_threshold"] = profile["perspective_threshold"]
+        results.append(scored)
+    return results
+
+
+def score_candidate(candidate, profile_name):
+    return score_candidates([candidate], profile_name)[0]
 
 
 def select_best_candidate(candidates, profile_name):
-    scored = []
-    for candidate in candidates:
-        result = score_candidate(candidate, profile_name)
-        if result is not None:
-            scored.append(result)
+    scored = [result for result in score_candidates(candidates, profile_name) if result is not None]
     if not scored:
         return None
 
@@ -1504,7 +1806,7 @@ def trim_to_target_ratio(image, target_ratio, max_trim_fraction=0.18):
 
 def log_crop_decision(profile_name, meta):
     selected = meta.get("selected_candidate") or {}
-    print(
+    log_line(
         "[material_crop] "
         f"profile={profile_name} "
         f"mode={meta.get('crop_mode', 'original')} "
@@ -1515,29 +1817,73 @@ def log_crop_decision(profile_name, meta):
     )
 
 
+def analyze_document_candidates(source_image, profile_name, source_scale=1.0, canny_scale=1.0):
+    """在分析尺寸上检测证件候选框。
+
+    source_scale 为 source_image 相对原图的缩放（标量或 (sx, sy)），
+    候选框的 points_orig 会换算回原图坐标。
+    """
+    profile = CROP_PROFILES[profile_name]
+    analysis_max_side = ANALYSIS_MAX_SIDES.get(profile_name, ANALYSIS_MAX_SIDE)
+    analysis_image, gray, preprocess_meta, scale = prepare_analysis_image(
+        source_image,
+        enable_low_light=profile.get("analysis_enhancement", True),
+        max_side=analysis_max_side,
+    )
+    if np.ndim(source_scale) or source_scale != 1.0:
+        scale = np.asarray(source_scale, dtype=np.float64) * scale
+
+    line_mask = None
+    if profile.get("allow_table_suppression"):
+        gray, line_mask = suppress_table_lines_for_hukou(gray)
+
+    candidates = detect_document_candidates(
+        analysis_image,
+        gray,
+        profile_name,
+        scale=scale,
+        line_mask=line_mask,
+        canny_scale=canny_scale,
+    )
+    best = select_best_candidate(candidates, profile_name)
+    return best, candidates, preprocess_meta
+
+
+def locate_document_from_path(path, profile_name, canny_scale=1.0):
+    """只做候选框检测，不解码全分辨率原图，返回 summarize_candidate 结果（坐标为原图坐标）。"""
+    max_side = ANALYSIS_MAX_SIDES.get(profile_name, ANALYSIS_MAX_SIDE)
+    source_image, source_scale, orig_size = read_cv_image_reduced(path, max_side=max_side)
+    if source_image is None:
+        return None
+    best, candidates, _ = analyze_document_candidates(
+        source_image,
+        profile_name,
+        source_scale=source_scale,
+        canny_scale=canny_scale,
+    )
+    if best is None:
+        return None
+    orig_w, orig_h = orig_size
+    points = np.asarray(best["points_orig"], dtype=np.float64)
+    points[:, 0] = np.clip(points[:, 0], 0, orig_w - 1)
+    points[:, 1] = np.clip(points[:, 1], 0, orig_h - 1)
+    best = dict(best, points_orig=points)
+    log_line(
+        f"[material_locate] profile={profile_name} "
+        f"decoded={source_image.shape[1]}x{source_image.shape[0]} "
+        f"original={orig_w}x{orig_h} candidates={len(candidates)}"
+    )
+    return summarize_candidate(best)
+
+
 def auto_crop_with_profile(image, profile_name, expand_ratio=None, return_meta=False, allow_perspective=None, expand_level=None, skip_ratio_trim=False, canny_scale=1.0):
     try:
         profile = CROP_PROFILES[profile_name]
-        analysis_max_side = ANALYSIS_MAX_SIDES.get(profile_name, ANALYSIS_MAX_SIDE)
-        analysis_image, gray, preprocess_meta, scale = prepare_analysis_image(
+        best, candidates, preprocess_meta = analyze_document_candidates(
             image,
-            enable_low_light=profile.get("analysis_enhancement", True),
-            max_side=analysis_max_side,
-        )
-
-        line_mask = None
-        if profile.get("allow_table_suppression"):
-            gray, line_mask = suppress_table_lines_for_hukou(gray)
-
-        candidates = detect_document_candidates(
-            analysis_image,
-            gray,
             profile_name,
-            scale=scale,
-            line_mask=line_mask,
             canny_scale=canny_scale,
         )
-        best = select_best_candidate(candidates, profile_name)
         _allow_perspective = allow_perspective if allow_perspective is not None else profile.get("allow_perspective", True)
         _expand_ratio = expand_ratio if expand_ratio is not None else profile["expand_ratio"]
         if expand_level == "tight":
@@ -1574,7 +1920,7 @@ def auto_crop_with_profile(image, profile_name, expand_ratio=None, return_meta=F
             return cropped, meta
         return cropped
     except Exception as exc:
-        print(f"Auto crop error ({profile_name}):", exc)
+        log_line(f"Auto crop error ({profile_name}):", exc)
         if return_meta:
             return image, {
                 "profile": profile_name,
@@ -1617,16 +1963,178 @@ def read_cv_image(path):
             else:  # 标准 RGB
                 return cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
     except Exception as e:
-        print(f"[read_cv_image] Pillow 读取/校正 EXIF 失败，退回默认读取: {e}")
+        log_line(f"[read_cv_image] Pillow 读取/校正 EXIF 失败，退回默认读取: {e}")
         img_np = np.fromfile(path, dtype=np.uint8)
         return cv2.imdecode(img_np, cv2.IMREAD_COLOR)
 
 
-def write_cv_image(path, img, quality=95):
-    ret, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
-    if ret:
-        with open(path, "wb") as file_obj:
+def read_cv_image_reduced(path, max_side=ANALYSIS_MAX_SIDE):
+    """
+    按分析尺寸读取图片：JPEG 借助 draft() 的 DCT 缩放直接解码为 1/2、1/4、1/8 尺寸，
+    不再先解出全分辨率再缩小。解码结果的长边不小于 max_side（由 prepare_analysis_image 再精确缩放）。
+
+    返回 (image, scale, orig_size)：
+        scale     : (sx, sy)，分析坐标乘以它即为 EXIF 校正后的原图坐标
+        orig_size : EXIF 校正后的原图 (宽, 高)
+    读取失败返回 (None, None, None)。
+    """
+    try:
+        from PIL import ImageOps
+        with Image.open(path) as pil_img:
+            stored_w, stored_h = pil_img.size
+            orientation = pil_img.getexif().get(0x0112, 1)
+            long_side = max(stored_w, stored_h)
+            if pil_img.format in ("JPEG", "MPO") and long_side > max_side:
+                ratio = max_side / float(long_side)
+                pil_img.draft("RGB", (int(np.ceil(stored_w * ratio)), int(np.ceil(stored_h * ratio))))
+            pil_img = ImageOps.exif_transpose(pil_img)
+            if pil_img.mode not in ("RGB", "L", "RGBA"):
+                pil_img = pil_img.convert("RGB")
+            img_np = np.array(pil_img)
+        if orientation in (5, 6, 7, 8):
+            orig_w, orig_h = stored_h, stored_w
+        else:
+            orig_w, orig_h = stored_w, stored_h
+        if len(img_np.shape) == 2:
+            image = cv2.cvtColor(img_np, cv2.COLOR_GRAY2BGR)
+        elif img_np.shape[2] == 4:
+            image = cv2.cvtColor(img_np, cv2.COLOR_RGBA2BGR)
+        else:
+            image = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
+        h, w = image.shape[:2]
+        return image, (orig_w / float(w), orig_h / float(h)), (orig_w, orig_h)
+    except Exception as e:
+        log_line(f"[read_cv_image_reduced] 降采样解码失败，退回全尺寸读取: {e}")
+        image = read_cv_image(path)
+        if image is None:
+            return None, None, None
+        h, w = image.shape[:2]
+        return image, (1.0, 1.0), (w, h)
+
+
+def _imencode_jpeg(img, quality, progressive):
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality), int(cv2.IMWRITE_JPEG_OPTIMIZE), 1]
+    if progressive:
+        params += [int(cv2.IMWRITE_JPEG_PROGRESSIVE), 1]
+    ret, buf = cv2.imencode(".jpg", img, params)
+    if not ret:
+        raise ValueError("JPEG 编码失败")
+    return buf
+
+
+def encode_jpeg_within_budget(img, max_bytes=None, max_quality=95, min_quality=30, min_scale=1.0,
+                              progressive=None):
+    """在内存中编码 JPEG，使输出不超过字节预算。
+
+    先按 max_quality 编码，超预算时在 [min_quality, max_quality) 内二分查找满足预算的最高质量
+    （最多 log2(质量区间) 次编码）；min_quality 仍超预算时按字节比例等比缩小后重新查找，
+    缩放不低于 min_scale。全部手段用尽仍超预算时返回能得到的最小结果。
+
+    返回:
+        (buffer, info)：buffer 为 cv2.imencode 的输出数组，
+        info 含 quality / scale / bytes / passes / within_budget
+    """
+    if progressive is None:
+        progressive = JPEG_PROGRESSIVE
+    passes = 0
+
+    def encode(image, quality):
+        nonlocal passes
+        passes += 1
+        return _imencode_jpeg(image, quality, progressive)
+
+    def result(buf, quality, scale):
+        size = int(buf.size)
+        return buf, {
+            "quality": int(quality),
+            "scale": round(float(scale), 4),
+            "bytes": size,
+            "passes": passes,
+            "within_budget": max_bytes is None or size <= max_bytes,
+        }
+
+    buf = encode(img, max_quality)
+    if max_bytes is None or buf.size <= max_bytes:
+        return result(buf, max_quality, 1.0)
+
+    h, w = img.shape[:2]
+    scale = 1.0
+    scaled = img
+    while True:
+        floor_buf = encode(scaled, min_quality)
+        if floor_buf.size <= max_bytes:
+            lo, hi = min_quality, max_quality - 1
+            best_buf, best_quality = floor_buf, min_quality
+            lo += 1
+            while lo <= hi:
+                mid = (lo + hi) // 2
+                candidate = encode(scaled, mid)
+                if candidate.size <= max_bytes:
+                    best_buf, best_quality = candidate, mid
+                    lo = mid + 1
+                else:
+                    hi = mid - 1
+            return result(best_buf, best_quality, scale)
+
+        if scale <= min_scale:
+            return result(floor_buf, min_quality, scale)
+        # JPEG 字节数大致与像素数成正比，按面积比例估算缩放系数并留 5% 余量
+        scale = max(min_scale, scale * float(np.sqrt(max_bytes / float(floor_buf.size))) * 0.95)
+        target = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        scaled = cv2.resize(img, target, interpolation=cv2.INTER_AREA)
+
+
+def write_cv_image(path, img, quality=95, profile=None):
+    """编码并一次性写出 JPEG。
+
+    profile 为 JPEG_OUTPUT_PROFILES 中的材料类型时按该类型的字节预算编码，
+    否则按固定 quality 编码。返回编码信息（同 encode_jpeg_within_budget）。
+    先写临时文件再替换：目标可能是 blob 存储的硬链接，不能原地改写。
+    PDF 为紧凑模式时，A4 画布的证件区域同时从未压缩的像素编码缓存（见 material_pdf_service）。
+    """
+    from services import material_pdf_service
+
+    options = dict(JPEG_OUTPUT_PROFILES.get(profile) or {"max_quality": quality})
+    buf, info = encode_jpeg_within_budget(img, **options)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file_obj:
             buf.tofile(file_obj)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if profile and material_pdf_service.get_pdf_mode() == "compact":
+        try:
+            material_pdf_service.remember_compact_parts(buf.tobytes(), img)
+        except Exception as exc:
+            log_line(f"[material_pdf] 缓存证件区域失败，PDF 将整页嵌入: {exc}")
+    return info
+
+
+def crop_file_to_temp(path, points, crop_mode="perspective"):
+    """按 4 个角点裁剪图片文件，写入同目录下的临时文件并返回其路径。
+
+    crop_mode 为 rect_only 时按外接矩形裁剪，否则做透视变换；
+    源文件不存在、点位无效或 crop_mode 为 none 时返回 None。
+    调用方负责删除返回的临时文件。
+    """
+    import tempfile
+
+    if not path or not os.path.exists(path) or not points or len(points) != 4:
+        return None
+    if crop_mode == "none":
+        return None
+    image = read_cv_image(path)
+    if image is None:
+        return None
+    mode = "rect_only" if crop_mode == "rect_only" else "perspective"
+    cropped = crop_image_with_points(image, points, mode=mode)
+    suffix = os.path.splitext(path)[1] or ".jpg"
+    temp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False, dir=os.path.dirname(path))
+    temp.close()
+    write_cv_image(temp.name, cropped)
+    return temp.name
 
 
 def create_a4_canvas():
@@ -1692,7 +2200,7 @@ def process_personal_photo(input_path, output_dir, name_prefix, logger=None, adj
                     if logger is not None:
                         logger.emit("info", scope, "rotate", f"照片已旋转 {extra_rotate}°", "")
             except Exception as rot_exc:
-                print(f"[photo] 旋转失败，使用原图: {rot_exc}")
+                log_line(f"[photo] 旋转失败，使用原图: {rot_exc}")
 
         # 白底替换（可选）
         if not skip_white_bg:
@@ -1710,7 +2218,7 @@ def process_personal_photo(input_path, output_dir, name_prefix, logger=None, adj
                     if logger is not None:
                         logger.emit("warning", scope, "bg_remove", "白底替换跳过", "rembg 依赖不可用，使用原图")
             except Exception as bg_exc:
-                print(f"[photo] 白底处理失败，使用原图: {bg_exc}")
+                log_line(f"[photo] 白底处理失败，使用原图: {bg_exc}")
                 if logger is not None:
                     logger.emit("warning", scope, "bg_remove", "白底替换失败", f"降级使用原图: {bg_exc}")
         else:
@@ -1735,32 +2243,26 @@ def process_personal_photo(input_path, output_dir, name_prefix, logger=None, adj
                 },
             )
 
-        quality = 95
-        while True:
-            buffer = io.BytesIO()
-            img.save(buffer, format="JPEG", quality=quality)
-            size_kb = len(buffer.getvalue()) / 1024
-            if size_kb < 1000 or quality <= 30:
-                with open(output_path, "wb") as file_obj:
-                    file_obj.write(buffer.getvalue())
-                if logger is not None:
-                    logger.emit(
-                        "success",
-                        scope,
-                        "write_output",
-                        "个人照片输出成功",
-                        "已生成符合大小要求的个人照片",
-                        details={
-                            "output_path": output_path,
-                            "jpeg_quality": quality,
-                            "output_kb": round(size_kb, 1),
-                        },
-                    )
-                break
-            quality -= 10
+        # 内存中按字节预算二分查找 JPEG 质量，只写一次磁盘
+        bgr = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+        info = write_cv_image(output_path, bgr, profile="photo")
+        if logger is not None:
+            logger.emit(
+                "success",
+                scope,
+                "write_output",
+                "个人照片输出成功",
+                "已生成符合大小要求的个人照片" if info["within_budget"] else "已按最低质量输出个人照片",
+                details={
+                    "output_path": output_path,
+                    "jpeg_quality": info["quality"],
+                    "output_kb": round(info["bytes"] / 1024, 1),
+                    "scale": info["scale"],
+                },
+            )
         return _build_process_result(scope, True, output_path=output_path)
     except Exception as exc:
-        print("Error processing personal photo:", exc)
+        log_line("Error processing personal photo:", exc)
         if logger is not None:
             logger.emit(
                 "error",
@@ -1790,17 +2292,17 @@ def process_diploma(input_path, output_dir, name_prefix, adjustments=None, logge
     tag = "[diploma]"
     scope = "diploma"
     try:
-        print(f"{tag} 开始处理: {os.path.basename(input_path)}")
+        log_line(f"{tag} 开始处理: {os.path.basename(input_path)}")
         if logger is not None:
             logger.emit("info", scope, "start", "开始处理学历证书", os.path.basename(input_path))
         img = read_cv_image(input_path)
         if img is None:
-            print(f"{tag} 读图失败，终止")
+            log_line(f"{tag} 读图失败，终止")
             if logger is not None:
                 logger.emit("error", scope, "read_input", "学历证书读取失败", "未能读取学历证书图片")
             return _build_process_result(scope, False, error="read failed")
         h0, w0 = img.shape[:2]
-        print(f"{tag} 原图尺寸: {w0}x{h0}")
+        log_line(f"{tag} 原图尺寸: {w0}x{h0}")
         if logger is not None:
             logger.emit(
                 "info",
@@ -1836,7 +2338,7 @@ def process_diploma(input_path, output_dir, name_prefix, adjustments=None, logge
             img, meta = auto_crop_diploma(img, return_meta=True, allow_perspective=_allow_persp, expand_level=expand_level, skip_ratio_trim=skip_ratio_trim)
             sel = meta.get("selected_candidate") or {}
             hc, wc = img.shape[:2]
-            print(
+            log_line(
                 f"{tag} 裁剪后: {wc}x{hc}  "
                 f"mode={meta.get('crop_mode')}  "
                 f"detector={sel.get('detector', 'N/A')}  "
@@ -1863,7 +2365,7 @@ def process_diploma(input_path, output_dir, name_prefix, adjustments=None, logge
 
         if extra_rotate:
             img = rotate_image_by_degrees(img, extra_rotate)
-            print(f"{tag} 额外旋转 {extra_rotate}°")
+            log_line(f"{tag} 额外旋转 {extra_rotate}°")
             if logger is not None:
                 logger.emit(
                     "info",
@@ -1877,7 +2379,7 @@ def process_diploma(input_path, output_dir, name_prefix, adjustments=None, logge
         max_width = A4_WIDTH - 2 * CM_IN_PX
         max_height = A4_HEIGHT - 2 * CM_IN_PX
         img_resized, target_width, target_height = resize_document_to_fit(img, max_width, max_height)
-        print(f"{tag} 缩放适配 A4 画布: 宽={target_width}px  高={target_height}px")
+        log_line(f"{tag} 缩放适配 A4 画布: 宽={target_width}px  高={target_height}px")
         if logger is not None:
             logger.emit(
                 "info",
@@ -1893,11 +2395,11 @@ def process_diploma(input_path, output_dir, name_prefix, adjustments=None, logge
         y_offset = max(0, (A4_HEIGHT - target_height) // 2)
 
         canvas[y_offset:y_offset + target_height, x_offset:x_offset + target_width] = img_resized
-        print(f"{tag} 排版位置: x={x_offset}  y={y_offset}")
+        log_line(f"{tag} 排版位置: x={x_offset}  y={y_offset}")
 
         output_path = os.path.join(output_dir, f"{name_prefix}-学历证书.jpg")
-        write_cv_image(output_path, canvas)
-        print(f"{tag} 已输出: {output_path}")
+        write_cv_image(output_path, canvas, profile="diploma")
+        log_line(f"{tag} 已输出: {output_path}")
         if logger is not None:
             logger.emit(
                 "success",
@@ -1913,7 +2415,7 @@ def process_diploma(input_path, output_dir, name_prefix, adjustments=None, logge
             )
         return _build_process_result(scope, True, output_path=output_path)
     except Exception as exc:
-        print(f"{tag} 处理失败:", exc)
+        log_line(f"{tag} 处理失败:", exc)
         if logger is not None:
             logger.emit("error", scope, "write_output", "学历证书处理失败", "学历证书生成过程中发生错误")
         return _build_process_result(scope, False, error=str(exc))
@@ -1947,7 +2449,7 @@ def process_id_cards(front_path, back_path, output_dir, name_prefix, adjustments
             front_img = read_cv_image(front_path)
             if front_img is not None:
                 h0, w0 = front_img.shape[:2]
-                print(f"{tag}[正面] 原图: {w0}x{h0}")
+                log_line(f"{tag}[正面] 原图: {w0}x{h0}")
                 if logger is not None:
                     logger.emit("info", "id_card_front", "read_input", "身份证正面读取成功", "已读取身份证正面原图", details=_size_details(front_img, "input"))
                 if front_manual_crop_applied:
@@ -1958,7 +2460,7 @@ def process_id_cards(front_path, back_path, output_dir, name_prefix, adjustments
                     front_img, meta = auto_crop_id_card(front_img, return_meta=True, allow_perspective=_allow_persp, expand_level=expand_level, skip_ratio_trim=skip_ratio_trim, canny_scale=canny_scale)
                     sel = meta.get("selected_candidate") or {}
                     hc, wc = front_img.shape[:2]
-                    print(
+                    log_line(
                         f"{tag}[正面] 裁剪后: {wc}x{hc}  "
                         f"mode={meta.get('crop_mode')}  "
                         f"detector={sel.get('detector', 'N/A')}  "
@@ -1985,18 +2487,18 @@ def process_id_cards(front_path, back_path, output_dir, name_prefix, adjustments
                 hc, wc = front_img.shape[:2]
                 if front_rotate:
                     front_img = rotate_image_by_degrees(front_img, front_rotate)
-                    print(f"{tag}[正面] 额外旋转 {front_rotate}°")
+                    log_line(f"{tag}[正面] 额外旋转 {front_rotate}°")
                     if logger is not None:
                         logger.emit("info", "id_card_front", "normalize_orientation", f"身份证正面额外旋转 {front_rotate}°", "已按人工设置旋转身份证正面方向", details={"rotation": int(front_rotate)})
                 if not front_manual_crop_applied and not front_rotate:
                     front_img = normalize_id_card_side(front_img, "front")
                 hn, wn = front_img.shape[:2]
                 if (hn, wn) != (hc, wc):
-                    print(f"{tag}[正面] 方向正规化后: {wn}x{hn}")
+                    log_line(f"{tag}[正面] 方向正规化后: {wn}x{hn}")
                     if logger is not None:
                         logger.emit("info", "id_card_front", "normalize_orientation", "身份证正面方向已校正", "已根据内容特征校正身份证正面方向", details=_size_details(front_img, "normalized"))
                 front_img, front_h = resize_document_to_width(front_img, target_width)
-                print(f"{tag}[正面] 缩放后: {target_width}x{front_h}")
+                log_line(f"{tag}[正面] 缩放后: {target_width}x{front_h}")
                 if logger is not None:
                     logger.emit("info", "id_card_front", "layout_a4", "身份证正面已适配版式", "已缩放身份证正面以便排入 A4", details={"target_width": target_width, "target_height": front_h})
 
@@ -2004,7 +2506,7 @@ def process_id_cards(front_path, back_path, output_dir, name_prefix, adjustments
             back_img = read_cv_image(back_path)
             if back_img is not None:
                 h0, w0 = back_img.shape[:2]
-                print(f"{tag}[反面] 原图: {w0}x{h0}")
+                log_line(f"{tag}[反面] 原图: {w0}x{h0}")
                 if logger is not None:
                     logger.emit("info", "id_card_back", "read_input", "身份证反面读取成功", "已读取身份证反面原图", details=_size_details(back_img, "input"))
                 if back_manual_crop_applied:
@@ -2015,7 +2517,7 @@ def process_id_cards(front_path, back_path, output_dir, name_prefix, adjustments
                     back_img, meta = auto_crop_id_card(back_img, return_meta=True, allow_perspective=_allow_persp, expand_level=expand_level, skip_ratio_trim=skip_ratio_trim, canny_scale=canny_scale)
                     sel = meta.get("selected_candidate") or {}
                     hc, wc = back_img.shape[:2]
-                    print(
+                    log_line(
                         f"{tag}[反面] 裁剪后: {wc}x{hc}  "
                         f"mode={meta.get('crop_mode')}  "
                         f"detector={sel.get('detector', 'N/A')}  "
@@ -2041,26 +2543,26 @@ def process_id_cards(front_path, back_path, output_dir, name_prefix, adjustments
                     logger.emit("info", "id_card_back", "auto_crop", "已按不裁剪模式处理", "本次保留身份证反面原图", details={"crop_mode": crop_mode})
                 if back_rotate:
                     back_img = rotate_image_by_degrees(back_img, back_rotate)
-                    print(f"{tag}[反面] 额外旋转 {back_rotate}°")
+                    log_line(f"{tag}[反面] 额外旋转 {back_rotate}°")
                     if logger is not None:
                         logger.emit("info", "id_card_back", "normalize_orientation", f"身份证反面额外旋转 {back_rotate}°", "已按人工设置旋转身份证反面方向", details={"rotation": int(back_rotate)})
                 if not back_manual_crop_applied and not back_rotate:
                     back_img = normalize_id_card_side(back_img, "back")
                 back_img, back_h = resize_document_to_width(back_img, target_width)
-                print(f"{tag}[反面] 缩放后: {target_width}x{back_h}")
+                log_line(f"{tag}[反面] 缩放后: {target_width}x{back_h}")
                 if logger is not None:
                     logger.emit("info", "id_card_back", "layout_a4", "身份证反面已适配版式", "已缩放身份证反面以便排入 A4", details={"target_width": target_width, "target_height": back_h})
 
         gap = max(front_h, back_h) // 2 if max(front_h, back_h) > 0 else 0
         total_height = front_h + back_h + gap
         max_height = A4_HEIGHT - 2 * CM_IN_PX
-        print(f"{tag} 拼接规划: front_h={front_h}  back_h={back_h}  gap={gap}  total={total_height}  max={max_height}")
+        log_line(f"{tag} 拼接规划: front_h={front_h}  back_h={back_h}  gap={gap}  total={total_height}  max={max_height}")
 
         if total_height > max_height and target_width > MIN_CROP_DIM:
             fit_scale = max_height / float(total_height)
             target_width = max(MIN_CROP_DIM, int(target_width * fit_scale))
             x_offset = (A4_WIDTH - target_width) // 2
-            print(f"{tag} 高度超出，整体缩放: scale={fit_scale:.3f}  新宽={target_width}")
+            log_line(f"{tag} 高度超出，整体缩放: scale={fit_scale:.3f}  新宽={target_width}")
 
             if front_img is not None:
                 front_img, front_h = resize_document_to_width(front_img, target_width)
@@ -2069,27 +2571,27 @@ def process_id_cards(front_path, back_path, output_dir, name_prefix, adjustments
 
             gap = max(20, int(max(front_h, back_h) * 0.25)) if max(front_h, back_h) > 0 else 0
             total_height = front_h + back_h + gap
-            print(f"{tag} 缩放后: front_h={front_h}  back_h={back_h}  gap={gap}  total={total_height}")
+            log_line(f"{tag} 缩放后: front_h={front_h}  back_h={back_h}  gap={gap}  total={total_height}")
 
         if front_img is not None and back_img is not None:
             y_front = (A4_HEIGHT - total_height) // 2
             y_back = y_front + front_h + gap
-            print(f"{tag} 排版: 正面 y={y_front}  反面 y={y_back}  x={x_offset}")
+            log_line(f"{tag} 排版: 正面 y={y_front}  反面 y={y_back}  x={x_offset}")
             canvas[y_front:y_front + front_h, x_offset:x_offset + target_width] = front_img
             canvas[y_back:y_back + back_h, x_offset:x_offset + target_width] = back_img
         elif front_img is not None:
             y_front = (A4_HEIGHT - front_h) // 2
-            print(f"{tag} 排版: 仅正面 y={y_front}  x={x_offset}")
+            log_line(f"{tag} 排版: 仅正面 y={y_front}  x={x_offset}")
             canvas[y_front:y_front + front_h, x_offset:x_offset + target_width] = front_img
         elif back_img is not None:
             y_back = (A4_HEIGHT - back_h) // 2
-            print(f"{tag} 排版: 仅反面 y={y_back}  x={x_offset}")
+            log_line(f"{tag} 排版: 仅反面 y={y_back}  x={x_offset}")
             canvas[y_back:y_back + back_h, x_offset:x_offset + target_width] = back_img
 
         if front_img is not None or back_img is not None:
             output_path = os.path.join(output_dir, f"{name_prefix}-身份证.jpg")
-            write_cv_image(output_path, canvas)
-            print(f"{tag} 已输出: {output_path}")
+            write_cv_image(output_path, canvas, profile="id_card")
+            log_line(f"{tag} 已输出: {output_path}")
             if logger is not None:
                 logger.emit(
                     "success",
@@ -2104,7 +2606,7 @@ def process_id_cards(front_path, back_path, output_dir, name_prefix, adjustments
             logger.emit("error", scope, "write_output", "身份证输出失败", "未读取到可用的身份证图片，无法生成输出")
         return _build_process_result(scope, False, error="no readable id card images")
     except Exception as exc:
-        print(f"{tag} 处理失败:", exc)
+        log_line(f"{tag} 处理失败:", exc)
         if logger is not None:
             logger.emit("error", scope, "write_output", "身份证处理失败", "身份证生成过程中发生错误")
         return _build_process_result(scope, False, error=str(exc))
@@ -2134,7 +2636,7 @@ def process_hukou(residence_path, personal_path, output_dir, name_prefix, adjust
         h1, h2 = 0, 0
 
         if residence_path and os.path.exists(residence_path):
-            print(f"{tag}[首页] 开始处理: {os.path.basename(residence_path)}")
+            log_line(f"{tag}[首页] 开始处理: {os.path.basename(residence_path)}")
             img1 = read_cv_image(residence_path)
             if img1 is not None:
                 if logger is not None:
@@ -2155,16 +2657,16 @@ def process_hukou(residence_path, personal_path, output_dir, name_prefix, adjust
                     logger.emit("success", "hukou_home", "auto_crop", "户口本首页处理完成", "已完成户口本首页裁边/方向校正准备排版", details={"crop_mode": crop_mode, **_size_details(img1, "processed")})
                 if home_rotate:
                     img1 = rotate_image_by_degrees(img1, home_rotate)
-                    print(f"{tag}[首页] 额外旋转 {home_rotate}°")
+                    log_line(f"{tag}[首页] 额外旋转 {home_rotate}°")
                     if logger is not None:
                         logger.emit("info", "hukou_home", "normalize_orientation", f"户口本首页额外旋转 {home_rotate}°", "已按人工设置旋转户口本首页方向", details={"rotation": int(home_rotate)})
                 img1, h1 = resize_document_to_width(img1, target_width)
-                print(f"{tag}[首页] 缩放后: {target_width}x{h1}")
+                log_line(f"{tag}[首页] 缩放后: {target_width}x{h1}")
                 if logger is not None:
                     logger.emit("info", "hukou_home", "layout_a4", "户口本首页已适配版式", "已缩放户口本首页以便排入 A4", details={"target_width": target_width, "target_height": h1})
 
         if personal_path and os.path.exists(personal_path):
-            print(f"{tag}[本人页] 开始处理: {os.path.basename(personal_path)}")
+            log_line(f"{tag}[本人页] 开始处理: {os.path.basename(personal_path)}")
             img2 = read_cv_image(personal_path)
             if img2 is not None:
                 if logger is not None:
@@ -2185,24 +2687,24 @@ def process_hukou(residence_path, personal_path, output_dir, name_prefix, adjust
                     logger.emit("success", "hukou_personal", "auto_crop", "户口本人页处理完成", "已完成户口本人页裁边/方向校正准备排版", details={"crop_mode": crop_mode, **_size_details(img2, "processed")})
                 if personal_rotate:
                     img2 = rotate_image_by_degrees(img2, personal_rotate)
-                    print(f"{tag}[本人页] 额外旋转 {personal_rotate}°")
+                    log_line(f"{tag}[本人页] 额外旋转 {personal_rotate}°")
                     if logger is not None:
                         logger.emit("info", "hukou_personal", "normalize_orientation", f"户口本人页额外旋转 {personal_rotate}°", "已按人工设置旋转户口本人页方向", details={"rotation": int(personal_rotate)})
                 img2, h2 = resize_document_to_width(img2, target_width)
-                print(f"{tag}[本人页] 缩放后: {target_width}x{h2}")
+                log_line(f"{tag}[本人页] 缩放后: {target_width}x{h2}")
                 if logger is not None:
                     logger.emit("info", "hukou_personal", "layout_a4", "户口本人页已适配版式", "已缩放户口本人页以便排入 A4", details={"target_width": target_width, "target_height": h2})
 
         gap = CM_IN_PX
         total_height = h1 + h2 + gap
         max_height = A4_HEIGHT - 2 * CM_IN_PX
-        print(f"{tag} 拼接规划: home_h={h1}  personal_h={h2}  gap={gap}  total={total_height}  max={max_height}")
+        log_line(f"{tag} 拼接规划: home_h={h1}  personal_h={h2}  gap={gap}  total={total_height}  max={max_height}")
 
         if total_height > max_height and target_width > MIN_CROP_DIM:
             fit_scale = max_height / float(total_height)
             target_width = max(MIN_CROP_DIM, int(target_width * fit_scale))
             x_offset = (A4_WIDTH - target_width) // 2
-            print(f"{tag} 高度超出，整体缩放: scale={fit_scale:.3f}  新宽={target_width}")
+            log_line(f"{tag} 高度超出，整体缩放: scale={fit_scale:.3f}  新宽={target_width}")
 
             if img1 is not None:
                 img1, h1 = resize_document_to_width(img1, target_width)
@@ -2211,26 +2713,26 @@ def process_hukou(residence_path, personal_path, output_dir, name_prefix, adjust
 
             gap = max(20, int(CM_IN_PX * fit_scale))
             total_height = h1 + h2 + gap
-            print(f"{tag} 缩放后: home_h={h1}  personal_h={h2}  gap={gap}  total={total_height}")
+            log_line(f"{tag} 缩放后: home_h={h1}  personal_h={h2}  gap={gap}  total={total_height}")
 
         if img1 is not None and img2 is not None:
             y_start = (A4_HEIGHT - total_height) // 2
-            print(f"{tag} 排版: 首页 y={y_start}  本人页 y={y_start + h1 + gap}  x={x_offset}")
+            log_line(f"{tag} 排版: 首页 y={y_start}  本人页 y={y_start + h1 + gap}  x={x_offset}")
             canvas[y_start:y_start + h1, x_offset:x_offset + target_width] = img1
             canvas[y_start + h1 + gap:y_start + h1 + gap + h2, x_offset:x_offset + target_width] = img2
         elif img1 is not None:
             y_start = (A4_HEIGHT - h1) // 2
-            print(f"{tag} 排版: 仅首页 y={y_start}  x={x_offset}")
+            log_line(f"{tag} 排版: 仅首页 y={y_start}  x={x_offset}")
             canvas[y_start:y_start + h1, x_offset:x_offset + target_width] = img1
         elif img2 is not None:
             y_start = (A4_HEIGHT - h2) // 2
-            print(f"{tag} 排版: 仅本人页 y={y_start}  x={x_offset}")
+            log_line(f"{tag} 排版: 仅本人页 y={y_start}  x={x_offset}")
             canvas[y_start:y_start + h2, x_offset:x_offset + target_width] = img2
 
         if img1 is not None or img2 is not None:
             output_path = os.path.join(output_dir, f"{name_prefix}-户口本.jpg")
-            write_cv_image(output_path, canvas)
-            print(f"{tag} 已输出: {output_path}")
+            write_cv_image(output_path, canvas, profile="hukou")
+            log_line(f"{tag} 已输出: {output_path}")
             if logger is not None:
                 logger.emit(
                     "success",
@@ -2245,7 +2747,7 @@ def process_hukou(residence_path, personal_path, output_dir, name_prefix, adjust
             logger.emit("error", scope, "write_output", "户口本输出失败", "未读取到可用的户口本图片，无法生成输出")
         return _build_process_result(scope, False, error="no readable hukou images")
     except Exception as exc:
-        print(f"{tag} 处理失败:", exc)
+        log_line(f"{tag} 处理失败:", exc)
         if logger is not None:
             logger.emit("error", scope, "write_output", "户口本处理失败", "户口本生成过程中发生错误")
         return _build_process_result(scope, False, error=str(exc))
@@ -2306,11 +2808,11 @@ def process_renewal_certificate_pages(info_page_path, records_page_path, output_
         for image, width, height, page_scope, label in resized_pages:
             x = max(0, (A4_WIDTH - width) // 2)
             canvas[y:y + height, x:x + width] = image
-            print(f"{tag} 排版: {label} x={x} y={y} w={width} h={height}")
+            log_line(f"{tag} 排版: {label} x={x} y={y} w={width} h={height}")
             y += height + gap
 
         output_path = os.path.join(output_dir, f"{name_prefix}-复审材料.jpg")
-        write_cv_image(output_path, canvas)
+        write_cv_image(output_path, canvas, profile="renewal_certificate")
         if logger is not None:
             logger.emit(
                 "success",
@@ -2327,7 +2829,7 @@ def process_renewal_certificate_pages(info_page_path, records_page_path, output_
             )
         return _build_process_result(scope, True, output_path=output_path)
     except Exception as exc:
-        print(f"{tag} 处理失败:", exc)
+        log_line(f"{tag} 处理失败:", exc)
         if logger is not None:
             logger.emit("error", scope, "write_output", "复审材料处理失败", "复审材料生成过程中发生错误")
         return _build_process_result(scope, False, error=str(exc))
@@ -2339,7 +2841,9 @@ def copy_health_form(form_path, output_dir, name_prefix, logger=None):
     if form_path and os.path.exists(form_path):
         ext = os.path.splitext(form_path)[1]
         output_path = os.path.join(output_dir, f"{name_prefix}-体检表{ext}")
-        shutil.copy2(form_path, output_path)
+        # 上次的输出可能与源文件共享 blob inode：复制到临时文件再替换，不原地覆盖
+        with blob_store_service.atomic_output(output_path) as tmp_path:
+            shutil.copy2(form_path, tmp_path)
         if logger is not None:
             logger.emit(
                 "success",
@@ -2355,6 +2859,115 @@ def copy_health_form(form_path, output_dir, name_prefix, logger=None):
     return _build_process_result(scope, False, error="health form missing")
 
 
+# 合成 PDF 的页面顺序（体检表为图片时追加在最后）
+# 材料处理算法或输出规格变化时递增，使已登记的材料输出缓存失效
+MATERIAL_CACHE_VERSION = 1
+
+
+def _output_cache_enabled():
+    return os.getenv("MATERIAL_OUTPUT_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def run_with_output_cache(scope, inputs, params, output_dir, name_prefix, process, *args, **kwargs):
+    """
+    以输入内容为键复用已生成的材料输出（见 blob_store_service）。
+
+    inputs 为参与生成的源文件路径，params 为影响输出的调整参数。源文件内容、参数与
+    MATERIAL_CACHE_VERSION 都和某次历史结果一致时，直接把该输出链接到 output_dir 并记录
+    cache_hit 事件，不再调用 process；否则调用 process(*args, **kwargs) 生成，
+    成功且无告警的输出登记到缓存（带告警的降级结果不复用）。
+    设置 MATERIAL_OUTPUT_CACHE=0 可关闭复用。
+    """
+    logger = kwargs.get("logger")
+    root = blob_store_service.root_for(os.path.join(output_dir, name_prefix))
+    if not (_output_cache_enabled() and blob_store_service.enabled() and root):
+        return process(*args, **kwargs)
+
+    cache_key = None
+    try:
+        cache_key = blob_store_service.material_key(scope, inputs, params, MATERIAL_CACHE_VERSION)
+        record = blob_store_service.lookup_material(cache_key, root)
+        if record:
+            output_path = os.path.join(output_dir, f"{name_prefix}{record['suffix']}")
+            if blob_store_service.link_blob(record["digest"], output_path, root):
+                log_line(f"[{scope}] 输入未变化，复用已生成的输出: {output_path}")
+                if logger is not None:
+                    logger.emit(
+                        "success",
+                        scope,
+                        "cache_hit",
+                        "复用已生成的材料",
+                        "源文件与调整参数和历史生成结果一致，直接复用已生成的文件",
+                        details={"output_path": output_path},
+                    )
+                return _build_process_result(scope, True, output_path=output_path)
+    except Exception as exc:
+        log_line(f"[{scope}] 读取材料输出缓存失败，重新生成: {exc}")
+
+    event_count = len(logger.events) if logger is not None else 0
+    result = process(*args, **kwargs)
+    output_path = result.get("output_path")
+    degraded = logger is not None and any(
+        event["level"] in ("warning", "error") for event in logger.events[event_count:]
+    )
+    if (
+        cache_key
+        and result.get("success")
+        and not degraded
+        and output_path
+        and os.path.basename(output_path).startswith(name_prefix)
+        and os.path.isfile(output_path)
+    ):
+        blob_store_service.store_material(
+            cache_key, output_path, os.path.basename(output_path)[len(name_prefix):], root
+        )
+    return result
+
+
+MATERIAL_PDF_ORDER = ("photo", "diploma", "id_card", "hukou", "renewal_certificate")
+MATERIAL_PDF_SUFFIX = "报名材料.pdf"
+
+
+def build_materials_pdf(output_dir, name_prefix, logger=None):
+    """将输出目录中的各材料 JPEG 合成为一个多页 PDF（见 material_pdf_service），失败不影响材料生成。"""
+    from services import material_pdf_service
+
+    mode = material_pdf_service.get_pdf_mode()
+    if mode == "off":
+        return None
+    output_path = os.path.join(output_dir, f"{name_prefix}-{MATERIAL_PDF_SUFFIX}")
+    pages = [
+        os.path.join(output_dir, f"{name_prefix}-{MATERIAL_OUTPUT_LABELS[material_type]}.jpg")
+        for material_type in MATERIAL_PDF_ORDER
+    ]
+    for ext in (".jpg", ".jpeg"):
+        pages.append(os.path.join(output_dir, f"{name_prefix}-{MATERIAL_OUTPUT_LABELS['training_form']}{ext}"))
+
+    try:
+        info = material_pdf_service.build_pdf(pages, output_path, mode=mode)
+    except Exception as exc:
+        log_line(f"[material_pdf] PDF 合成失败: {exc}")
+        if logger is not None:
+            logger.emit("warning", "global", "pdf", "PDF 合成失败", f"各材料图片已生成，仅合成 PDF 失败: {exc}")
+        return None
+
+    if info is None:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return None
+    log_line(f"[material_pdf] 已合成 PDF: {info['pages']} 页, {info['bytes']} 字节, 模式={mode}")
+    if logger is not None:
+        logger.emit(
+            "info",
+            "global",
+            "pdf",
+            "已合成报名材料 PDF",
+            f"共 {info['pages']} 页",
+            details=dict(info),
+        )
+    return info
+
+
 def generate_student_materials(student, base_dir, output_root):
     """
     入口函数，生成学员打包资料
@@ -2381,13 +2994,15 @@ def generate_student_materials(student, base_dir, output_root):
         )
 
     def get_abs_path(key):
-        rel = student.get(key)
-        return os.path.join(base_dir, rel) if rel else None
+        return resolve_source_path(base_dir, student.get(key))
 
     results = []
     photo_path = get_abs_path("photo_path")
     if photo_path and os.path.exists(photo_path):
-        results.append(process_personal_photo(photo_path, output_dir, name_prefix, logger=logger))
+        results.append(run_with_output_cache(
+            "photo", [photo_path], None, output_dir, name_prefix,
+            process_personal_photo, photo_path, output_dir, name_prefix, logger=logger,
+        ))
 
     is_renewal = (
         student.get("training_type") == "special_equipment"
@@ -2399,7 +3014,9 @@ def generate_student_materials(student, base_dir, output_root):
         if (info_page_path and os.path.exists(info_page_path)) or (
             records_page_path and os.path.exists(records_page_path)
         ):
-            results.append(process_renewal_certificate_pages(
+            results.append(run_with_output_cache(
+                "renewal_certificate", [info_page_path, records_page_path], None, output_dir, name_prefix,
+                process_renewal_certificate_pages,
                 info_page_path,
                 records_page_path,
                 output_dir,
@@ -2415,7 +3032,8 @@ def generate_student_materials(student, base_dir, output_root):
             logger.emit("error", "global", "finish", "没有找到可处理的原始材料", "当前学员没有可用于生成的原始材料文件")
             results.append(_build_process_result("global", False, error="no source materials"))
 
-        _sync_output_dir_to_cos(output_dir, base_dir)
+        build_materials_pdf(output_dir, name_prefix, logger=logger)
+        _sync_output_dir_to_cos(output_dir, base_dir, logger=logger)
         report = build_generation_report(output_dir, logger, results)
         logger.emit(
             "success" if report["success"] else "error",
@@ -2433,21 +3051,30 @@ def generate_student_materials(student, base_dir, output_root):
 
     diploma_path = get_abs_path("diploma_path")
     if diploma_path and os.path.exists(diploma_path):
-        results.append(process_diploma(diploma_path, output_dir, name_prefix, logger=logger))
+        results.append(run_with_output_cache(
+            "diploma", [diploma_path], None, output_dir, name_prefix,
+            process_diploma, diploma_path, output_dir, name_prefix, logger=logger,
+        ))
 
     id_card_front_path = get_abs_path("id_card_front_path")
     id_card_back_path = get_abs_path("id_card_back_path")
     if (id_card_front_path and os.path.exists(id_card_front_path)) or (
         id_card_back_path and os.path.exists(id_card_back_path)
     ):
-        results.append(process_id_cards(id_card_front_path, id_card_back_path, output_dir, name_prefix, logger=logger))
+        results.append(run_with_output_cache(
+            "id_card", [id_card_front_path, id_card_back_path], None, output_dir, name_prefix,
+            process_id_cards, id_card_front_path, id_card_back_path, output_dir, name_prefix, logger=logger,
+        ))
 
     hukou_residence_path = get_abs_path("hukou_residence_path")
     hukou_personal_path = get_abs_path("hukou_personal_path")
     if (hukou_residence_path and os.path.exists(hukou_residence_path)) or (
         hukou_personal_path and os.path.exists(hukou_personal_path)
     ):
-        results.append(process_hukou(hukou_residence_path, hukou_personal_path, output_dir, name_prefix, logger=logger))
+        results.append(run_with_output_cache(
+            "hukou", [hukou_residence_path, hukou_personal_path], None, output_dir, name_prefix,
+            process_hukou, hukou_residence_path, hukou_personal_path, output_dir, name_prefix, logger=logger,
+        ))
 
     training_form_path = get_abs_path("training_form_path")
     if training_form_path and os.path.exists(training_form_path):
@@ -2457,8 +3084,9 @@ def generate_student_materials(student, base_dir, output_root):
         logger.emit("error", "global", "finish", "没有找到可处理的原始材料", "当前学员没有可用于生成的原始材料文件")
         results.append(_build_process_result("global", False, error="no source materials"))
 
-    # 生成完成后，批量同步报名材料目录内所有文件至 COS
-    _sync_output_dir_to_cos(output_dir, base_dir)
+    # 合成 PDF 后，批量同步报名材料目录内所有文件至 COS
+    build_materials_pdf(output_dir, name_prefix, logger=logger)
+    _sync_output_dir_to_cos(output_dir, base_dir, logger=logger)
     report = build_generation_report(output_dir, logger, results)
     logger.emit(
         "success" if report["success"] else "error",
@@ -2509,44 +3137,59 @@ def regenerate_single_material(student, base_dir, output_root, material_type, ad
         )
 
     def get_abs_path(key):
-        rel = student.get(key)
-        return os.path.join(base_dir, rel) if rel else None
+        return resolve_source_path(base_dir, student.get(key))
 
     results = []
     if material_type == "diploma":
         diploma_path = get_abs_path("diploma_path")
         if diploma_path and os.path.exists(diploma_path):
-            results.append(process_diploma(diploma_path, output_dir, name_prefix, adjustments=adjustments, logger=logger))
+            results.append(run_with_output_cache(
+                "diploma", [diploma_path], adjustments, output_dir, name_prefix,
+                process_diploma, diploma_path, output_dir, name_prefix, adjustments=adjustments, logger=logger,
+            ))
 
     elif material_type == "id_card":
         front_path = get_abs_path("id_card_front_path")
         back_path = get_abs_path("id_card_back_path")
         if (front_path and os.path.exists(front_path)) or (back_path and os.path.exists(back_path)):
-            results.append(process_id_cards(front_path, back_path, output_dir, name_prefix, adjustments=adjustments, logger=logger))
+            results.append(run_with_output_cache(
+                "id_card", [front_path, back_path], adjustments, output_dir, name_prefix,
+                process_id_cards, front_path, back_path, output_dir, name_prefix, adjustments=adjustments, logger=logger,
+            ))
 
     elif material_type == "hukou":
         residence_path = get_abs_path("hukou_residence_path")
         personal_path = get_abs_path("hukou_personal_path")
         if (residence_path and os.path.exists(residence_path)) or (personal_path and os.path.exists(personal_path)):
-            results.append(process_hukou(residence_path, personal_path, output_dir, name_prefix, adjustments=adjustments, logger=logger))
+            results.append(run_with_output_cache(
+                "hukou", [residence_path, personal_path], adjustments, output_dir, name_prefix,
+                process_hukou, residence_path, personal_path, output_dir, name_prefix, adjustments=adjustments, logger=logger,
+            ))
 
     elif material_type == "renewal_certificate":
         info_page_path = get_abs_path("certificate_info_page_path")
         records_page_path = get_abs_path("certificate_records_page_path")
         if (info_page_path and os.path.exists(info_page_path)) or (records_page_path and os.path.exists(records_page_path)):
-            results.append(process_renewal_certificate_pages(info_page_path, records_page_path, output_dir, name_prefix, logger=logger))
+            results.append(run_with_output_cache(
+                "renewal_certificate", [info_page_path, records_page_path], None, output_dir, name_prefix,
+                process_renewal_certificate_pages, info_page_path, records_page_path, output_dir, name_prefix, logger=logger,
+            ))
 
     elif material_type == "photo":
         photo_path = get_abs_path("photo_path")
         if photo_path and os.path.exists(photo_path):
-            results.append(process_personal_photo(photo_path, output_dir, name_prefix, adjustments=adjustments, logger=logger))
+            results.append(run_with_output_cache(
+                "photo", [photo_path], adjustments, output_dir, name_prefix,
+                process_personal_photo, photo_path, output_dir, name_prefix, adjustments=adjustments, logger=logger,
+            ))
 
     if not results:
         logger.emit("error", "global", "finish", "未找到可重新生成的原始材料", f"没有找到 {material_type} 对应的原始附件")
         return build_generation_report(output_dir, logger, [_build_process_result(material_type, False, error="source material missing")])
 
-    # 生成完成后，同步该目录内所有文件至 COS
-    _sync_output_dir_to_cos(output_dir, base_dir)
+    # 重新合成 PDF 后，同步该目录内所有文件至 COS
+    build_materials_pdf(output_dir, name_prefix, logger=logger)
+    _sync_output_dir_to_cos(output_dir, base_dir, logger=logger)
     report = build_generation_report(output_dir, logger, results)
     logger.emit(
         "success" if report["success"] else "error",
@@ -2559,34 +3202,53 @@ def regenerate_single_material(student, base_dir, output_root, material_type, ad
     return build_generation_report(output_dir, logger, results)
 
 
-def _sync_output_dir_to_cos(output_dir, base_dir):
+def _sync_output_dir_to_cos(output_dir, base_dir, logger=None):
     """
-    将本地 output_dir 目录下所有文件同步到 COS。
-    仅在 STORAGE_BACKEND=cos 或 dual 时执行。
+    将本地 output_dir 目录下所有文件并发同步到 COS（见 cos_sync_service）。
+    仅在 STORAGE_BACKEND=cos 或 dual 时执行，远端内容一致的文件跳过。
     同步失败持续处理（本地已有文件）。
+    传入 logger 时记录一条 cos_sync 事件（含逐文件结果），同步耗时计入该步骤。
+
+    返回:
+        dict: cos_sync_service.sync_files 的结果汇总；未执行同步时返回 None
     """
     import os as _os
-    from services import storage_service as _ss
+    from services import cos_sync_service, storage_service as _ss
 
     backend = _ss._get_backend()
     if backend not in ('cos', 'dual'):
-        return
+        return None
 
     if not _os.path.isdir(output_dir):
-        return
+        return None
 
-    synced, failed = 0, 0
-    for filename in _os.listdir(output_dir):
+    pairs = []
+    for filename in sorted(_os.listdir(output_dir)):
         abs_path = _os.path.join(output_dir, filename)
         if not _os.path.isfile(abs_path):
             continue
         # 计算相对 key：将本地绝对路径转为相对于 base_dir 的路径
-        rel_key = _os.path.relpath(abs_path, base_dir).replace('\\', '/')
-        try:
-            _ss.save_from_local(abs_path, rel_key)
-            synced += 1
-        except Exception as exc:
-            failed += 1
-            print(f'[material_service] COS 同步失败: {rel_key} -> {exc}')
+        pairs.append((abs_path, _os.path.relpath(abs_path, base_dir).replace('\\', '/')))
 
-    print(f'[material_service] COS 同步完成: 成功 {synced} 个，失败 {failed} 个')
+    summary = cos_sync_service.sync_files(pairs)
+    failed = summary["failed"]
+    if logger is not None:
+        logger.emit(
+            "warning" if failed else "info",
+            "global",
+            "cos_sync",
+            "输出文件已同步至 COS" if not failed else "部分输出文件同步 COS 失败",
+            f"上传 {summary['uploaded']} 个，未变化跳过 {summary['skipped']} 个，"
+            f"复用相同内容 {summary['copied']} 个，排队 {summary['queued']} 个，失败 {failed} 个",
+            details={
+                "synced": summary["uploaded"] + summary["skipped"] + summary["copied"] + summary["queued"],
+                "failed": failed,
+                "uploaded": summary["uploaded"],
+                "skipped": summary["skipped"],
+                "copied": summary["copied"],
+                "queued": summary["queued"],
+                "bytes": summary["bytes"],
+                "files": summary["files"],
+            },
+        )
+    return summary
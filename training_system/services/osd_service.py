@@ -0,0 +1,308 @@
+"""
+文字方向检测（OSD）服务。
+
+户口本方向校正（material_service.normalize_hukou_page_orientation）每页会多次调用
+Tesseract OSD。原实现每次都写临时 PNG、启动一次 tesseract 子进程并重新加载模型，
+进程启动和模型加载占了户口本处理的大部分时间。本模块改为：
+
+    1. 常驻工作线程：所有检测请求通过队列交给同一个后台线程处理。
+       安装了 tesserocr 时，该线程持有一个 PyTessBaseAPI(psm=OSD_ONLY)，模型只加载一次，
+       图片以内存对象传入；未安装时回退到 tesseract 命令行，经 stdin 传入 PNG 数据，
+       不再落临时文件
+    2. 结果缓存：按图片内容哈希（BLAKE2b）缓存检测结果，同一页面重复检测直接命中
+    3. 批量接口：detect_rotations() 一次提交多张图片，相同内容只检测一次
+    4. 超时：每张图片的等待超时从工作线程开始处理它时计起，排在前面的检测不会耗尽后续图片的超时；
+       排队等待最长 OSD_QUEUE_WAIT_MAX_SEC
+
+tesserocr 为可选依赖，不在 requirements.txt 中：编译安装需要系统先提供 libtesseract / libleptonica 开发包
+（如 apt install libtesseract-dev libleptonica-dev tesseract-ocr-osd，再 pip install tesserocr）。
+未安装或初始化失败时回退到命令行，每张图片启动一次 tesseract 进程。
+
+检测结果格式与 tesseract --psm 0 的输出保持一致：
+    {"rotate_degrees": 0/90/180/270, "confidence": float}
+无法识别时返回 None。
+
+可选依赖:
+    - tesserocr : 常驻 OSD 模型（未安装时使用 tesseract 命令行）
+"""
+import hashlib
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+TESSERACT_BINARY = shutil.which("tesseract")
+OSD_CACHE_MAX_ENTRIES = 256
+OSD_DEFAULT_TIMEOUT_SEC = 8
+OSD_QUEUE_WAIT_MAX_SEC = 60
+
+# ======================== 可选依赖加载 ========================
+TESSEROCR_IMPORT_ERROR = ''
+
+try:
+    import tesserocr
+except Exception as err:
+    tesserocr = None
+    TESSEROCR_IMPORT_ERROR = str(err)
+
+
+def is_available():
+    """当前环境是否具备 OSD 能力（tesserocr 或 tesseract 命令行其一可用）。"""
+    return tesserocr is not None or TESSERACT_BINARY is not None
+
+
+def image_digest(image):
+    """按图片尺寸和像素内容计算缓存键。"""
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(f"{image.shape}|{image.dtype}".encode("ascii"))
+    hasher.update(np.ascontiguousarray(image))
+    return hasher.hexdigest()
+
+
+def parse_osd_output(output):
+    """解析 tesseract --psm 0 的文本输出。"""
+    rotate_degrees = None
+    confidence = None
+    for line in (output or "").splitlines():
+        if line.startswith("Rotate:"):
+            try:
+                rotate_degrees = int(line.split(":", 1)[1].strip())
+            except ValueError:
+                rotate_degrees = None
+        elif line.startswith("Orientation confidence:"):
+            try:
+                confidence = float(line.split(":", 1)[1].strip())
+            except ValueError:
+                confidence = None
+
+    if rotate_degrees is None or confidence is None:
+        return None
+    return {"rotate_degrees": rotate_degrees % 360, "confidence": confidence}
+
+
+# ======================== 检测后端 ========================
+
+def _open_tesserocr_backend():
+    """在工作线程内创建 OSD 专用的 tesserocr API，返回检测函数。"""
+    from PIL import Image
+
+    api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.OSD_ONLY)
+
+    def detect(image):
+        if image.ndim == 3:
+            pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        else:
+            pil_image = Image.fromarray(image)
+        api.SetImage(pil_image)
+        result = api.DetectOrientationScript()
+        api.Clear()
+        if not result:
+            return None
+        # orient_deg 为页面当前朝向，与命令行 "Rotate:" 的换算关系同 tesseract 源码
+        return {
+            "rotate_degrees": (360 - int(result["orient_deg"])) % 360,
+            "confidence": float(result["orient_conf"]),
+        }
+
+    return detect, api.End
+
+
+def _open_cli_backend(timeout):
+    """tesseract 命令行后端：PNG 经 stdin 传入，不写临时文件。"""
+
+    def detect(image):
+        ok, buf = cv2.imencode(".png", image)
+        if not ok:
+            return None
+        try:
+            process = subprocess.run(
+                [TESSERACT_BINARY, "stdin", "stdout", "--psm", "0"],
+                input=buf.tobytes(),
+                capture_output=True,
+                timeout=timeout,
+                check=False,
+            )
+        except (OSError, subprocess.SubprocessError):
+            return None
+        output = "\n".join(
+            part.decode("utf-8", errors="ignore")
+            for part in (process.stdout, process.stderr)
+            if part
+        )
+        return parse_osd_output(output)
+
+    return detect, None
+
+
+def _open_default_backend(timeout=OSD_DEFAULT_TIMEOUT_SEC):
+    if tesserocr is not None:
+        try:
+            return _open_tesserocr_backend()
+        except Exception as err:
+            print(f"[osd_service] tesserocr 初始化失败，回退到 tesseract 命令行: {err}")
+    if TESSERACT_BINARY is not None:
+        return _open_cli_backend(timeout)
+    return (lambda image: None), None
+
+
+# ======================== 常驻工作线程 ========================
+
+class OsdWorker:
+    """
+    单线程 OSD 工作器。
+
+    backend_factory 在工作线程内调用，返回 (detect, close)：
+    detect(image) -> dict | None，close 可为 None。tesserocr 的 API 对象不是线程安全的，
+    因此所有检测都在同一个线程中串行执行。
+    """
+
+    def __init__(self, backend_factory=_open_default_backend, cache_size=OSD_CACHE_MAX_ENTRIES):
+        self._backend_factory = backend_factory
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._pending = {}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "detections": 0}
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="osd-worker", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        with self._start_lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout=5)
+
+    def _run(self):
+        detect, close = self._backend_factory()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                digest, image, future = item
+                if not future.set_running_or_notify_cancel():
+                    with self._cache_lock:
+                        self._pending.pop(digest, None)
+                    continue
+                future.started_at = time.monotonic()
+                future.started.set()
+                try:
+                    result = detect(image)
+                except Exception as err:
+                    print(f"[osd_service] OSD 检测失败: {err}")
+                    result = None
+                self.stats["detections"] += 1
+                self._store(digest, result)
+                future.set_result(result)
+        finally:
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    def _store(self, digest, result):
+        with self._cache_lock:
+            self._pending.pop(digest, None)
+            self._cache[digest] = result
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def submit(self, image):
+        """提交单张图片，返回 Future。命中缓存或相同内容正在检测时不会重复入队。"""
+        digest = image_digest(image)
+        with self._cache_lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                self.stats["hits"] += 1
+                future = Future()
+                future.set_result(self._cache[digest])
+                return future
+            pending = self._pending.get(digest)
+            if pending is not None:
+                self.stats["hits"] += 1
+                return pending
+            self.stats["misses"] += 1
+            future = Future()
+            future.started = threading.Event()
+            self._pending[digest] = future
+        self.start()
+        self._queue.put((digest, image, future))
+        return future
+
+    def detect(self, image, timeout=OSD_DEFAULT_TIMEOUT_SEC):
+        return self.detect_many([image], timeout=timeout)[0]
+
+    def detect_many(self, images, timeout=OSD_DEFAULT_TIMEOUT_SEC):
+        """批量检测：全部入队后统一等待，超时的图片返回 None。"""
+        futures = [self.submit(image) for image in images]
+        results = []
+        for future in futures:
+            try:
+                results.append(self._wait(future, timeout))
+            except Exception:
+                results.append(None)
+        return results
+
+    @staticmethod
+    def _wait(future, timeout):
+        """等待检测结果：超时从工作线程取出该图片时计起，排队时间不计入。"""
+        if future.done():
+            return future.result()
+        if not future.started.wait(OSD_QUEUE_WAIT_MAX_SEC):
+            return None
+        remaining = future.started_at + timeout - time.monotonic()
+        return future.result(timeout=max(0.0, remaining))
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    """返回进程内共享的 OSD 工作器（首次调用时启动工作线程并加载模型）。"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = OsdWorker().start()
+        return _worker
+
+
+def detect_rotation(image, timeout=OSD_DEFAULT_TIMEOUT_SEC):
+    """检测单张图片的文字方向，返回 {"rotate_degrees", "confidence"} 或 None。"""
+    if image is None or image.size == 0 or not is_available():
+        return None
+    return get_worker().detect(image, timeout=timeout)
+
+
+def detect_rotations(images, timeout=OSD_DEFAULT_TIMEOUT_SEC):
+    """批量检测多张图片的文字方向，结果与输入顺序一一对应。"""
+    if not is_available():
+        return [None for _ in images]
+    valid = [image for image in images if image is not None and image.size > 0]
+    detected = iter(get_worker().detect_many(valid, timeout=timeout))
+    return [
+        next(detected) if image is not None and image.size > 0 else None
+        for image in images
+    ]
@@ -0,0 +1,141 @@
+"""
+材料生成步骤耗时统计。
+
+MaterialGenerationLogger 为每个事件记录了墙钟/CPU 步骤耗时，build_generation_report 按 (材料, 步骤)
+汇总为 step_timings。本模块把每次生成的 step_timings 写入 material_step_timings 表，
+并按时间窗口聚合为每个 (材料, 步骤) 的分位数和直方图，用于判断 rembg、OSD、边缘检测、
+COS 同步等环节中哪一步是生产环境的瓶颈：
+
+    1. 记录：路由拿到生成报告后调用 record_report()，记录失败只打印日志，不影响业务
+    2. 滚动窗口：统计默认取最近 PIPELINE_TIMINGS_WINDOW_DAYS 天的样本；
+       超过 PIPELINE_TIMINGS_RETENTION_DAYS 天的样本在写入时顺带清理
+    3. 直方图：按 HISTOGRAM_BUCKETS_MS 的对数刻度分桶，便于观察长尾
+
+样本写入共享的 SQLite 数据库，多个 worker 进程的数据自然汇总在一起。
+
+环境变量:
+    PIPELINE_TIMINGS_WINDOW_DAYS      默认统计窗口（默认 7 天）
+    PIPELINE_TIMINGS_RETENTION_DAYS   样本保留天数（默认 30 天）
+"""
+import math
+import os
+import time
+from datetime import datetime, timedelta
+
+from models.student import delete_step_timings_before, get_step_timings_since, save_step_timings
+
+# 直方图桶上界（毫秒），最后一个桶收纳超过最大上界的样本
+HISTOGRAM_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+PRUNE_INTERVAL_SEC = 3600
+
+_last_prune = 0.0
+
+
+def _env_days(name, default):
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def _format_time(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def percentile(values, q):
+    """最近秩法分位数（q 取 0-100）；空序列返回 None。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(q / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def build_histogram(values):
+    """按 HISTOGRAM_BUCKETS_MS 分桶计数，返回 [{'le', 'count'}]，最后一桶的 le 为 None。"""
+    counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    for value in values:
+        for index, upper in enumerate(HISTOGRAM_BUCKETS_MS):
+            if value <= upper:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+    bounds = list(HISTOGRAM_BUCKETS_MS) + [None]
+    return [{'le': upper, 'count': count} for upper, count in zip(bounds, counts)]
+
+
+def record_report(report):
+    """
+    记录一次生成报告中的步骤耗时，返回写入的样本数（失败返回 0）。
+    """
+    global _last_prune
+    timings = (report or {}).get('step_timings') or []
+    if not timings:
+        return 0
+    job_id = (report.get('log_summary') or {}).get('job_id', '')
+    try:
+        written = save_step_timings(job_id, timings)
+        now = time.time()
+        if now - _last_prune >= PRUNE_INTERVAL_SEC:
+            _last_prune = now
+            retention = _env_days('PIPELINE_TIMINGS_RETENTION_DAYS', 30)
+            delete_step_timings_before(_format_time(datetime.now() - timedelta(days=retention)))
+        return written
+    except Exception as e:
+        print(f'[pipeline_metrics] 记录步骤耗时失败: {e}')
+        return 0
+
+
+def summarize(days=None):
+    """
+    聚合最近 days 天的步骤耗时。
+
+    返回:
+        dict: {
+            'window_days', 'sample_count', 'buckets_ms',
+            'scopes': [{'scope', 'scope_label', 'steps': [...]}]
+        }
+        steps 中每项: {'step', 'count', 'wall_p50_ms', 'wall_p95_ms', 'cpu_p50_ms', 'cpu_p95_ms',
+                       'wall_max_ms', 'histogram'}
+    """
+    from services.material_service import MATERIAL_SCOPE_LABELS
+
+    days = days or _env_days('PIPELINE_TIMINGS_WINDOW_DAYS', 7)
+    samples = get_step_timings_since(_format_time(datetime.now() - timedelta(days=days)))
+
+    grouped = {}
+    for sample in samples:
+        steps = grouped.setdefault(sample['scope'], {})
+        wall, cpu = steps.setdefault(sample['step'], ([], []))
+        wall.append(float(sample['wall_ms'] or 0))
+        cpu.append(float(sample['cpu_ms'] or 0))
+
+    scopes = []
+    for scope, steps in grouped.items():
+        step_items = []
+        for step, (wall, cpu) in steps.items():
+            step_items.append({
+                'step': step,
+                'count': len(wall),
+                'wall_p50_ms': percentile(wall, 50),
+                'wall_p95_ms': percentile(wall, 95),
+                'cpu_p50_ms': percentile(cpu, 50),
+                'cpu_p95_ms': percentile(cpu, 95),
+                'wall_max_ms': max(wall),
+                'histogram': build_histogram(wall),
+            })
+        step_items.sort(key=lambda item: item['wall_p95_ms'] or 0, reverse=True)
+        scopes.append({
+            'scope': scope,
+            'scope_label': MATERIAL_SCOPE_LABELS.get(scope, scope),
+            'steps': step_items,
+        })
+    scopes.sort(key=lambda item: item['scope'])
+
+    return {
+        'window_days': days,
+        'sample_count': len(samples),
+        'buckets_ms': list(HISTOGRAM_BUCKETS_MS),
+        'scopes': scopes,
+    }
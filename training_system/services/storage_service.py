@@ -8,11 +8,15 @@
                     COS 提供给用户访问（公读桶，永久有效 URL）
 
 双写模式（dual）行为：
-  - 上传：先写本地，再异步推 COS（本地写失败则整体失败）
+  - 上传：先写本地，再异步推 COS（本地写失败则整体失败）；COS 上传/移动/删除登记到
+          cos_outbox 发件箱由后台线程执行，失败自动重试（见 cos_outbox_service）
   - 服务端读取（生成材料等）：直接读本地文件，无需走网络
   - 对外 URL：返回 COS 公网 URL
   - 删除：本地 + COS 同时删除
   - 文件列举：基于本地文件系统（速度快）
+  - 去重：students/ 下内容相同的本地文件共享同一份磁盘空间（硬链接），相同内容再次上传
+          COS 时改为服务端复制（见 blob_store_service）
+  - 文件浏览索引：本地写入/移动/删除后登记所在文件夹，由 folder_index_service 增量刷新
 
 数据库中存储的相对路径（如 students/特种设备-XX公司-张三/xxx.jpg）
 在所有后端中含义一致，local 后端拼接 BASE_DIR 得到绝对路径，
@@ -107,6 +111,19 @@ def _push_to_cos(data_bytes, key):
     client, config = _get_cos_client()
     full = _full_cos_key(key, config)
 
+    # 相同内容已上传过 COS 时改为服务端复制，不再上传文件内容（见 blob_store_service）
+    from services import blob_store_service, cos_sync_service
+    digest = None
+    blob_root = None
+    if blob_store_service.enabled() and len(data_bytes) >= blob_store_service.min_bytes():
+        blob_root = blob_store_service.root_for(os.path.join(get_base_dir(), key))
+    if blob_root:
+        import hashlib
+        digest = blob_store_service.hash_bytes(data_bytes)
+        if cos_sync_service.copy_duplicate(key, digest, hashlib.md5(data_bytes).hexdigest(), blob_root):
+            _log_info(f'COS去重复制: key={key}')
+            return
+
     # 推断 Content-Type，避免 COS 默认返回 application/octet-stream 导致浏览器下载
     content_type, _ = mimetypes.guess_type(key)
     if not content_type:
@@ -121,6 +138,42 @@ def _push_to_cos(data_bytes, key):
         ContentDisposition='inline',
     )
     _log_info(f'COS上传: key={key} content_type={content_type}')
+    if digest:
+        blob_store_service.remember_cos_key(digest, key, blob_root)
+
+
+def _dedup_local(abs_path, key, data=None):
+    """
+    students/ 下的本地文件纳入内容寻址存储：相同内容共享同一份磁盘空间（硬链接），
+    key 不变。入库失败不影响保存结果。
+    """
+    if not key.startswith('students/'):
+        return None
+    from services import blob_store_service
+    if data is not None and len(data) < blob_store_service.min_bytes():
+        return None
+    digest = blob_store_service.hash_bytes(data) if data is not None else None
+    info = blob_store_service.ingest(abs_path, digest)
+    if info and info['deduped']:
+        _log_info(f'本地去重: {key} -> blob {info["digest"][:12]}')
+    return info
+
+
+def _enqueue_cos(op, key, src_key=''):
+    """
+    dual 模式下把 COS 操作登记到发件箱（见 cos_outbox_service）。
+
+    返回:
+        bool: 已登记返回 True；发件箱未启用或登记失败返回 False，由调用方同步执行
+    """
+    from services import cos_outbox_service
+    return cos_outbox_service.enqueue(op, key, src_key)
+
+
+def _mark_index(*keys):
+    """本地文件变化后把所在顶层文件夹记为待刷新（见 folder_index_service）。"""
+    from services import folder_index_service
+    folder_index_service.mark_changed(*keys)
 
 
 # ======================== 基础目录 ========================
@@ -184,6 +237,8 @@ def save_file(data_or_fileobj, key):
                 f.write(data)
             os.replace(tmp_path, abs_path)
             _log_info(f'本地保存: {abs_path}')
+            _dedup_local(abs_path, key, data)
+            _mark_index(key)
         except Exception:
             if os.path.exists(tmp_path):
                 try:
@@ -192,10 +247,14 @@ def save_file(data_or_fileobj, key):
                     pass
             raise
 
-    if backend in ('cos', 'dual'):
+    if backend == 'dual' and _enqueue_cos('put', key):
+        # dual 模式：登记到发件箱，由后台线程异步上传
+        pass
+    elif backend in ('cos', 'dual'):
         # 上传 COS（dual 模式下本地已成功才执行此步骤）
         try:
             _push_to_cos(data, key)
+            _invalidate_cache(key)
         except Exception as e:
             # dual 模式下 COS 推送失败记警告但不影响业务（本地已有备份）
             if backend == 'dual':
@@ -223,12 +282,23 @@ def save_from_local(local_abs_path, key):
         str: key
     """
     backend = _get_backend()
+    if backend in ('local', 'dual'):
+        _mark_index(key)
+
+    if (
+        backend == 'dual'
+        and os.path.abspath(local_abs_path) == os.path.abspath(os.path.join(get_base_dir(), key))
+        and _enqueue_cos('put', key)
+    ):
+        # 文件就在 key 对应的本地位置：登记到发件箱，执行时读取本地最新内容
+        return key
 
     if backend in ('cos', 'dual'):
         try:
             with open(local_abs_path, 'rb') as f:
                 data = f.read()
             _push_to_cos(data, key)
+            _invalidate_cache(key)
         except Exception as e:
             if backend == 'dual':
                 _log_warning(f'COS同步失败 local={local_abs_path}: {e}')
@@ -270,8 +340,12 @@ def move_temp_file(src_key, dst_key):
         os.makedirs(os.path.dirname(dst_abs), exist_ok=True)
         shutil.move(src_abs, dst_abs)
         _log_info(f'本地移动: {src_key} -> {dst_key}')
+        _mark_index(src_key, dst_key)
 
-        if backend == 'dual':
+        if backend == 'dual' and _enqueue_cos('copy', dst_key, src_key):
+            # dual 模式：COS 端的复制+删除登记到发件箱异步执行
+            pass
+        elif backend == 'dual':
             # dual 模式：在 COS 端也做移动（复制+删除）
             try:
                 client, config = _get_cos_client()
@@ -305,6 +379,7 @@ def move_temp_file(src_key, dst_key):
                 CopySource={'Bucket': bucket, 'Key': src_full, 'Region': config['region']}
             )
             client.delete_object(Bucket=bucket, Key=src_full)
+            _invalidate_cache(src_key, dst_key)
             return True
         except Exception as e:
             _log_warning(f'COS移动失败 {src_key}->{dst_key}: {e}')
@@ -337,6 +412,7 @@ def delete_file(key):
             if os.path.exists(abs_path):
                 os.remove(abs_path)
                 _log_info(f'本地删除: {abs_path}')
+                _mark_index(key)
                 # 清理空文件夹
                 if key.startswith('students/'):
                     folder = os.path.dirname(abs_path)
@@ -346,11 +422,14 @@ def delete_file(key):
             _log_warning(f'本地删除失败 {abs_path}: {e}')
             local_ok = False
 
-    if backend in ('cos', 'dual'):
+    if backend == 'dual' and _enqueue_cos('delete', key):
+        pass
+    elif backend in ('cos', 'dual'):
         try:
             client, config = _get_cos_client()
             full = _full_cos_key(key, config)
             client.delete_object(Bucket=config['bucket'], Key=full)
+            _invalidate_cache(key)
             _log_info(f'COS删除: {key}')
         except Exception as e:
             _log_warning(f'COS删除失败 key={key}: {e}')
@@ -390,38 +469,18 @@ def delete_prefix(prefix):
                 else:
                     os.remove(abs_path)
                     deleted_count += 1
+                _mark_index(clean_prefix)
             except Exception as e:
                 _log_warning(f'本地目录删除失败 {abs_path}: {e}')
                 failed_keys.append(f'local:{abs_path}')
 
-    # 2. COS 目录/前缀清理
-    if backend in ('cos', 'dual'):
-        try:
-            client, config = _get_cos_client()
-            bucket = config['bucket']
-            cos_prefix = _full_cos_key(clean_prefix, config)
-            marker = ''
-            while True:
-                resp = client.list_objects(Bucket=bucket, Prefix=cos_prefix, Marker=marker, MaxKeys=1000)
-                contents = resp.get('Contents', []) or []
-                if not contents:
-                    break
-                objects = [{'Key': obj['Key']} for obj in contents]
-                del_resp = client.delete_objects(Bucket=bucket, Delete={'Object': objects, 'Quiet': True})
-                errors = del_resp.get('Error', []) or []
-                if errors:
-                    for err in errors:
-                        failed_keys.append(f"cos:{err.get('Key')}")
-                        _log_warning(f"COS 批量删除异常 Key={err.get('Key')}: {err.get('Message')}")
-                deleted_count += len(objects) - len(errors)
-                if resp.get('IsTruncated') == 'true' and resp.get('NextMarker'):
-                    marker = resp.get('NextMarker')
-                else:
-                    break
-            _log_info(f'COS 前缀清理完成: {clean_prefix}')
-        except Exception as e:
-            _log_warning(f'COS 前缀清理异常 prefix={clean_prefix}: {e}')
-            failed_keys.append(f'cos_prefix:{clean_prefix}')
+    # 2. COS 目录/前缀清理（dual 模式登记到发件箱，排在前缀下已登记的上传之后执行）
+    if backend == 'dual' and _enqueue_cos('delete_prefix', clean_prefix):
+        pass
+    elif backend in ('cos', 'dual'):
+        cos_result = _delete_cos_prefix(clean_prefix)
+        deleted_count += cos_result['deleted_count']
+        failed_keys.extend(cos_result['failed_keys'])
 
     return {
         'success': len(failed_keys) == 0,
@@ -430,6 +489,44 @@ def delete_prefix(prefix):
     }
 
 
+def _delete_cos_prefix(clean_prefix):
+    """
+    删除 COS 上指定前缀下的全部对象。
+
+    返回:
+        dict: {'deleted_count': int, 'failed_keys': list}
+    """
+    failed_keys = []
+    deleted_count = 0
+    try:
+        client, config = _get_cos_client()
+        bucket = config['bucket']
+        cos_prefix = _full_cos_key(clean_prefix, config)
+        marker = ''
+        while True:
+            resp = client.list_objects(Bucket=bucket, Prefix=cos_prefix, Marker=marker, MaxKeys=1000)
+            contents = resp.get('Contents', []) or []
+            if not contents:
+                break
+            objects = [{'Key': obj['Key']} for obj in contents]
+            del_resp = client.delete_objects(Bucket=bucket, Delete={'Object': objects, 'Quiet': True})
+            errors = del_resp.get('Error', []) or []
+            if errors:
+                for err in errors:
+                    failed_keys.append(f"cos:{err.get('Key')}")
+                    _log_warning(f"COS 批量删除异常 Key={err.get('Key')}: {err.get('Message')}")
+            deleted_count += len(objects) - len(errors)
+            if resp.get('IsTruncated') == 'true' and resp.get('NextMarker'):
+                marker = resp.get('NextMarker')
+            else:
+                break
+        _log_info(f'COS 前缀清理完成: {clean_prefix}')
+    except Exception as e:
+        _log_warning(f'COS 前缀清理异常 prefix={clean_prefix}: {e}')
+        failed_keys.append(f'cos_prefix:{clean_prefix}')
+    return {'deleted_count': deleted_count, 'failed_keys': failed_keys}
+
+
 # ======================== 读取接口 ========================
 
 def read_local(key):
@@ -453,7 +550,7 @@ def read_bytes(key):
     """
     从存储后端读取文件内容（bytes）。
 
-    dual/local 模式优先读本地；cos-only 模式从 COS 下载。
+    dual/local 模式优先读本地；cos-only 模式经本地磁盘读缓存（见 cos_cache_service）读取。
 
     参数:
         key: 存储 key
@@ -466,16 +563,37 @@ def read_bytes(key):
     if backend in ('local', 'dual'):
         return read_local(key)
 
-    # cos-only
-    try:
-        client, config = _get_cos_client()
-        full = _full_cos_key(key, config)
-        resp = client.get_object(Bucket=config['bucket'], Key=full)
-        return resp['Body'].get_raw_stream().read()
-    except Exception as e:
-        if 'NoSuchKey' in str(e) or '404' in str(e):
+    # cos-only：经本地磁盘缓存读取
+    f = _open_cached(key)
+    if f is None:
+        return None
+    with f:
+        return f.read()
+
+def open_stream(key):
+    """
+    以流的方式打开文件，供大文件/打包下载逐块读取，不把整个文件读入内存。
+
+    dual/local 模式打开本地文件；cos-only 模式打开本地读缓存中的副本（未命中时先流式下载）。
+    调用方负责 close()。
+
+    参数:
+        key: 存储 key
+
+    返回:
+        可 read(size) 的文件对象，或 None（文件不存在）
+    """
+    backend = _get_backend()
+
+    if backend in ('local', 'dual'):
+        abs_path = os.path.join(get_base_dir(), key)
+        if not os.path.isfile(abs_path):
             return None
-        raise
+        return open(abs_path, 'rb')
+
+    # cos-only：经本地磁盘缓存读取
+    return _open_cached(key)
+
 
 def pull_from_cos(key):
     """
@@ -486,15 +604,13 @@ def pull_from_cos(key):
     if backend == 'local':
         return False
     try:
+        from services.cos_cache_service import stream_object_to_file
         client, config = _get_cos_client()
         full = _full_cos_key(key, config)
-        response = client.get_object(Bucket=config['bucket'], Key=full)
-        data = response['Body'].get_raw_stream().read()
-        
-        abs_path = local_abs_path(key)
-        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-        with open(abs_path, 'wb') as f:
-            f.write(data)
+        # 分块写入本地文件，不在内存中保留整个对象
+        if stream_object_to_file(client, config['bucket'], full, local_abs_path(key)) is None:
+            _log_warning(f'从COS拉取失败 {key}: 对象不存在')
+            return False
         _log_info(f'从COS拉取并保存到本地: {key}')
         return True
     except Exception as e:
@@ -517,6 +633,48 @@ def local_abs_path(key):
     return os.path.join(get_base_dir(), key)
 
 
+def ensure_local(key):
+    """
+    返回可直接按路径读取的本地文件（供 cv2.imread 等按路径读取的处理流程使用）。
+
+    local/dual 模式返回 key 对应的本地文件；cos-only 模式优先使用已拉取到本地的文件，
+    否则返回本地读缓存中的副本（未命中时流式下载）。文件不存在时返回 None。
+    """
+    abs_path = local_abs_path(key)
+    if os.path.isfile(abs_path):
+        return abs_path
+    if _get_backend() != 'cos':
+        return None
+    return _cached_path(key)
+
+
+def _cached_path(key):
+    """cos-only 模式：经读缓存取得对象的本地副本路径；对象不存在返回 None。"""
+    from services import cos_cache_service
+    client, config = _get_cos_client()
+    return cos_cache_service.get_cache().fetch(key, client, config['bucket'], _full_cos_key(key, config))
+
+
+def _open_cached(key):
+    """cos-only 模式：打开读缓存中的副本（打开前被淘汰时重新获取）；对象不存在返回 None。"""
+    from services import cos_cache_service
+    client, config = _get_cos_client()
+    return cos_cache_service.get_cache().open_file(key, client, config['bucket'], _full_cos_key(key, config))
+
+
+def _invalidate_cache(*keys):
+    """cos-only 模式下对象被覆盖/移动/删除后清除读缓存。"""
+    if _get_backend() != 'cos':
+        return
+    from services import cos_cache_service
+    cache = cos_cache_service.get_cache()
+    for key in keys:
+        try:
+            cache.invalidate(key)
+        except Exception as e:
+            _log_warning(f'清除读缓存失败 {key}: {e}')
+
+
 def file_exists_local(key):
     """检查文件是否存在于本地（dual/local 模式）。"""
     return os.path.exists(os.path.join(get_base_dir(), key))
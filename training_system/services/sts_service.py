@@ -1,16 +1,53 @@
+"""
+小程序直传 COS 的临时凭证（STS）。
+
+/api/config/sts 原先每次请求都新建 StsClient 调用一次 GetFederationToken（100–300 ms），
+小程序每个上传流程都会请求一次，报名高峰期还可能触发 STS 频控。凭证的权限范围固定
+（仅 students/tmp/*），有效期 30 分钟，可以在多次上传之间复用：
+
+    1. 进程内缓存：凭证剩余有效期大于 STS_REFRESH_MARGIN_SEC 时直接返回，
+       保证调用方拿到的凭证至少还能用这么久
+    2. 跨 worker 共享：凭证同时写入本地 SQLite 小库（默认 database/sts_cache.db，权限 600），
+       同一台机器上的其他 worker 进程直接读取，不必各自申请
+    3. 单飞刷新：进程内用锁、进程间用 SQLite 写锁（BEGIN IMMEDIATE）串行化刷新，
+       拿到锁后再检查一次缓存，并发请求只会触发一次 GetFederationToken
+    4. 缓存按 SecretId、桶、地域与权限策略区分，修改 COS 配置后自动失效；
+       共享库不可用时退化为进程内缓存
+
+环境变量:
+    STS_REFRESH_MARGIN_SEC   凭证剩余有效期低于该值时刷新（默认 300 秒）
+    STS_CACHE_PATH           共享缓存库路径（默认 database/sts_cache.db）
+"""
+import hashlib
 import json
 import os
+import sqlite3
+import threading
+import time
 from flask import current_app
 from tencentcloud.common import credential
 from tencentcloud.common.profile.client_profile import ClientProfile
 from tencentcloud.common.profile.http_profile import HttpProfile
 from tencentcloud.sts.v20180813 import sts_client, models
 
-def get_cos_sts_token():
-    """
-    获取直传 COS 的临时凭证（STS Token）。
-    该凭证仅允许上传到当前桶的 students/tmp/* 目录。
-    """
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.path.join(PROJECT_DIR, 'database', 'sts_cache.db')
+# 凭证有效期（秒）
+TOKEN_DURATION_SEC = 1800
+
+_memory = {}
+_refresh_lock = threading.Lock()
+_stats = {'memory_hits': 0, 'store_hits': 0, 'refreshes': 0}
+
+
+def _refresh_margin():
+    try:
+        return max(0, int(os.getenv('STS_REFRESH_MARGIN_SEC', '300')))
+    except ValueError:
+        return 300
+
+
+def _load_config():
     secret_id = os.getenv('COS_SECRET_ID', '')
     secret_key = os.getenv('COS_SECRET_KEY', '')
     bucket = os.getenv('COS_BUCKET', '')
@@ -22,20 +59,6 @@ def get_cos_sts_token():
     # 从 bucket 名称提取 appid（格式形如 examplebucket-1250000000）
     appid = bucket.split('-')[-1] if '-' in bucket else '*'
 
-    cred = credential.Credential(secret_id, secret_key)
-    
-    httpProfile = HttpProfile()
-    # 强制走内网端点可以通过特定配置，但默认公网也可
-    httpProfile.endpoint = "sts.tencentcloudapi.com"
-
-    clientProfile = ClientProfile()
-    clientProfile.httpProfile = httpProfile
-
-    client = sts_client.StsClient(cred, region, clientProfile)
-
-    req = models.GetFederationTokenRequest()
-    req.Name = "miniprogram_upload"
-    
     # 构造仅允许 PutObject 和 PostObject 的 Policy
     policy = {
         "version": "2.0",
@@ -57,14 +80,50 @@ def get_cos_sts_token():
             }
         ]
     }
-    
-    req.Policy = json.dumps(policy)
+    return {
+        'secret_id': secret_id,
+        'secret_key': secret_key,
+        'bucket': bucket,
+        'region': region,
+        'policy': json.dumps(policy),
+    }
+
+
+def _cache_key(config):
+    """缓存键：配置变化（换密钥、换桶、改策略）后旧凭证不再命中。不包含 SecretKey 本身。"""
+    raw = '|'.join([config['secret_id'], config['bucket'], config['region'], config['policy'],
+                    str(TOKEN_DURATION_SEC)])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _is_fresh(credentials, now=None):
+    if not credentials:
+        return False
+    return credentials['ExpiredTime'] - (now or time.time()) > _refresh_margin()
+
+
+def _request_token(config):
+    """调用 GetFederationToken 申请新凭证。"""
+    cred = credential.Credential(config['secret_id'], config['secret_key'])
+
+    httpProfile = HttpProfile()
+    # 强制走内网端点可以通过特定配置，但默认公网也可
+    httpProfile.endpoint = "sts.tencentcloudapi.com"
+
+    clientProfile = ClientProfile()
+    clientProfile.httpProfile = httpProfile
+
+    client = sts_client.StsClient(cred, config['region'], clientProfile)
+
+    req = models.GetFederationTokenRequest()
+    req.Name = "miniprogram_upload"
+    req.Policy = config['policy']
     # 设置过期时间 1800 秒（半小时）
-    req.DurationSeconds = 1800
+    req.DurationSeconds = TOKEN_DURATION_SEC
 
     try:
-        import time
         resp = client.GetFederationToken(req)
+        _stats['refreshes'] += 1
         # 转换为字典返回
         return {
             "TmpSecretId": resp.Credentials.TmpSecretId,
@@ -72,9 +131,108 @@ def get_cos_sts_token():
             "Token": resp.Credentials.Token,
             "StartTime": int(time.time()),
             "ExpiredTime": resp.ExpiredTime,
-            "Bucket": bucket,
-            "Region": region
+            "Bucket": config['bucket'],
+            "Region": config['region']
         }
     except Exception as e:
         current_app.logger.error(f"Failed to generate STS Token: {str(e)}")
         raise RuntimeError(f"生成上传凭证失败: {str(e)}")
+
+
+def _open_store():
+    path = os.getenv('STS_CACHE_PATH', '') or DEFAULT_CACHE_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    created = not os.path.exists(path)
+    # isolation_level=None：事务由下面显式的 BEGIN IMMEDIATE 控制
+    conn = sqlite3.connect(path, timeout=15, isolation_level=None)
+    if created:
+        # 库中保存的是临时密钥，只允许服务进程读写
+        os.chmod(path, 0o600)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sts_cache (
+            cache_key    TEXT PRIMARY KEY,
+            credentials  TEXT NOT NULL,
+            expired_time INTEGER NOT NULL,
+            updated_at   REAL NOT NULL
+        )
+    ''')
+    return conn
+
+
+def _read_store(conn, cache_key):
+    row = conn.execute('SELECT credentials FROM sts_cache WHERE cache_key = ?', (cache_key,)).fetchone()
+    credentials = json.loads(row[0]) if row else None
+    return credentials if _is_fresh(credentials) else None
+
+
+def _load_or_refresh(cache_key, config):
+    """从共享库读取凭证；没有可用凭证时持有写锁申请新凭证并写回，其他进程等待后直接读取。"""
+    try:
+        conn = _open_store()
+    except (sqlite3.Error, OSError) as e:
+        current_app.logger.warning(f'STS 凭证共享缓存不可用，仅使用进程内缓存: {e}')
+        return _request_token(config)
+    credentials = None
+    try:
+        credentials = _read_store(conn, cache_key)
+        if credentials:
+            _stats['store_hits'] += 1
+            return credentials
+        conn.execute('BEGIN IMMEDIATE')
+        credentials = _read_store(conn, cache_key)
+        if credentials:
+            # 等锁期间已由其他进程刷新
+            conn.execute('ROLLBACK')
+            _stats['store_hits'] += 1
+            return credentials
+        try:
+            credentials = _request_token(config)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('DELETE FROM sts_cache')
+        conn.execute(
+            'INSERT INTO sts_cache (cache_key, credentials, expired_time, updated_at) VALUES (?, ?, ?, ?)',
+            (cache_key, json.dumps(credentials), credentials['ExpiredTime'], time.time())
+        )
+        conn.execute('COMMIT')
+        return credentials
+    except sqlite3.Error as e:
+        current_app.logger.warning(f'STS 凭证共享缓存读写失败: {e}')
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        # 凭证已申请成功、只是写回失败时直接使用，否则绕过共享库重新申请
+        return credentials if _is_fresh(credentials) else _request_token(config)
+    finally:
+        conn.close()
+
+
+def get_cos_sts_token():
+    """
+    获取直传 COS 的临时凭证（STS Token）。
+    该凭证仅允许上传到当前桶的 students/tmp/* 目录。
+
+    未临近过期的凭证在进程内与本机 worker 之间复用，返回的凭证剩余有效期不少于 STS_REFRESH_MARGIN_SEC。
+    """
+    config = _load_config()
+    cache_key = _cache_key(config)
+
+    credentials = _memory.get(cache_key)
+    if _is_fresh(credentials):
+        _stats['memory_hits'] += 1
+        return dict(credentials)
+
+    with _refresh_lock:
+        credentials = _memory.get(cache_key)
+        if _is_fresh(credentials):
+            _stats['memory_hits'] += 1
+            return dict(credentials)
+        credentials = _load_or_refresh(cache_key, config)
+        _memory.clear()
+        _memory[cache_key] = credentials
+    return dict(credentials)
+
+
+def get_stats():
+    """缓存命中统计（进程内）。"""
+    return dict(_stats)
@@ -0,0 +1,386 @@
+"""
+学员冷存储归档：把早已办结（考试通过）或已驳回的学员迁出热库，附件打包成每人一个压缩包。
+
+历年提交的学员都留在 students 表和 students/ 目录里，列表查询、文件夹扫描、数据库备份、
+文件浏览索引与附件对账的开销都随历史年限线性增长。本模块提供归档子系统：
+
+    1. 归档：状态为终态（STUDENT_ARCHIVE_STATUSES）且创建时间超过 STUDENT_ARCHIVE_AGE_DAYS 天的学员，
+       附件（学员文件夹 + 各 *_path 字段引用的文件，不含隐藏的派生文件）打包为
+       archive/students/<ID>-<文件夹名>.tar.gz，经 storage_service 写入本地或 COS（随存储后端）；
+       学员记录及关联表行（material_adjustments、material_crop_points）写入独立的归档库，
+       压缩包内另附 manifest.json，归档库损坏时也能单独恢复
+    2. 安全：归档库写入成功后才删除热库记录与附件；打包期间记录被修改则放弃本次归档；
+       同姓名同单位的学员共用文件夹时只打包、删除本人引用的文件
+    3. 检索：归档库按姓名 / 身份证号 / 手机号 / 单位搜索，不读取压缩包
+    4. 恢复：按原 ID 写回学员记录与关联表行，附件从压缩包还原到原路径，随后删除归档记录与压缩包
+
+归档库默认与主库同目录（student_archive.db），可用 STUDENT_ARCHIVE_DB 指定路径。
+
+环境变量:
+    STUDENT_ARCHIVE_AGE_DAYS   创建超过多少天的学员可归档（默认 365）
+    STUDENT_ARCHIVE_STATUSES   可归档的终态，逗号分隔（默认 exam_passed,rejected）
+    STUDENT_ARCHIVE_DB         归档库路径（默认 <主库目录>/student_archive.db）
+"""
+import io
+import json
+import os
+import sqlite3
+import tarfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models.student import (
+    delete_student,
+    get_archive_candidates,
+    get_student_archive_rows,
+    get_students_with_name,
+    restore_student_rows,
+)
+from services import image_service, image_variant_service, storage_service, student_folder_service
+from services.operation_log_service import log_student_operation
+from utils.error_handlers import AppError, NotFoundError
+
+ARCHIVE_PREFIX = 'archive/students/'
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# 学员记录中引用附件的字段
+ATTACHMENT_FIELDS = (
+    'photo_path',
+    'diploma_path',
+    'id_card_front_path',
+    'id_card_back_path',
+    'hukou_residence_path',
+    'hukou_personal_path',
+    'certificate_info_page_path',
+    'certificate_records_page_path',
+    'training_form_path',
+)
+# 归档库中可直接检索的列（其余字段只保存在 record_json 中）
+_SUMMARY_COLUMNS = ('id', 'name', 'id_card', 'phone', 'company', 'training_type', 'status',
+                    'created_at', 'archived_at', 'bundle_key', 'bundle_size', 'file_count')
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def get_age_days():
+    try:
+        return max(0, int(os.getenv('STUDENT_ARCHIVE_AGE_DAYS', '365')))
+    except ValueError:
+        return 365
+
+
+def get_statuses():
+    raw = os.getenv('STUDENT_ARCHIVE_STATUSES', 'exam_passed,rejected')
+    return tuple(s.strip() for s in raw.split(',') if s.strip())
+
+
+def get_archive_db_path():
+    configured = (os.getenv('STUDENT_ARCHIVE_DB', '') or '').strip()
+    if configured:
+        return configured
+    return os.path.join(os.path.dirname(current_app.config['DATABASE']), 'student_archive.db')
+
+
+def _init_archive_db(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_students (
+            id            INTEGER PRIMARY KEY,
+            name          TEXT NOT NULL,
+            id_card       TEXT,
+            phone         TEXT,
+            company       TEXT,
+            training_type TEXT,
+            status        TEXT,
+            created_at    TEXT,
+            archived_at   TEXT NOT NULL,
+            bundle_key    TEXT NOT NULL DEFAULT '',
+            bundle_size   INTEGER NOT NULL DEFAULT 0,
+            file_count    INTEGER NOT NULL DEFAULT 0,
+            record_json   TEXT NOT NULL,
+            related_json  TEXT NOT NULL DEFAULT '{}'
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archived_students_name ON archived_students(name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archived_students_id_card ON archived_students(id_card)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archived_students_archived_at '
+                 'ON archived_students(archived_at DESC)')
+
+
+@contextmanager
+def _archive_db():
+    """归档库连接（正常退出提交，异常回滚）。"""
+    path = get_archive_db_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        if path not in _initialized:
+            with _init_lock:
+                _init_archive_db(conn)
+                _initialized.add(path)
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _is_safe_key(key):
+    parts = key.split('/')
+    return key.startswith('students/') and '..' not in parts and not os.path.isabs(key)
+
+
+def _folder_prefix(student):
+    """学员独占的文件夹前缀；无法计算或与其他学员共用时返回 None。"""
+    prefix = student_folder_service.get_student_folder_prefix(student)
+    if not prefix:
+        return None
+    others = get_students_with_name(student.get('name'), student.get('company'), student['id'])
+    if any(student_folder_service.get_student_folder_prefix(other) == prefix for other in others):
+        return None
+    return prefix
+
+
+def _collect_keys(student, prefix):
+    """待打包的附件 key：引用字段 + 独占文件夹下的文件（不含隐藏的派生文件）。"""
+    keys = [student[field] for field in ATTACHMENT_FIELDS if student.get(field)]
+    if prefix:
+        for item in storage_service.list_dir(prefix, recursive=True)['files']:
+            if not any(part.startswith('.') for part in item['key'].split('/')):
+                keys.append(item['key'])
+    return sorted({key for key in keys if _is_safe_key(key) and not key.endswith('.tmp_upload')})
+
+
+def _write_bundle(path, rows, keys, archived_at):
+    """写压缩包，返回 (已打包的文件清单, 缺失的 key)。"""
+    files, missing = [], []
+    with tarfile.open(path, 'w:gz') as tar:
+        for key in keys:
+            stream = storage_service.open_stream(key)
+            if stream is None:
+                missing.append(key)
+                continue
+            with stream:
+                st = os.fstat(stream.fileno())
+                info = tarfile.TarInfo(key)
+                info.size = st.st_size
+                info.mtime = int(st.st_mtime)
+                tar.addfile(info, stream)
+            files.append({'key': key, 'size': st.st_size})
+        manifest = json.dumps({
+            'student': rows['student'],
+            'related': rows['related'],
+            'files': files,
+            'missing': missing,
+            'archived_at': archived_at,
+        }, ensure_ascii=False, indent=2).encode('utf-8')
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(manifest)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(manifest))
+    return files, missing
+
+
+def _store_bundle(tmp_path, key):
+    """把本地临时压缩包写入存储后端（local/dual 原地落盘，cos 上传；临时文件由调用方清理）。"""
+    if storage_service._get_backend() == 'cos':
+        with open(tmp_path, 'rb') as f:
+            storage_service.save_file(f, key)
+        return
+    final_path = os.path.join(storage_service.get_base_dir(), key)
+    os.replace(tmp_path, final_path)
+    storage_service.save_from_local(final_path, key)
+
+
+def _delete_files(student, prefix):
+    if prefix:
+        return image_service.delete_student_files(student)
+    failed = []
+    for field in ATTACHMENT_FIELDS:
+        key = student.get(field)
+        if key:
+            image_variant_service.delete_variants(key)
+            if not storage_service.delete_file(key):
+                failed.append(key)
+    return {'success': not failed, 'failed_files': failed}
+
+
+def archive_student(student_id):
+    """
+    归档单个学员（需要应用上下文）。
+
+    返回:
+        dict: {'id', 'bundle_key', 'bundle_size', 'file_count', 'missing'}
+
+    异常:
+        NotFoundError: 学员不存在
+        AppError: 状态不是可归档的终态，或打包期间记录被修改
+    """
+    rows = get_student_archive_rows(student_id)
+    if rows is None:
+        raise NotFoundError('学员不存在')
+    student = rows['student']
+    if student.get('status') not in get_statuses():
+        raise AppError('仅已办结或已驳回的学员可以归档', status_code=400)
+
+    prefix = _folder_prefix(student)
+    folder_name = prefix.strip('/').split('/')[-1] if prefix else 'student'
+    bundle_key = f'{ARCHIVE_PREFIX}{student_id}-{folder_name}.tar.gz'
+    archived_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    tmp_path = os.path.join(storage_service.get_base_dir(), bundle_key) + '.tmp_upload'
+    os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+    try:
+        files, missing = _write_bundle(tmp_path, rows, _collect_keys(student, prefix), archived_at)
+        bundle_size = os.path.getsize(tmp_path)
+        # 打包期间记录被修改（管理员编辑、重新上传）时放弃，留待下次归档
+        if get_student_archive_rows(student_id) != rows:
+            raise AppError('学员记录在归档过程中被修改，已放弃本次归档', status_code=409)
+        _store_bundle(tmp_path, bundle_key)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    with _archive_db() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO archived_students '
+            '(id, name, id_card, phone, company, training_type, status, created_at, archived_at, '
+            'bundle_key, bundle_size, file_count, record_json, related_json) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (student_id, student.get('name') or '', student.get('id_card'), student.get('phone'),
+             student.get('company'), student.get('training_type'), student.get('status'),
+             student.get('created_at'), archived_at, bundle_key, bundle_size, len(files),
+             json.dumps(student, ensure_ascii=False), json.dumps(rows['related'], ensure_ascii=False))
+        )
+    # 归档库已落盘，再删除热库记录与附件
+    delete_student(student_id)
+    result = _delete_files(student, prefix)
+    if not result.get('success'):
+        print(f'[archive] 学员 {student_id} 部分附件删除失败: {result.get("failed_files")}')
+
+    log_student_operation(
+        student_id, 'student_archived', '归档',
+        message=f'已归档 {len(files)} 个附件',
+        metadata={'name': student.get('name', ''), 'bundle_key': bundle_key, 'missing': missing},
+    )
+    return {
+        'id': student_id,
+        'bundle_key': bundle_key,
+        'bundle_size': bundle_size,
+        'file_count': len(files),
+        'missing': missing,
+    }
+
+
+def archive_eligible(age_days=None, statuses=None, limit=None, dry_run=False):
+    """
+    批量归档满足条件的学员（需要应用上下文）。
+
+    返回:
+        dict: {'candidates', 'archived', 'failed'（[{'id', 'error'}]）, 'bundle_bytes', 'ids'（dry-run 时）}
+    """
+    age_days = get_age_days() if age_days is None else age_days
+    cutoff = (datetime.now() - timedelta(days=age_days)).strftime('%Y-%m-%d %H:%M:%S')
+    ids = get_archive_candidates(statuses or get_statuses(), cutoff, limit)
+    result = {'candidates': len(ids), 'archived': 0, 'failed': [], 'bundle_bytes': 0}
+    if dry_run:
+        result['ids'] = ids
+        return result
+    for student_id in ids:
+        try:
+            archived = archive_student(student_id)
+        except Exception as e:
+            result['failed'].append({'id': student_id, 'error': str(e)})
+            print(f'[archive] 学员 {student_id} 归档失败: {e}')
+            continue
+        result['archived'] += 1
+        result['bundle_bytes'] += archived['bundle_size']
+    return result
+
+
+def search_archived(search='', company='', page=1, page_size=DEFAULT_PAGE_SIZE):
+    """
+    检索归档学员（需要应用上下文），按归档时间倒序。
+
+    返回:
+        dict: {'rows', 'total', 'page', 'page_size'}
+    """
+    where, params = ['1=1'], []
+    if search:
+        where.append('(name LIKE ? OR id_card LIKE ? OR phone LIKE ?)')
+        params.extend([f'%{search}%'] * 3)
+    if company:
+        where.append('company LIKE ?')
+        params.append(f'%{company}%')
+    page = max(1, int(page or 1))
+    page_size = min(MAX_PAGE_SIZE, max(1, int(page_size or DEFAULT_PAGE_SIZE)))
+    clause = ' AND '.join(where)
+    with _archive_db() as conn:
+        total = conn.execute(f'SELECT COUNT(*) FROM archived_students WHERE {clause}', params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(_SUMMARY_COLUMNS)} FROM archived_students WHERE {clause} "
+            'ORDER BY archived_at DESC, id DESC LIMIT ? OFFSET ?',
+            params + [page_size, (page - 1) * page_size]
+        ).fetchall()
+    return {'rows': [dict(row) for row in rows], 'total': total, 'page': page, 'page_size': page_size}
+
+
+def get_archived(student_id):
+    """读取单个归档学员的完整记录（含 record、related），不存在返回 None。"""
+    with _archive_db() as conn:
+        row = conn.execute('SELECT * FROM archived_students WHERE id = ?', (student_id,)).fetchone()
+    if not row:
+        return None
+    data = dict(row)
+    data['record'] = json.loads(data.pop('record_json'))
+    data['related'] = json.loads(data.pop('related_json') or '{}')
+    return data
+
+
+def restore_student(student_id):
+    """
+    从归档恢复学员（需要应用上下文）：还原附件，按原 ID 写回记录，删除归档记录与压缩包。
+
+    返回:
+        dict: {'id', 'restored_files'}
+
+    异常:
+        NotFoundError: 归档记录或压缩包不存在
+    """
+    archived = get_archived(student_id)
+    if archived is None:
+        raise NotFoundError('归档记录不存在')
+    if get_student_archive_rows(student_id) is not None:
+        raise AppError(f'学员 ID {student_id} 已存在，无法恢复', status_code=409)
+
+    stream = storage_service.open_stream(archived['bundle_key'])
+    if stream is None:
+        raise NotFoundError('归档压缩包不存在')
+    restored = 0
+    with stream, tarfile.open(fileobj=stream, mode='r:gz') as tar:
+        for member in tar:
+            if not member.isfile() or member.name == MANIFEST_NAME or not _is_safe_key(member.name):
+                continue
+            storage_service.save_file(tar.extractfile(member), member.name)
+            restored += 1
+
+    restore_student_rows(archived['record'], archived['related'])
+    with _archive_db() as conn:
+        conn.execute('DELETE FROM archived_students WHERE id = ?', (student_id,))
+    storage_service.delete_file(archived['bundle_key'])
+
+    log_student_operation(
+        student_id, 'student_restored', '恢复归档',
+        message=f'已还原 {restored} 个附件',
+        metadata={'name': archived.get('name', ''), 'bundle_key': archived['bundle_key']},
+    )
+    return {'id': student_id, 'restored_files': restored}
@@ -4,13 +4,32 @@
 当管理员编辑学员的关键字段（training_type、company、name、id_card）时，
 负责将该学员在本地磁盘和 COS 上的所有关联文件迁移到新路径，
 并协调 DB 路径字段的更新和回滚。
+
+迁移引擎：
+    1. 迁移日志：迁移清单与逐文件进度（renamed / copied / deleted）记录在 folder_migrations 表，
+       进程中断后 resume_migrations() 续做（本地阶段按 DB 是否已指向新路径决定前进或回滚）
+    2. 并发复制：COS copy_object 由有界线程池（MIGRATION_COS_THREADS，默认 8）并发执行
+    3. 延迟删除：所有复制成功后才用 delete_objects 批量删除旧 key；复制失败时旧对象完好，
+       回滚只需批量删除已复制出的新 key
+    4. 后台执行：dual 模式且 create_app 已调用 start_service() 时，请求只等待本地 rename，
+       COS 阶段交给后台线程（MIGRATION_BACKGROUND_WORKERS，默认 2）执行并重试
 """
 
 import json
 import os
+import threading
 import time
 import logging
-
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from models.student import (
+    claim_folder_migration,
+    create_folder_migration,
+    get_folder_migration,
+    get_student_by_id,
+    get_unfinished_folder_migrations,
+    update_folder_migration,
+)
 from services.storage_service import (
     get_base_dir,
     list_dir,
@@ -20,9 +39,16 @@ from services.storage_service import (
     _full_cos_key,
 )
 from services.operation_log_service import create_operation_log
+from services.image_variant_service import variant_path_mapping
+from services import folder_index_service
 
 logger = logging.getLogger(__name__)
 
+# 迁移日志写回间隔（秒）、COS 批量删除每批数量、迁移执行租约（秒）
+CHECKPOINT_INTERVAL_SEC = 1.0
+COS_DELETE_BATCH = 1000
+MIGRATION_LEASE_SEC = 600
+
 
 # ======================== 异常类 ========================
 
@@ -140,6 +166,7 @@ def _compute_path_mapping(
 
     包括：
     - DB 中记录的附件路径（photo_path, diploma_path 等）
+    - 上述附件在 .variants/ 下的缩略图/分析图变体与清单
     - 报名材料子目录下的所有文件（通过本地 list_dir 枚举）
 
     对于磁盘上不存在的文件，跳过不报错。
@@ -183,6 +210,10 @@ def _compute_path_mapping(
                 continue
             mapping.append((old_path, new_path))
             seen_old_paths.add(old_path)
+            # 变体文件名由母版文件名派生，随母版一起迁移
+            for old_variant, new_variant in variant_path_mapping(old_path, new_path, get_base_dir()):
+                mapping.append((old_variant, new_variant))
+                seen_old_paths.add(old_variant)
 
     # 3. 枚举报名材料子目录下的文件
     old_material_dir = f"students/{old_dir_name}/{old_prefix}-报名材料/"
@@ -350,167 +381,447 @@ def _db_fields_match_new_paths(
     return True
 
 
+# ======================== 迁移日志 ========================
+
+class _Journal:
+    """迁移日志：逐文件进度（renamed / copied / deleted）由协调线程按间隔写回 folder_migrations。
+
+    登记失败（如数据库不可用）时 migration_id 为 None，迁移照常执行，只是无法续做。
+    """
+
+    def __init__(self, migration_id, items):
+        self.migration_id = migration_id
+        self.items = items
+        self._dirty = False
+        self._flushed_at = time.monotonic()
+
+    @classmethod
+    def create(cls, student_id, backend, path_mapping):
+        items = [{'old': old_key, 'new': new_key} for old_key, new_key in path_mapping]
+        try:
+            migration_id = create_folder_migration(
+                student_id, backend, items, lease_until=time.time() + MIGRATION_LEASE_SEC
+            )
+        except Exception as e:
+            logger.warning(f'登记迁移日志失败（迁移中断后将无法续做）: {e}')
+            migration_id = None
+        return cls(migration_id, items)
+
+    def mark(self, item, flag):
+        item[flag] = True
+        self._dirty = True
+        if time.monotonic() - self._flushed_at >= CHECKPOINT_INTERVAL_SEC:
+            self.flush()
+
+    def flush(self, phase=None, last_error=None, failed_attempt=False, release=False):
+        if self.migration_id is None:
+            return
+        if not (self._dirty or phase or last_error is not None or failed_attempt or release):
+            return
+        try:
+            update_folder_migration(
+                self.migration_id,
+                phase=phase,
+                items=self.items if self._dirty or phase else None,
+                last_error=last_error,
+                failed_attempt=failed_attempt,
+                release=release,
+            )
+            self._dirty = False
+            self._flushed_at = time.monotonic()
+        except Exception as e:
+            logger.warning(f'写入迁移日志失败 id={self.migration_id}: {e}')
+
+
 # ======================== 迁移执行 ========================
 
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def _is_missing(error):
+    return 'NoSuchKey' in str(error) or '404' in str(error)
+
+
+def _run_concurrently(func, items, threads, on_done=None):
+    """有界线程池并发执行 func(item)。
+
+    on_done(item, error) 在调用线程中逐项回调（便于协调线程写迁移日志）。
+
+    返回:
+        list of (item, error): 失败的项
+    """
+    failures = []
+
+    def finish(item, error):
+        if error is not None:
+            failures.append((item, error))
+        if on_done is not None:
+            on_done(item, error)
+
+    if threads <= 1 or len(items) <= 1:
+        for item in items:
+            try:
+                func(item)
+                finish(item, None)
+            except Exception as e:
+                finish(item, e)
+        return failures
+
+    with ThreadPoolExecutor(max_workers=min(threads, len(items)), thread_name_prefix='folder-migrate') as executor:
+        futures = {executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            finish(futures[future], future.exception())
+    return failures
+
+
+def _cos_copy(client, config, old_key, new_key, base_dir):
+    """COS 服务端复制 old_key -> new_key。
+
+    源对象不存在时：本地有新文件（dual 模式发件箱尚未推送）则直接上传；
+    新对象已存在（中断前已复制并删除了源对象）视为完成；否则抛出原异常。
+    """
+    bucket = config['bucket']
+    new_cos_key = _full_cos_key(new_key, config)
+    try:
+        client.copy_object(
+            Bucket=bucket,
+            Key=new_cos_key,
+            CopySource={
+                'Bucket': bucket,
+                'Key': _full_cos_key(old_key, config),
+                'Region': config['region'],
+            },
+        )
+    except Exception as e:
+        if not _is_missing(e):
+            raise
+        new_abs_path = os.path.join(base_dir, new_key)
+        if os.path.isfile(new_abs_path):
+            from services import cos_sync_service
+            cos_sync_service.upload_file(new_abs_path, new_key)
+            return
+        try:
+            client.head_object(Bucket=bucket, Key=new_cos_key)
+        except Exception:
+            raise e
+    logger.info(f'COS复制: {old_key} -> {new_key}')
+
+
+def _cos_batch_delete(client, config, keys):
+    """按每批 COS_DELETE_BATCH 个调用 delete_objects 删除 keys，返回删除失败的 key 集合。"""
+    failed = set()
+    for start in range(0, len(keys), COS_DELETE_BATCH):
+        batch = keys[start:start + COS_DELETE_BATCH]
+        try:
+            resp = client.delete_objects(
+                Bucket=config['bucket'],
+                Delete={'Object': [{'Key': _full_cos_key(key, config)} for key in batch], 'Quiet': 'true'},
+            ) or {}
+        except Exception as e:
+            logger.warning(f'COS批量删除失败 ({len(batch)} 个): {e}')
+            failed.update(batch)
+            continue
+        full_to_key = {_full_cos_key(key, config): key for key in batch}
+        for err in resp.get('Error', []) or []:
+            failed.add(full_to_key.get(err.get('Key'), err.get('Key')))
+            logger.warning(f"COS删除失败 Key={err.get('Key')}: {err.get('Message')}")
+    return failed
+
+
+def _run_local_phase(journal, base_dir):
+    """本地 rename（按日志跳过已完成的项；中断前已移动的文件直接标记完成）。"""
+    for item in journal.items:
+        if item.get('renamed'):
+            continue
+        old_abs_path = os.path.join(base_dir, item['old'])
+        new_abs_path = os.path.join(base_dir, item['new'])
+        if not os.path.exists(old_abs_path) and os.path.exists(new_abs_path):
+            journal.mark(item, 'renamed')
+            continue
+        os.renames(old_abs_path, new_abs_path)
+        folder_index_service.mark_changed(item['old'], item['new'])
+        journal.mark(item, 'renamed')
+        logger.info(f'本地迁移: {item["old"]} -> {item["new"]}')
+    journal.flush()
+
+
+def _run_cos_phase(journal, base_dir):
+    """COS 阶段：有界线程池并发复制全部文件，全部成功后再批量删除旧 key。
+
+    复制未全部成功时不删除任何旧对象（旧 key 保持完整，可安全回滚或续做）。
+
+    异常:
+        RuntimeError: 有文件复制失败或旧 key 删除失败
+    """
+    client, config = _get_cos_client()
+    threads = _env_int('MIGRATION_COS_THREADS', 8)
+
+    def copied(item, error):
+        if error is None:
+            journal.mark(item, 'copied')
+
+    pending = [item for item in journal.items if not item.get('copied')]
+    failures = _run_concurrently(
+        lambda item: _cos_copy(client, config, item['old'], item['new'], base_dir),
+        pending,
+        threads,
+        on_done=copied,
+    )
+    journal.flush()
+    if failures:
+        item, error = failures[0]
+        raise RuntimeError(f'{len(failures)} 个文件复制失败，如 {item["old"]}: {error}')
+
+    to_delete = [item for item in journal.items if not item.get('deleted')]
+    failed_keys = _cos_batch_delete(client, config, [item['old'] for item in to_delete])
+    for item in to_delete:
+        if item['old'] not in failed_keys:
+            journal.mark(item, 'deleted')
+    journal.flush()
+    if failed_keys:
+        raise RuntimeError(f'{len(failed_keys)} 个旧 key 删除失败，如 {sorted(failed_keys)[0]}')
+    logger.info(f'COS迁移完成: 复制 {len(pending)} 个，删除旧 key {len(to_delete)} 个')
+
+
 def _execute_migration(
     path_mapping: list[tuple[str, str]],
-) -> None:
+    student_id=None,
+    defer_cos: bool = False,
+) -> dict:
     """执行实际的文件迁移操作。
 
     按顺序：
-    1. 本地 rename（如果 backend 包含 local）
-    2. COS copy+delete（如果 backend 包含 cos）
+    1. 登记迁移日志（folder_migrations），逐文件进度随执行写回，进程中断后由 resume_migrations 续做
+    2. 本地 rename（如果 backend 包含 local）
+    3. COS 阶段（如果 backend 包含 cos）：有界线程池并发 copy，全部成功后批量 delete 旧 key
 
-    每步操作成功后记录到 completed_ops 列表，任一步骤失败时
-    调用 _rollback(completed_ops) 后抛出 MigrationError。
+    defer_cos=True（dual 模式且后台服务已启动）时，COS 阶段交给后台线程执行，
+    本函数在本地阶段完成后即返回，请求不再等待 COS。
+
+    本地阶段或同步执行的复制阶段失败时调用 _rollback 后抛出 MigrationError；
+    复制全部成功后的旧 key 删除失败不回滚（新 key 已完整），留在迁移日志中由续做补删。
 
     参数:
         path_mapping: (old_relative_path, new_relative_path) 元组列表
+        student_id: 学员 ID（用于中断后判断 DB 是否已指向新路径）
+        defer_cos: 是否把 COS 阶段交给后台线程
+
+    返回:
+        dict: {'migration_id': int 或 None, 'cos': 'skipped' | 'done' | 'deferred' | 'pending_delete'}
 
     异常:
         MigrationError: 迁移失败且回滚完成后抛出
     """
-    backend = os.environ.get('STORAGE_BACKEND', 'dual').strip().lower()
-    completed_ops: list[dict] = []
+    backend = _get_backend()
+    base_dir = get_base_dir()
+    journal = _Journal.create(student_id, backend, path_mapping)
+    cos_enabled = backend in ('cos', 'dual')
 
     try:
         # 1. 本地 rename（如果 backend 包含 local）
         if backend in ('local', 'dual'):
-            base_dir = get_base_dir()
-            for old_key, new_key in path_mapping:
-                old_abs_path = os.path.join(base_dir, old_key)
-                new_abs_path = os.path.join(base_dir, new_key)
-                os.renames(old_abs_path, new_abs_path)
-                completed_ops.append({
-                    'type': 'local_rename',
-                    'old_key': old_key,
-                    'new_key': new_key,
-                })
-                logger.info(f'本地迁移: {old_key} -> {new_key}')
-
-        # 2. COS copy+delete（如果 backend 包含 cos）
-        if backend in ('cos', 'dual'):
-            client, config = _get_cos_client()
-            bucket = config['bucket']
-            region = config['region']
-
-            for old_key, new_key in path_mapping:
-                old_cos_key = _full_cos_key(old_key, config)
-                new_cos_key = _full_cos_key(new_key, config)
-
-                # 2a. copy_object: 复制到新 key
-                client.copy_object(
-                    Bucket=bucket,
-                    Key=new_cos_key,
-                    CopySource={
-                        'Bucket': bucket,
-                        'Key': old_cos_key,
-                        'Region': region,
-                    },
-                )
-                completed_ops.append({
-                    'type': 'cos_copy',
-                    'old_key': old_key,
-                    'new_key': new_key,
-                })
-                logger.info(f'COS复制: {old_key} -> {new_key}')
-
-                # 2b. delete_object: 删除旧 key
-                client.delete_object(Bucket=bucket, Key=old_cos_key)
-                completed_ops.append({
-                    'type': 'cos_delete',
-                    'old_key': old_key,
-                    'new_key': new_key,
-                })
-                logger.info(f'COS删除旧key: {old_key}')
+            _run_local_phase(journal, base_dir)
+        if not cos_enabled:
+            journal.flush(phase='done', release=True)
+            return {'migration_id': journal.migration_id, 'cos': 'skipped'}
+
+        # 2. COS 阶段：后台执行或在请求内并发执行
+        if defer_cos and journal.migration_id is not None:
+            journal.flush(phase='cos', release=True)
+            _submit_cos_phase(journal.migration_id)
+            return {'migration_id': journal.migration_id, 'cos': 'deferred'}
+        journal.flush(phase='cos')
+        _run_cos_phase(journal, base_dir)
 
     except Exception as e:
-        logger.error(f'迁移失败: {e}，开始回滚已完成的 {len(completed_ops)} 个操作')
-        _rollback(completed_ops)
+        if cos_enabled and journal.items and all(item.get('copied') for item in journal.items):
+            # 复制已全部完成，只有旧 key 删除失败：新路径完整，不回滚
+            logger.warning(f'迁移旧 key 清理未完成，稍后续做: {e}')
+            journal.flush(last_error=str(e), failed_attempt=True, release=True)
+            return {'migration_id': journal.migration_id, 'cos': 'pending_delete'}
+
+        done = sum(1 for item in journal.items if item.get('renamed') or item.get('copied'))
+        logger.error(f'迁移失败: {e}，开始回滚已完成的 {done} 个文件')
+        try:
+            _rollback(journal.items)
+        except MigrationRollbackError:
+            journal.flush(phase='rollback_failed', last_error=str(e), release=True)
+            raise
+        journal.flush(phase='rolled_back', last_error=str(e), release=True)
         raise MigrationError(f'文件迁移失败: {e}') from e
 
+    journal.flush(phase='done', release=True)
+    return {'migration_id': journal.migration_id, 'cos': 'done'}
+
 
 # ======================== 回滚逻辑 ========================
 
-def _rollback(completed_ops: list[dict]) -> None:
-    """逆序回滚已完成的操作。
+def _rollback(items: list[dict]) -> None:
+    """回滚迁移日志中已完成的操作。
 
-    遍历 completed_ops（逆序），对每个操作执行反向操作：
-    - local_rename：将文件从 new_key 移回 old_key
-    - cos_copy：删除新 key（copy 的逆操作）
-    - cos_delete：从新 key copy 回旧 key（delete 的逆操作）
+    复制阶段失败时旧 key 尚未删除，回滚只需：
+    - copied：批量删除已复制出的新 key
+    - renamed：逆序将本地文件从 new_key 移回 old_key
 
     如果所有回滚操作均成功，正常返回。
     如果任一回滚操作失败，收集失败信息后抛出 MigrationRollbackError。
 
     参数:
-        completed_ops: 已完成的操作列表，每个元素格式:
-            {'type': 'local_rename'|'cos_copy'|'cos_delete',
-             'old_key': str, 'new_key': str}
+        items: 迁移日志中的逐文件记录，格式:
+            {'old': str, 'new': str, 'renamed': bool, 'copied': bool, 'deleted': bool}
 
     异常:
         MigrationRollbackError: 回滚过程中有操作失败时抛出
     """
     failed_rollbacks: list[dict] = []
-    base_dir = get_base_dir()
-
-    for op in reversed(completed_ops):
-        op_type = op['type']
-        old_key = op['old_key']
-        new_key = op['new_key']
 
+    copied = [item for item in items if item.get('copied') and not item.get('deleted')]
+    if copied:
         try:
-            if op_type == 'local_rename':
-                # 将文件从 new 移回 old
-                new_abs_path = os.path.join(base_dir, new_key)
-                old_abs_path = os.path.join(base_dir, old_key)
-                os.renames(new_abs_path, old_abs_path)
-                logger.info(f'回滚 local_rename: {new_key} -> {old_key}')
-
-            elif op_type == 'cos_copy':
-                # copy 的逆操作：删除新 key
-                client, config = _get_cos_client()
-                full_new_key = _full_cos_key(new_key, config)
-                client.delete_object(
-                    Bucket=config['bucket'],
-                    Key=full_new_key,
-                )
-                logger.info(f'回滚 cos_copy: 删除 {new_key}')
-
-            elif op_type == 'cos_delete':
-                # delete 的逆操作：从新 key copy 回旧 key
-                client, config = _get_cos_client()
-                full_new_key = _full_cos_key(new_key, config)
-                full_old_key = _full_cos_key(old_key, config)
-                client.copy_object(
-                    Bucket=config['bucket'],
-                    Key=full_old_key,
-                    CopySource={
-                        'Bucket': config['bucket'],
-                        'Key': full_new_key,
-                        'Region': config['region'],
-                    },
-                )
-                logger.info(f'回滚 cos_delete: 从 {new_key} 复制回 {old_key}')
-
+            client, config = _get_cos_client()
+            failed_keys = _cos_batch_delete(client, config, [item['new'] for item in copied])
+        except Exception as e:
+            failed_keys = {item['new'] for item in copied}
+            logger.error(f'回滚 COS 复制失败: {e}')
+        for item in copied:
+            if item['new'] in failed_keys:
+                failed_rollbacks.append({'op': dict(item, type='cos_copy'), 'error': 'COS 删除新 key 失败'})
             else:
-                logger.warning(f'回滚跳过未知操作类型: {op_type}')
+                item['copied'] = False
+        logger.info(f'回滚 cos_copy: 删除 {len(copied) - len(failed_keys)} 个新 key')
 
+    base_dir = get_base_dir()
+    for item in reversed(items):
+        if not item.get('renamed'):
+            continue
+        try:
+            os.renames(os.path.join(base_dir, item['new']), os.path.join(base_dir, item['old']))
+            folder_index_service.mark_changed(item['old'], item['new'])
+            item['renamed'] = False
+            logger.info(f'回滚 local_rename: {item["new"]} -> {item["old"]}')
         except Exception as e:
-            logger.error(f'回滚失败 [{op_type}] old={old_key} new={new_key}: {e}')
-            failed_rollbacks.append({
-                'op': op,
-                'error': str(e),
-            })
+            logger.error(f'回滚失败 [local_rename] old={item["old"]} new={item["new"]}: {e}')
+            failed_rollbacks.append({'op': dict(item, type='local_rename'), 'error': str(e)})
 
     if failed_rollbacks:
         raise MigrationRollbackError(
             f'迁移回滚部分失败，{len(failed_rollbacks)} 个操作未能恢复，需人工介入',
-            completed_ops,
+            items,
             failed_rollbacks,
         )
 
 
+# ======================== 后台 COS 阶段与续做 ========================
+
+_executor = None
+_app = None
+_executor_lock = threading.Lock()
+
+
+def start_service(app):
+    """启动后台迁移线程（由 create_app 调用）并续做上次中断的迁移。
+
+    dual 模式下启动后，关键字段修改只等待本地 rename，COS 阶段由后台线程完成。
+    """
+    global _executor, _app
+    with _executor_lock:
+        if _executor is None:
+            _app = app
+            _executor = ThreadPoolExecutor(
+                max_workers=_env_int('MIGRATION_BACKGROUND_WORKERS', 2),
+                thread_name_prefix='folder-migration',
+            )
+    _executor.submit(resume_migrations, app)
+    return _executor
+
+
+def _submit_cos_phase(migration_id):
+    _executor.submit(_run_deferred_cos_phase, _app, migration_id)
+
+
+def _run_deferred_cos_phase(app, migration_id, max_attempts=3):
+    """后台执行一次迁移的 COS 阶段，失败按退避重试；仍失败则保留在迁移日志中待下次续做。"""
+    with app.app_context():
+        for attempt in range(1, max_attempts + 1):
+            if not claim_folder_migration(migration_id, time.time(), MIGRATION_LEASE_SEC):
+                return
+            record = get_folder_migration(migration_id)
+            if not record or record['phase'] != 'cos':
+                return
+            journal = _Journal(migration_id, record['items'])
+            try:
+                _run_cos_phase(journal, get_base_dir())
+                journal.flush(phase='done', release=True)
+                return
+            except Exception as e:
+                logger.warning(f'后台 COS 迁移失败 id={migration_id} 第 {attempt} 次: {e}')
+                journal.flush(last_error=str(e), failed_attempt=True, release=True)
+            time.sleep(min(60, 5 * attempt))
+
+
+def _resume_local_phase(record):
+    """续做中断在本地阶段的迁移：DB 已指向新路径则继续移动，否则把已移动的文件移回。"""
+    journal = _Journal(record['id'], record['items'])
+    new_keys = {item['new'] for item in journal.items}
+    try:
+        student = get_student_by_id(record['student_id']) if record['student_id'] else {}
+    except Exception:
+        student = {}
+    roll_forward = any((student.get(field) or '') in new_keys for field in _PATH_FIELDS)
+
+    base_dir = get_base_dir()
+    if roll_forward:
+        _run_local_phase(journal, base_dir)
+        journal.flush(phase='cos' if record['backend'] in ('cos', 'dual') else 'done')
+        return 'forward'
+
+    for item in journal.items:
+        # 中断时日志可能尚未写入最新进度，以磁盘实际状态为准
+        item['renamed'] = (
+            os.path.exists(os.path.join(base_dir, item['new']))
+            and not os.path.exists(os.path.join(base_dir, item['old']))
+        )
+    _rollback(journal.items)
+    journal.flush(phase='rolled_back', release=True)
+    return 'rolled_back'
+
+
+def resume_migrations(app=None):
+    """续做所有未完成的迁移（local 阶段按 DB 判断前进或回滚，cos 阶段补做复制与删除）。
+
+    返回:
+        dict: {'resumed', 'rolled_back', 'failed'}
+    """
+    if app is not None:
+        with app.app_context():
+            return resume_migrations()
+
+    result = {'resumed': 0, 'rolled_back': 0, 'failed': 0}
+    for record in get_unfinished_folder_migrations():
+        if not claim_folder_migration(record['id'], time.time(), MIGRATION_LEASE_SEC):
+            continue
+        journal = _Journal(record['id'], record['items'])
+        try:
+            if record['phase'] == 'local' and _resume_local_phase(record) == 'rolled_back':
+                result['rolled_back'] += 1
+                continue
+            record = get_folder_migration(record['id'])
+            journal = _Journal(record['id'], record['items'])
+            if record['phase'] == 'cos':
+                _run_cos_phase(journal, get_base_dir())
+            journal.flush(phase='done', release=True)
+            result['resumed'] += 1
+        except Exception as e:
+            logger.warning(f'续做迁移失败 id={record["id"]}: {e}')
+            journal.flush(last_error=str(e), failed_attempt=True, release=True)
+            result['failed'] += 1
+    return result
+
+
 # ======================== 主入口函数 ========================
 
 
@@ -581,8 +892,10 @@ def migrate_student_files(
         return {}
 
     # 4. 执行迁移（失败时内部会回滚并抛出 MigrationError）
+    #    dual 模式且后台服务已启动时，COS 阶段在后台完成，请求只等待本地 rename
+    defer_cos = _get_backend() == 'dual' and _executor is not None
     try:
-        _execute_migration(path_mapping)
+        migration = _execute_migration(path_mapping, student_id=student_id, defer_cos=defer_cos)
     except MigrationError as e:
         # 迁移失败且已回滚 - 记录失败审计日志
         elapsed_ms = int((time.time() - start_time) * 1000)
@@ -640,7 +953,7 @@ def migrate_student_files(
     logger.info(
         f'文件迁移完成: {len(path_mapping)} 个文件, '
         f'耗时 {elapsed_ms}ms, '
-        f'DB 字段更新 {len(db_updates)} 个'
+        f'DB 字段更新 {len(db_updates)} 个, COS 阶段: {migration["cos"]}'
     )
 
     # 7. 记录成功审计日志
@@ -672,6 +985,8 @@ def migrate_student_files(
                 'file_count': len(path_mapping),
                 'elapsed_ms': elapsed_ms,
                 'changed_fields': changed_fields,
+                'migration_id': migration['migration_id'],
+                'cos_phase': migration['cos'],
             },
         )
     except Exception as log_err:
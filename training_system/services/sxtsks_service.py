@@ -1245,8 +1245,10 @@ class SxtsksClient:
             if output_dir:
                 os.makedirs(output_dir, exist_ok=True)
                 form_path = os.path.join(output_dir, filename)
-                with open(form_path, 'wb') as f:
-                    f.write(content)
+                from services import blob_store_service
+                with blob_store_service.atomic_output(form_path) as tmp_path:
+                    with open(tmp_path, 'wb') as f:
+                        f.write(content)
                 result['form_path'] = form_path
                 self._log_step('保存申请表', 'ok', form_path)
 
@@ -0,0 +1,305 @@
+"""
+按需缩略图服务（/thumbs/<size>/<path>）。
+
+审核页和文件浏览原先直接加载附件原图（经 serve_students 本地发送或重定向到 COS），
+一屏几十个学员就要下载数百 MB。本模块按需生成缩小后的 JPEG / WebP：
+
+    1. 尺寸档位：只允许 THUMB_SIZES 中的固定档位，避免任意尺寸把缓存撑爆
+    2. 源图选择：档位不超过上传变体尺寸时优先从 .variants/ 下的缩略图/分析图变体缩放
+       （见 image_variant_service），否则读取母版；JPEG 按 DCT 缩放解码
+    3. 内容寻址磁盘缓存：缓存文件名 = SHA-256(源图内容哈希 + 档位 + 格式 + 版本)，
+       源图内容不变则缓存永远有效；按总字节数做 LRU 淘汰（命中时刷新 mtime）
+    4. 强 ETag：即缓存文件名（内容摘要），浏览器带 If-None-Match 时直接 304
+
+源图内容哈希按 (路径, mtime, 大小) 在进程内记忆，本地存在的源图不必每次重新读取整文件。
+cos-only 模式下源图不在本地，每次未命中记忆时从 COS 读取后计算。
+
+环境变量:
+    THUMB_CACHE_DIR   缓存目录（默认 database/thumb_cache）
+    THUMB_CACHE_MB    缓存上限（默认 512MB）
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+from services import image_variant_service, storage_service
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+THUMB_SIZES = {'s': 160, 'm': 320, 'l': 640, 'xl': 1280}
+THUMB_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', '.jpg'),
+    'webp': ('WEBP', 'image/webp', '.webp'),
+}
+THUMB_QUALITY = 80
+# 生成算法变化时递增，使旧缓存自然失效
+THUMB_VERSION = 1
+THUMB_BATCH_MAX = 100
+SOURCE_DIGEST_MEMO_MAX = 4096
+
+
+def resolve_size(token):
+    """将尺寸档位（名称或像素值）解析为长边像素，不支持的档位返回 None。"""
+    token = str(token or '').strip().lower()
+    if token in THUMB_SIZES:
+        return THUMB_SIZES[token]
+    if token.isdigit() and int(token) in THUMB_SIZES.values():
+        return int(token)
+    return None
+
+
+def resolve_format(requested='', accept=''):
+    """
+    选择输出格式：显式指定优先，否则浏览器声明支持 WebP 时用 WebP，其余用 JPEG。
+    """
+    requested = str(requested or '').strip().lower()
+    if requested in ('jpg', 'jpeg'):
+        return 'jpeg'
+    if requested == 'webp':
+        return 'webp'
+    return 'webp' if 'image/webp' in str(accept or '') else 'jpeg'
+
+
+# ======================== 磁盘缓存 ========================
+
+class ThumbnailCache:
+    """
+    内容寻址的缩略图磁盘缓存，按总字节数 LRU 淘汰。
+
+    文件布局: <root>/<digest[:2]>/<digest><ext>
+    LRU 顺序以文件 mtime 表示（命中时 touch），进程重启后扫描目录即可恢复。
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._entries = None
+        self.size_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def path_for(self, digest, ext):
+        return os.path.join(self.root, digest[:2], f'{digest}{ext}')
+
+    def _ensure_loaded(self):
+        if self._entries is not None:
+            return
+        found = []
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if filename.endswith('.tmp'):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((st.st_mtime, path, st.st_size))
+        found.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in found)
+        self.size_bytes = sum(self._entries.values())
+
+    def get(self, digest, ext):
+        """命中返回缓存文件路径并刷新 LRU 位置，未命中返回 None。"""
+        path = self.path_for(digest, ext)
+        with self._lock:
+            self._ensure_loaded()
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                # 已被其他进程淘汰
+                self.size_bytes -= self._entries.pop(path, 0)
+                self.stats['misses'] += 1
+                return None
+            if path not in self._entries:
+                # 其他 worker 进程写入的缓存文件，纳入本进程的记账
+                self._entries[path] = size
+                self.size_bytes += size
+            self._entries.move_to_end(path)
+            self.stats['hits'] += 1
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return path
+
+    def put(self, digest, ext, data):
+        """原子写入缓存文件并按需淘汰最久未用的条目，返回缓存文件路径。"""
+        path = self.path_for(digest, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._ensure_loaded()
+            self.size_bytes -= self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self.size_bytes += len(data)
+            self._evict_locked(keep=path)
+        return path
+
+    def _evict_locked(self, keep=None):
+        while self.size_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = next(iter(self._entries.items()))
+            if path == keep:
+                break
+            self._entries.pop(path)
+            self.size_bytes -= size
+            self.stats['evictions'] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def snapshot(self):
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self.stats, entries=len(self._entries), size_bytes=self.size_bytes,
+                        max_bytes=self.max_bytes)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """返回进程内共享的缩略图缓存（懒加载）。"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                root = os.environ.get('THUMB_CACHE_DIR', '').strip() or \
+                    os.path.join(PROJECT_DIR, 'database', 'thumb_cache')
+                max_mb = int(os.environ.get('THUMB_CACHE_MB', '512'))
+                _cache = ThumbnailCache(root, max_mb * 1024 * 1024)
+    return _cache
+
+
+# ======================== 源图与生成 ========================
+
+_source_digests = OrderedDict()
+_source_digest_lock = threading.Lock()
+
+
+def _pick_source_key(key, max_side):
+    """档位不超过已有变体尺寸时用变体作为源图，减少解码量。"""
+    if max_side <= image_variant_service.THUMB_MAX_SIDE:
+        candidate = image_variant_service.variant_key(key, 'thumb')
+        if storage_service.file_exists_local(candidate):
+            return candidate
+    if max_side <= image_variant_service.ANALYSIS_VARIANT_MAX_SIDE:
+        candidate = image_variant_service.variant_key(key, 'analysis')
+        if storage_service.file_exists_local(candidate):
+            return candidate
+    return key
+
+
+def _load_source(key):
+    """
+    返回 (content_digest, data)；data 为 None 表示命中记忆、尚未读取内容。
+    源图不存在时返回 (None, None)。
+    """
+    abs_path = storage_service.local_abs_path(key)
+    try:
+        st = os.stat(abs_path)
+        identity = (abs_path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        identity = None
+
+    if identity is not None:
+        with _source_digest_lock:
+            digest = _source_digests.get(identity)
+            if digest:
+                _source_digests.move_to_end(identity)
+                return digest, None
+
+    data = storage_service.read_bytes(key)
+    if data is None:
+        return None, None
+    digest = hashlib.sha256(data).hexdigest()
+    if identity is not None:
+        with _source_digest_lock:
+            _source_digests[identity] = digest
+            while len(_source_digests) > SOURCE_DIGEST_MEMO_MAX:
+                _source_digests.popitem(last=False)
+    return digest, data
+
+
+def render_thumbnail(data, max_side, fmt='jpeg'):
+    """将图片字节缩放到长边不超过 max_side，编码为指定格式后返回字节。"""
+    pil_format = THUMB_FORMATS[fmt][0]
+    img = Image.open(io.BytesIO(data))
+    if img.format == 'JPEG':
+        img.draft('RGB', (max_side, max_side))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+
+    buf = io.BytesIO()
+    if pil_format == 'JPEG':
+        image_variant_service.flatten_to_rgb(img).save(
+            buf, format='JPEG', quality=THUMB_QUALITY, optimize=True, progressive=True,
+        )
+    else:
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        img.save(buf, format='WEBP', quality=THUMB_QUALITY, method=4)
+    return buf.getvalue()
+
+
+def thumbnail_digest(source_digest, max_side, fmt):
+    """缩略图的内容寻址摘要（同时作为强 ETag）。"""
+    token = f'{source_digest}:{max_side}:{fmt}:{THUMB_VERSION}'
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def get_thumbnail(key, max_side, fmt='jpeg'):
+    """
+    获取缩略图（必要时生成并写入缓存）。
+
+    参数:
+        key: 原图存储 key，如 'students/xxx/yyy.jpg'
+        max_side: 长边像素（应为 THUMB_SIZES 中的档位）
+        fmt: 'jpeg' 或 'webp'
+
+    返回:
+        dict 或 None: {'path', 'etag', 'mimetype'}；源图不存在或无法解码时返回 None
+    """
+    if not key or image_variant_service.is_variant_key(key) or fmt not in THUMB_FORMATS:
+        return None
+    _, mimetype, ext = THUMB_FORMATS[fmt]
+
+    source_key = _pick_source_key(key, max_side)
+    source_digest, data = _load_source(source_key)
+    if source_digest is None:
+        return None
+
+    digest = thumbnail_digest(source_digest, max_side, fmt)
+    cache = get_cache()
+    path = cache.get(digest, ext)
+    if path is None:
+        if data is None:
+            data = storage_service.read_bytes(source_key)
+            if data is None:
+                return None
+        try:
+            payload = render_thumbnail(data, max_side, fmt)
+        except Exception as e:
+            print(f'[thumbnail] 生成缩略图失败 {key}: {e}')
+            return None
+        path = cache.put(digest, ext, payload)
+    return {'path': path, 'etag': digest[:32], 'mimetype': mimetype}
+
+
+def get_thumbnails(keys, max_side, fmt='jpeg'):
+    """批量获取缩略图，返回 {key: 结果或 None}（最多 THUMB_BATCH_MAX 个）。"""
+    results = {}
+    for key in list(keys)[:THUMB_BATCH_MAX]:
+        results[key] = get_thumbnail(key, max_side, fmt)
+    return results
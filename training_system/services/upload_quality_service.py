@@ -0,0 +1,188 @@
+"""
+上传图片质量快速检查。
+
+模糊、反光、拍不全的手机照片原先会直接通过上传，直到管理员运行完整的裁剪生成流程后才被发现并驳回，
+既浪费一次生成，也要学员重新提交。本模块在上传时对缩小后的副本做几项轻量检查（几十毫秒内）：
+
+    1. 分辨率：按原图短边判断，过小的图片无法打印清晰
+    2. 模糊：拉普拉斯方差（在固定长边 ANALYSIS_SIDE 的灰度图上计算，不同尺寸原图可比）
+    3. 反光：高光截断像素占比（灰度 >= HIGHLIGHT_LEVEL），仅对证件类附件判定
+    4. 证件存在：边缘轮廓中最大外接矩形的面积占比，以及是否贴边（可能没拍全），仅对证件类附件判定
+
+结论为 pass / warn / fail，只作为提示返回给上传方，不拦截保存（最终仍由管理员审核）。
+阈值为经验值，集中定义在 QUALITY_PROFILES 中。
+"""
+import io
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+ANALYSIS_SIDE = 1024
+PRESENCE_SIDE = 512
+HIGHLIGHT_LEVEL = 250
+
+QUALITY_PROFILES = {
+    'photo': {
+        'min_short_side_fail': 240,
+        'min_short_side_warn': 400,
+        'blur_fail': 15.0,
+        'blur_warn': 40.0,
+        'check_document': False,
+    },
+    'document': {
+        'min_short_side_fail': 600,
+        'min_short_side_warn': 1000,
+        'blur_fail': 25.0,
+        'blur_warn': 60.0,
+        'glare_warn': 0.08,
+        'glare_fail': 0.35,
+        'document_min_area': 0.15,
+        'check_document': True,
+    },
+}
+
+VERDICT_ORDER = {'pass': 0, 'warn': 1, 'fail': 2}
+
+
+def _profile_for(file_type):
+    return QUALITY_PROFILES['photo'] if file_type == 'photo' else QUALITY_PROFILES['document']
+
+
+def _to_gray(img, max_side):
+    # 先按整数倍 reduce（块平均，开销很小），再缩放到目标尺寸
+    factor = max(1, max(img.size) // max_side)
+    work = img.reduce(factor) if factor > 1 else img
+    work = work.convert('L')
+    if max(work.size) > max_side:
+        work.thumbnail((max_side, max_side), Image.BILINEAR)
+    return np.asarray(work, dtype=np.uint8)
+
+
+def measure_sharpness(gray):
+    """拉普拉斯方差，越小越模糊。"""
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def measure_glare(gray):
+    """高光截断像素占比。"""
+    return float(np.count_nonzero(gray >= HIGHLIGHT_LEVEL)) / float(gray.size)
+
+
+def measure_document_presence(gray):
+    """
+    快速检测画面中是否有证件：返回 (面积占比, 贴边数)。
+
+    在 PRESENCE_SIDE 尺寸上做 Canny + 膨胀，取最大外部轮廓的最小外接矩形。
+    """
+    h, w = gray.shape[:2]
+    scale = PRESENCE_SIDE / float(max(h, w))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        h, w = gray.shape[:2]
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), dtype=np.uint8), iterations=2)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return 0.0, 0
+
+    largest = max(contours, key=cv2.contourArea)
+    (_, _), (rw, rh), _ = cv2.minAreaRect(largest)
+    area_ratio = min(1.0, float(rw * rh) / float(w * h))
+    x, y, bw, bh = cv2.boundingRect(largest)
+    margin = 2
+    touches = sum((
+        x <= margin,
+        y <= margin,
+        x + bw >= w - margin,
+        y + bh >= h - margin,
+    ))
+    return area_ratio, int(touches)
+
+
+def assess_image(img, file_type, original_size=None):
+    """
+    对已解码（已转正）的图片做质量检查。
+
+    参数:
+        img: PIL.Image
+        file_type: 附件类型（photo / diploma / id_card_front 等）
+        original_size: 原图尺寸 (宽, 高)；img 为缩小后的母版时传入，默认取 img.size
+
+    返回:
+        dict: {'verdict', 'scores', 'issues', 'elapsed_ms'}
+    """
+    started = time.perf_counter()
+    profile = _profile_for(file_type)
+    width, height = original_size or img.size
+    short_side = min(width, height)
+    gray = _to_gray(img, ANALYSIS_SIDE)
+
+    issues = []
+
+    def flag(code, level, message):
+        issues.append({'code': code, 'level': level, 'message': message})
+
+    scores = {
+        'width': int(width),
+        'height': int(height),
+        'sharpness': round(measure_sharpness(gray), 2),
+        'glare_ratio': round(measure_glare(gray), 4),
+    }
+
+    if short_side < profile['min_short_side_fail']:
+        flag('low_resolution', 'fail', f'图片分辨率过低（{width}×{height}），请使用原图或重新拍摄')
+    elif short_side < profile['min_short_side_warn']:
+        flag('low_resolution', 'warn', f'图片分辨率偏低（{width}×{height}），打印可能不清晰')
+
+    if scores['sharpness'] < profile['blur_fail']:
+        flag('blurry', 'fail', '图片模糊，请对焦后重新拍摄')
+    elif scores['sharpness'] < profile['blur_warn']:
+        flag('blurry', 'warn', '图片略有模糊，建议重新拍摄')
+
+    if profile['check_document']:
+        if scores['glare_ratio'] >= profile['glare_fail']:
+            flag('glare', 'fail', '图片反光或过曝严重，请避开灯光重新拍摄')
+        elif scores['glare_ratio'] >= profile['glare_warn']:
+            flag('glare', 'warn', '图片存在反光，请确认文字清晰可辨')
+
+        area_ratio, touches = measure_document_presence(gray)
+        scores['document_area_ratio'] = round(area_ratio, 4)
+        scores['document_border_touches'] = touches
+        if area_ratio < profile['document_min_area']:
+            flag('no_document', 'warn', '未检测到完整证件，请将证件置于画面中央拍摄')
+        elif touches >= 2:
+            flag('cut_off', 'warn', '证件可能未拍全，请确保四边完整入镜')
+
+    verdict = 'pass'
+    for issue in issues:
+        if VERDICT_ORDER[issue['level']] > VERDICT_ORDER[verdict]:
+            verdict = issue['level']
+
+    return {
+        'verdict': verdict,
+        'scores': scores,
+        'issues': issues,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def assess_image_bytes(data, file_type):
+    """
+    解码图片字节并做质量检查；非图片或无法解码时返回 None。
+
+    JPEG 按 DCT 缩放解码到接近 ANALYSIS_SIDE，避免解出全尺寸像素。
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        width, height = img.size
+        # 5-8 为含 90° 旋转的 EXIF 方向值，原图尺寸按转正后的方向给出
+        if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            width, height = height, width
+        if img.format == 'JPEG':
+            img.draft('RGB', (ANALYSIS_SIDE, ANALYSIS_SIDE))
+        img = ImageOps.exif_transpose(img)
+    except Exception:
+        return None
+    return assess_image(img, file_type, original_size=(width, height))
@@ -0,0 +1,145 @@
+"""
+流式 ZIP 打包。
+
+附件包、报名材料包原先先在 io.BytesIO 中用 ZIP_DEFLATED 生成完整压缩包再发送：
+所有附件同时驻留内存，而且对 JPEG 重复压缩几乎没有收益。本模块边读文件边输出 ZIP 数据块：
+
+    1. 流式输出：每个文件按 CHUNK_SIZE 分块读取、分块输出，单次下载的内存占用与文件数量、大小无关，
+       首字节在读到第一个文件时即可发出
+    2. 数据描述符：本地文件头中的 CRC 和大小置 0（通用标志位 3），在文件数据之后的
+       数据描述符中写入实际 CRC、压缩后大小和原始大小，因此无需预先读取文件
+    3. 压缩方式：JPEG/PNG/PDF/Office 等本身已压缩的格式使用 STORED，其余使用 DEFLATE
+    4. 数据来源：通过 storage_service.open_stream 读取，cos-only 模式下直接转发 COS 响应流；
+       无法打开的文件在写入文件头之前跳过，不会产生损坏的条目
+
+文件名按 UTF-8 编码（通用标志位 11），中文文件名在主流解压工具中可正确显示。
+不支持 ZIP64，单个文件和整个压缩包需小于 4GB（附件和材料远小于该限制）。
+"""
+import os
+import struct
+import time
+import zlib
+from urllib.parse import quote
+
+from services import storage_service
+
+CHUNK_SIZE = 64 * 1024
+DEFLATE_LEVEL = 6
+
+# 本身已压缩的格式，再次 DEFLATE 只浪费 CPU
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.pdf', '.zip', '.docx', '.xlsx', '.pptx', '.mp4',
+}
+
+_FLAG_DATA_DESCRIPTOR = 0x0008
+_FLAG_UTF8 = 0x0800
+_METHOD_STORED = 0
+_METHOD_DEFLATED = 8
+_VERSION = 20
+_EXTERNAL_ATTR = 0o100644 << 16
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def compression_method(arcname):
+    ext = os.path.splitext(arcname)[1].lower()
+    return _METHOD_STORED if ext in STORED_EXTENSIONS else _METHOD_DEFLATED
+
+
+def stream_zip(entries, open_func=None, chunk_size=CHUNK_SIZE):
+    """
+    逐块生成 ZIP 文件内容。
+
+    参数:
+        entries: [(source, arcname)]，source 交给 open_func 打开（默认为存储 key）
+        open_func: source -> 文件对象或 None，默认 storage_service.open_stream
+        chunk_size: 单次读取字节数
+
+    返回:
+        生成器，依次产出 bytes 数据块
+    """
+    open_func = open_func or storage_service.open_stream
+    offset = 0
+    central = []
+    dos_time, dos_date = _dos_datetime(time.time())
+
+    for source, arcname in entries:
+        try:
+            stream = open_func(source)
+        except Exception as e:
+            storage_service._log_warning(f'打包时打开文件失败 {source}: {e}')
+            stream = None
+        if stream is None:
+            continue
+
+        name = arcname.replace('\\', '/').encode('utf-8')
+        method = compression_method(arcname)
+        flags = _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8
+        header_offset = offset
+
+        header = struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, _VERSION, flags, method, dos_time, dos_date,
+            0, 0, 0, len(name), 0,
+        ) + name
+        yield header
+        offset += len(header)
+
+        crc = 0
+        raw_size = 0
+        compressed_size = 0
+        compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15) if method == _METHOD_DEFLATED else None
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                raw_size += len(chunk)
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                    if not chunk:
+                        continue
+                compressed_size += len(chunk)
+                yield chunk
+        finally:
+            stream.close()
+        if compressor is not None:
+            tail = compressor.flush()
+            compressed_size += len(tail)
+            if tail:
+                yield tail
+        offset += compressed_size
+
+        descriptor = struct.pack('<IIII', 0x08074b50, crc, compressed_size, raw_size)
+        yield descriptor
+        offset += len(descriptor)
+
+        central.append(struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, _VERSION, _VERSION, flags, method, dos_time, dos_date,
+            crc, compressed_size, raw_size, len(name), 0, 0, 0, 0, _EXTERNAL_ATTR, header_offset,
+        ) + name)
+
+    directory = b''.join(central)
+    yield directory
+    yield struct.pack(
+        '<IHHHHIIH', 0x06054b50, 0, 0, len(central), len(central), len(directory), offset, 0,
+    )
+
+
+def attachment_headers(filename):
+    """
+    构造下载响应头；中文文件名按 RFC 5987 编码，并附带 ASCII 兜底文件名。
+    """
+    fallback = filename.encode('ascii', 'ignore').decode('ascii').strip() or 'download.zip'
+    return {
+        'Content-Disposition': f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}",
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+    }
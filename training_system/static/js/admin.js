@@ -78,6 +78,74 @@ function toFileUrl(relativePath) {
     return '/' + relativePath;
 }
 
+/**
+ * 将相对存储路径转换为缩略图 URL。
+ * 缩略图由服务端 /thumbs/<size>/<path> 按需生成并缓存（见 thumbnail_service），
+ * 无法生成时由 setThumbSrc 回退到原图。
+ *
+ * @param {string} relativePath - 数据库中的相对路径，如 'students/xxx/yyy.jpg'
+ * @param {string} [size='m'] - 尺寸档位（s/m/l/xl）
+ * @returns {string} 缩略图 URL
+ */
+function toThumbUrl(relativePath, size = 'm') {
+    if (!relativePath) return '';
+    return `/thumbs/${size}/${relativePath.replace(/^\/?students\//, '')}`;
+}
+
+/**
+ * 为小图预览设置缩略图地址，缩略图不存在时自动回退为原图。
+ *
+ * @param {HTMLImageElement} img - 预览图元素
+ * @param {string} relativePath - 数据库中的相对路径
+ * @param {number|string} ts - 缓存时间戳
+ * @param {string} [size='m'] - 尺寸档位
+ */
+function setThumbSrc(img, relativePath, ts, size = 'm') {
+    const fallback = toFileUrl(relativePath) + '?t=' + ts;
+    img.onerror = function () {
+        img.onerror = null;
+        img.src = fallback;
+    };
+    img.src = toThumbUrl(relativePath, size) + '?t=' + ts;
+}
+
+/** 单次批量请求的缩略图数量上限（与 thumbnail_service.THUMB_BATCH_MAX 一致） */
+const THUMB_BATCH_MAX = 100;
+
+/**
+ * 通过 POST /api/thumbs/batch 一次取回多张缩略图（内联 data URI），减少逐张请求的往返。
+ * 接口失败或某张无法生成时回退为 setThumbSrc 单张加载。
+ *
+ * @param {Array<{img: HTMLImageElement, path: string, ts: (number|string)}>} entries - 预览图元素与相对路径
+ * @param {string} [size='m'] - 尺寸档位
+ */
+async function setThumbSrcBatch(entries, size = 'm') {
+    for (let start = 0; start < entries.length; start += THUMB_BATCH_MAX) {
+        const chunk = entries.slice(start, start + THUMB_BATCH_MAX);
+        let items = {};
+        try {
+            const res = await fetch('/api/thumbs/batch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ paths: chunk.map(entry => entry.path), size })
+            });
+            if (res.ok) {
+                items = (await res.json()).items || {};
+            }
+        } catch (e) {
+            console.warn('批量加载缩略图失败，改为逐张加载', e);
+        }
+        chunk.forEach(({ img, path, ts }) => {
+            const item = items[path];
+            if (item && item.data) {
+                img.src = item.data;
+            } else {
+                setThumbSrc(img, path, ts, size);
+            }
+        });
+    }
+}
+
 // ======================== 图片灯箱预览 ========================
 /**
  * 在页面内弹出图片预览层（灯箱）。
@@ -1767,6 +1835,7 @@ document.addEventListener('DOMContentLoaded', async () => {
         let idCardGroup = null;
         let hukouGroup = null;
 
+        const attachmentThumbs = [];
         attachments.forEach(attachment => {
             const existingPath = student[attachment.dbKey] || '';
             const wrapper = document.createElement('div');
@@ -1844,8 +1913,8 @@ document.addEventListener('DOMContentLoaded', async () => {
             img.style.height = '100%';
             img.style.objectFit = 'cover';
             if (existingPath) {
-                // 用页面加载时的固定时间戳，同一会话内浏览器可缓存，刷新页面后时间戳变更则强制重下
-                img.src = toFileUrl(existingPath) + '?t=' + PAGE_LOAD_TS;
+                // 所有附件的缩略图在循环结束后一次批量请求；回退逐张加载时用页面加载时的固定时间戳
+                attachmentThumbs.push({ img, path: existingPath, ts: PAGE_LOAD_TS });
             }
 
             const input = document.createElement('input');
@@ -1982,6 +2051,7 @@ document.addEventListener('DOMContentLoaded', async () => {
                 filesContainer.appendChild(wrapper);
             }
         });
+        setThumbSrcBatch(attachmentThumbs);
 
 
         // 体检表（带下载/重新生成）和报名申请表卡片，稍后追加到报名材料行
@@ -2227,6 +2297,7 @@ document.addEventListener('DOMContentLoaded', async () => {
                                 materialsSection.style.display = 'block';
                             }
                             materialsContainer.innerHTML = '';
+                            const materialThumbs = [];
                             filteredMaterials.forEach(mat => {
                                 const wrapper = document.createElement('div');
                                 wrapper.style.display = 'flex';
@@ -2249,7 +2320,10 @@ document.addEventListener('DOMContentLoaded', async () => {
                                 } else {
                                     const version = mat.version || mat.mtime || '';
                                     const imgUrl = toFileUrl(mat.url) + (version ? ('?v=' + encodeURIComponent(version)) : '');
-                                    imgBox.innerHTML = `<img src="${imgUrl}" style="width:100%;height:100%;object-fit:cover;">`;
+                                    const thumbImg = document.createElement('img');
+                                    thumbImg.style.cssText = 'width:100%;height:100%;object-fit:cover;';
+                                    materialThumbs.push({ img: thumbImg, path: mat.url, ts: encodeURIComponent(version) });
+                                    imgBox.appendChild(thumbImg);
                                     imgBox.onclick = () => showImagePreview(imgUrl, mat.name.replace(/^[^-]+-[^-]+-/, ''));
                                 }
 
@@ -2284,6 +2358,7 @@ document.addEventListener('DOMContentLoaded', async () => {
 
                                 materialsContainer.appendChild(wrapper);
                             });
+                            setThumbSrcBatch(materialThumbs, 's');
                         } else {
                             // 没有报名材料文件
                             materialsContainer.innerHTML = '';
@@ -2674,7 +2749,7 @@ document.addEventListener('DOMContentLoaded', async () => {
 
             // 上传成功后，将小图从 base64 切换为带时间戳的正式 URL（避免浏览器缓存旧图）
             if (previewImg && result.path) {
-                previewImg.src = toFileUrl(result.path) + '?t=' + Date.now();
+                setThumbSrc(previewImg, result.path, Date.now());
             }
         } catch (e) {
             console.error('Upload error:', e);
@@ -0,0 +1,451 @@
+"""
+证件裁剪流水线基准与精度回归套件。
+
+调整 CROP_PROFILES 或 material_service 中的检测器时，需要同时知道速度和精度有没有变化。
+本模块合成带已知角点的身份证 / 户口本页 / 学历证书照片（覆盖不同背景、倾斜、光照和分辨率），
+逐个跑完整的自动裁剪流程，记录：
+
+    - 分阶段耗时：decode（JPEG 解码）、enhancement（分析图缩放 + 弱光增强 + 表格线抑制）、
+      edges（边缘检测）、candidates（轮廓提取 + 候选框构建与评分）、output（裁剪、导出增强与 JPEG 编码）
+    - 检测结果与真实角点的 IoU
+
+结果可以写成基线 JSON（默认 tests/crop_benchmark_baseline.json），之后与基线比较：
+精度下降超过容差即判定为回归；耗时与机器相关，只有显式指定 --max-slowdown 时才参与判定。
+
+用法（在 training_system 目录下）:
+    python -m tests.crop_benchmark                          # 运行 standard 套件并打印报告
+    python -m tests.crop_benchmark --suite quick            # 快速套件（单元测试使用的子集）
+    python -m tests.crop_benchmark --write-baseline         # 重新生成基线
+    python -m tests.crop_benchmark --compare                # 与基线比较，有回归时退出码为 1
+    python -m tests.crop_benchmark --compare --max-slowdown 1.5 --output result.json
+
+合成数据完全由 case id 决定（固定随机种子），只依赖 numpy 与 OpenCV，可在普通 CPU 机器上运行。
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import material_service  # noqa: E402
+
+BASELINE_PATH = os.path.join(TEST_DIR, "crop_benchmark_baseline.json")
+STAGES = ("decode", "enhancement", "edges", "candidates", "output")
+
+PROFILES = ("id_card", "hukou", "diploma")
+BACKGROUNDS = ("dark_desk", "wood", "light_desk", "pattern")
+SKEWS = ("flat", "rotated", "perspective")
+LIGHTINGS = ("normal", "low_light", "uneven")
+RESOLUTIONS = (1600, 3000, 4000)
+
+# 单个样例 IoU 允许的下降幅度 / 单个证件类型平均 IoU 允许的下降幅度
+DEFAULT_CASE_IOU_TOLERANCE = 0.05
+DEFAULT_MEAN_IOU_TOLERANCE = 0.02
+
+# 证件在画面中所占面积比例范围（与 CROP_PROFILES 的 preferred_area_ratio 大致对应）
+DOCUMENT_AREA_RANGES = {
+    "id_card": (0.20, 0.42),
+    "hukou": (0.45, 0.68),
+    "diploma": (0.50, 0.72),
+}
+
+
+# ======================== 样例定义 ========================
+
+def build_cases(suite="standard"):
+    """
+    生成样例列表。
+
+    standard: 证件类型 × 背景 × 倾斜 × 光照 全组合，分辨率轮换（108 个）
+    quick   : 每个 证件类型 × 背景 取 standard 中第一个 1600 分辨率样例（12 个，单元测试使用）
+    full    : 在 standard 基础上每个组合覆盖全部分辨率（324 个）
+    """
+    cases = []
+    index = 0
+    for profile in PROFILES:
+        for background in BACKGROUNDS:
+            for skew in SKEWS:
+                for lighting in LIGHTINGS:
+                    resolutions = RESOLUTIONS if suite == "full" else (RESOLUTIONS[index % len(RESOLUTIONS)],)
+                    index += 1
+                    for resolution in resolutions:
+                        cases.append({
+                            "id": f"{profile}-{background}-{skew}-{lighting}-{resolution}",
+                            "profile": profile,
+                            "background": background,
+                            "skew": skew,
+                            "lighting": lighting,
+                            "resolution": resolution,
+                        })
+    if suite == "quick":
+        picked = {}
+        for case in cases:
+            if case["resolution"] == RESOLUTIONS[0]:
+                picked.setdefault((case["profile"], case["background"]), case)
+        cases = list(picked.values())
+    elif suite not in ("standard", "full"):
+        raise ValueError(f"unknown suite: {suite}")
+    return cases
+
+
+# ======================== 合成数据 ========================
+
+def _text_lines(canvas, rng, x0, y0, x1, y1, color, line_height):
+    y = y0
+    while y + line_height <= y1:
+        width = int((x1 - x0) * rng.uniform(0.35, 1.0))
+        cv2.rectangle(canvas, (x0, y), (x0 + width, y + max(2, line_height // 3)), color, -1)
+        y += line_height
+
+
+def render_document(profile, rng):
+    """绘制平铺的证件图像（证件坐标系，四角即为真实角点）。"""
+    if profile == "id_card":
+        width, height = 856, 540
+        doc = np.full((height, width, 3), (236, 228, 214), dtype=np.uint8)
+        cv2.rectangle(doc, (560, 70), (800, 380), (170, 170, 176), -1)
+        cv2.ellipse(doc, (680, 190), (70, 90), 0, 0, 360, (120, 110, 105), -1)
+        _text_lines(doc, rng, 60, 80, 520, 460, (60, 60, 70), 52)
+        cv2.putText(doc, "0123456789X", (60, 500), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (40, 40, 40), 3)
+    elif profile == "hukou":
+        width, height = 1025, 725
+        doc = np.full((height, width, 3), (244, 242, 238), dtype=np.uint8)
+        for y in range(60, height - 40, 58):
+            cv2.line(doc, (40, y), (width - 40, y), (90, 90, 90), 2)
+        for x in (40, 230, 520, 700, width - 40):
+            cv2.line(doc, (x, 60), (x, height - 40 - (height - 100) % 58), (90, 90, 90), 2)
+        for y in range(75, height - 60, 58):
+            _text_lines(doc, rng, 60, y, 210, y + 20, (50, 50, 60), 20)
+            _text_lines(doc, rng, 250, y, 500, y + 20, (50, 50, 60), 20)
+        cv2.circle(doc, (820, 560), 80, (60, 60, 200), 6)
+    else:
+        width, height = 1400, 1000
+        doc = np.full((height, width, 3), (222, 236, 242), dtype=np.uint8)
+        cv2.rectangle(doc, (30, 30), (width - 30, height - 30), (40, 90, 150), 10)
+        cv2.rectangle(doc, (55, 55), (width - 55, height - 55), (40, 90, 150), 3)
+        cv2.rectangle(doc, (450, 120), (950, 190), (60, 60, 60), -1)
+        _text_lines(doc, rng, 160, 280, 1240, 780, (70, 70, 80), 64)
+        cv2.circle(doc, (1080, 820), 90, (50, 50, 190), 8)
+    return doc
+
+
+def _add_noise(image, sigma):
+    """叠加高斯噪声（使用 OpenCV 随机数发生器，种子在 synthesize_case 中设置）。"""
+    noise = np.empty(image.shape, dtype=np.int16)
+    cv2.randn(noise, 0, sigma)
+    return cv2.add(image, noise, dtype=cv2.CV_8U)
+
+
+def _solid(width, height, color):
+    return np.full((height, width, 3), color, dtype=np.uint8)
+
+
+def render_background(kind, width, height, rng):
+    if kind == "dark_desk":
+        return _solid(width, height, (38, 34, 30))
+    if kind == "wood":
+        rows = np.linspace(0, 40 * np.pi, height, dtype=np.float32)[:, None]
+        grain = 18 * np.sin(rows + rng.uniform(0, 6)) + 8 * np.sin(rows * 3.7)
+        column = np.clip(np.array([60, 100, 150], dtype=np.float32) + grain, 0, 255).astype(np.uint8)
+        return np.ascontiguousarray(np.broadcast_to(column[:, None, :], (height, width, 3)))
+    if kind == "light_desk":
+        return _solid(width, height, (196, 198, 200))
+    cell = max(16, min(width, height) // 24)
+    checker = ((np.arange(height)[:, None] // cell + np.arange(width)[None, :] // cell) % 2).astype(np.uint8)
+    return cv2.add(_solid(width, height, (110, 120, 95)), cv2.merge([checker * 22] * 3))
+
+
+def _target_quad(profile, skew, width, height, doc_shape, rng):
+    doc_h, doc_w = doc_shape[:2]
+    low, high = DOCUMENT_AREA_RANGES[profile]
+    area = rng.uniform(low, high) * width * height
+    scale = np.sqrt(area / float(doc_w * doc_h))
+    half_w, half_h = doc_w * scale / 2.0, doc_h * scale / 2.0
+
+    angle = {"flat": rng.uniform(-3, 3), "rotated": rng.uniform(10, 18) * rng.choice([-1, 1]),
+             "perspective": rng.uniform(-6, 6)}[skew]
+    theta = np.deg2rad(angle)
+    rotation = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+    corners = np.array([[-half_w, -half_h], [half_w, -half_h], [half_w, half_h], [-half_w, half_h]])
+    quad = corners @ rotation.T
+    if skew == "perspective":
+        jitter = 0.06 * min(half_w, half_h) * 2
+        quad += rng.uniform(-jitter, jitter, size=(4, 2))
+
+    # 保证证件完整落在画面内，并留出至少 3% 的边距
+    margin = 0.03 * min(width, height)
+    span = quad.max(axis=0) - quad.min(axis=0)
+    fit = min(1.0, (width - 2 * margin) / span[0], (height - 2 * margin) / span[1])
+    quad *= fit
+    low_c = margin - quad.min(axis=0)
+    high_c = np.maximum(low_c, np.array([width, height]) - margin - quad.max(axis=0))
+    center = np.array([rng.uniform(low_c[0], high_c[0]), rng.uniform(low_c[1], high_c[1])])
+    return (quad + center).astype(np.float32)
+
+
+def _apply_lighting(image, lighting, rng):
+    height, width = image.shape[:2]
+    if lighting == "low_light":
+        gain = np.linspace(0.25, 0.42, width, dtype=np.float32)[None, :]
+    elif lighting == "uneven":
+        ys = np.arange(height, dtype=np.float32)[:, None]
+        xs = np.arange(width, dtype=np.float32)[None, :]
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        distance = np.sqrt((xs - cx) ** 2 + (ys - cy) ** 2) / np.float32(np.hypot(width, height))
+        gain = 1.15 - 0.75 * distance
+    else:
+        return image
+    gain = np.ascontiguousarray(np.broadcast_to(gain, (height, width)), dtype=np.float32)
+    return cv2.multiply(image, cv2.merge([gain] * 3), dtype=cv2.CV_8U)
+
+
+def synthesize_case(case):
+    """按样例参数合成照片，返回 (BGR 图像, 真实角点[左上, 右上, 右下, 左下])。"""
+    seed = zlib.crc32(case["id"].encode("utf-8"))
+    rng = np.random.default_rng(seed)
+    cv2.setRNGSeed(seed & 0x7FFFFFFF)
+    doc = render_document(case["profile"], rng)
+    resolution = case["resolution"]
+    width, height = resolution, int(round(resolution * 0.75))
+    if case["profile"] == "hukou" and rng.random() < 0.5:
+        width, height = height, width
+
+    quad = _target_quad(case["profile"], case["skew"], width, height, doc.shape, rng)
+    doc_h, doc_w = doc.shape[:2]
+    source = np.array([[0, 0], [doc_w - 1, 0], [doc_w - 1, doc_h - 1], [0, doc_h - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(source, quad)
+    warped = cv2.warpPerspective(doc, matrix, (width, height), flags=cv2.INTER_LINEAR)
+    mask = cv2.warpPerspective(np.full((doc_h, doc_w), 255, dtype=np.uint8), matrix, (width, height))
+
+    image = render_background(case["background"], width, height, rng)
+    np.copyto(image, warped, where=(mask > 127)[:, :, None])
+    image = _apply_lighting(image, case["lighting"], rng)
+    image = _add_noise(image, 5)
+    image = cv2.GaussianBlur(image, (3, 3), 0)
+    return image, quad
+
+
+# ======================== 评估 ========================
+
+def polygon_iou(predicted, expected):
+    """两个凸四边形的 IoU（任一为空时为 0）。"""
+    if predicted is None or expected is None:
+        return 0.0
+    first = material_service.order_points(np.asarray(predicted, dtype=np.float32))
+    second = material_service.order_points(np.asarray(expected, dtype=np.float32))
+    area_first = abs(cv2.contourArea(first))
+    area_second = abs(cv2.contourArea(second))
+    if area_first <= 0 or area_second <= 0:
+        return 0.0
+    intersection, _ = cv2.intersectConvexConvex(first, second)
+    union = area_first + area_second - intersection
+    return float(intersection / union) if union > 0 else 0.0
+
+
+class StageTimer:
+    """包装 material_service 内部函数，累计各阶段耗时（秒）。"""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.totals[stage] += time.perf_counter() - start
+        return timed
+
+
+def run_case(case, work_dir):
+    image, expected = synthesize_case(case)
+    path = os.path.join(work_dir, f"{case['id']}.jpg")
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+    timer = StageTimer()
+    start = time.perf_counter()
+    decoded = material_service.read_cv_image(path)
+    decode_sec = time.perf_counter() - start
+
+    patches = [
+        patch.object(material_service, name, timer.wrap(stage, getattr(material_service, name)))
+        for name, stage in (
+            ("analyze_document_candidates", "analysis"),
+            ("prepare_analysis_image", "enhancement"),
+            ("suppress_table_lines_for_hukou", "enhancement"),
+            ("detect_edges", "edges"),
+        )
+    ]
+    with contextlib.ExitStack() as stack:
+        for item in patches:
+            stack.enter_context(item)
+        stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        start = time.perf_counter()
+        cropped, meta = material_service.auto_crop_with_profile(decoded, case["profile"], return_meta=True)
+        ok, _ = cv2.imencode(".jpg", cropped, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        pipeline_sec = time.perf_counter() - start
+
+    analysis_sec = timer.totals["analysis"]
+    timings = {
+        "decode": decode_sec,
+        "enhancement": timer.totals["enhancement"],
+        "edges": timer.totals["edges"],
+        "candidates": max(0.0, analysis_sec - timer.totals["enhancement"] - timer.totals["edges"]),
+        "output": max(0.0, pipeline_sec - analysis_sec),
+    }
+    selected = meta.get("selected_candidate") or {}
+    predicted = selected.get("points_orig")
+    return {
+        "id": case["id"],
+        "profile": case["profile"],
+        "detected": predicted is not None,
+        "crop_mode": meta.get("crop_mode"),
+        "iou": round(polygon_iou(predicted, expected), 4),
+        "timings_ms": {stage: round(value * 1000.0, 2) for stage, value in timings.items()},
+    }
+
+
+def _median(values):
+    return float(np.median(values)) if values else 0.0
+
+
+def summarize(results):
+    summary = {}
+    by_profile = defaultdict(list)
+    for result in results:
+        by_profile[result["profile"]].append(result)
+    for profile, items in sorted(by_profile.items()):
+        ious = [item["iou"] for item in items]
+        summary[profile] = {
+            "cases": len(items),
+            "detected_rate": round(sum(item["detected"] for item in items) / float(len(items)), 4),
+            "mean_iou": round(float(np.mean(ious)), 4),
+            "min_iou": round(float(np.min(ious)), 4),
+            "median_timings_ms": {
+                stage: round(_median([item["timings_ms"][stage] for item in items]), 2)
+                for stage in STAGES
+            },
+        }
+    return summary
+
+
+def run_benchmark(suite="standard", cases=None):
+    cases = cases if cases is not None else build_cases(suite)
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = [run_case(case, work_dir) for case in cases]
+    return {
+        "suite": suite,
+        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": {
+            "python": sys.version.split()[0],
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+        },
+        "summary": summarize(results),
+        "cases": {result["id"]: result for result in results},
+    }
+
+
+def compare_to_baseline(report, baseline, case_iou_tolerance=DEFAULT_CASE_IOU_TOLERANCE,
+                        mean_iou_tolerance=DEFAULT_MEAN_IOU_TOLERANCE, max_slowdown=None):
+    """与基线比较，返回回归描述列表（空列表表示没有回归）。只比较双方都有的样例。"""
+    regressions = []
+    baseline_cases = baseline.get("cases", {})
+    for case_id, result in report["cases"].items():
+        expected = baseline_cases.get(case_id)
+        if expected is None:
+            continue
+        if expected["iou"] - result["iou"] > case_iou_tolerance:
+            regressions.append(f"{case_id}: IoU {expected['iou']:.3f} -> {result['iou']:.3f}")
+
+    current_summary = summarize(list(report["cases"].values()))
+    shared = [case_id for case_id in report["cases"] if case_id in baseline_cases]
+    baseline_summary = summarize([baseline_cases[case_id] for case_id in shared])
+    for profile, current in current_summary.items():
+        expected = baseline_summary.get(profile)
+        if expected is None:
+            continue
+        if expected["mean_iou"] - current["mean_iou"] > mean_iou_tolerance:
+            regressions.append(
+                f"{profile}: mean IoU {expected['mean_iou']:.3f} -> {current['mean_iou']:.3f}"
+            )
+        if max_slowdown:
+            for stage in STAGES:
+                before = expected["median_timings_ms"][stage]
+                after = current["median_timings_ms"][stage]
+                if before > 1.0 and after / before > max_slowdown:
+                    regressions.append(
+                        f"{profile}: {stage} median {before:.1f}ms -> {after:.1f}ms (x{after / before:.2f})"
+                    )
+    return regressions
+
+
+def format_report(report):
+    header = f"{'profile':<10}{'cases':>6}{'detect':>8}{'meanIoU':>9}{'minIoU':>8}" + "".join(
+        f"{stage:>13}" for stage in STAGES
+    )
+    lines = [f"suite={report['suite']}  (median ms per stage)", header]
+    for profile, item in report["summary"].items():
+        lines.append(
+            f"{profile:<10}{item['cases']:>6}{item['detected_rate']:>8.2f}{item['mean_iou']:>9.3f}{item['min_iou']:>8.3f}"
+            + "".join(f"{item['median_timings_ms'][stage]:>13.1f}" for stage in STAGES)
+        )
+    return "\n".join(lines)
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="证件裁剪流水线基准与精度回归")
+    parser.add_argument("--suite", choices=("quick", "standard", "full"), default="standard")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线 JSON 路径")
+    parser.add_argument("--write-baseline", action="store_true", help="用本次结果覆盖基线")
+    parser.add_argument("--compare", action="store_true", help="与基线比较，有回归时退出码为 1")
+    parser.add_argument("--max-slowdown", type=float, default=None, help="阶段耗时中位数允许的最大倍数")
+    parser.add_argument("--output", default=None, help="本次结果另存为 JSON")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.suite)
+    print(format_report(report))
+    if args.output:
+        write_report(report, args.output)
+    if args.write_baseline:
+        write_report(report, args.baseline)
+        print(f"baseline written: {args.baseline}")
+    if args.compare:
+        regressions = compare_to_baseline(report, load_baseline(args.baseline), max_slowdown=args.max_slowdown)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("no regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
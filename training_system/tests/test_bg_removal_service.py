@@ -0,0 +1,241 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import bg_removal_service  # noqa: E402
+
+
+class FakeProcessor:
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate
+
+    def factory(self):
+        def process(data, bg_color):
+            if self.gate is not None:
+                self.gate.wait(2)
+            self.calls.append((data, bg_color))
+            return b'out:' + data + bytes(bg_color)
+        return process
+
+
+class ResultCacheTests(unittest.TestCase):
+    def test_evicts_least_recently_used_by_bytes(self):
+        cache = bg_removal_service.ResultCache(max_bytes=10)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        self.assertEqual(cache.get('a'), b'1234')
+        cache.put('c', b'1234')
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'1234')
+        self.assertEqual(cache.size_bytes, 8)
+
+
+class BgRemovalEngineTests(unittest.TestCase):
+    def test_cache_key_includes_background_colour(self):
+        white = bg_removal_service.cache_key(b'photo', (255, 255, 255))
+        blue = bg_removal_service.cache_key(b'photo', (67, 142, 219))
+        self.assertNotEqual(white, blue)
+        self.assertEqual(white, bg_removal_service.cache_key(b'photo', [255, 255, 255]))
+
+    def test_repeated_photo_hits_cache(self):
+        fake = FakeProcessor()
+        engine = bg_removal_service.BgRemovalEngine(fake.factory, cache_bytes=1024, batch_wait_ms=0)
+        try:
+            first = engine.process(b'photo', (255, 255, 255), timeout=2)
+            second = engine.process(b'photo', (255, 255, 255), timeout=2)
+            other = engine.process(b'photo', (0, 0, 255), timeout=2)
+        finally:
+            engine.stop()
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(len(fake.calls), 2)
+        self.assertEqual(engine.stats['hits'], 1)
+
+    def test_concurrent_identical_requests_share_one_inference(self):
+        gate = threading.Event()
+        fake = FakeProcessor(gate)
+        engine = bg_removal_service.BgRemovalEngine(fake.factory, cache_bytes=1024, batch_max=4, batch_wait_ms=50)
+        try:
+            futures = [engine.submit(b'same') for _ in range(3)]
+            futures.append(engine.submit(b'other'))
+            gate.set()
+            results = [future.result(timeout=2) for future in futures]
+        finally:
+            engine.stop()
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[1], results[2])
+        self.assertEqual(len(fake.calls), 2)
+
+    def test_processor_failure_returns_none(self):
+        def factory():
+            def process(data, bg_color):
+                raise RuntimeError('boom')
+            return process
+
+        engine = bg_removal_service.BgRemovalEngine(factory, cache_bytes=1024, batch_wait_ms=0)
+        try:
+            self.assertIsNone(engine.process(b'photo', timeout=2))
+        finally:
+            engine.stop()
+        self.assertEqual(engine.stats['errors'], 1)
+
+    def test_load_failure_is_not_reported_ready(self):
+        def factory():
+            raise RuntimeError('model missing')
+
+        engine = bg_removal_service.BgRemovalEngine(factory, cache_bytes=1024, batch_wait_ms=0).start()
+        try:
+            self.assertFalse(engine.wait_ready(2))
+            self.assertFalse(engine.snapshot()['ready'])
+            self.assertEqual(engine.load_error, 'model missing')
+        finally:
+            engine.stop()
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'requires AF_UNIX')
+class BgRemovalServerTests(unittest.TestCase):
+    def test_client_round_trip_through_socket(self):
+        fake = FakeProcessor()
+        engine = bg_removal_service.BgRemovalEngine(fake.factory, cache_bytes=1024, batch_wait_ms=0)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            socket_path = os.path.join(temp_dir, 'bg.sock')
+            ready = threading.Event()
+            stop = threading.Event()
+            server = threading.Thread(
+                target=bg_removal_service.serve,
+                kwargs={'socket_path': socket_path, 'engine': engine, 'ready_event': ready, 'stop_event': stop},
+                daemon=True,
+            )
+            server.start()
+            self.assertTrue(ready.wait(5))
+            try:
+                self.assertTrue(bg_removal_service.ping(socket_path))
+                # 代码版本不一致的推理进程不视为可用
+                with patch.object(bg_removal_service, 'SERVICE_VERSION', 'other'):
+                    self.assertFalse(bg_removal_service.ping(socket_path))
+                payload = bg_removal_service._request(('remove', b'photo', (255, 255, 255)), socket_path, timeout=5)
+                again = bg_removal_service._request(('remove', b'photo', (255, 255, 255)), socket_path, timeout=5)
+                stats = bg_removal_service._request(('stats',), socket_path, timeout=5)
+            finally:
+                stop.set()
+                server.join(timeout=5)
+
+        self.assertEqual(payload, again)
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_unavailable_service_does_not_load_a_local_model_unless_enabled(self):
+        fake = FakeProcessor()
+        local_engine = bg_removal_service.BgRemovalEngine(fake.factory, cache_bytes=1024, batch_wait_ms=0)
+        try:
+            with patch.object(bg_removal_service, 'is_available', return_value=True), \
+                    patch.object(bg_removal_service, '_service_supported', return_value=True), \
+                    patch.object(bg_removal_service, 'ensure_server', return_value=False) as ensure, \
+                    patch.object(bg_removal_service, 'get_local_engine', return_value=local_engine) as get_local, \
+                    patch.object(bg_removal_service, '_service_retry_after', 0.0):
+                with patch.dict(os.environ, {'BG_REMOVAL_LOCAL_FALLBACK': 'false'}):
+                    self.assertIsNone(bg_removal_service.remove_background(b'photo'))
+                    get_local.assert_not_called()
+                with patch.dict(os.environ, {'BG_REMOVAL_LOCAL_FALLBACK': 'true'}):
+                    result = bg_removal_service.remove_background(b'photo')
+        finally:
+            local_engine.stop()
+
+        self.assertEqual(result, b'out:photo' + bytes((255, 255, 255)))
+        # 等待推理进程完成模型加载，而不是短暂等待后在本进程加载
+        self.assertEqual(ensure.call_args_list[0].kwargs['wait_timeout'], bg_removal_service.BG_REMOVAL_STARTUP_TIMEOUT_SEC)
+        # 第一次失败后进入冷却，冷却期内不再等待推理进程
+        self.assertEqual(ensure.call_count, 1)
+
+    def test_serve_exits_without_listening_when_model_fails_to_load(self):
+        def factory():
+            raise RuntimeError('model missing')
+
+        engine = bg_removal_service.BgRemovalEngine(factory, cache_bytes=1024, batch_wait_ms=0)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            socket_path = os.path.join(temp_dir, 'bg.sock')
+            ready = threading.Event()
+            bg_removal_service.serve(socket_path=socket_path, engine=engine, ready_event=ready)
+
+            self.assertFalse(ready.is_set())
+            self.assertFalse(os.path.exists(socket_path))
+            self.assertFalse(bg_removal_service.ping(socket_path))
+            # 留下失败原因，等待就绪的客户端不必等满启动超时
+            with open(socket_path + '.error', encoding='utf-8') as f:
+                self.assertEqual(f.read(), 'model missing')
+
+    def test_empty_service_reply_returns_none_without_cooldown(self):
+        with patch.object(bg_removal_service, 'is_available', return_value=True), \
+                patch.object(bg_removal_service, '_service_supported', return_value=True), \
+                patch.object(bg_removal_service, 'ensure_server', return_value=True), \
+                patch.object(bg_removal_service, '_request', return_value=None), \
+                patch.object(bg_removal_service, 'get_local_engine') as get_local, \
+                patch.object(bg_removal_service, '_service_retry_after', 0.0), \
+                patch.dict(os.environ, {'BG_REMOVAL_LOCAL_FALLBACK': 'false'}):
+            result = bg_removal_service.remove_background(b'photo')
+            retry_after = bg_removal_service._service_retry_after
+
+        self.assertIsNone(result)
+        get_local.assert_not_called()
+        # 单张照片失败不会让整个推理服务进入冷却
+        self.assertEqual(retry_after, 0.0)
+
+    def test_new_version_retires_older_server(self):
+        def start(socket_path, **kwargs):
+            engine = bg_removal_service.BgRemovalEngine(FakeProcessor().factory, cache_bytes=1024, batch_wait_ms=0)
+            ready = threading.Event()
+            thread = threading.Thread(
+                target=bg_removal_service.serve,
+                kwargs=dict(socket_path=socket_path, engine=engine, ready_event=ready, **kwargs),
+                daemon=True,
+            )
+            thread.start()
+            self.assertTrue(ready.wait(5))
+            return thread
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            old_path = os.path.join(temp_dir, 'bg_removal-000000000000.sock')
+            new_path = os.path.join(temp_dir, f'bg_removal-{bg_removal_service.SERVICE_VERSION}.sock')
+            old_server = start(old_path)
+            stop = threading.Event()
+            new_server = start(new_path, stop_event=stop)
+            try:
+                old_server.join(timeout=5)
+                self.assertFalse(old_server.is_alive())
+                self.assertFalse(os.path.exists(old_path))
+                self.assertTrue(bg_removal_service.ping(new_path))
+            finally:
+                stop.set()
+                new_server.join(timeout=5)
+
+    def test_server_exits_with_its_owner_process(self):
+        owner = subprocess.Popen([sys.executable, '-c', 'pass'])
+        owner.wait()
+        engine = bg_removal_service.BgRemovalEngine(FakeProcessor().factory, cache_bytes=1024, batch_wait_ms=0)
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch.object(bg_removal_service, 'BG_REMOVAL_OWNER_POLL_SEC', 0.05):
+            server = threading.Thread(
+                target=bg_removal_service.serve,
+                kwargs={'socket_path': os.path.join(temp_dir, 'bg.sock'), 'engine': engine, 'owner_pid': owner.pid},
+                daemon=True,
+            )
+            server.start()
+            server.join(timeout=5)
+            self.assertFalse(server.is_alive())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import blob_store_service, cos_sync_service, material_service, storage_service
+
+
+class FakeCosClient:
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise RuntimeError("404 NoSuchKey")
+        data, meta = self.objects[Key]
+        return {"ETag": f'"{hashlib.md5(data).hexdigest()}"', **meta}
+
+    def put_object(self, Bucket, Body, Key, Metadata=None, **kwargs):
+        self.calls.append(("put", Key))
+        self.objects[Key] = (Body if isinstance(Body, bytes) else Body.read(), dict(Metadata or {}))
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.calls.append(("copy", Key))
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+
+class BlobStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = os.path.join(self.tmp.name, "base")
+        self.client = FakeCosClient()
+        self.patchers = [
+            patch.dict(os.environ, {
+                "STORAGE_BACKEND": "local",
+                "BLOB_STORE_DIR": os.path.join(self.base, "blobs"),
+                "BLOB_MIN_BYTES": "16",
+            }),
+            patch.object(storage_service, "get_base_dir", lambda: self.base),
+            patch.object(storage_service, "_get_cos_client", lambda: (self.client, {
+                "bucket": "bucket", "region": "ap-test", "prefix": "",
+            })),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def test_identical_uploads_share_one_blob_and_are_reference_counted(self):
+        data = b"id-card-front" * 100
+        first = "students/特种作业-甲公司-张三/张三-身份证正面.jpg"
+        second = "students/特种设备-乙公司-张三/张三-身份证正面.jpg"
+        storage_service.save_file(data, first)
+        storage_service.save_file(data, second)
+        storage_service.save_file(b"tiny", "students/特种作业-甲公司-张三/a.json")
+
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertTrue(os.path.samefile(
+            storage_service.local_abs_path(first), storage_service.local_abs_path(second)
+        ))
+        self.assertEqual(blob_store_service.ref_count(digest), 2)
+        self.assertEqual(storage_service.read_bytes(second), data)
+        stats = blob_store_service.stats()
+        self.assertEqual((stats["blobs"], stats["saved_bytes"]), (1, len(data)))
+
+        # 覆盖写入不影响共享同一 blob 的其他 key
+        storage_service.save_file(b"replaced-content" * 10, second)
+        self.assertEqual(storage_service.read_bytes(first), data)
+        self.assertEqual(blob_store_service.ref_count(digest), 1)
+
+        storage_service.delete_file(first)
+        self.assertEqual(blob_store_service.ref_count(digest), 0)
+        self.assertEqual(blob_store_service.gc()["blobs_removed"], 1)
+        self.assertFalse(os.path.exists(blob_store_service.blob_path(digest)))
+
+    def test_same_content_is_copied_on_cos_instead_of_uploaded(self):
+        folder = os.path.join(self.base, "students", "张三")
+        os.makedirs(folder)
+        pairs = []
+        for name in ("a.jpg", "b.jpg"):
+            with open(os.path.join(folder, name), "wb") as f:
+                f.write(b"diploma" * 100)
+            pairs.append((os.path.join(folder, name), f"students/张三/{name}"))
+
+        first = cos_sync_service.sync_files(pairs[:1])
+        second = cos_sync_service.sync_files(pairs[1:])
+
+        self.assertEqual((first["uploaded"], second["copied"], second["bytes"]), (1, 1, 0))
+        self.assertEqual(self.client.calls, [("put", "students/张三/a.jpg"), ("copy", "students/张三/b.jpg")])
+
+        # 源对象已不存在时照常上传
+        del self.client.objects["students/张三/a.jpg"]
+        self.client.objects.pop("students/张三/b.jpg")
+        self.assertEqual(cos_sync_service.upload_file(*pairs[1]), "uploaded")
+
+    def test_material_outputs_are_reused_for_identical_inputs(self):
+        source = os.path.join(self.base, "students", "src.jpg")
+        os.makedirs(os.path.dirname(source))
+        with open(source, "wb") as f:
+            f.write(b"source" * 100)
+        calls = []
+
+        def process(input_path, output_dir, name_prefix, logger=None):
+            calls.append(output_dir)
+            os.makedirs(output_dir, exist_ok=True)
+            output_path = os.path.join(output_dir, f"{name_prefix}-学历证书.jpg")
+            with open(output_path, "wb") as f:
+                f.write(b"rendered" * 100)
+            return material_service._build_process_result("diploma", True, output_path=output_path)
+
+        def run(output_dir, name_prefix, params=None):
+            logger = material_service.MaterialGenerationLogger()
+            result = material_service.run_with_output_cache(
+                "diploma", [source], params, output_dir, name_prefix,
+                process, source, output_dir, name_prefix, logger=logger,
+            )
+            return result, logger
+
+        first_dir = os.path.join(self.base, "students", "甲", "out")
+        second_dir = os.path.join(self.base, "students", "乙", "out")
+        run(first_dir, "110-张三")
+        result, logger = run(second_dir, "110-张三")
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(result["output_path"], os.path.join(second_dir, "110-张三-学历证书.jpg"))
+        self.assertTrue(os.path.samefile(result["output_path"], os.path.join(first_dir, "110-张三-学历证书.jpg")))
+        self.assertEqual(logger.events[-1]["step"], "cache_hit")
+
+        # 调整参数不同则重新生成
+        run(second_dir, "110-张三", params={"rotate": 90})
+        self.assertEqual(len(calls), 2)
+
+    def test_regenerating_over_deduped_output_keeps_other_copies(self):
+        students = os.path.join(self.base, "students")
+        form = os.path.join(students, "甲", "110-张三-体检表.docx")
+        first_dir = os.path.join(students, "甲", "110-张三-报名材料")
+        second_dir = os.path.join(students, "乙", "110-张三-报名材料")
+        os.makedirs(first_dir)
+        with open(form, "wb") as f:
+            f.write(b"health-form" * 100)
+        first = material_service.copy_health_form(form, first_dir, "110-张三")["output_path"]
+
+        # 补做去重不处理报名材料输出目录
+        os.makedirs(second_dir)
+        with open(os.path.join(second_dir, "110-张三-体检表.docx"), "wb") as f:
+            f.write(b"health-form" * 100)
+        summary = blob_store_service.ingest_tree(students)
+        self.assertEqual((summary["files"], summary["deduped"]), (1, 0))
+        self.assertFalse(os.path.samefile(form, first))
+
+        # 历史版本已经链接在一起的输出：重新生成时只替换本目录的文件
+        blob_store_service.ingest(first)
+        blob_store_service.ingest(form)
+        second = material_service.copy_health_form(form, second_dir, "110-张三")["output_path"]
+        blob_store_service.ingest(second)
+        self.assertTrue(os.path.samefile(form, second))
+        self.assertTrue(os.path.samefile(form, first))
+
+        # 源文件与输出共享 inode 时不报 SameFileError
+        material_service.copy_health_form(form, second_dir, "110-张三")
+        with open(form, "rb") as f:
+            self.assertEqual(f.read(), b"health-form" * 100)
+
+        with blob_store_service.atomic_output(form) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                f.write(b"new-form" * 100)
+        material_service.copy_health_form(form, second_dir, "110-张三")
+        with open(second, "rb") as f:
+            self.assertEqual(f.read(), b"new-form" * 100)
+        with open(first, "rb") as f:
+            self.assertEqual(f.read(), b"health-form" * 100)
+        self.assertEqual(os.listdir(second_dir), ["110-张三-体检表.docx"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import bulk_op_service
+
+
+def make_items(count, size=100):
+    return [(f"students/{i:03d}.jpg", size, None) for i in range(count)]
+
+
+class BulkRunnerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "bulk_ops.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _checkpoint(self, job="migrate"):
+        checkpoint = bulk_op_service.Checkpoint(self.db_path, job)
+        self.addCleanup(checkpoint.close)
+        return checkpoint
+
+    def test_rerun_skips_completed_keys_and_retries_failures(self):
+        calls = []
+        lock = threading.Lock()
+        broken = {"students/003.jpg"}
+
+        def operation(key, payload):
+            with lock:
+                calls.append(key)
+            if key in broken:
+                raise RuntimeError("timeout")
+            return "skipped" if key == "students/000.jpg" else "done"
+
+        first = bulk_op_service.run_bulk(
+            "migrate", make_items(20), operation, threads=4,
+            checkpoint=self._checkpoint(), progress_sec=0,
+        )
+        self.assertEqual((first["done"], first["skipped"], first["failed"]), (18, 1, 1))
+        self.assertEqual(first["bytes"], 1800)
+        self.assertEqual(first["failed_keys"], ["students/003.jpg"])
+        self.assertEqual(self._checkpoint().failed_keys(), ["students/003.jpg"])
+
+        calls.clear()
+        broken.clear()
+        second = bulk_op_service.run_bulk(
+            "migrate", make_items(20), operation, threads=4,
+            checkpoint=self._checkpoint(), progress_sec=0,
+        )
+        self.assertEqual(calls, ["students/003.jpg"])
+        self.assertEqual((second["already_done"], second["done"], second["failed"]), (19, 1, 0))
+
+        # 其他作业的进度互不影响；reset 后从头执行
+        self.assertEqual(self._checkpoint("fix_headers").completed_keys(), set())
+        self._checkpoint().reset()
+        self.assertEqual(self._checkpoint().summary(), {})
+
+    def test_dry_run_counts_pending_objects_without_calling_operation(self):
+        self._checkpoint().record_many([("students/000.jpg", "done", 100, "")])
+
+        def operation(key, payload):
+            raise AssertionError("dry-run must not call operation")
+
+        report = bulk_op_service.run_bulk(
+            "migrate", make_items(5), operation, checkpoint=self._checkpoint(), dry_run=True,
+        )
+        self.assertEqual((report["seen"], report["already_done"], report["pending"]), (5, 1, 4))
+        self.assertEqual(report["pending_bytes"], 400)
+        self.assertIn("待处理 4 个", bulk_op_service.format_report(report))
+
+    def test_rate_limiter_spaces_operations(self):
+        limiter = bulk_op_service.RateLimiter(50)
+        started = time.monotonic()
+        for _ in range(11):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+
+        unlimited = bulk_op_service.RateLimiter(0)
+        started = time.monotonic()
+        for _ in range(1000):
+            unlimited.acquire()
+        self.assertLess(time.monotonic() - started, 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import cos_cache_service, storage_service
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+
+    def get_raw_stream(self):
+        return io.BytesIO(self.data)
+
+
+class FakeCosClient:
+    def __init__(self):
+        self.objects = {}
+        self.gets = []
+        self.heads = []
+
+    def _etag(self, key):
+        return f'"{hashlib.md5(self.objects[key]).hexdigest()}"'
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise RuntimeError("NoSuchKey")
+        self.gets.append(Key)
+        return {"ETag": self._etag(Key), "Body": FakeBody(self.objects[Key])}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise RuntimeError("404 Not Found")
+        self.heads.append(Key)
+        return {"ETag": self._etag(Key)}
+
+
+class CosReadCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = FakeCosClient()
+        self.cache = cos_cache_service.CosReadCache(os.path.join(self.tmp.name, "cache"), 1024 * 1024, 3600)
+        self.patchers = [
+            patch.dict(os.environ, {"STORAGE_BACKEND": "cos"}),
+            patch.object(storage_service, "_get_cos_client", lambda: (self.client, {
+                "bucket": "bucket", "region": "ap-test", "prefix": "",
+            })),
+            patch.object(storage_service, "get_base_dir", lambda: os.path.join(self.tmp.name, "base")),
+            patch.object(cos_cache_service, "_cache", self.cache),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def test_reads_are_served_from_disk_and_revalidated_by_etag(self):
+        key = "students/张三/a.jpg"
+        self.client.objects[key] = b"v1"
+
+        self.assertEqual(storage_service.read_bytes(key), b"v1")
+        self.assertEqual(storage_service.read_bytes(key), b"v1")
+        self.assertEqual(self.client.gets, [key])
+        self.assertTrue(storage_service.ensure_local(key).endswith(".jpg"))
+
+        self.cache.revalidate_sec = 0
+        self.assertEqual(storage_service.read_bytes(key), b"v1")
+        self.assertEqual((len(self.client.gets), len(self.client.heads)), (1, 1))
+
+        self.client.objects[key] = b"v2"
+        self.assertEqual(storage_service.read_bytes(key), b"v2")
+        self.assertEqual(len(self.client.gets), 2)
+
+        del self.client.objects[key]
+        self.assertIsNone(storage_service.read_bytes(key))
+        self.assertFalse(os.path.exists(self.cache.path_for(key)))
+
+    def test_evicts_least_recently_used_objects_by_bytes(self):
+        self.cache.max_bytes = 10
+        for name in ("a", "b", "c"):
+            self.client.objects[f"students/{name}.jpg"] = b"1234"
+        storage_service.read_bytes("students/a.jpg")
+        storage_service.read_bytes("students/b.jpg")
+        storage_service.read_bytes("students/a.jpg")
+        storage_service.read_bytes("students/c.jpg")
+
+        self.assertTrue(os.path.exists(self.cache.path_for("students/a.jpg")))
+        self.assertFalse(os.path.exists(self.cache.path_for("students/b.jpg")))
+        self.assertEqual(self.cache.snapshot()["size_bytes"], 8)
+        self.assertEqual(self.cache.snapshot()["evictions"], 1)
+
+    def test_caches_sharing_a_directory_share_the_size_limit(self):
+        # 两个实例模拟同一缓存目录上的两个 worker 进程
+        other = cos_cache_service.CosReadCache(self.cache.root, 10, 3600)
+        self.cache.max_bytes = 10
+        for name in ("a", "b", "c"):
+            self.client.objects[f"students/{name}.jpg"] = b"1234"
+        self.cache.fetch("students/a.jpg", self.client, "bucket", "students/a.jpg")
+        other.fetch("students/b.jpg", self.client, "bucket", "students/b.jpg")
+        self.cache.fetch("students/c.jpg", self.client, "bucket", "students/c.jpg")
+
+        self.assertFalse(os.path.exists(self.cache.path_for("students/a.jpg")))
+        self.assertEqual(other.snapshot()["size_bytes"], 8)
+        self.assertEqual(self.cache.snapshot()["entries"], 2)
+
+    def test_entry_evicted_by_another_process_is_downloaded_again(self):
+        key = "students/a.jpg"
+        self.client.objects[key] = b"payload"
+        path = self.cache.fetch(key, self.client, "bucket", key)
+        real_getsize = os.path.getsize
+
+        def evicted_getsize(target):
+            if target == path and not evicted:
+                evicted.append(target)
+                # 模拟另一个进程在 exists 检查之后淘汰了该文件
+                os.remove(target)
+            return real_getsize(target)
+
+        evicted = []
+        with patch.object(cos_cache_service.os.path, "getsize", evicted_getsize):
+            self.assertEqual(self.cache.fetch(key, self.client, "bucket", key), path)
+
+        self.assertEqual(self.client.gets, [key, key])
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"payload")
+
+    def test_read_retries_when_entry_is_evicted_before_open(self):
+        self.client.objects["students/a.jpg"] = b"payload"
+        real_fetch = self.cache.fetch
+        calls = []
+
+        def fetch_then_evict(*args):
+            path = real_fetch(*args)
+            calls.append(path)
+            if len(calls) == 1:
+                # 模拟另一个线程在路径返回后、打开前淘汰了该文件
+                os.remove(path)
+            return path
+
+        with patch.object(self.cache, "fetch", fetch_then_evict):
+            self.assertEqual(storage_service.read_bytes("students/a.jpg"), b"payload")
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.client.gets, ["students/a.jpg", "students/a.jpg"])
+        self.assertEqual(self.cache.stats["reopened"], 1)
+
+    def test_pull_from_cos_streams_to_local_path(self):
+        key = "students/tmp/u1.jpg"
+        self.client.objects[key] = b"x" * 700000
+
+        self.assertTrue(storage_service.pull_from_cos(key))
+        local = storage_service.local_abs_path(key)
+        self.assertEqual(os.path.getsize(local), 700000)
+        self.assertEqual(storage_service.ensure_local(key), local)
+        self.assertFalse(storage_service.pull_from_cos("students/tmp/missing.jpg"))
+
+
+if __name__ == "__main__":
+    unittest.main()
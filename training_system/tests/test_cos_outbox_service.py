@@ -0,0 +1,158 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from app import create_app
+from models import student as student_model
+from services import cos_outbox_service, cos_sync_service, storage_service
+
+
+class FakeCosClient:
+    def __init__(self, fail_puts=0):
+        self.objects = {}
+        self.calls = []
+        self.fail_puts = fail_puts
+
+    def put_object(self, Bucket, Body, Key, **kwargs):
+        if self.fail_puts:
+            self.fail_puts -= 1
+            raise RuntimeError("connection reset")
+        self.calls.append(("put", Key))
+        self.objects[Key] = Body if isinstance(Body, bytes) else Body.read()
+
+    def copy_object(self, Bucket, Key, CopySource):
+        if CopySource["Key"] not in self.objects:
+            raise RuntimeError("NoSuchKey")
+        self.calls.append(("copy", Key))
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+    def delete_object(self, Bucket, Key):
+        self.calls.append(("delete", Key))
+        self.objects.pop(Key, None)
+
+    def list_objects(self, Bucket, Prefix="", **kwargs):
+        contents = [
+            {"Key": key, "Size": len(data), "LastModified": ""}
+            for key, data in sorted(self.objects.items())
+            if key.startswith(Prefix)
+        ]
+        return {"Contents": contents, "IsTruncated": "false"}
+
+
+class CosOutboxTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "students.db")
+        self.client = FakeCosClient()
+        self.patchers = [
+            patch.dict(os.environ, {
+                "TRAINING_SYSTEM_ENV_FILE": os.path.join(self.tmp.name, ".env"),
+                "STORAGE_BACKEND": "dual",
+            }),
+            patch.object(storage_service, "_get_cos_client", lambda: (self.client, {
+                "bucket": "bucket", "region": "ap-test", "prefix": "",
+            })),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        student_model.init_db(self.db_path)
+        self.app = create_app()
+        self.app.config.update(TESTING=True, DATABASE=self.db_path, BASE_DIR=self.tmp.name)
+        self.worker = cos_outbox_service.CosOutboxWorker(self.app, threads=2, max_attempts=2)
+        self.patchers.append(patch.object(cos_outbox_service, "_worker", self.worker))
+        self.patchers[-1].start()
+
+    def tearDown(self):
+        self.worker.stop()
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def test_uploads_are_deferred_and_superseded_writes_are_merged(self):
+        with self.app.app_context():
+            storage_service.save_file(b"tmp", "students/tmp/a.jpg")
+            storage_service.move_temp_file("students/tmp/a.jpg", "students/张三/a.jpg")
+            storage_service.save_file(b"v2", "students/张三/b.jpg")
+            storage_service.save_file(b"v3", "students/张三/b.jpg")
+            self.assertEqual(self.client.calls, [])
+            self.assertEqual(cos_outbox_service.get_metrics()["pending"], 3)
+
+        self.worker.drain()
+
+        self.assertEqual(sorted(self.client.calls), sorted([
+            ("delete", "students/tmp/a.jpg"),
+            ("put", "students/张三/a.jpg"),
+            ("put", "students/张三/b.jpg"),
+        ]))
+        self.assertEqual(self.client.objects["students/张三/b.jpg"], b"v3")
+        with self.app.app_context():
+            self.assertEqual(cos_outbox_service.get_metrics()["pending"], 0)
+
+    def test_operations_on_same_key_run_in_order(self):
+        with self.app.app_context():
+            first = student_model.enqueue_cos_op("put", "students/a.jpg")
+            claimed = student_model.claim_cos_ops(time.time(), 10, 60)
+            student_model.enqueue_cos_op("delete", "students/a.jpg")
+            student_model.enqueue_cos_op("delete_prefix", "students/")
+
+            self.assertEqual([op["id"] for op in claimed], [first])
+            self.assertEqual(student_model.claim_cos_ops(time.time(), 10, 60), [])
+            student_model.complete_cos_op(first)
+            # 待执行的 delete 已被前缀删除取代
+            self.assertEqual([op["op"] for op in student_model.claim_cos_ops(time.time(), 10, 60)], ["delete_prefix"])
+
+    def test_failed_uploads_are_kept_and_reconciled(self):
+        self.client.fail_puts = 2
+        local_only = os.path.join(self.tmp.name, "students", "张三", "d.jpg")
+        with self.app.app_context():
+            storage_service.save_file(b"data", "students/张三/c.jpg")
+        with open(local_only, "wb") as f:
+            f.write(b"local-only")
+
+        self.worker.drain()
+        with self.app.app_context():
+            with student_model.get_db_connection() as conn:
+                conn.execute("UPDATE cos_outbox SET next_attempt_at = 0")
+        self.worker.drain()
+
+        with self.app.app_context():
+            metrics = cos_outbox_service.get_metrics()
+            self.assertEqual(metrics["failed"], 1)
+            self.assertIn("connection reset", metrics["recent_failures"][0]["last_error"])
+
+            result = cos_outbox_service.reconcile("students/")
+            self.assertEqual(result["requeued_failed"], 1)
+            self.assertEqual(result["missing"], 2)
+        self.worker.drain()
+
+        self.assertEqual(self.client.objects["students/张三/c.jpg"], b"data")
+        self.assertEqual(self.client.objects["students/张三/d.jpg"], b"local-only")
+
+    def test_relay_process_records_generated_outputs_for_the_web_worker(self):
+        output = os.path.join(self.tmp.name, "students", "张三", "110-张三-报名材料", "a.jpg")
+        os.makedirs(os.path.dirname(output))
+        with open(output, "wb") as f:
+            f.write(b"generated")
+
+        # 模拟图像处理子进程：没有发件箱线程，只登记
+        with patch.object(cos_outbox_service, "_worker", None), patch.object(cos_outbox_service, "_relay", False):
+            with self.app.app_context():
+                self.assertTrue(cos_outbox_service.enable_relay())
+                report = cos_sync_service.sync_files([(output, "students/张三/110-张三-报名材料/a.jpg")])
+        self.assertEqual(report["queued"], 1)
+        self.assertEqual(self.client.calls, [])
+
+        self.worker.drain()
+        self.assertEqual(self.client.objects["students/张三/110-张三-报名材料/a.jpg"], b"generated")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import cos_sync_service, material_service, storage_service
+
+
+class FakeCosClient:
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _record(self, name, key):
+        with self.lock:
+            self.calls.append((name, key))
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise RuntimeError("404 NoSuchKey")
+        data, meta = self.objects[Key]
+        return {"ETag": f'"{hashlib.md5(data).hexdigest()}"', **meta}
+
+    def put_object(self, Bucket, Body, Key, Metadata=None, **kwargs):
+        if isinstance(Body, (bytes, bytearray)):
+            raise AssertionError("body should be streamed from a file object")
+        self._record("put", Key)
+        self.objects[Key] = (Body.read(), dict(Metadata or {}))
+
+    def upload_file(self, Bucket, Key, LocalFilePath, PartSize, MAXThread, Metadata=None, **kwargs):
+        self._record("multipart", Key)
+        with open(LocalFilePath, "rb") as f:
+            # 分块上传的 ETag 不是内容 MD5，依赖 x-cos-meta-md5 判断
+            self.objects[Key] = (f.read(), dict(Metadata or {}))
+
+
+class CosSyncTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = FakeCosClient()
+        self.patchers = [
+            patch.dict(os.environ, {
+                "STORAGE_BACKEND": "cos",
+                "COS_SYNC_THREADS": "3",
+                "COS_MULTIPART_THRESHOLD_MB": "1",
+            }),
+            patch.object(storage_service, "_get_cos_client", lambda: (self.client, {
+                "bucket": "bucket", "region": "ap-test", "prefix": "",
+            })),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.output_dir = os.path.join(self.tmp.name, "students", "张三", "张三-报名材料")
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def write(self, name, data):
+        with open(os.path.join(self.output_dir, name), "wb") as f:
+            f.write(data)
+
+    def test_sync_skips_unchanged_and_uses_multipart_for_large_files(self):
+        self.write("a.jpg", b"a" * 1000)
+        self.write("b.jpg", b"b" * 1000)
+        self.write("c.pdf", os.urandom(1536 * 1024))
+        self.client.objects["students/张三/张三-报名材料/a.jpg"] = (b"a" * 1000, {})
+        logger = material_service.MaterialGenerationLogger()
+
+        summary = material_service._sync_output_dir_to_cos(self.output_dir, self.tmp.name, logger=logger)
+
+        statuses = {item["key"].rsplit("/", 1)[-1]: item["status"] for item in summary["files"]}
+        self.assertEqual(statuses, {"a.jpg": "skipped", "b.jpg": "uploaded", "c.pdf": "uploaded"})
+        self.assertIn(("multipart", "students/张三/张三-报名材料/c.pdf"), self.client.calls)
+        self.assertEqual(summary["bytes"], 1000 + 1536 * 1024)
+        event = logger.events[-1]
+        self.assertEqual(event["step"], "cos_sync")
+        self.assertEqual(event["details"]["skipped"], 1)
+        self.assertEqual(len(event["details"]["files"]), 3)
+
+        # 第二次同步：分块上传的文件依靠 md5 元数据判定未变化
+        again = cos_sync_service.sync_files(
+            [(os.path.join(self.output_dir, name), f"students/张三/张三-报名材料/{name}") for name in ("b.jpg", "c.pdf")]
+        )
+        self.assertEqual(again["skipped"], 2)
+
+    def test_failures_are_reported_per_file(self):
+        self.write("a.jpg", b"a")
+
+        summary = cos_sync_service.sync_files([
+            (os.path.join(self.output_dir, "a.jpg"), "students/a.jpg"),
+            (os.path.join(self.output_dir, "missing.jpg"), "students/missing.jpg"),
+        ])
+
+        self.assertEqual((summary["uploaded"], summary["failed"]), (1, 1))
+        self.assertTrue(summary["files"][1]["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
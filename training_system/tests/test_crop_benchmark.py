@@ -0,0 +1,64 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from tests import crop_benchmark
+
+
+class CropBenchmarkHelperTests(unittest.TestCase):
+    def test_polygon_iou_of_shifted_square(self):
+        square = np.array([[0, 0], [100, 0], [100, 100], [0, 100]], dtype=np.float32)
+        shifted = square + np.array([50, 0], dtype=np.float32)
+
+        self.assertAlmostEqual(crop_benchmark.polygon_iou(square, square), 1.0, places=4)
+        self.assertAlmostEqual(crop_benchmark.polygon_iou(square, shifted), 1.0 / 3.0, places=3)
+        self.assertEqual(crop_benchmark.polygon_iou(None, square), 0.0)
+
+    def test_synthesized_case_is_deterministic_and_inside_frame(self):
+        case = crop_benchmark.build_cases("quick")[0]
+        first, quad = crop_benchmark.synthesize_case(case)
+        second, quad_again = crop_benchmark.synthesize_case(case)
+
+        self.assertTrue(np.array_equal(first, second))
+        self.assertTrue(np.array_equal(quad, quad_again))
+        height, width = first.shape[:2]
+        self.assertTrue((quad[:, 0] >= 0).all() and (quad[:, 0] < width).all())
+        self.assertTrue((quad[:, 1] >= 0).all() and (quad[:, 1] < height).all())
+
+    def test_compare_flags_iou_drop_and_optional_slowdown(self):
+        timings = {stage: 10.0 for stage in crop_benchmark.STAGES}
+        baseline = {"cases": {"c1": {"id": "c1", "profile": "id_card", "detected": True, "iou": 0.98, "timings_ms": timings}}}
+        slow = {stage: 30.0 for stage in crop_benchmark.STAGES}
+        report = {"cases": {"c1": {"id": "c1", "profile": "id_card", "detected": True, "iou": 0.80, "timings_ms": slow}}}
+
+        without_timing = crop_benchmark.compare_to_baseline(report, baseline)
+        with_timing = crop_benchmark.compare_to_baseline(report, baseline, max_slowdown=2.0)
+
+        self.assertTrue(any(line.startswith("c1:") for line in without_timing))
+        self.assertFalse(any("median" in line for line in without_timing))
+        self.assertTrue(any("median" in line for line in with_timing))
+
+
+class CropAccuracyRegressionTests(unittest.TestCase):
+    def test_quick_suite_matches_baseline_accuracy(self):
+        baseline = crop_benchmark.load_baseline()
+        cases = crop_benchmark.build_cases("quick")
+        self.assertTrue(all(case["id"] in baseline["cases"] for case in cases))
+
+        report = crop_benchmark.run_benchmark("quick", cases=cases)
+        regressions = crop_benchmark.compare_to_baseline(report, baseline)
+
+        self.assertEqual(regressions, [])
+        for result in report["cases"].values():
+            self.assertEqual(set(result["timings_ms"]), set(crop_benchmark.STAGES))
+
+
+if __name__ == "__main__":
+    unittest.main()
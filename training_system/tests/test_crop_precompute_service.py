@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+from flask import Flask
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from models import student as student_model
+from services import crop_precompute_service
+
+
+def write_card(path, offset=0):
+    image = np.full((1200, 1600, 3), 40, dtype=np.uint8)
+    card = np.array([[300 + offset, 250], [1300 + offset, 250], [1300 + offset, 880], [300 + offset, 880]], dtype=np.int32)
+    cv2.fillPoly(image, [card], (235, 235, 235))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv2.imwrite(path, image)
+
+
+class CropPrecomputeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "students.db")
+        student_model.init_db(self.db_path)
+        self.app = Flask(__name__)
+        self.app.config["DATABASE"] = self.db_path
+        self.app.config["BASE_DIR"] = self.tmp.name
+        self.rel = "students/特种作业-单位-张三/1-张三-身份证正面.jpg"
+        write_card(os.path.join(self.tmp.name, self.rel))
+        self.student = {"id": 7, "id_card_front_path": self.rel}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_precompute_stores_points_and_lookup_hits_cache(self):
+        with self.app.app_context():
+            computed = crop_precompute_service.precompute_student(self.student, self.tmp.name)
+            cached = student_model.get_crop_points(7, "id_card_front_path")
+
+            with patch.object(crop_precompute_service, "detect_points") as detect:
+                points = crop_precompute_service.get_points(
+                    self.student, "id_card_front_path", "id_card", self.tmp.name,
+                )
+
+        self.assertEqual(computed, 1)
+        self.assertEqual(cached["profile_name"], "id_card")
+        self.assertEqual(len(cached["points"]), 4)
+        self.assertEqual(points, cached["points"])
+        detect.assert_not_called()
+
+    def test_replaced_source_or_new_canny_scale_triggers_detection(self):
+        calls = []
+        original = crop_precompute_service.detect_points
+
+        def counting(*args, **kwargs):
+            calls.append(kwargs.get("canny_scale"))
+            return original(*args, **kwargs)
+
+        with self.app.app_context(), patch.object(crop_precompute_service, "detect_points", side_effect=counting):
+            first = crop_precompute_service.get_points(self.student, "id_card_front_path", "id_card", self.tmp.name)
+            write_card(os.path.join(self.tmp.name, self.rel), offset=150)
+            second = crop_precompute_service.get_points(self.student, "id_card_front_path", "id_card", self.tmp.name)
+            crop_precompute_service.get_points(
+                self.student, "id_card_front_path", "id_card", self.tmp.name, canny_scale=1.5,
+            )
+            crop_precompute_service.get_points(self.student, "id_card_front_path", "id_card", self.tmp.name)
+
+        self.assertEqual(calls, [1.0, 1.0, 1.5])
+        self.assertGreater(min(x for x, _ in second), min(x for x, _ in first) + 100)
+
+    def test_worker_merges_duplicate_schedules(self):
+        worker = crop_precompute_service.CropPrecomputeWorker(self.app)
+        with patch.object(crop_precompute_service, "get_student_by_id", return_value=self.student):
+            self.assertTrue(worker.schedule(7))
+            self.assertFalse(worker.schedule(7))
+            worker.start()
+            worker.join()
+            worker.stop()
+
+        self.assertEqual(worker.stats["scheduled"], 1)
+        self.assertEqual(worker.stats["computed"], 1)
+        with self.app.app_context():
+            self.assertIsNotNone(student_model.get_crop_points(7, "id_card_front_path"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from app import create_app
+from models import student as student_model
+from services import file_reconcile_service, storage_service
+
+OLD = "2020-01-01T00:00:00.000Z"
+FOLDER = "students/特种作业-甲公司-张三"
+
+
+class FakeCosClient:
+    def __init__(self):
+        self.objects = {}
+        self.delete_calls = []
+
+    def list_objects(self, Bucket, Prefix="", **kwargs):
+        contents = [
+            {"Key": key, "Size": size, "LastModified": modified}
+            for key, (size, modified) in sorted(self.objects.items())
+            if key.startswith(Prefix)
+        ]
+        return {"Contents": contents, "IsTruncated": "false"}
+
+    def delete_objects(self, Bucket, Delete):
+        keys = [item["Key"] for item in Delete["Object"]]
+        self.delete_calls.append(keys)
+        for key in keys:
+            self.objects.pop(key, None)
+        return {"Deleted": [{"Key": key} for key in keys]}
+
+
+class FileReconcileTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "students.db")
+        self.client = FakeCosClient()
+        self.patchers = [
+            patch.dict(os.environ, {
+                "TRAINING_SYSTEM_ENV_FILE": os.path.join(self.tmp.name, ".env"),
+                "STORAGE_BACKEND": "dual",
+                "RECONCILE_MIN_AGE_HOURS": "24",
+            }),
+            patch.object(storage_service, "_get_cos_client", lambda: (self.client, {
+                "bucket": "bucket", "region": "ap-test", "prefix": "",
+            })),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        student_model.init_db(self.db_path)
+        self.app = create_app()
+        self.app.config.update(TESTING=True, DATABASE=self.db_path, BASE_DIR=self.tmp.name)
+        with self.app.app_context():
+            with student_model.get_db_connection() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO students (name, gender, education, id_card, phone, job_category, company, "
+                    "photo_path, diploma_path, id_card_front_path) "
+                    "VALUES ('张三', '男', '本科', '110', '13800000000', '电工', '甲公司', ?, ?, ?)",
+                    (f"{FOLDER}/p.jpg", f"{FOLDER}/d.jpg", f"{FOLDER}/f.jpg"),
+                )
+                self.student_id = cursor.lastrowid
+                conn.execute(
+                    "INSERT INTO students (name, gender, education, id_card, phone, job_category, company, photo_path) "
+                    "VALUES ('李四', '男', '本科', '120', '13900000000', '焊工', '乙公司', ?)",
+                    ("students/特种设备-乙公司-李四/1.jpg",),
+                )
+
+        # 本地：p/d 被引用；orphan 与 pending 未引用且已过最小存在时间；young 刚上传
+        self.old = time.time() - 3 * 86400
+        self._write_local(f"{FOLDER}/p.jpg", 100)
+        self._write_local(f"{FOLDER}/d.jpg", 50)
+        self._write_local(f"{FOLDER}/orphan.jpg", 30)
+        self._write_local(f"{FOLDER}/pending.jpg", 30)
+        self._write_local(f"{FOLDER}/young.jpg", 30, old=False)
+        self._write_local(f"{FOLDER}/110-张三-报名材料/a.pdf", 10)
+        self._write_local(f"{FOLDER}/.variants/thumb.jpg", 10)
+        self._write_local("students/特种设备-乙公司-李四/1.jpg", 10)
+        # COS：d 大小不一致，f 只在 COS 上，orphan-cos 只在 COS 上且未引用
+        self.client.objects = {
+            f"{FOLDER}/p.jpg": (100, OLD),
+            f"{FOLDER}/d.jpg": (40, OLD),
+            f"{FOLDER}/f.jpg": (20, OLD),
+            f"{FOLDER}/orphan-cos.jpg": (20, OLD),
+            "students/特种设备-乙公司-李四/1.jpg": (10, OLD),
+        }
+        with self.app.app_context():
+            student_model.enqueue_cos_op("put", f"{FOLDER}/pending.jpg")
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def _write_local(self, key, size, old=True):
+        path = os.path.join(self.tmp.name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        if old:
+            os.utime(path, (self.old, self.old))
+
+    def _findings(self):
+        with self.app.app_context():
+            return {(row["kind"], row["key"], row["location"]) for row in file_reconcile_service.get_plan()}
+
+    def test_first_run_is_full_and_classifies_three_way_differences(self):
+        with self.app.app_context():
+            summary = file_reconcile_service.build_plan()
+
+        self.assertEqual(summary["mode"], "full")
+        self.assertEqual(summary["folders_checked"], 2)
+        self.assertEqual((summary["orphan"], summary["missing"], summary["mismatch"]), (2, 1, 1))
+        self.assertEqual(summary["young_skipped"], 1)
+        # 报名材料、隐藏派生文件与发件箱中正在同步的 key 不列入
+        self.assertEqual(self._findings(), {
+            ("orphan", f"{FOLDER}/orphan.jpg", "local"),
+            ("orphan", f"{FOLDER}/orphan-cos.jpg", "cos"),
+            ("missing", f"{FOLDER}/f.jpg", "local"),
+            ("mismatch", f"{FOLDER}/d.jpg", "both"),
+        })
+
+    def test_incremental_run_only_checks_changed_folders(self):
+        start = time.time()
+        with self.app.app_context():
+            file_reconcile_service.build_plan(now=start + 10)
+            with patch.object(file_reconcile_service, "_list_cos",
+                              wraps=file_reconcile_service._list_cos) as list_cos:
+                summary = file_reconcile_service.build_plan(now=start + 100)
+                # 只有上次仍有条目的文件夹需要复查
+                self.assertEqual(summary["mode"], "incremental")
+                self.assertEqual([c.args[0] for c in list_cos.call_args_list], [f"{FOLDER}/"])
+
+                # 外部写入新文件夹 + 数据库不再引用李四的照片，两个文件夹都进入下一次检查
+                self._write_local("students/手工拷贝-丙公司-王五/a.jpg", 10)
+                os.utime(os.path.join(self.tmp.name, "students/手工拷贝-丙公司-王五"), (start + 150, start + 150))
+                with student_model.get_db_connection() as conn:
+                    conn.execute("UPDATE students SET photo_path = NULL WHERE name = '李四'")
+                list_cos.reset_mock()
+                summary = file_reconcile_service.build_plan(now=start + 200)
+
+        self.assertEqual(sorted(c.args[0] for c in list_cos.call_args_list), sorted([
+            f"{FOLDER}/", "students/手工拷贝-丙公司-王五/", "students/特种设备-乙公司-李四/",
+        ]))
+        self.assertEqual(summary["folders_checked"], 3)
+        findings = self._findings()
+        self.assertIn(("orphan", "students/手工拷贝-丙公司-王五/a.jpg", "local"), findings)
+        self.assertIn(("orphan", "students/特种设备-乙公司-李四/1.jpg", "both"), findings)
+
+    def test_apply_rechecks_each_orphan_before_deleting(self):
+        self._write_local(f"{FOLDER}/orphan2.jpg", 30)
+        self.client.objects[f"{FOLDER}/orphan-cos2.jpg"] = (20, OLD)
+        with self.app.app_context():
+            file_reconcile_service.build_plan()
+            # 计划生成后：orphan2 又被写入，orphan-cos2 进入发件箱
+            self._write_local(f"{FOLDER}/orphan2.jpg", 31)
+            student_model.enqueue_cos_op("put", f"{FOLDER}/orphan-cos2.jpg")
+
+            preview = file_reconcile_service.apply(dry_run=True)
+            self.assertEqual(sorted(preview["keys"]), [f"{FOLDER}/orphan-cos.jpg", f"{FOLDER}/orphan.jpg"])
+            self.assertTrue(os.path.exists(os.path.join(self.tmp.name, FOLDER, "orphan.jpg")))
+
+            result = file_reconcile_service.apply()
+
+        self.assertEqual((result["deleted_local"], result["deleted_cos"], result["skipped"]), (1, 1, 2))
+        self.assertEqual(result["freed_bytes"], 30)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, FOLDER, "orphan.jpg")))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, FOLDER, "orphan2.jpg")))
+        self.assertEqual(self.client.delete_calls, [[f"{FOLDER}/orphan-cos.jpg"]])
+        self.assertIn(f"{FOLDER}/orphan-cos2.jpg", self.client.objects)
+        remaining = {key for kind, key, _ in self._findings() if kind == "orphan"}
+        self.assertEqual(remaining, {f"{FOLDER}/orphan2.jpg", f"{FOLDER}/orphan-cos2.jpg"})
+
+        # 数据库未引用任何附件时拒绝删除
+        with self.app.app_context():
+            with student_model.get_db_connection() as conn:
+                conn.execute("DELETE FROM students")
+            with self.assertRaises(RuntimeError):
+                file_reconcile_service.apply()
+
+
+if __name__ == "__main__":
+    unittest.main()
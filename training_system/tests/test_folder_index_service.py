@@ -0,0 +1,132 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from app import create_app
+from models import student as student_model
+from services import folder_index_service, storage_service
+
+
+class FolderIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "students.db")
+        self.students_dir = os.path.join(self.tmp.name, "students")
+        self.patchers = [
+            patch.dict(os.environ, {
+                "TRAINING_SYSTEM_ENV_FILE": os.path.join(self.tmp.name, ".env"),
+                "STORAGE_BACKEND": "local",
+                "BLOB_DEDUP": "0",
+            }),
+            patch.object(folder_index_service, "_pending", set()),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        student_model.init_db(self.db_path)
+        self.app = create_app()
+        self.app.config.update(
+            TESTING=True, DATABASE=self.db_path, BASE_DIR=self.tmp.name, STUDENTS_FOLDER=self.students_dir,
+        )
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["auth_verified"] = True
+
+        with self.app.app_context():
+            with student_model.get_db_connection() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO students (name, gender, education, id_card, phone, job_category, company) "
+                    "VALUES ('张三', '男', '本科', '110', '13800000000', '电工', '甲公司')"
+                )
+                self.student_id = cursor.lastrowid
+        self._write("students/特种作业-甲公司-张三/110-张三-个人照片.jpg", b"x" * 300)
+        self._write("students/特种作业-甲公司-张三/.variants/thumb.jpg", b"t" * 50)
+        self._write("students/特种作业-甲公司-张三/110-张三-报名材料/a.pdf", b"p" * 200)
+        for i in range(5):
+            self._write(f"students/特种设备-乙公司-李{i}/1.jpg", b"y" * (10 + i))
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def _write(self, key, data):
+        path = os.path.join(self.tmp.name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _browse(self, **params):
+        resp = self.client.get("/api/files/browse", query_string=params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_json()
+
+    def test_browse_is_served_from_index_with_paging_sorting_and_search(self):
+        data = self._browse(page=1, page_size=2, sort="size", order="desc")
+
+        self.assertEqual(data["total"], 6)
+        self.assertEqual(data["summary"]["directories"], 6)
+        self.assertEqual(data["summary"]["matched"], 1)
+        first = data["items"][0]
+        self.assertEqual(first["name"], "特种作业-甲公司-张三")
+        self.assertEqual((first["size"], first["file_count"]), (550, 2))
+        self.assertEqual(first["student_id"], self.student_id)
+        self.assertEqual(data["items"][1]["name"], "特种设备-乙公司-李4")
+
+        searched = self._browse(page=1, q="李", sort="name", order="asc")
+        self.assertEqual([item["name"] for item in searched["items"]],
+                         [f"特种设备-乙公司-李{i}" for i in range(5)])
+        self.assertEqual(self._browse(page=1, matched="0")["total"], 5)
+
+        # 不带分页参数时保持原有的数组返回格式
+        self.assertEqual(len(self.client.get("/api/files/browse").get_json()), 6)
+
+    def test_storage_writes_update_index_incrementally(self):
+        self._browse(page=1)
+        with patch.object(folder_index_service, "dir_stats", wraps=folder_index_service.dir_stats) as stats:
+            with self.app.app_context():
+                storage_service.save_file(b"z" * 100, "students/特种设备-乙公司-李0/2.jpg")
+                storage_service.delete_file("students/特种设备-乙公司-李1/1.jpg")
+            data = self._browse(page=1, q="李", sort="name", order="asc")
+
+        # 只重新统计发生变化的文件夹；李1 删空后目录随之清理，直接移出索引
+        self.assertEqual(stats.call_count, 1)
+        self.assertEqual([item["name"] for item in data["items"]],
+                         ["特种设备-乙公司-李0", "特种设备-乙公司-李2", "特种设备-乙公司-李3", "特种设备-乙公司-李4"])
+        self.assertEqual((data["items"][0]["size"], data["items"][0]["file_count"]), (110, 2))
+
+    def test_marks_from_other_processes_are_flushed_by_browse(self):
+        self._browse(page=1)
+        # 图像处理子进程直接写盘，父进程路由只登记文件夹（登记写入库中，不依赖本进程内存）
+        self._write("students/特种设备-乙公司-李3/材料/b.pdf", b"b" * 1000)
+        with self.app.app_context():
+            folder_index_service.mark_changed("students/特种设备-乙公司-李3/")
+            self.assertEqual(list(student_model.get_folder_index_dirty()), ["特种设备-乙公司-李3"])
+        self.assertEqual(folder_index_service._pending, set())
+
+        data = self._browse(page=1, q="李3")
+        self.assertEqual((data["items"][0]["size"], data["items"][0]["file_count"]), (1013, 2))
+        with self.app.app_context():
+            self.assertEqual(student_model.get_folder_index_dirty(), {})
+
+    def test_reconcile_picks_up_changes_made_outside_storage_service(self):
+        self._browse(page=1)
+        self._write("students/手工拷贝-丙公司-王五/a.jpg", b"w" * 10)
+        with open(os.path.join(self.students_dir, "特种设备-乙公司-李2", "1.jpg"), "ab") as f:
+            f.write(b"more")
+
+        with self.app.app_context():
+            result = folder_index_service.reconcile(self.students_dir)
+
+        self.assertEqual((result["entries"], result["added"], result["changed"], result["removed"]), (7, 1, 1, 0))
+        self.assertEqual(self._browse(page=1)["total"], 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
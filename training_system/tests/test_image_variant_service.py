@@ -0,0 +1,128 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import image_variant_service, storage_service  # noqa: E402
+
+
+def _jpeg_bytes(size, orientation=None):
+    image = Image.new('RGB', size, 'white')
+    image.paste((200, 30, 30), (0, 0, size[0] // 4, size[1] // 4))
+    buf = io.BytesIO()
+    if orientation:
+        exif = image.getexif()
+        exif[0x0112] = orientation
+        image.save(buf, format='JPEG', exif=exif)
+    else:
+        image.save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+class ImageVariantServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base_dir = self.tmp.name
+        self.patchers = [
+            patch.dict(os.environ, {'STORAGE_BACKEND': 'local'}),
+            patch.object(storage_service, 'get_base_dir', lambda: self.base_dir),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def _abs(self, key):
+        return os.path.join(self.base_dir, key)
+
+    def test_variant_keys_live_in_hidden_sibling_directory(self):
+        key = 'students/特种作业-单位-张三/1-张三-个人照片.jpg'
+
+        self.assertEqual(
+            image_variant_service.variant_key(key, 'thumb'),
+            'students/特种作业-单位-张三/.variants/1-张三-个人照片.jpg.thumb.jpg',
+        )
+        self.assertEqual(
+            image_variant_service.manifest_key(key),
+            'students/特种作业-单位-张三/.variants/1-张三-个人照片.jpg.json',
+        )
+        self.assertTrue(image_variant_service.is_variant_key(image_variant_service.variant_key(key, 'analysis')))
+        self.assertFalse(image_variant_service.is_variant_key(key))
+
+    def test_small_upright_upload_keeps_original_bytes(self):
+        data = _jpeg_bytes((1200, 900))
+        key = 'students/tmp/a_photo.jpg'
+
+        manifest = image_variant_service.save_upload(data, key)
+
+        with open(self._abs(key), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertIsNone(manifest['variants']['analysis'])
+        self.assertFalse(manifest['source']['reencoded'])
+        with Image.open(self._abs(image_variant_service.variant_key(key, 'thumb'))) as thumb:
+            self.assertEqual(thumb.size, (320, 240))
+
+    def test_rotated_oversized_upload_is_transposed_and_bounded(self):
+        data = _jpeg_bytes((4800, 3600), orientation=6)
+        key = 'students/tmp/b_diploma.jpg'
+
+        with patch.object(image_variant_service, 'UPLOAD_MASTER_MAX_SIDE', 3200):
+            manifest = image_variant_service.save_upload(data, key)
+
+        with Image.open(self._abs(key)) as master:
+            self.assertEqual(master.size, (2400, 3200))
+            self.assertEqual(master.getexif().get(0x0112, 1), 1)
+        self.assertEqual(manifest['source']['original_size'], [3600, 4800])
+        self.assertTrue(manifest['source']['exif_transposed'])
+        self.assertEqual(manifest['variants']['analysis']['height'], 2400)
+
+        source_path, scale = image_variant_service.analysis_source(key, self.base_dir)
+        self.assertEqual(source_path, self._abs(image_variant_service.variant_key(key, 'analysis')))
+        self.assertAlmostEqual(scale[0], 2400 / 1800)
+        self.assertAlmostEqual(scale[1], 3200 / 2400)
+
+    def test_non_image_is_saved_without_variants(self):
+        key = 'students/tmp/c_form.pdf'
+
+        self.assertIsNone(image_variant_service.save_upload(b'%PDF-1.4', key))
+        self.assertTrue(os.path.exists(self._abs(key)))
+        self.assertFalse(os.path.exists(self._abs(image_variant_service.manifest_key(key))))
+
+    def test_move_and_delete_follow_master(self):
+        src = 'students/tmp/d_photo.jpg'
+        dst = 'students/特种作业-单位-张三/1-张三-个人照片.jpg'
+        image_variant_service.save_upload(_jpeg_bytes((800, 600)), src)
+
+        storage_service.move_temp_file(src, dst)
+        moved = image_variant_service.move_variants(src, dst)
+
+        self.assertEqual(moved, 2)
+        with open(self._abs(image_variant_service.manifest_key(dst)), 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['master']['width'], 800)
+        self.assertEqual(
+            image_variant_service.variant_path_mapping(dst, 'students/x/y.jpg', self.base_dir),
+            [
+                (image_variant_service.variant_key(dst, 'thumb'), 'students/x/.variants/y.jpg.thumb.jpg'),
+                (image_variant_service.manifest_key(dst), 'students/x/.variants/y.jpg.json'),
+            ],
+        )
+
+        image_variant_service.delete_variants(dst)
+        self.assertFalse(os.path.exists(self._abs(image_variant_service.variant_key(dst, 'thumb'))))
+        self.assertFalse(os.path.exists(self._abs(image_variant_service.manifest_key(dst))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import bg_removal_service, image_worker_pool, storage_service
+from services.material_service import (
+    capture_logs, crop_file_to_temp, log_line, pipeline_logger, process_personal_photo,
+)
+
+
+def _white_background(data, bg_color=(255, 255, 255)):
+    ok, encoded = cv2.imencode(".jpg", np.full((400, 300, 3), 255, dtype=np.uint8))
+    return encoded.tobytes()
+
+
+def _process_photo_in_worker(input_path, output_dir):
+    """在子进程内执行：用固定的白底结果代替模型推理，走完个人照片处理流程。"""
+    with patch.object(bg_removal_service, "is_available", lambda: True), \
+            patch.object(bg_removal_service, "remove_background", _white_background):
+        result = process_personal_photo(input_path, output_dir, "110-张三")
+    return result, storage_service.get_base_dir()
+
+
+class ImageWorkerPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = image_worker_pool.ImageWorkerPool(processes=1, max_jobs=2, memory_mb=1024, cv_threads=1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_jobs_run_in_recycled_child_process_and_relay_logs(self):
+        with capture_logs("job-1") as job_log:
+            pids = [self.pool.run(os.getpid) for _ in range(3)]
+            self.pool.run(log_line, "worker says", "hi")
+
+        self.assertNotIn(os.getpid(), pids)
+        # max_jobs=2：第三个任务由新拉起的子进程执行
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertEqual(job_log.lines, ["worker says hi"])
+
+    def test_relayed_logs_keep_their_level(self):
+        with capture_logs("job-2") as job_log:
+            self.pool.run(pipeline_logger.warning, "disk almost full")
+
+        self.assertEqual(job_log.records(), [(logging.WARNING, "disk almost full")])
+        with self.assertLogs("relay-target", level="WARNING") as logs:
+            job_log.flush_to(logging.getLogger("relay-target"))
+        self.assertEqual(logs.output, ["WARNING:relay-target:[job-2] disk almost full"])
+
+    def test_memory_limit_fails_job_without_breaking_pool(self):
+        with self.assertRaises(image_worker_pool.ImageJobMemoryError):
+            self.pool.run(np.ones, 2 * 1024 * 1024 * 1024, dtype=np.uint8)
+
+        self.assertEqual(self.pool.run(max, 1, 2), 2)
+        self.assertEqual(self.pool.stats["memory_errors"], 1)
+
+    def test_crop_via_temp_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, "card.jpg")
+            cv2.imwrite(source, np.full((600, 800, 3), 200, dtype=np.uint8))
+
+            cropped = self.pool.run(crop_file_to_temp, source, [[100, 100], [500, 100], [500, 350], [100, 350]], "rect_only")
+
+            self.assertEqual(os.path.dirname(cropped), tmp_dir)
+            self.assertEqual(cv2.imread(cropped).shape[:2], (250, 400))
+
+    def test_personal_photo_runs_inside_worker_app_context(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pool = image_worker_pool.ImageWorkerPool(
+                processes=1, max_jobs=2, memory_mb=0, cv_threads=1,
+                app_config={"BASE_DIR": tmp_dir, "DATABASE": os.path.join(tmp_dir, "students.db")},
+            )
+            source = os.path.join(tmp_dir, "photo.jpg")
+            cv2.imwrite(source, np.full((400, 300, 3), (200, 80, 30), dtype=np.uint8))
+            try:
+                with capture_logs("job-photo") as job_log:
+                    result, base_dir = pool.run(_process_photo_in_worker, source, tmp_dir)
+            finally:
+                pool.shutdown()
+
+            self.assertEqual(base_dir, tmp_dir)
+            self.assertTrue(result["success"])
+            # 白底替换在子进程内生效，输出不是原图的蓝色背景
+            self.assertGreater(cv2.imread(result["output_path"]).mean(), 250)
+            self.assertFalse([line for line in job_log.lines if "白底处理失败" in line])
+
+    def test_module_run_falls_back_to_inline_when_not_started(self):
+        self.assertIsNone(image_worker_pool.get_pool())
+        self.assertEqual(image_worker_pool.run(os.getpid), os.getpid())
+
+
+if __name__ == "__main__":
+    unittest.main()
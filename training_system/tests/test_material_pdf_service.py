@@ -0,0 +1,112 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import material_pdf_service, material_service
+
+
+def write_jpeg(path, image, quality=95):
+    ok, buf = cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    assert ok
+    with open(path, "wb") as f:
+        f.write(buf.tobytes())
+    return buf.tobytes()
+
+
+def a4_page_with_card():
+    canvas = material_service.create_a4_canvas()
+    rng = np.random.default_rng(0)
+    canvas[400:1400, 300:2180] = rng.integers(0, 200, size=(1000, 1880, 3), dtype=np.uint8)
+    return canvas
+
+
+class MaterialPdfTests(unittest.TestCase):
+    def test_jpeg_info_reads_sof_without_decoding(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data = write_jpeg(os.path.join(tmp_dir, "a.jpg"), np.zeros((30, 40, 3), dtype=np.uint8))
+
+        self.assertEqual(material_pdf_service.jpeg_info(data), (40, 30, 3, False))
+        with self.assertRaises(ValueError):
+            material_pdf_service.jpeg_info(b"\x89PNG....")
+
+    def test_full_mode_embeds_original_jpeg_bytes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            page = write_jpeg(os.path.join(tmp_dir, "p1.jpg"), a4_page_with_card())
+            photo = write_jpeg(os.path.join(tmp_dir, "p2.jpg"), np.full((413, 295, 3), 90, dtype=np.uint8))
+            output = os.path.join(tmp_dir, "out.pdf")
+
+            info = material_pdf_service.build_pdf(
+                [os.path.join(tmp_dir, "p1.jpg"), os.path.join(tmp_dir, "missing.jpg"), os.path.join(tmp_dir, "p2.jpg")],
+                output,
+            )
+            with open(output, "rb") as f:
+                pdf = f.read()
+
+        self.assertEqual(info["pages"], 2)
+        self.assertTrue(pdf.startswith(b"%PDF-1.4"))
+        self.assertTrue(pdf.rstrip().endswith(b"%%EOF"))
+        self.assertTrue(page in pdf)
+        self.assertTrue(photo in pdf)
+        self.assertTrue(b"/Count 2" in pdf)
+        # 个人照片按 300DPI 实际尺寸放置：295px = 70.8pt
+        self.assertTrue(b"q 70.800 0 0 99.120" in pdf)
+        startxref = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+        self.assertTrue(pdf[startxref:].startswith(b"xref"))
+
+    def test_compact_mode_places_only_document_region(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch.dict(os.environ, {"MATERIAL_PDF_PARTS_DIR": os.path.join(tmp_dir, "parts")}), \
+                patch.object(material_pdf_service, "_parts_cache", None):
+            path = os.path.join(tmp_dir, "p1.jpg")
+            page = write_jpeg(path, a4_page_with_card())
+
+            # 画布生成时没有缓存证件区域：整页原样嵌入，不解码重新压缩
+            material_pdf_service.build_pdf([path], os.path.join(tmp_dir, "uncached.pdf"), mode="compact")
+            with open(os.path.join(tmp_dir, "uncached.pdf"), "rb") as f:
+                self.assertTrue(page in f.read())
+
+            material_pdf_service.remember_compact_parts(page, a4_page_with_card())
+            full = material_pdf_service.build_pdf([path], os.path.join(tmp_dir, "full.pdf"), mode="full")
+            compact = material_pdf_service.build_pdf([path], os.path.join(tmp_dir, "compact.pdf"), mode="compact")
+            with open(os.path.join(tmp_dir, "compact.pdf"), "rb") as f:
+                pdf = f.read()
+            cached_part = material_pdf_service.page_images(page, mode="compact")[0][0]
+
+        regions = material_pdf_service.find_content_regions(a4_page_with_card())
+        self.assertEqual(len(regions), 1)
+        x, y, w, h = regions[0]
+        self.assertLessEqual(abs(x - 300), 16)
+        self.assertLessEqual(abs(w - 1880), 32)
+        self.assertTrue(b"/Width %d /Height %d" % (w, h) in pdf)
+        self.assertLess(compact["bytes"], full["bytes"])
+        # 嵌入的是画布生成时缓存的区域 JPEG
+        self.assertTrue(cached_part in pdf)
+
+    def test_generation_pipeline_writes_student_pdf(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            name_prefix = "110101199001011234-张三"
+            for label in ("学历证书", "身份证"):
+                write_jpeg(os.path.join(tmp_dir, f"{name_prefix}-{label}.jpg"), a4_page_with_card())
+            logger = material_service.MaterialGenerationLogger()
+
+            info = material_service.build_materials_pdf(tmp_dir, name_prefix, logger=logger)
+
+            self.assertEqual(info["pages"], 2)
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, f"{name_prefix}-报名材料.pdf")))
+            self.assertEqual(logger.events[-1]["step"], "pdf")
+            self.assertIn(info["output_path"], logger.output_files)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,12 @@
+import logging
 import os
 import sys
 import tempfile
+import threading
 import unittest
+from unittest.mock import patch
 
+import cv2
 import numpy as np
 from PIL import Image
 
@@ -56,6 +60,59 @@ class MaterialServiceTests(unittest.TestCase):
         self.assertEqual(summary["material_count"], 3)
         self.assertEqual(summary["output_files"], ["/tmp/a.jpg"])
 
+    def test_log_lines_outside_capture_reach_the_attached_logger(self):
+        target = logging.getLogger("training_system.tests.pipeline")
+        with patch.object(material_service, "_fallback_logger", target):
+            with self.assertLogs(target, "INFO") as logs:
+                material_service.log_line("[hukou] 后台预计算", 1)
+            with self.assertNoLogs(target, "INFO"):
+                with material_service.capture_logs() as job_log:
+                    material_service.log_line("inside")
+
+        self.assertEqual(logs.records[0].getMessage(), "[hukou] 后台预计算 1")
+        self.assertEqual(job_log.lines, ["inside"])
+
+    def test_capture_logs_is_context_local_across_threads(self):
+        barrier = threading.Barrier(2)
+        captured = {}
+
+        def job(name):
+            with material_service.capture_logs() as job_log:
+                for index in range(20):
+                    material_service.log_line(f"[{name}]", index)
+                    if index == 0:
+                        barrier.wait()
+                captured[name] = job_log
+
+        threads = [threading.Thread(target=job, args=(name,)) for name in ("a", "b")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(captured["a"].lines, [f"[a] {index}" for index in range(20)])
+        self.assertEqual(captured["b"].lines, [f"[b] {index}" for index in range(20)])
+        self.assertNotEqual(captured["a"].job_id, captured["b"].job_id)
+        self.assertIsNone(material_service.current_job_id())
+
+    def test_generation_report_carries_job_id_and_step_timings(self):
+        with material_service.capture_logs("job-42"):
+            collector = material_service.MaterialGenerationLogger()
+            collector.emit("info", "diploma", "start", "开始", "")
+            collector.emit("info", "diploma", "auto_crop", "裁剪", "")
+            collector.emit("success", "diploma", "write_output", "输出", "")
+
+        report = material_service.build_generation_report("/tmp/out", collector, [{"scope": "diploma", "success": True}])
+
+        self.assertEqual(report["log_summary"]["job_id"], "job-42")
+        self.assertEqual(
+            [(item["scope"], item["step"]) for item in report["step_timings"]],
+            [("diploma", "start"), ("diploma", "auto_crop"), ("diploma", "write_output")],
+        )
+        self.assertTrue(all(item["wall_ms"] >= 0 and item["cpu_ms"] >= 0 for item in report["step_timings"]))
+        self.assertTrue(all(event["job_id"] == "job-42" for event in collector.events))
+        self.assertLessEqual(collector.events[0]["elapsed_ms"], collector.events[-1]["elapsed_ms"])
+
     def test_rect_only_manual_crop_uses_bounding_box(self):
         image = np.arange(100 * 100 * 3, dtype=np.uint8).reshape(100, 100, 3)
         points = np.array([[10, 20], [60, 10], [80, 70], [20, 80]], dtype=np.float32)
@@ -172,6 +229,137 @@ class MaterialServiceTests(unittest.TestCase):
             self.assertIn("110101199001011234-张三-个人照片.jpg", output_files)
             self.assertIn("110101199001011234-张三-复审材料.jpg", output_files)
 
+    def test_hukou_crop_osd_runs_only_when_source_result_is_weak(self):
+        source = np.full((400, 300, 3), 255, dtype=np.uint8)
+        crop = source[50:350, 50:250].copy()
+        submitted = []
+
+        def fake_osd(images, confidence):
+            submitted.append(len(images))
+            return [{"rotate_degrees": 0, "confidence": confidence} for _ in images]
+
+        with patch.object(material_service, "detect_text_osd_rotations", lambda images: fake_osd(images, 5.0)):
+            material_service.normalize_hukou_page_orientation(crop, source, page_kind="personal")
+        self.assertEqual(submitted, [1])
+
+        submitted.clear()
+        with patch.object(material_service, "detect_text_osd_rotations", lambda images: fake_osd(images, 0.1)), \
+                patch.object(material_service, "estimate_orientation_by_projection", return_value=(0, {0: 1.0})):
+            material_service.normalize_hukou_page_orientation(crop, source, page_kind="personal")
+        self.assertEqual(submitted, [1, 1])
+
+    def test_read_cv_image_reduced_decodes_jpeg_at_reduced_scale(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "large.jpg")
+            Image.new("RGB", (4000, 3000), "white").save(path)
+
+            image, scale, orig_size = material_service.read_cv_image_reduced(path, max_side=1000)
+
+            self.assertEqual(image.shape[:2], (750, 1000))
+            self.assertEqual(scale, (4.0, 4.0))
+            self.assertEqual(orig_size, (4000, 3000))
+
+    def test_read_cv_image_reduced_applies_exif_orientation(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "rotated.jpg")
+            pil_image = Image.new("RGB", (4000, 3000), "white")
+            exif = pil_image.getexif()
+            exif[0x0112] = 6
+            pil_image.save(path, exif=exif)
+
+            image, scale, orig_size = material_service.read_cv_image_reduced(path, max_side=1800)
+
+            self.assertEqual(image.shape[:2], (2000, 1500))
+            self.assertEqual(scale, (2.0, 2.0))
+            self.assertEqual(orig_size, (3000, 4000))
+
+    def test_locate_document_from_path_returns_points_in_original_coordinates(self):
+        image = np.full((2400, 3200, 3), 40, dtype=np.uint8)
+        card = np.array([[800, 600], [2400, 600], [2400, 1610], [800, 1610]], dtype=np.int32)
+        cv2.fillPoly(image, [card], (235, 235, 235))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "card.jpg")
+            cv2.imwrite(path, image)
+
+            with patch.dict(material_service.ANALYSIS_MAX_SIDES, {"id_card": 800}):
+                summary = material_service.locate_document_from_path(path, "id_card")
+
+        points = material_service.order_points(np.array(summary["points_orig"], dtype=np.float32))
+        expected = material_service.order_points(card.astype(np.float32))
+        self.assertLess(float(np.abs(points - expected).max()), 12.0)
+
+    def test_scoring_engine_densities_match_full_frame_masks(self):
+        rng = np.random.default_rng(7)
+        edges = np.where(rng.random((480, 640)) > 0.9, 255, 0).astype(np.uint8)
+        line_mask = np.where(rng.random((480, 640)) > 0.95, 255, 0).astype(np.uint8)
+        engine = material_service.CandidateScoringEngine(edges, line_mask)
+        quads = [
+            np.array([[100, 80], [500, 90], [520, 400], [90, 380]], dtype=np.float32),
+            np.array([[-20, -10], [660, 0], [640, 479], [0, 500]], dtype=np.float32),
+            np.array([[0, 0], [639, 0], [639, 479], [0, 479]], dtype=np.float32),
+        ]
+        for quad in quads:
+            pts = quad.astype(np.int32)
+            border = np.zeros(edges.shape, dtype=np.uint8)
+            cv2.polylines(border, [pts], True, 255, engine.thickness)
+            expected_border = min(1.0, cv2.countNonZero(cv2.bitwise_and(edges, border)) / float(cv2.countNonZero(border)) * 4.0)
+            inner = np.zeros(edges.shape, dtype=np.uint8)
+            cv2.fillPoly(inner, [pts], 255)
+            inner = cv2.erode(inner, np.ones((5, 5), dtype=np.uint8), iterations=1)
+            expected_inner = min(1.0, cv2.countNonZero(cv2.bitwise_and(line_mask, inner)) / float(cv2.countNonZero(inner)) * 10.0)
+
+            self.assertEqual(engine.border_edge_density(quad), expected_border)
+            self.assertEqual(engine.inner_line_density(quad), expected_inner)
+
+    def test_score_candidates_rejects_out_of_range_candidates(self):
+        edges = np.zeros((600, 800), dtype=np.uint8)
+        card = np.array([[200, 150], [600, 150], [600, 403], [200, 403]], dtype=np.int32)
+        tiny = np.array([[10, 10], [30, 10], [30, 23], [10, 23]], dtype=np.int32)
+        cv2.polylines(edges, [card], True, 255, 3)
+        engine = material_service.CandidateScoringEngine(edges)
+        candidates = engine.build_candidates(
+            [(card.reshape(-1, 1, 2), "edge"), (tiny.reshape(-1, 1, 2), "edge")],
+            scale=1.0,
+        )
+        engine.measure_densities(candidates, "id_card")
+
+        scored = material_service.score_candidates(candidates, "id_card")
+
+        self.assertIsNotNone(scored[0])
+        self.assertIsNone(scored[1])
+        self.assertGreater(scored[0]["edge_density_on_border"], 0.5)
+        self.assertEqual(candidates[1]["edge_density_on_border"], 0.0)
+        self.assertEqual(material_service.select_best_candidate(candidates, "id_card")["confidence"], scored[0]["confidence"])
+
+    def test_encode_jpeg_within_budget_searches_highest_quality_under_budget(self):
+        rng = np.random.default_rng(3)
+        image = cv2.GaussianBlur(rng.integers(0, 256, (600, 800, 3), dtype=np.uint8), (5, 5), 0)
+        full_size = cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), 95])[1].size
+        budget = full_size // 3
+
+        buf, info = material_service.encode_jpeg_within_budget(image, max_bytes=budget, min_quality=30)
+
+        self.assertTrue(info["within_budget"])
+        self.assertLessEqual(buf.size, budget)
+        self.assertEqual(info["scale"], 1.0)
+        self.assertLessEqual(info["passes"], 2 + int(np.ceil(np.log2(95 - 30))))
+        above = cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), info["quality"] + 1,
+                                             int(cv2.IMWRITE_JPEG_OPTIMIZE), 1])[1]
+        self.assertGreater(above.size, budget)
+
+    def test_encode_jpeg_within_budget_scales_down_when_quality_floor_is_not_enough(self):
+        rng = np.random.default_rng(5)
+        image = rng.integers(0, 256, (400, 400, 3), dtype=np.uint8)
+
+        buf, info = material_service.encode_jpeg_within_budget(
+            image, max_bytes=20 * 1024, min_quality=70, min_scale=0.25, progressive=True,
+        )
+
+        self.assertTrue(info["within_budget"])
+        self.assertLess(info["scale"], 1.0)
+        decoded = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        self.assertLess(decoded.shape[0], 400)
+
 
 if __name__ == "__main__":
     unittest.main()
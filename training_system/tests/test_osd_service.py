@@ -0,0 +1,114 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import osd_service
+
+
+class FakeBackend:
+    def __init__(self):
+        self.calls = []
+        self.opened = 0
+        self.closed = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self):
+        self.opened += 1
+
+        def detect(image):
+            self.release.wait(timeout=5)
+            self.calls.append(image.shape)
+            return {"rotate_degrees": 90, "confidence": float(image.shape[0])}
+
+        def close():
+            self.closed += 1
+
+        return detect, close
+
+
+class OsdServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.worker = osd_service.OsdWorker(backend_factory=self.backend, cache_size=2)
+
+    def tearDown(self):
+        self.worker.stop()
+
+    def test_parse_osd_output_reads_rotate_and_confidence(self):
+        output = "Page number: 0\nOrientation in degrees: 90\nRotate: 270\nOrientation confidence: 3.21\n"
+
+        self.assertEqual(
+            osd_service.parse_osd_output(output),
+            {"rotate_degrees": 270, "confidence": 3.21},
+        )
+        self.assertIsNone(osd_service.parse_osd_output("Too few characters. Skipping this page"))
+
+    def test_backend_is_loaded_once_and_repeated_images_hit_cache(self):
+        image = np.zeros((20, 30), dtype=np.uint8)
+
+        first = self.worker.detect(image)
+        second = self.worker.detect(image.copy())
+
+        self.assertEqual(first, {"rotate_degrees": 90, "confidence": 20.0})
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertEqual(self.backend.opened, 1)
+        self.assertEqual(self.worker.stats["hits"], 1)
+
+    def test_detect_many_deduplicates_identical_images(self):
+        self.backend.release.clear()
+        a = np.zeros((10, 10), dtype=np.uint8)
+        b = np.ones((12, 10), dtype=np.uint8)
+        futures = [self.worker.submit(image) for image in (a, b, a.copy())]
+        self.backend.release.set()
+
+        results = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual([r["confidence"] for r in results], [10.0, 12.0, 10.0])
+        self.assertEqual(len(self.backend.calls), 2)
+
+    def test_cache_evicts_least_recently_used_entries(self):
+        images = [np.full((5 + i, 5), i, dtype=np.uint8) for i in range(3)]
+
+        self.worker.detect_many(images)
+        self.worker.detect(images[0])
+
+        self.assertEqual(len(self.backend.calls), 4)
+
+    def test_timeout_counts_from_dequeue_not_queue_wait(self):
+        def slow_backend():
+            def detect(image):
+                time.sleep(0.3)
+                return {"rotate_degrees": 0, "confidence": float(image.shape[0])}
+            return detect, None
+
+        worker = osd_service.OsdWorker(backend_factory=slow_backend)
+        try:
+            # 其他请求先排入三张图片，本次检测要排队约 0.9 秒，超过 0.5 秒的超时，但检测本身只需 0.3 秒
+            for i in range(3):
+                worker.submit(np.full((6 + i, 6), i, dtype=np.uint8))
+            result = worker.detect(np.full((20, 6), 9, dtype=np.uint8), timeout=0.5)
+        finally:
+            worker.stop()
+
+        self.assertEqual(result, {"rotate_degrees": 0, "confidence": 20.0})
+
+    def test_stop_closes_backend(self):
+        self.worker.detect(np.zeros((4, 4), dtype=np.uint8))
+        self.worker.stop()
+
+        self.assertEqual(self.backend.closed, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
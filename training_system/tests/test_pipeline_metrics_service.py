@@ -0,0 +1,87 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from app import create_app
+from models import student as student_model
+from services import pipeline_metrics_service
+
+
+def make_report(job_id, bg_remove_ms):
+    return {
+        "log_summary": {"job_id": job_id},
+        "step_timings": [
+            {"scope": "photo", "step": "bg_remove", "count": 1, "wall_ms": bg_remove_ms, "cpu_ms": bg_remove_ms / 2},
+            {"scope": "photo", "step": "write_output", "count": 1, "wall_ms": 20.0, "cpu_ms": 15.0},
+        ],
+    }
+
+
+class PipelineMetricsTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "students.db")
+        self.env = patch.dict(os.environ, {"TRAINING_SYSTEM_ENV_FILE": os.path.join(self.tmp.name, ".env")})
+        self.env.start()
+        student_model.init_db(self.db_path)
+        self.app = create_app()
+        self.app.config.update(TESTING=True, DATABASE=self.db_path)
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_percentile_and_histogram(self):
+        values = [float(value) for value in range(1, 101)]
+
+        self.assertEqual(pipeline_metrics_service.percentile(values, 50), 50.0)
+        self.assertEqual(pipeline_metrics_service.percentile(values, 95), 95.0)
+        self.assertIsNone(pipeline_metrics_service.percentile([], 50))
+        histogram = pipeline_metrics_service.build_histogram([5, 30, 70000])
+        self.assertEqual(histogram[0], {"le": 10, "count": 1})
+        self.assertEqual(histogram[2], {"le": 50, "count": 1})
+        self.assertEqual(histogram[-1], {"le": None, "count": 1})
+
+    def test_recorded_reports_are_summarised_per_scope_and_step(self):
+        with self.app.app_context():
+            for index in range(20):
+                pipeline_metrics_service.record_report(make_report(f"job-{index}", 100.0 * (index + 1)))
+            self.assertEqual(pipeline_metrics_service.record_report({"step_timings": []}), 0)
+            summary = pipeline_metrics_service.summarize(7)
+
+        self.assertEqual(summary["sample_count"], 40)
+        photo = summary["scopes"][0]
+        self.assertEqual(photo["scope"], "photo")
+        bg_remove = photo["steps"][0]
+        self.assertEqual(bg_remove["step"], "bg_remove")
+        self.assertEqual(bg_remove["count"], 20)
+        self.assertEqual(bg_remove["wall_p50_ms"], 1000.0)
+        self.assertEqual(bg_remove["wall_p95_ms"], 1900.0)
+        self.assertEqual(bg_remove["cpu_p95_ms"], 950.0)
+
+    def test_admin_endpoint_returns_summary(self):
+        with self.app.app_context():
+            pipeline_metrics_service.record_report(make_report("job-1", 300.0))
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess["auth_verified"] = True
+
+        resp = client.get("/api/logs/pipeline_timings?days=1")
+
+        self.assertEqual(resp.status_code, 200)
+        payload = resp.get_json()
+        self.assertTrue(payload["success"])
+        self.assertEqual(payload["window_days"], 1)
+        self.assertEqual(payload["scopes"][0]["steps"][0]["wall_p95_ms"], 300.0)
+        self.assertEqual(client.get("/admin/pipeline_timings").status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
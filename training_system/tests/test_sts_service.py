@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from app import create_app
+from services import sts_service
+
+
+class FakeStsClient:
+    calls = []
+    lifetime = 1800
+
+    def __init__(self, cred, region, profile):
+        self.region = region
+
+    def GetFederationToken(self, req):
+        time.sleep(0.05)
+        FakeStsClient.calls.append(req.Policy)
+        n = len(FakeStsClient.calls)
+        return SimpleNamespace(
+            Credentials=SimpleNamespace(TmpSecretId=f"id-{n}", TmpSecretKey=f"key-{n}", Token=f"token-{n}"),
+            ExpiredTime=int(time.time()) + FakeStsClient.lifetime,
+        )
+
+
+class StsCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        FakeStsClient.calls = []
+        FakeStsClient.lifetime = 1800
+        self.patchers = [
+            patch.dict(os.environ, {
+                "TRAINING_SYSTEM_ENV_FILE": os.path.join(self.tmp.name, ".env"),
+                "COS_SECRET_ID": "sid",
+                "COS_SECRET_KEY": "skey",
+                "COS_BUCKET": "bucket-1250000000",
+                "COS_REGION": "ap-test",
+                "STS_CACHE_PATH": os.path.join(self.tmp.name, "sts_cache.db"),
+                "STS_REFRESH_MARGIN_SEC": "300",
+            }),
+            patch.object(sts_service.sts_client, "StsClient", FakeStsClient),
+            patch.object(sts_service, "_memory", {}),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.app = create_app()
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def test_concurrent_callers_share_a_single_refresh(self):
+        results = []
+
+        def worker():
+            with self.app.app_context():
+                results.append(sts_service.get_cos_sts_token()["Token"])
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(FakeStsClient.calls), 1)
+        self.assertEqual(results, ["token-1"] * 8)
+        with self.app.app_context():
+            credentials = sts_service.get_cos_sts_token()
+        self.assertEqual((credentials["Bucket"], credentials["Region"]), ("bucket-1250000000", "ap-test"))
+        self.assertIn("bucket-1250000000/students/tmp/*", FakeStsClient.calls[0])
+        self.assertEqual(len(FakeStsClient.calls), 1)
+
+    def test_other_workers_reuse_stored_token_until_near_expiry(self):
+        with self.app.app_context():
+            first = sts_service.get_cos_sts_token()
+            # 模拟另一个 worker 进程：进程内缓存为空，从共享库读取
+            sts_service._memory.clear()
+            self.assertEqual(sts_service.get_cos_sts_token()["Token"], first["Token"])
+            self.assertEqual(len(FakeStsClient.calls), 1)
+
+            # 剩余有效期不足刷新余量时重新申请
+            with patch.dict(os.environ, {"STS_REFRESH_MARGIN_SEC": "1900"}):
+                self.assertEqual(sts_service.get_cos_sts_token()["Token"], "token-2")
+
+            # 更换存储桶后旧凭证不再命中
+            with patch.dict(os.environ, {"COS_BUCKET": "other-1250000000"}):
+                self.assertEqual(sts_service.get_cos_sts_token()["Bucket"], "other-1250000000")
+        self.assertEqual(len(FakeStsClient.calls), 3)
+
+    def test_unusable_store_falls_back_to_process_cache(self):
+        os.environ["STS_CACHE_PATH"] = os.path.join(self.tmp.name, "missing-dir-file", "x.db")
+        with open(os.path.join(self.tmp.name, "missing-dir-file"), "w") as f:
+            f.write("not a directory")
+        with self.app.app_context():
+            sts_service.get_cos_sts_token()
+            sts_service.get_cos_sts_token()
+        self.assertEqual(len(FakeStsClient.calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
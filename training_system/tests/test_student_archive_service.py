@@ -0,0 +1,144 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from app import create_app
+from models import student as student_model
+from services import student_archive_service
+
+OLD = "2020-01-01 08:00:00"
+
+
+class StudentArchiveTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "students.db")
+        self.patchers = [
+            patch.dict(os.environ, {
+                "TRAINING_SYSTEM_ENV_FILE": os.path.join(self.tmp.name, ".env"),
+                "STORAGE_BACKEND": "local",
+                "BLOB_DEDUP": "0",
+                "STUDENT_ARCHIVE_AGE_DAYS": "365",
+            }),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        student_model.init_db(self.db_path)
+        self.app = create_app()
+        self.app.config.update(TESTING=True, DATABASE=self.db_path, BASE_DIR=self.tmp.name)
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["auth_verified"] = True
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def _write(self, key, data):
+        path = os.path.join(self.tmp.name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _read(self, key):
+        with open(os.path.join(self.tmp.name, key), "rb") as f:
+            return f.read()
+
+    def _add_student(self, name, status, created_at=OLD, id_card="110"):
+        folder = f"students/特种作业-甲公司-{name}"
+        photo = f"{folder}/{id_card}-{name}-个人照片.jpg"
+        with self.app.app_context():
+            with student_model.get_db_connection() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO students (name, gender, education, id_card, phone, job_category, company, "
+                    "training_type, status, created_at, photo_path) "
+                    "VALUES (?, '男', '本科', ?, '13800000000', '电工', '甲公司', 'special_operation', ?, ?, ?)",
+                    (name, id_card, status, created_at, photo),
+                )
+                student_id = cursor.lastrowid
+                conn.execute(
+                    "INSERT INTO material_adjustments (student_id, material_type, adjustments_json) VALUES (?, ?, ?)",
+                    (student_id, "photo", '{"rotate": 90}'),
+                )
+        self._write(photo, f"photo-{name}".encode())
+        return student_id, folder, photo
+
+    def test_batch_archive_moves_only_old_final_students_out_of_hot_storage(self):
+        done_id, done_folder, done_photo = self._add_student("张三", "exam_passed")
+        self._write(f"{done_folder}/110-张三-报名材料/a.pdf", b"pdf")
+        self._write(f"{done_folder}/.variants/thumb.jpg", b"thumb")
+        pending_id, pending_folder, _ = self._add_student("李四", "unreviewed", id_card="120")
+        recent_id, recent_folder, _ = self._add_student("王五", "rejected", created_at="2999-01-01 00:00:00",
+                                                          id_card="130")
+
+        with self.app.app_context():
+            preview = student_archive_service.archive_eligible(dry_run=True)
+            self.assertEqual(preview["ids"], [done_id])
+            result = student_archive_service.archive_eligible()
+            self.assertEqual(student_model.get_student_archive_rows(done_id), None)
+            self.assertIsNotNone(student_model.get_student_archive_rows(pending_id))
+
+        self.assertEqual((result["candidates"], result["archived"], result["failed"]), (1, 1, []))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, done_folder)))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, pending_folder)))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, recent_folder)))
+
+        data = self.client.get("/api/students/archived", query_string={"search": "张"}).get_json()
+        self.assertEqual(data["total"], 1)
+        row = data["rows"][0]
+        self.assertEqual((row["id"], row["name"], row["file_count"]), (done_id, "张三", 2))
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp.name, row["bundle_key"])))
+        self.assertNotIn("record_json", row)
+
+    def test_restore_brings_back_record_related_rows_and_files(self):
+        student_id, folder, photo = self._add_student("张三", "rejected")
+        self._write(f"{folder}/110-张三-报名材料/a.pdf", b"pdf")
+        with self.app.app_context():
+            bundle_key = student_archive_service.archive_student(student_id)["bundle_key"]
+
+        resp = self.client.post(f"/api/students/archived/{student_id}/restore")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()["restored_files"], 2)
+
+        self.assertEqual(self._read(photo), "photo-张三".encode())
+        self.assertEqual(self._read(f"{folder}/110-张三-报名材料/a.pdf"), b"pdf")
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, bundle_key)))
+        with self.app.app_context():
+            rows = student_model.get_student_archive_rows(student_id)
+            self.assertEqual((rows["student"]["status"], rows["student"]["created_at"]), ("rejected", OLD))
+            self.assertEqual(rows["related"]["material_adjustments"][0]["adjustments_json"], '{"rotate": 90}')
+            self.assertIsNone(student_archive_service.get_archived(student_id))
+        self.assertEqual(self.client.post("/api/students/archived/999/restore").status_code, 404)
+        # 未办结的学员不能归档
+        with self.app.app_context():
+            student_model.update_student(student_id, {"status": "unreviewed"})
+        self.assertEqual(self.client.post(f"/api/students/{student_id}/archive").status_code, 400)
+
+    def test_shared_folder_keeps_other_students_files(self):
+        old_id, folder, _ = self._add_student("张三", "exam_passed")
+        old_photo = f"{folder}/110-张三-旧照片.jpg"
+        self._write(old_photo, b"old")
+        with self.app.app_context():
+            student_model.update_student(old_id, {"photo_path": old_photo})
+        new_id, _, new_photo = self._add_student("张三", "reviewed", id_card="111")
+
+        with self.app.app_context():
+            result = student_archive_service.archive_student(old_id)
+
+        # 同名同单位共用文件夹：只打包并删除本人引用的文件
+        self.assertEqual(result["file_count"], 1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, old_photo)))
+        self.assertEqual(self._read(new_photo), "photo-张三".encode())
+        self.assertTrue(result["bundle_key"].endswith(f"{old_id}-student.tar.gz"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from app import create_app
+from models import student as student_model
+from services import storage_service, student_folder_service
+
+
+class FakeCosClient:
+    def __init__(self, fail_copy=()):
+        self.objects = {}
+        self.calls = []
+        self.fail_copy = set(fail_copy)
+        self.lock = threading.Lock()
+
+    def copy_object(self, Bucket, Key, CopySource):
+        with self.lock:
+            if CopySource["Key"] in self.fail_copy:
+                raise RuntimeError("copy timeout")
+            if CopySource["Key"] not in self.objects:
+                raise RuntimeError("NoSuchKey")
+            self.calls.append(("copy", Key))
+            self.objects[Key] = self.objects[CopySource["Key"]]
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise RuntimeError("404 Not Found")
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        with self.lock:
+            keys = [obj["Key"] for obj in Delete["Object"]]
+            self.calls.append(("delete_objects", tuple(sorted(keys))))
+            for key in keys:
+                self.objects.pop(key, None)
+        return {}
+
+
+class RecordingExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, func, *args):
+        self.submitted.append((func, args))
+
+
+OLD_FIELDS = {"training_type": "special_operation", "company": "甲公司", "name": "张三", "id_card": "110"}
+NEW_FIELDS = {"training_type": "special_operation", "company": "乙公司", "name": "张三", "id_card": "110"}
+OLD_DIR = "students/特种作业-甲公司-张三"
+NEW_DIR = "students/特种作业-乙公司-张三"
+
+
+class FolderMigrationTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "students.db")
+        self.client = FakeCosClient()
+        self.patchers = [
+            patch.dict(os.environ, {
+                "TRAINING_SYSTEM_ENV_FILE": os.path.join(self.tmp.name, ".env"),
+                "STORAGE_BACKEND": "dual",
+                "MIGRATION_COS_THREADS": "4",
+            }),
+            patch.object(storage_service, "_get_cos_client", lambda: (self.client, {
+                "bucket": "bucket", "region": "ap-test", "prefix": "",
+            })),
+            patch.object(student_folder_service, "_get_cos_client", lambda: (self.client, {
+                "bucket": "bucket", "region": "ap-test", "prefix": "",
+            })),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        student_model.init_db(self.db_path)
+        self.app = create_app()
+        self.app.config.update(TESTING=True, DATABASE=self.db_path, BASE_DIR=self.tmp.name)
+
+        self.student = {"id": None, "status": "unreviewed"}
+        for field, label in (("photo_path", "个人照片"), ("diploma_path", "学历证书"), ("id_card_front_path", "身份证正面")):
+            key = f"{OLD_DIR}/110-张三-{label}.jpg"
+            self.student[field] = key
+            self._write(key, label.encode("utf-8"))
+            self.client.objects[key] = label.encode("utf-8")
+        material_key = f"{OLD_DIR}/110-张三-报名材料/110-张三-报名材料.pdf"
+        self._write(material_key, b"pdf")
+        self.client.objects[material_key] = b"pdf"
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def _write(self, key, data):
+        path = os.path.join(self.tmp.name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _journal(self):
+        with self.app.app_context():
+            with student_model.get_db_connection() as conn:
+                row = conn.execute("SELECT id FROM folder_migrations ORDER BY id DESC LIMIT 1").fetchone()
+            return student_model.get_folder_migration(row["id"])
+
+    def test_copies_run_first_and_old_keys_are_deleted_in_one_batch(self):
+        with self.app.app_context():
+            updates = student_folder_service.migrate_student_files(self.student, OLD_FIELDS, NEW_FIELDS)
+
+        self.assertEqual(updates["photo_path"], f"{NEW_DIR}/110-张三-个人照片.jpg")
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, updates["diploma_path"])))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, OLD_DIR)))
+        self.assertEqual(sorted(self.client.objects), sorted([
+            f"{NEW_DIR}/110-张三-个人照片.jpg",
+            f"{NEW_DIR}/110-张三-学历证书.jpg",
+            f"{NEW_DIR}/110-张三-身份证正面.jpg",
+            f"{NEW_DIR}/110-张三-报名材料/110-张三-报名材料.pdf",
+        ]))
+        self.assertEqual([call[0] for call in self.client.calls], ["copy"] * 4 + ["delete_objects"])
+        journal = self._journal()
+        self.assertEqual(journal["phase"], "done")
+        self.assertTrue(all(item["copied"] and item["deleted"] for item in journal["items"]))
+
+    def test_copy_failure_rolls_back_without_touching_old_objects(self):
+        self.client.fail_copy = {f"{OLD_DIR}/110-张三-学历证书.jpg"}
+
+        with self.app.app_context():
+            with self.assertRaises(student_folder_service.MigrationError):
+                student_folder_service.migrate_student_files(self.student, OLD_FIELDS, NEW_FIELDS)
+
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, self.student["photo_path"])))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, NEW_DIR)))
+        self.assertEqual(sorted(self.client.objects), sorted([
+            self.student["photo_path"],
+            self.student["diploma_path"],
+            self.student["id_card_front_path"],
+            f"{OLD_DIR}/110-张三-报名材料/110-张三-报名材料.pdf",
+        ]))
+        self.assertEqual(self._journal()["phase"], "rolled_back")
+
+    def test_cos_phase_can_be_deferred_and_resumed(self):
+        executor = RecordingExecutor()
+        with patch.object(student_folder_service, "_executor", executor):
+            with self.app.app_context():
+                updates = student_folder_service.migrate_student_files(self.student, OLD_FIELDS, NEW_FIELDS)
+
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(self.client.calls, [])
+        self.assertEqual(len(executor.submitted), 1)
+        self.assertEqual(self._journal()["phase"], "cos")
+
+        result = student_folder_service.resume_migrations(self.app)
+
+        self.assertEqual(result["resumed"], 1)
+        self.assertIn(f"{NEW_DIR}/110-张三-个人照片.jpg", self.client.objects)
+        self.assertNotIn(self.student["photo_path"], self.client.objects)
+        self.assertEqual(self._journal()["phase"], "done")
+
+    def test_interrupted_local_phase_is_rolled_back_when_db_was_not_updated(self):
+        old_key = self.student["photo_path"]
+        new_key = f"{NEW_DIR}/110-张三-个人照片.jpg"
+        with self.app.app_context():
+            student_model.create_folder_migration(None, "local", [{"old": old_key, "new": new_key}])
+        os.renames(os.path.join(self.tmp.name, old_key), os.path.join(self.tmp.name, new_key))
+
+        result = student_folder_service.resume_migrations(self.app)
+
+        self.assertEqual(result["rolled_back"], 1)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, old_key)))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, new_key)))
+
+
+if __name__ == "__main__":
+    unittest.main()
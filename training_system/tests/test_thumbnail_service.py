@@ -0,0 +1,119 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from app import create_app
+from services import thumbnail_service
+
+
+def write_image(path, size=(1600, 1200)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", size, (230, 230, 230)).save(path, format="JPEG", quality=90)
+
+
+class ThumbnailCacheTests(unittest.TestCase):
+    def test_evicts_least_recently_used_files_by_bytes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = thumbnail_service.ThumbnailCache(tmp_dir, max_bytes=10)
+            first = cache.put("aa11", ".jpg", b"1234")
+            cache.put("bb22", ".jpg", b"1234")
+            self.assertEqual(cache.get("aa11", ".jpg"), first)
+            cache.put("cc33", ".jpg", b"1234")
+
+            self.assertIsNone(cache.get("bb22", ".jpg"))
+            self.assertTrue(os.path.exists(first))
+            self.assertEqual(cache.size_bytes, 8)
+
+            reloaded = thumbnail_service.ThumbnailCache(tmp_dir, max_bytes=10)
+            self.assertEqual(reloaded.snapshot()["entries"], 2)
+
+    def test_resolve_size_and_format(self):
+        self.assertEqual(thumbnail_service.resolve_size("m"), 320)
+        self.assertEqual(thumbnail_service.resolve_size("640"), 640)
+        self.assertIsNone(thumbnail_service.resolve_size("333"))
+        self.assertEqual(thumbnail_service.resolve_format("", "image/avif,image/webp,*/*"), "webp")
+        self.assertEqual(thumbnail_service.resolve_format("jpg", "image/webp"), "jpeg")
+
+
+class ThumbnailRouteTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patchers = [
+            patch.dict(os.environ, {
+                "TRAINING_SYSTEM_ENV_FILE": os.path.join(self.tmp.name, ".env"),
+                "STORAGE_BACKEND": "local",
+            }),
+            patch.object(
+                thumbnail_service,
+                "_cache",
+                thumbnail_service.ThumbnailCache(os.path.join(self.tmp.name, "cache"), 1024 * 1024),
+            ),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["BASE_DIR"] = self.tmp.name
+        self.app.config["STUDENTS_FOLDER"] = os.path.join(self.tmp.name, "students")
+        self.client = self.app.test_client()
+        write_image(os.path.join(self.tmp.name, "students", "特种作业-单位-张三", "1-张三-学历证书.jpg"))
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def test_thumbnail_is_resized_and_revalidated_by_etag(self):
+        url = "/thumbs/m/特种作业-单位-张三/1-张三-学历证书.jpg?fmt=jpeg"
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.mimetype, "image/jpeg")
+        with Image.open(io.BytesIO(first.data)) as thumb:
+            self.assertEqual(thumb.size, (320, 240))
+        etag = first.headers["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+
+        again = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(again.status_code, 304)
+
+        versioned = self.client.get(f"{url}&v={etag.strip(chr(34))}")
+        self.assertIn("immutable", versioned.headers["Cache-Control"])
+        self.assertEqual(self.client.get("/thumbs/333/特种作业-单位-张三/1-张三-学历证书.jpg").status_code, 404)
+
+    def test_batch_endpoint_returns_inline_thumbnails(self):
+        with self.client.session_transaction() as sess:
+            sess["auth_verified"] = True
+        key = "students/特种作业-单位-张三/1-张三-学历证书.jpg"
+
+        resp = self.client.post(
+            "/api/thumbs/batch",
+            json={"paths": [key, "students/missing.jpg"], "size": "s", "format": "webp"},
+        )
+
+        self.assertEqual(resp.status_code, 200)
+        payload = resp.get_json()
+        self.assertEqual(payload["size"], 160)
+        self.assertTrue(payload["items"][key]["data"].startswith("data:image/webp;base64,"))
+        self.assertIn("?v=", payload["items"][key]["url"])
+        self.assertIsNone(payload["items"]["students/missing.jpg"])
+
+        # 带版本号的地址可被浏览器长期缓存；inline=false 时只返回地址
+        versioned = self.client.get(payload["items"][key]["url"] + "&fmt=webp")
+        self.assertIn("immutable", versioned.headers["Cache-Control"])
+        resp = self.client.post("/api/thumbs/batch", json={"paths": [key], "size": "s", "inline": False})
+        self.assertNotIn("data", resp.get_json()["items"][key])
+
+
+if __name__ == "__main__":
+    unittest.main()
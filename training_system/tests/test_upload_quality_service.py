@@ -0,0 +1,69 @@
+import io
+import os
+import sys
+import unittest
+
+import cv2
+import numpy as np
+from PIL import Image
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from services import upload_quality_service  # noqa: E402
+
+
+def document_scene(width=2400, height=1800):
+    image = np.full((height, width, 3), 60, dtype=np.uint8)
+    cv2.rectangle(image, (width // 6, height // 6), (width * 5 // 6, height * 5 // 6), (235, 235, 235), -1)
+    for y in range(height // 6 + 100, height * 5 // 6 - 40, 60):
+        cv2.putText(image, "ABCDEFG 1234567", (width // 6 + 50, y), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (20, 20, 20), 3)
+    return image
+
+
+def to_pil(image):
+    return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+
+class UploadQualityTests(unittest.TestCase):
+    def test_sharp_document_passes(self):
+        report = upload_quality_service.assess_image(to_pil(document_scene()), "diploma")
+
+        self.assertEqual(report["verdict"], "pass")
+        self.assertGreater(report["scores"]["document_area_ratio"], 0.3)
+        self.assertEqual(report["issues"], [])
+
+    def test_blurred_document_fails(self):
+        blurred = cv2.GaussianBlur(document_scene(), (0, 0), 6)
+
+        report = upload_quality_service.assess_image(to_pil(blurred), "id_card_front")
+
+        self.assertEqual(report["verdict"], "fail")
+        self.assertIn("blurry", [issue["code"] for issue in report["issues"]])
+
+    def test_glare_and_missing_document_warn(self):
+        scene = document_scene()
+        cv2.circle(scene, (1200, 900), 500, (255, 255, 255), -1)
+        glare = upload_quality_service.assess_image(to_pil(scene), "hukou_personal")
+        empty = upload_quality_service.assess_image(to_pil(np.full((1800, 2400, 3), 128, dtype=np.uint8)), "diploma")
+
+        self.assertIn("glare", [issue["code"] for issue in glare["issues"]])
+        self.assertEqual(glare["verdict"], "warn")
+        self.assertIn("no_document", [issue["code"] for issue in empty["issues"]])
+
+    def test_assess_bytes_uses_original_resolution_after_exif_rotation(self):
+        image = to_pil(cv2.resize(document_scene(), (560, 420)))
+        exif = image.getexif()
+        exif[0x0112] = 6
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", exif=exif)
+
+        report = upload_quality_service.assess_image_bytes(buf.getvalue(), "photo")
+
+        self.assertEqual((report["scores"]["width"], report["scores"]["height"]), (420, 560))
+        self.assertIsNone(upload_quality_service.assess_image_bytes(b"%PDF-1.4", "diploma"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(TEST_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from app import create_app
+from routes import student_routes
+from services import zip_stream_service
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class ZipStreamTests(unittest.TestCase):
+    def test_stream_is_valid_zip_with_stored_jpegs_and_skips_missing(self):
+        jpeg = b"\xff\xd8" + os.urandom(200000) + b"\xff\xd9"
+        text = "报名材料说明\n".encode("utf-8") * 5000
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_file(os.path.join(tmp_dir, "a.jpg"), jpeg)
+            write_file(os.path.join(tmp_dir, "b.txt"), text)
+            opened = []
+
+            def open_local(name):
+                opened.append(name)
+                path = os.path.join(tmp_dir, name)
+                return open(path, "rb") if os.path.exists(path) else None
+
+            chunks = zip_stream_service.stream_zip(
+                [("a.jpg", "材料/照片.jpg"), ("missing.jpg", "缺失.jpg"), ("b.txt", "材料/说明.txt")],
+                open_func=open_local,
+                chunk_size=16384,
+            )
+            first = next(chunks)
+            # 首个数据块产出时只打开了第一个文件
+            self.assertEqual(opened, ["a.jpg"])
+            data = first + b"".join(chunks)
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            infos = {info.filename: info for info in zf.infolist()}
+            self.assertEqual(set(infos), {"材料/照片.jpg", "材料/说明.txt"})
+            self.assertEqual(infos["材料/照片.jpg"].compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(infos["材料/说明.txt"].compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(zf.read("材料/照片.jpg"), jpeg)
+            self.assertEqual(zf.read("材料/说明.txt"), text)
+        self.assertLess(len(data), len(jpeg) + len(text) // 10)
+
+
+class ZipRouteTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patchers = [
+            patch.dict(os.environ, {
+                "TRAINING_SYSTEM_ENV_FILE": os.path.join(self.tmp.name, ".env"),
+                "STORAGE_BACKEND": "local",
+            }),
+            patch.object(student_routes, "get_student_by_id", return_value={
+                "id": 1,
+                "name": "张三",
+                "id_card": "110101199001011234",
+                "company": "单位",
+                "training_type": "special_operation",
+                "status": "reviewed",
+                "photo_path": "students/特种作业-单位-张三/110101199001011234-张三-个人照片.jpg",
+                "diploma_path": "students/特种作业-单位-张三/缺失.jpg",
+            }),
+            patch.object(student_routes, "log_student_operation"),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["BASE_DIR"] = self.tmp.name
+        self.app.config["STUDENTS_FOLDER"] = os.path.join(self.tmp.name, "students")
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess["auth_verified"] = True
+        folder = os.path.join(self.tmp.name, "students", "特种作业-单位-张三")
+        write_file(os.path.join(folder, "110101199001011234-张三-个人照片.jpg"), b"\xff\xd8photo")
+        write_file(os.path.join(folder, "110101199001011234-张三-报名材料", "110101199001011234-张三-身份证.jpg"), b"\xff\xd8card")
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.cleanup()
+
+    def test_attachments_and_materials_are_streamed(self):
+        resp = self.client.get("/api/students/1/attachments.zip")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_streamed)
+        self.assertIn("filename*=UTF-8''", resp.headers["Content-Disposition"])
+        with zipfile.ZipFile(io.BytesIO(resp.get_data())) as zf:
+            self.assertEqual(zf.namelist(), ["110101199001011234-张三-个人照片.jpg"])
+
+        resp = self.client.get("/api/students/1/download_materials.zip")
+        self.assertEqual(resp.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(resp.get_data())) as zf:
+            self.assertEqual(
+                zf.namelist(),
+                ["110101199001011234-张三-报名材料/110101199001011234-张三-身份证.jpg"],
+            )
+            self.assertEqual(zf.read(zf.namelist()[0]), b"\xff\xd8card")
+
+
+if __name__ == "__main__":
+    unittest.main()